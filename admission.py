@@ -0,0 +1,274 @@
+import asyncio
+import json
+import math
+import re
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+# Requests admitted at once across every controlled route
+DEFAULT_MAX_IN_FLIGHT = 64
+
+# Token buckets remembered before the least recently used is dropped
+DEFAULT_MAX_CLIENTS = 10_000
+
+
+class Lane:
+    """
+    A priority class of requests
+
+    Waiting requests are admitted strictly by lane priority (lower first),
+    FIFO within a lane. Each client gets its own token bucket per lane. A
+    lane limit below the controller's max_in_flight keeps the remaining
+    slots free for higher lanes, so a critical request need not wait for
+    bulk work to finish.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        priority: int,
+        rate: float,
+        burst: float,
+        max_queue: int,
+        max_wait: Optional[float],
+        limit: Optional[int]
+    ):
+        """
+        Args:
+            name (str): Lane name, e.g. "critical"
+            priority (int): Lower is admitted first
+            rate (float): Requests per second each client may sustain
+            burst (float): Requests a client may make at once
+            max_queue (int): Waiting requests beyond this are shed
+            max_wait: Seconds a request may wait for a slot before it is
+                shed; None waits as long as it takes
+            limit: Most requests of this lane in flight at once
+        """
+        self.name = name
+        self.priority = priority
+        self.rate = rate
+        self.burst = burst
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.limit = limit
+        self.in_flight = 0
+        self.waiting: Deque[Tuple[asyncio.Future, "AdmissionRoute"]] = deque()
+        self.admitted = 0
+        self.shed: Dict[str, int] = {"rate": 0, "queue": 0, "timeout": 0}
+        self.wait_seconds = 0.0
+        self.max_wait_seen = 0.0
+
+
+class AdmissionRoute:
+    """Requests of one method to one path template, in one lane, with an optional concurrency limit"""
+
+    def __init__(self, method: str, template: str, lane: Lane, limit: Optional[int] = None):
+        self.method = method
+        self.template = template
+        self.pattern = re.compile("^" + re.sub(r"\\{[^/]+?\\}", "[^/]+", re.escape(template)) + "$")
+        self.lane = lane
+        self.limit = limit
+        self.in_flight = 0
+
+
+class Rejected(Exception):
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Concurrency limits, per-client rate limits and priority lanes for write routes
+
+    A request to a controlled route first takes a token from its client's
+    bucket for the route's lane, or is shed. It is then admitted at once if
+    the global, lane and route concurrency limits all have room; otherwise
+    it waits in its lane. Each freed slot goes to the first waiter of the
+    highest priority lane with room, so critical requests overtake queued
+    bulk work. A lane whose queue is full, or a waiter that outlasts its lane's
+    max_wait, is shed. Requests to other routes are not controlled.
+    """
+
+    def __init__(self, max_in_flight: int = DEFAULT_MAX_IN_FLIGHT, max_clients: int = DEFAULT_MAX_CLIENTS):
+        self.max_in_flight = max_in_flight
+        self.max_clients = max_clients
+        self.in_flight = 0
+        self.lanes: Dict[str, Lane] = {}
+        self._by_priority: List[Lane] = []
+        self.routes: List[AdmissionRoute] = []
+        # (client, lane) -> (tokens, last refill)
+        self._buckets: "OrderedDict[Tuple[Any, str], Tuple[float, float]]" = OrderedDict()
+
+    def lane(self, name: str, priority: int, rate: float, burst: float, max_queue: int,
+             max_wait: Optional[float] = None, limit: Optional[int] = None) -> Lane:
+        self.lanes[name] = Lane(name, priority, rate, burst, max_queue, max_wait, limit)
+        self._by_priority = sorted(self.lanes.values(), key=lambda lane: lane.priority)
+        return self.lanes[name]
+
+    def route(self, method: str, template: str, lane: str, limit: Optional[int] = None) -> None:
+        """
+        Control a route
+
+        Args:
+            method (str): HTTP method
+            template (str): Path with {name} placeholders, e.g. "/api/tasks/{task_id}/status"
+            lane (str): Name of the route's lane
+            limit: Most requests to this route in flight at once
+        """
+        self.routes.append(AdmissionRoute(method, template, self.lanes[lane], limit))
+
+    def match(self, method: str, path: str) -> Optional[AdmissionRoute]:
+        return next((route for route in self.routes if route.method == method and route.pattern.match(path)), None)
+
+    def _take_token(self, client: Any, lane: Lane) -> float:
+        """Take a token from the client's bucket; return 0, or the seconds until one is available"""
+        now = time.monotonic()
+        key = (client, lane.name)
+        tokens, updated = self._buckets.pop(key, (lane.burst, now))
+        tokens = min(lane.burst, tokens + (now - updated) * lane.rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / lane.rate
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_clients:
+            self._buckets.popitem(last=False)
+        return wait
+
+    def _has_room(self, route: AdmissionRoute) -> bool:
+        lane = route.lane
+        return (
+            self.in_flight < self.max_in_flight
+            and (lane.limit is None or lane.in_flight < lane.limit)
+            and (route.limit is None or route.in_flight < route.limit)
+        )
+
+    def _grant(self, route: AdmissionRoute) -> None:
+        self.in_flight += 1
+        route.in_flight += 1
+        route.lane.in_flight += 1
+        route.lane.admitted += 1
+
+    async def acquire(self, route: AdmissionRoute, client: Any) -> None:
+        """
+        Wait for a slot on a route
+
+        Raises:
+            Rejected: If the request is shed; retry_after suggests when to retry
+        """
+        lane = route.lane
+        wait = self._take_token(client, lane)
+        if wait:
+            lane.shed["rate"] += 1
+            raise Rejected(f"Rate limit exceeded for {lane.name} requests", wait)
+        # Waiters are only ever blocked for lack of room (see _dispatch), so
+        # a request that finds room overtakes no one
+        if self._has_room(route):
+            self._grant(route)
+            return
+        if len(lane.waiting) >= lane.max_queue:
+            lane.shed["queue"] += 1
+            raise Rejected(f"Server is busy; {lane.name} queue is full", 1.0)
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (future, route)
+        lane.waiting.append(entry)
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), lane.max_wait)
+        except asyncio.TimeoutError:
+            if not future.done():
+                lane.waiting.remove(entry)
+                future.cancel()
+                lane.shed["timeout"] += 1
+                raise Rejected(f"Server is busy; {lane.name} request timed out waiting", 1.0)
+        except asyncio.CancelledError:
+            # The client went away: give back a slot granted meanwhile
+            if future.done() and not future.cancelled():
+                self.release(route)
+            elif entry in lane.waiting:
+                lane.waiting.remove(entry)
+                future.cancel()
+            raise
+        waited = time.monotonic() - started
+        lane.wait_seconds += waited
+        lane.max_wait_seen = max(lane.max_wait_seen, waited)
+
+    def release(self, route: AdmissionRoute) -> None:
+        self.in_flight -= 1
+        route.in_flight -= 1
+        route.lane.in_flight -= 1
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Hand free slots to waiters, highest priority lane first"""
+        for lane in self._by_priority:
+            if self.in_flight >= self.max_in_flight:
+                return
+            for entry in list(lane.waiting):
+                future, route = entry
+                if self.in_flight >= self.max_in_flight:
+                    return
+                if self._has_room(route):
+                    lane.waiting.remove(entry)
+                    self._grant(route)
+                    future.set_result(None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "lanes": {
+                lane.name: {
+                    "in_flight": lane.in_flight,
+                    "waiting": len(lane.waiting),
+                    "admitted": lane.admitted,
+                    "shed": dict(lane.shed),
+                    "avg_wait_ms": round(lane.wait_seconds / lane.admitted * 1000, 2) if lane.admitted else 0.0,
+                    "max_wait_ms": round(lane.max_wait_seen * 1000, 2),
+                }
+                for lane in self._by_priority
+            },
+        }
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware applying an AdmissionController
+
+    Clients are identified by their token's subject (set by AuthMiddleware,
+    which must wrap this one) or else their address. Shed requests get 429
+    with Retry-After.
+    """
+
+    def __init__(self, app, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        route = self.controller.match(scope["method"], scope["path"]) if scope["type"] == "http" else None
+        if route is None:
+            await self.app(scope, receive, send)
+            return
+
+        user = scope.get("state", {}).get("user")
+        client = user["sub"] if user else (scope.get("client") or ("unknown",))[0]
+        try:
+            await self.controller.acquire(route, client)
+        except Rejected as e:
+            body = json.dumps({"detail": e.reason}).encode()
+            await send({"type": "http.response.start", "status": 429, "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, math.ceil(e.retry_after))).encode()),
+            ]})
+            await send({"type": "http.response.body", "body": body})
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(route)
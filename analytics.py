@@ -0,0 +1,486 @@
+import asyncio
+import math
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from records import TaskType
+
+# Rows per chunk; a full chunk is sealed and, with a directory, written as one file
+DEFAULT_CHUNK_ROWS = 65_536
+
+# Seconds between checkpoints of the unsealed rows; a crash loses at most these
+DEFAULT_CHECKPOINT_INTERVAL = 5.0
+
+# Percentiles of completion time reported
+DEFAULT_PERCENTILES = (50, 90, 95, 99)
+
+# Span of a throughput query without `since`
+DEFAULT_THROUGHPUT_WINDOW = timedelta(hours=24)
+
+# Upper bound on buckets returned by one throughput query
+MAX_BUCKETS = 10_000
+
+TASK_TYPES = tuple(member.value for member in TaskType)
+_TYPE_CODES = {value: code for code, value in enumerate(TASK_TYPES)}
+UNKNOWN_TYPE = 255
+
+# Kinds of assignment log entry; stored as their index
+ASSIGNMENT_KINDS = ("assignment", "priority_boost", "override", "override_removed", "step_confirmed")
+
+# Kinds that count as an operator overriding the scheduler
+OVERRIDE_KINDS = ("priority_boost", "override")
+
+TASK_COLUMNS = {
+    "completed_at": np.float64,
+    "created_at": np.float64,
+    "deadline": np.float64,
+    "type": np.uint8,
+    "overridden": np.bool_,
+}
+ASSIGNMENT_COLUMNS = {"time": np.float64, "kind": np.uint8, "type": np.uint8}
+
+INTERVALS = {"hour": timedelta(hours=1), "day": timedelta(days=1)}
+
+# Completion times are sorted by type and duration in one pass as
+# type * _TYPE_STRIDE + seconds; any duration under ~300 years fits
+_TYPE_STRIDE = 1e10
+
+
+def _timestamp(value: Optional[datetime]) -> float:
+    return value.timestamp() if isinstance(value, datetime) else math.nan
+
+
+def _type_code(value: Any) -> int:
+    return _TYPE_CODES.get(getattr(value, "value", value), UNKNOWN_TYPE)
+
+
+def _local(value: Optional[datetime]) -> Optional[datetime]:
+    """Naive local time, as the app's timestamps are"""
+    return value.astimezone().replace(tzinfo=None) if value is not None and value.tzinfo else value
+
+
+def _seconds(value: float) -> Optional[float]:
+    return round(float(value), 1) if not math.isnan(value) else None
+
+
+def _save_npz(path: str, arrays: Dict[str, np.ndarray]) -> None:
+    """Write arrays as an .npz file; a crash leaves the previous file or none, never part of one"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as file:
+        np.savez(file, **arrays)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+
+
+def _remove(path: str) -> None:
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def _sorted_percentiles(values: np.ndarray, percentiles: Sequence[float]) -> np.ndarray:
+    """np.percentile's default (linear) method, for values already sorted"""
+    if not len(values):
+        return np.full(len(percentiles), math.nan)
+    position = np.asarray(percentiles, dtype=float) / 100 * (len(values) - 1)
+    below = np.floor(position).astype(np.int64)
+    above = np.minimum(below + 1, len(values) - 1)
+    return values[below] + (values[above] - values[below]) * (position - below)
+
+
+class ColumnStore:
+    """
+    Append-only table of NumPy columns, held as chunks of chunk_rows rows
+
+    Rows go into a preallocated tail chunk. A full tail is sealed: it never
+    changes again and, with a directory, is written as one .npz file on the
+    caller's executor, off the event loop. Each chunk keeps the range of its
+    time column, so a scan of a time range skips chunks outside it without
+    touching their data. checkpoint() writes a copy of the unsealed tail
+    under the number its chunk will get; it is loaded back as the tail only
+    if that chunk was never written, so a crash loses the rows since the
+    last checkpoint and never duplicates any.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        columns: Dict[str, Any],
+        time_column: str,
+        directory: Optional[str] = None,
+        chunk_rows: int = DEFAULT_CHUNK_ROWS,
+        executor: Optional[ThreadPoolExecutor] = None
+    ):
+        """
+        Args:
+            name (str): File name prefix of the chunks, e.g. "tasks"
+            columns (dict): Column name -> NumPy dtype, in row order
+            time_column (str): Column that scans filter on
+            directory (str): Where chunks are written and loaded from; None keeps them in memory
+            chunk_rows (int): Rows per chunk
+            executor: Runs the chunk writes
+        """
+        self.name = name
+        self.columns = columns
+        self.time_column = time_column
+        self.directory = directory
+        self.chunk_rows = chunk_rows
+        self._executor = executor
+        self._lock = threading.Lock()
+        # (earliest time, latest time, columns) per sealed chunk
+        self._chunks: List[Tuple[float, float, Dict[str, np.ndarray]]] = []
+        self._next_file = 0
+        self._new_tail()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._load()
+
+    def _load(self) -> None:
+        pattern = re.compile(rf"{re.escape(self.name)}-(\d+)\.npz$")
+        files = os.listdir(self.directory)
+        numbered = sorted((int(match.group(1)), file) for file in files if (match := pattern.match(file)))
+        for number, file in numbered:
+            with np.load(os.path.join(self.directory, file)) as data:
+                self._add_chunk({column: data[column] for column in self.columns})
+            self._next_file = number + 1
+
+        tail_path = self._tail_path(self._next_file)
+        if os.path.exists(tail_path):
+            with np.load(tail_path) as data:
+                size = len(data[self.time_column])
+                if size < self.chunk_rows:
+                    for column, array in zip(self.columns, self._tail):
+                        array[:size] = data[column]
+                    self._size = self._checkpointed = size
+        # Tails of chunks written since, and writes cut short by a crash
+        stale = re.compile(rf"{re.escape(self.name)}-\d+\.(tail\.npz|npz\.tmp|tail\.npz\.tmp)$")
+        for file in files:
+            path = os.path.join(self.directory, file)
+            if stale.match(file) and path != tail_path:
+                os.remove(path)
+
+    def _tail_path(self, number: int) -> str:
+        return os.path.join(self.directory, f"{self.name}-{number:08d}.tail.npz")
+
+    def _new_tail(self) -> None:
+        self._tail = [np.empty(self.chunk_rows, dtype) for dtype in self.columns.values()]
+        self._size = 0
+        self._checkpointed = 0
+
+    def _add_chunk(self, chunk: Dict[str, np.ndarray]) -> None:
+        times = chunk[self.time_column]
+        if len(times):
+            self._chunks.append((float(times.min()), float(times.max()), chunk))
+
+    def _seal(self) -> None:
+        size = self._size
+        chunk = {
+            column: array if size == self.chunk_rows else array[:size].copy()
+            for column, array in zip(self.columns, self._tail)
+        }
+        self._add_chunk(chunk)
+        self._new_tail()
+        if self.directory:
+            number = self._next_file
+            self._next_file += 1
+            # The executor has one thread, so the checkpointed tail goes only
+            # once the chunk holding its rows is in place
+            self._executor.submit(_save_npz, os.path.join(self.directory, f"{self.name}-{number:08d}.npz"), chunk)
+            self._executor.submit(_remove, self._tail_path(number))
+
+    def append(self, row: Sequence[Any]) -> None:
+        """Append one row, values in the order of columns"""
+        with self._lock:
+            size = self._size
+            for array, value in zip(self._tail, row):
+                array[size] = value
+            self._size = size + 1
+            if self._size == self.chunk_rows:
+                self._seal()
+
+    def flush(self) -> None:
+        """Seal the tail, writing it with a directory, even if it is not full"""
+        with self._lock:
+            if self._size:
+                self._seal()
+
+    def checkpoint(self) -> None:
+        """With a directory, write a copy of the unsealed tail if rows were added since the last one"""
+        if not self.directory:
+            return
+        with self._lock:
+            if self._size == self._checkpointed:
+                return
+            tail = {column: array[:self._size].copy() for column, array in zip(self.columns, self._tail)}
+            self._checkpointed = self._size
+            path = self._tail_path(self._next_file)
+        self._executor.submit(_save_npz, path, tail)
+
+    def scan(
+        self,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        columns: Optional[Sequence[str]] = None
+    ) -> Dict[str, np.ndarray]:
+        """
+        Columns of the rows whose time is in [since, until)
+
+        Args:
+            since (float): Inclusive lower bound, seconds since the Unix epoch, or None
+            until (float): Exclusive upper bound, or None
+            columns (list): Columns to read; all of them if None
+
+        Returns:
+            dict: Column name -> array, one element per row
+        """
+        columns = list(columns or self.columns)
+        low = -math.inf if since is None else since
+        high = math.inf if until is None else until
+        with self._lock:
+            chunks = [entry for entry in self._chunks if entry[1] >= low and entry[0] < high]
+            if self._size:
+                tail = {column: array[:self._size].copy() for column, array in zip(self.columns, self._tail)}
+                times = tail[self.time_column]
+                chunks.append((float(times.min()), float(times.max()), tail))
+        parts = []
+        for earliest, latest, chunk in chunks:
+            # Only chunks straddling a bound need filtering row by row
+            if earliest < low or latest >= high:
+                times = chunk[self.time_column]
+                keep = (times >= low) & (times < high)
+                chunk = {column: chunk[column][keep] for column in columns}
+            parts.append(chunk)
+        if not parts:
+            return {column: np.empty(0, self.columns[column]) for column in columns}
+        return {column: np.concatenate([part[column] for part in parts]) for column in columns}
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"rows": sum(len(chunk[self.time_column]) for _, _, chunk in self._chunks) + self._size,
+                    "chunks": len(self._chunks)}
+
+
+class TaskHistory:
+    """
+    Columnar history of finished tasks and assignment log entries
+
+    Each task is added once, when it is DONE, and each assignment log entry
+    when it is written, so months of history stay queryable after tasks
+    leave memory for the archive. Rows are fixed-width NumPy columns (times
+    as epoch seconds, task types and log kinds as small integer codes), and
+    every report is a handful of vectorized passes over the rows in its
+    time range. Queries run on a dedicated thread, off the event loop.
+    """
+
+    def __init__(self, directory: Optional[str] = None, chunk_rows: int = DEFAULT_CHUNK_ROWS):
+        """
+        Args:
+            directory (str): Where chunk files are kept; None keeps the history in memory only
+            chunk_rows (int): Rows per chunk
+        """
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="task-history")
+        self.tasks = ColumnStore("tasks", TASK_COLUMNS, "completed_at", directory, chunk_rows, self._executor)
+        self.assignments = ColumnStore("assignments", ASSIGNMENT_COLUMNS, "time", directory, chunk_rows, self._executor)
+
+    async def _run(self, function: Callable, *args) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    # Ingestion, called from commands on the event loop
+
+    def add_task(self, task: Dict[str, Any]) -> None:
+        """Add a task that has just become DONE"""
+        self.tasks.append((
+            _timestamp(task.get("completed_at")),
+            _timestamp(task.get("created_at")),
+            _timestamp(task.get("deadline")),
+            _type_code(task.get("type")),
+            bool(task.get("operator_override")),
+        ))
+
+    def add_assignment(self, entry: Dict[str, Any], kind: str, task_type: Any = None) -> None:
+        """Add an assignment log entry of one of ASSIGNMENT_KINDS"""
+        self.assignments.append((
+            _timestamp(entry["assignment_time"]), ASSIGNMENT_KINDS.index(kind), _type_code(task_type)
+        ))
+
+    # Blocking implementations, only ever called on the history thread
+
+    def _completion_times(
+        self,
+        since: Optional[datetime],
+        until: Optional[datetime],
+        percentiles: Sequence[float]
+    ) -> Dict[str, Any]:
+        rows = self.tasks.scan(*self._range(since, until), ("completed_at", "created_at", "type"))
+        seconds = rows["completed_at"] - rows["created_at"]
+        known = ~np.isnan(seconds)
+        seconds, types = seconds[known], rows["type"][known]
+
+        # One sort orders the durations within each type; the counts per
+        # type give where each type's run starts
+        by_type = np.sort(types * _TYPE_STRIDE + seconds)
+        counts = np.bincount(types, minlength=256)
+        starts = np.concatenate(([0], np.cumsum(counts)))
+
+        def summary(values: np.ndarray) -> Dict[str, Any]:
+            return {
+                "count": int(len(values)),
+                "mean_seconds": _seconds(values.mean()) if len(values) else None,
+                "percentiles_seconds": {
+                    f"p{p:g}": _seconds(point) for p, point in zip(percentiles, _sorted_percentiles(values, percentiles))
+                },
+            }
+
+        return {
+            **summary(np.sort(seconds)),
+            "by_type": {
+                task_type: summary(by_type[starts[code]:starts[code + 1]] - code * _TYPE_STRIDE)
+                for code, task_type in enumerate(TASK_TYPES) if counts[code]
+            },
+        }
+
+    def _throughput(self, since: Optional[datetime], until: Optional[datetime], interval: str) -> Dict[str, Any]:
+        until = until or datetime.now()
+        since = since or until - DEFAULT_THROUGHPUT_WINDOW
+        step = INTERVALS[interval]
+        start = since.replace(minute=0, second=0, microsecond=0)
+        if interval == "day":
+            start = start.replace(hour=0)
+        buckets = math.ceil((until - start) / step)
+        if buckets > MAX_BUCKETS:
+            raise ValueError(f"{buckets} {interval} buckets requested; at most {MAX_BUCKETS} per query")
+        times = self.tasks.scan(since.timestamp(), until.timestamp(), ("completed_at",))["completed_at"]
+        counts = np.bincount(
+            ((times - start.timestamp()) // step.total_seconds()).astype(np.int64), minlength=max(buckets, 0)
+        )
+        peak = int(counts.argmax()) if len(times) else None
+        return {
+            "interval": interval,
+            "since": since,
+            "until": until,
+            "total": int(len(times)),
+            "peak": {"start": start + peak * step, "completed": int(counts[peak])} if peak is not None else None,
+            "buckets": [{"start": start + n * step, "completed": int(count)} for n, count in enumerate(counts.tolist())],
+        }
+
+    def _deadline_misses(self, since: Optional[datetime], until: Optional[datetime]) -> Dict[str, Any]:
+        rows = self.tasks.scan(*self._range(since, until), ("completed_at", "deadline", "type"))
+        types = rows["type"]
+        has_deadline = ~np.isnan(rows["deadline"])
+        missed = has_deadline & (rows["completed_at"] > rows["deadline"])
+        completed = np.bincount(types, minlength=256)
+        with_deadline = np.bincount(types[has_deadline], minlength=256)
+        late = np.bincount(types[missed], minlength=256)
+
+        def summary(done: int, due: int, miss: int) -> Dict[str, Any]:
+            return {
+                "completed": done,
+                "with_deadline": due,
+                "missed": miss,
+                "miss_rate": round(miss / due, 4) if due else None,
+            }
+
+        return {
+            **summary(int(len(types)), int(has_deadline.sum()), int(missed.sum())),
+            "by_type": {
+                task_type: summary(int(completed[code]), int(with_deadline[code]), int(late[code]))
+                for code, task_type in enumerate(TASK_TYPES) if completed[code]
+            },
+        }
+
+    def _overrides(self, since: Optional[datetime], until: Optional[datetime]) -> Dict[str, Any]:
+        bounds = self._range(since, until)
+        entries = self.assignments.scan(*bounds)
+        tasks = self.tasks.scan(*bounds, ("overridden",))
+        kinds = np.bincount(entries["kind"], minlength=len(ASSIGNMENT_KINDS))
+        is_override = np.isin(entries["kind"], [ASSIGNMENT_KINDS.index(kind) for kind in OVERRIDE_KINDS])
+        overrides = int(is_override.sum())
+        by_type = np.bincount(entries["type"][is_override], minlength=256)
+        completed = int(len(tasks["overridden"]))
+
+        # Per hour over the queried span, or from the first entry found until
+        # now; spans under an hour count as one, so a fresh history does not
+        # extrapolate a few overrides into thousands an hour
+        times = entries["time"]
+        first = bounds[0] if bounds[0] is not None else (float(times.min()) if len(times) else None)
+        last = bounds[1] if bounds[1] is not None else datetime.now().timestamp()
+        hours = max((last - first) / 3600, 1.0) if first is not None else None
+
+        return {
+            "overrides": overrides,
+            "by_kind": {kind: int(kinds[code]) for code, kind in enumerate(ASSIGNMENT_KINDS)},
+            "by_type": {task_type: int(by_type[code]) for code, task_type in enumerate(TASK_TYPES) if by_type[code]},
+            "per_hour": round(overrides / hours, 3) if hours else None,
+            "per_100_completed": round(overrides * 100 / completed, 2) if completed else None,
+            "completed_overridden_share": round(float(tasks["overridden"].mean()), 4) if completed else None,
+        }
+
+    @staticmethod
+    def _range(since: Optional[datetime], until: Optional[datetime]) -> Tuple[Optional[float], Optional[float]]:
+        return (since.timestamp() if since else None, until.timestamp() if until else None)
+
+    # Public API
+
+    async def completion_times(
+        self,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        percentiles: Sequence[float] = DEFAULT_PERCENTILES
+    ) -> Dict[str, Any]:
+        """
+        Completion time (created to DONE) of tasks completed in [since, until)
+
+        Returns:
+            dict: Count, mean and percentiles in seconds, overall and per task type
+        """
+        return await self._run(self._completion_times, _local(since), _local(until), percentiles)
+
+    async def throughput(
+        self,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        interval: str = "hour"
+    ) -> Dict[str, Any]:
+        """
+        Tasks completed per hour or day in [since, until)
+
+        Args:
+            since (datetime): Start of the range; DEFAULT_THROUGHPUT_WINDOW before until if None
+            until (datetime): End of the range; now if None
+            interval (str): Bucket width, a key of INTERVALS
+
+        Returns:
+            dict: The buckets, in local time, their total and the busiest bucket
+
+        Raises:
+            ValueError: If the range holds more than MAX_BUCKETS buckets
+        """
+        return await self._run(self._throughput, _local(since), _local(until), interval)
+
+    async def deadline_misses(self, since: Optional[datetime] = None, until: Optional[datetime] = None) -> Dict[str, Any]:
+        """Share of tasks completed in [since, until) after their deadline, overall and per task type"""
+        return await self._run(self._deadline_misses, _local(since), _local(until))
+
+    async def overrides(self, since: Optional[datetime] = None, until: Optional[datetime] = None) -> Dict[str, Any]:
+        """How often operators overrode the scheduler in [since, until), per hour and per completed task"""
+        return await self._run(self._overrides, _local(since), _local(until))
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {"tasks": self.tasks.stats(), "assignments": self.assignments.stats()}
+
+    def checkpoint(self) -> None:
+        """Write the unsealed rows of both stores, on the history thread"""
+        self.tasks.checkpoint()
+        self.assignments.checkpoint()
+
+    def close(self) -> None:
+        """Write the unsealed rows and wait for all writes to finish"""
+        self.tasks.flush()
+        self.assignments.flush()
+        self._executor.shutdown(wait=True)
@@ -1,26 +1,171 @@
-from fastapi import FastAPI, Depends, HTTPException, status, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, Depends, HTTPException, Request, status, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, FileResponse
+from fastapi.responses import HTMLResponse, FileResponse, PlainTextResponse, StreamingResponse
+from fastapi.encoders import jsonable_encoder
 import json
 from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Mapping, Set, Tuple
 from datetime import datetime, timedelta
-import uuid
+import secrets
 import os
-from enum import Enum
-import requests
+import time
+import asyncio
+import numpy as np
 
 # Import database models and session
 from database import SessionLocal, engine, Base
 from models import Task, Robot, AssignmentLog
+from customer_directory import CustomerDirectory
+from customer_bulk import detect_format, export_customers, import_customers
+from external_api_client import AsyncExternalApiClient
+from order_pipeline import OrderPipeline, PipelineFull, PipelineStopped
+from trip_planner import TripPlanner, build_location_index
+from event_store import EventStore, EventType, dumps as dump_state
+from records import RecordTable, RobotRecord, TaskRecord, TripRecord, TaskState, TaskType, RobotStatus
+from task_archive import DEFAULT_INTERVAL, DEFAULT_QUERY_LIMIT, DEFAULT_TTL, TaskArchive
+from analytics import DEFAULT_CHECKPOINT_INTERVAL, INTERVALS, TaskHistory
+from admission import DEFAULT_MAX_IN_FLIGHT, AdmissionController, AdmissionMiddleware
+from auth import DEFAULT_TOKEN_TTL, AuthMiddleware, Authenticator, load_users
+from response_cache import ResponseCache, ResponseCacheMiddleware
+from robot_bus import DEFAULT_ACK_TIMEOUT, CommandRejected, CommandTimeout, RobotBus, RobotOffline
+from spatial_index import FLOOR_KINDS, FloorIndex
+from robot_states import DEFAULT_SHIFT_HOURS, DEFAULT_WINDOWS, TOTAL as ROBOT_STATES_TOTAL, RobotStateTracker
+from ws_topics import InvalidSubscription, SubscriptionIndex, parse_filter
+from ws_outbox import DEFAULT_MAX_MESSAGES as DEFAULT_OUTBOX_SIZE, ConnectionOutbox
+from command_loop import CommandLoop
+from diagnostics import DEFAULT_SLOW_CALLBACK, LoopDiagnostics
+from id_allocator import IdAllocator, claim_worker_id
+from traffic_capture import CaptureMiddleware, TrafficCapture
+import structured_log
+from structured_log import DEFAULT_BACKUPS, DEFAULT_MAX_BYTES, CorrelationMiddleware, get_logger, parse_sample_rates
 
 # Create all tables
 Base.metadata.create_all(bind=engine)
 
 app = FastAPI(title="Tom Yum Robot Control Center API", version="1.0.0")
 
+# Polled read endpoints are served from pre-encoded bytes with ETags. Added
+# before CORS so CORS stays outermost and per-origin headers are never cached.
+response_cache = ResponseCache()
+response_cache.route("/api/tables", "tables")
+response_cache.route("/api/points", "points")
+response_cache.route("/api/charging/status", "charging_stations")
+response_cache.route("/api/charging/policy")
+response_cache.route("/api/robots", "robots")
+response_cache.route(
+    "/api/reports/daily", "tasks", "robots", vary=lambda: datetime.now().replace(second=0, microsecond=0)
+)
+response_cache.route("/api/reports/tasks", "tasks")
+response_cache.route("/api/reports/performance")
+app.add_middleware(ResponseCacheMiddleware, cache=response_cache)
+
+# Write routes pass admission control: per-client token buckets, a cap on
+# requests in flight and priority lanes, so robot commands and operator
+# overrides are admitted ahead of queued task and customer traffic and
+# overload sheds bulk work with 429. Added after the cache and before auth,
+# so clients are identified by their token.
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", DEFAULT_MAX_IN_FLIGHT))
+admission = AdmissionController(max_in_flight=ADMISSION_MAX_IN_FLIGHT)
+admission.lane("critical", priority=0, rate=50, burst=100, max_queue=1000)
+admission.lane("normal", priority=1, rate=50, burst=100, max_queue=256, max_wait=5.0,
+               limit=ADMISSION_MAX_IN_FLIGHT * 3 // 4)
+admission.lane("bulk", priority=2, rate=10, burst=20, max_queue=32, max_wait=2.0,
+               limit=ADMISSION_MAX_IN_FLIGHT // 8)
+admission.route("POST", "/api/robots/{robot_id}/command", "critical")
+admission.route("POST", "/api/queue/tasks/{task_id}/override", "critical")
+admission.route("DELETE", "/api/queue/tasks/{task_id}/override", "critical")
+admission.route("PUT", "/api/queue/tasks/{task_id}/priority", "critical")
+admission.route("PUT", "/api/queue/tasks/priority/batch", "critical", limit=2)
+admission.route("POST", "/api/charging/manual-request", "critical")
+admission.route("PUT", "/api/tasks/{task_id}/pause", "critical")
+admission.route("PUT", "/api/tasks/{task_id}/resume", "critical")
+admission.route("POST", "/api/tasks", "normal")
+admission.route("PUT", "/api/tasks/{task_id}/status", "normal")
+admission.route("POST", "/api/tasks/batch", "normal", limit=2)
+admission.route("PUT", "/api/tasks/status/batch", "normal", limit=2)
+admission.route("POST", "/api/tasks/{task_id}/confirm-step", "normal")
+admission.route("POST", "/api/trips/plan", "normal", limit=1)
+admission.route("POST", "/api/orders", "normal")
+admission.route("PUT", "/api/orders/{order_id}/status", "normal")
+admission.route("POST", "/api/customers", "bulk")
+admission.route("PUT", "/api/customers/{customer_id}", "bulk")
+admission.route("DELETE", "/api/customers/{customer_id}", "bulk")
+admission.route("POST", "/api/customers/import", "bulk", limit=1)
+admission.route("GET", "/api/customers/export", "bulk", limit=2)
+app.add_middleware(AdmissionMiddleware, controller=admission)
+
+# Opt-in recording of API and WebSocket traffic for replay_traffic.py,
+# started and stopped through /api/capture, or from startup to shutdown
+# with TRAFFIC_CAPTURE=1. Added after admission, so captured timings
+# include queuing and 429s, and before auth, so it sees who sent what.
+TRAFFIC_CAPTURE_DIR = os.getenv("TRAFFIC_CAPTURE_DIR", "captures")
+traffic_capture = TrafficCapture()
+app.add_middleware(CaptureMiddleware, capture=traffic_capture)
+
+# JWT signing key; without JWT_SECRET a random key is used, so tokens do
+# not survive a restart
+JWT_SECRET = os.getenv("JWT_SECRET") or secrets.token_urlsafe(32)
+ACCESS_TOKEN_TTL = float(os.getenv("ACCESS_TOKEN_TTL", DEFAULT_TOKEN_TTL))
+
+# Demo accounts, enabled only by DEMO_AUTH=1; each password is the username
+DEMO_USERS = {
+    "admin": {
+        "role": "administrator",
+        "password_hash": "$pbkdf2-sha256$29000$bS1FKAXAWItRSomRsjZGaA$xnM9HXtiUlIoFU5m52BEii37mbnElFNxApeNmqQSPPY"
+    },
+    "operator": {
+        "role": "operator",
+        "password_hash": "$pbkdf2-sha256$29000$pbS2NqY0ptQ6Rwhh7P1/Dw$dhUFtin2R86TeXVoCWQj93R6ME8EG.sOWyzbhuIhrIg"
+    },
+    "viewer": {
+        "role": "viewer",
+        "password_hash": "$pbkdf2-sha256$29000$gzBGyBlD6N373/u/t3YuxQ$NRE.8Gx91jhYKFgS.BdEaGLnAGXvABH2XfnG1jRasFA"
+    },
+    # Robot agents: one account per robot, named after its id, which may
+    # only attach to /ws/robots/{its id}
+    "R1": {
+        "role": "robot",
+        "password_hash": "$pbkdf2-sha256$29000$t1YqJQTgPMfYu7d2DsG4Nw$M1rP.GN/VbmglOcQtX4Mj.fLxOJtZTRnFH.PeU0jzlE"
+    },
+    "R2": {
+        "role": "robot",
+        "password_hash": "$pbkdf2-sha256$29000$DOH8f.8dA.B8DyGEcI4x5g$GJMU0oLqfE1GkzgmF3tKnWsf4zuPck2OqqAYau4vka0"
+    },
+    "R3": {
+        "role": "robot",
+        "password_hash": "$pbkdf2-sha256$29000$W.tdq7U2RojRes/ZW.t9bw$WG98PTix2GTV/5148eOir.JDFUj/MVwmLc6ifVIxqAo"
+    },
+    "R4": {
+        "role": "robot",
+        "password_hash": "$pbkdf2-sha256$29000$cg7BWMu5NybkPCfk/F9rzQ$RvKA6UHT/v1VAcjz68s7ji2TFN2tdpH6ZmslNyg/Jus"
+    }
+}
+
+# Accounts come from AUTH_USERS_FILE, a JSON object of username ->
+# {"role", "password_hash"}. Without it the server refuses to start, unless
+# DEMO_AUTH=1 explicitly enables the demo accounts.
+AUTH_USERS_FILE = os.getenv("AUTH_USERS_FILE")
+if AUTH_USERS_FILE:
+    AUTH_USERS = load_users(AUTH_USERS_FILE)
+elif os.getenv("DEMO_AUTH") == "1":
+    AUTH_USERS = DEMO_USERS
+else:
+    raise RuntimeError("No accounts configured: set AUTH_USERS_FILE, or DEMO_AUTH=1 for the demo accounts")
+
+# Every /api request and WebSocket needs a valid token. Added after the
+# response cache so it wraps it: cached responses are served only to
+# authenticated clients.
+authenticator = Authenticator(JWT_SECRET, AUTH_USERS, token_ttl=ACCESS_TOKEN_TTL)
+app.add_middleware(
+    AuthMiddleware,
+    authenticator=authenticator,
+    public_paths=("/api/auth/login",),
+    self_service_paths=("/api/auth/logout",),
+    read_only_roles=("viewer", "robot")
+)
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -28,98 +173,63 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID"],
 )
 
-# Serve static files from React build
-@app.get("/{full_path:path}", response_class=HTMLResponse)
-async def serve_react_app(full_path: str):
-    # For API routes, let them pass through
-    if full_path.startswith("api/") or full_path.startswith("static/"):
-        return
-    
-    # Try to serve static files first
-    try:
-        return FileResponse(f"dist/{full_path}")
-    except FileNotFoundError:
-        pass
-    
-    # For all other routes, serve index.html for React Router
-    try:
-        return FileResponse("dist/index.html")
-    except FileNotFoundError:
-        raise HTTPException(status_code=404, detail="Frontend not built. Run 'npm run build' first.")
+# Structured JSON logs: handlers only queue records and a writer thread
+# writes them in batches to stdout, or to LOG_FILE rotated at
+# LOG_MAX_BYTES. Noisy events are sampled (LOG_SAMPLE_RATES, e.g.
+# "http.request=0.1,commands.broadcast=1"); repeated warnings and errors
+# are rate limited. Added last, so every request gets its correlation id
+# (X-Request-ID) before anything else runs.
+structured_log.configure(
+    path=os.getenv("LOG_FILE") or None,
+    level=os.getenv("LOG_LEVEL", "info"),
+    sample_rates=parse_sample_rates(os.getenv("LOG_SAMPLE_RATES", "commands.broadcast=0.1")),
+    max_bytes=int(os.getenv("LOG_MAX_BYTES", DEFAULT_MAX_BYTES)),
+    backups=int(os.getenv("LOG_BACKUPS", DEFAULT_BACKUPS))
+)
+app.add_middleware(CorrelationMiddleware)
+log = get_logger("app")
 
 # OAuth2 scheme
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
 # In-memory data storage for demo purposes
 # In production, this would be stored in the database
-class TaskState(str, Enum):
-    WAITING = "WAITING"
-    READY = "READY"
-    CLAIMED = "CLAIMED"
-    RUNNING = "RUNNING"
-    PAUSED = "PAUSED"
-    DONE = "DONE"
-
-class TaskType(str, Enum):
-    ORDERING = "ordering"
-    DELIVERY = "delivery"
-    COLLECTION = "collection"
-    PAYMENT = "payment"
-    CHARGING = "charging"
-
-class RobotStatus(str, Enum):
-    IDLE = "IDLE"
-    MOVING = "MOVING"
-    CHARGING = "CHARGING"
-    ERROR = "ERROR"
-
 # External API configuration
 EXTERNAL_API_URL = os.getenv("EXTERNAL_API_URL", "https://your-external-api.com/api")
 EXTERNAL_API_KEY = os.getenv("EXTERNAL_API_KEY", "")
 
-# Function to send data to external API
-def send_to_external_api(endpoint: str, data: Dict[str, Any]) -> Dict[str, Any]:
-    """
-    Send data to external API
-    
-    Args:
-        endpoint (str): API endpoint
-        data (dict): Data to send
-        
-    Returns:
-        dict: Response from external API
-    """
-    if not EXTERNAL_API_URL:
-        print("External API URL not configured")
-        return {"message": "External API not configured"}
-    
-    try:
-        headers = {
-            "Content-Type": "application/json"
-        }
-        
-        if EXTERNAL_API_KEY:
-            headers["Authorization"] = f"Bearer {EXTERNAL_API_KEY}"
-        
-        response = requests.post(
-            f"{EXTERNAL_API_URL}/{endpoint}",
-            json=data,
-            headers=headers,
-            timeout=30
-        )
-        
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        print(f"Error sending data to external API: {e}")
-        return {"error": str(e)}
+# Shared async client; the only path to the external API. None disables syncing.
+external_api: Optional[AsyncExternalApiClient] = (
+    AsyncExternalApiClient(EXTERNAL_API_URL, EXTERNAL_API_KEY or None) if EXTERNAL_API_URL else None
+)
+
+@app.on_event("shutdown")
+async def close_external_api():
+    if external_api:
+        await external_api.aclose()
+
+# Ids for tasks, trips, orders, customers and assignment logs are
+# time-ordered and unique across worker processes. Each process claims a
+# worker id once at startup: WORKER_ID if set (required when workers run
+# on several hosts), else a free lease in WORKER_LEASE_DIR on this host.
+if os.getenv("WORKER_ID"):
+    WORKER_ID = int(os.getenv("WORKER_ID"))
+else:
+    WORKER_ID, worker_lease = claim_worker_id(os.getenv("WORKER_LEASE_DIR", "worker_leases"))
+ids = IdAllocator(WORKER_ID)
+
+# The venue whose fleet this process holds. Each venue's state is a shard
+# in its own worker process; venue_gateway.py routes /venues/{venue_id}/...
+# to it, so venues never share state, an event loop or a CPU.
+VENUE_ID = os.getenv("VENUE_ID", "default")
 
 # Global state management
 class SystemState:
     def __init__(self):
-        self.robots: List[Dict[str, Any]] = [
+        self.robots = RecordTable(RobotRecord, [
             {
                 "id": "R1",
                 "current_location": "Kitchen",
@@ -152,9 +262,9 @@ class SystemState:
                 "current_task_id": None,
                 "last_active": datetime.now()
             }
-        ]
+        ])
         
-        self.tasks: List[Dict[str, Any]] = [
+        self.tasks = RecordTable(TaskRecord, [
             {
                 "id": "T-101",
                 "type": TaskType.DELIVERY,
@@ -220,7 +330,7 @@ class SystemState:
                 "assigned_robot": None,
                 "created_at": datetime.now() - timedelta(minutes=1)
             }
-        ]
+        ])
         
         self.assignment_logs: List[Dict[str, Any]] = [
             {
@@ -293,7 +403,7 @@ class SystemState:
             }
         ]
         
-        self.customers: List[Dict[str, Any]] = [
+        self.customers: CustomerDirectory = CustomerDirectory([
             {
                 "id": 1,
                 "name": "John Smith",
@@ -327,33 +437,466 @@ class SystemState:
                 "lastVisit": "2024-06-18",
                 "membership": "vip"
             }
-        ]
+        ], id_source=ids.next_int)
+        
+        # Consolidated multi-stop trips planned by the trip planner; a trip
+        # is dropped once all its tasks have been archived
+        self.trips = RecordTable(TripRecord)
         
         self.active_connections: List[WebSocket] = []
 
 # Initialize system state
 system_state = SystemState()
 
-# WebSocket manager for real-time updates
+# Runtime collections kept in the event log. Tables and points are floor
+# configuration and always come from the code.
+STATE_COLLECTIONS = ("robots", "tasks", "assignment_logs", "charging_stations", "orders", "trips", "customers")
+
+# Every mutation is appended to this log; an empty EVENT_STORE_DIR disables it
+EVENT_STORE_DIR = os.getenv("EVENT_STORE_DIR", "event_store")
+event_store: Optional[EventStore] = EventStore(EVENT_STORE_DIR) if EVENT_STORE_DIR else None
+
+# Collections held in RecordTables rather than plain lists
+RECORD_TABLES = {"robots": RobotRecord, "tasks": TaskRecord, "trips": TripRecord}
+
+def capture_state() -> Dict[str, List[Dict[str, Any]]]:
+    return {
+        name: system_state.customers.all() if name == "customers" else list(getattr(system_state, name))
+        for name in STATE_COLLECTIONS
+    }
+
+def snapshot_copy() -> Dict[str, List[Dict[str, Any]]]:
+    """capture_state() with every entity copied, for pickling off the loop"""
+    return {name: [dict(entity.items()) for entity in entities] for name, entities in capture_state().items()}
+
+def restore_state(collections: Dict[str, List[Dict[str, Any]]]):
+    for name in STATE_COLLECTIONS:
+        entities = collections.get(name, [])
+        if name == "customers":
+            system_state.customers = CustomerDirectory(entities, id_source=ids.next_int)
+        elif name in RECORD_TABLES:
+            setattr(system_state, name, RecordTable(RECORD_TABLES[name], entities))
+        else:
+            setattr(system_state, name, entities)
+
+def record(collection: str, entity: Dict[str, Any]):
+    """Append the current version of an entity to the event log"""
+    response_cache.bump(collection)
+    floor_index.sync(collection, entity)
+    robot_states.sync(collection, entity)
+    if event_store:
+        event_store.append(EventType.SAVED, collection, entity)
+
+def record_deleted(collection: str, entity_id: Any):
+    response_cache.bump(collection)
+    floor_index.discard(collection, entity_id)
+    robot_states.discard(collection, entity_id)
+    if event_store:
+        event_store.append(EventType.DELETED, collection, entity_id)
+
+# Recover before anything below captures references into system_state. A
+# fresh store starts from the demo data, snapshotted so it is durable.
+if event_store:
+    recovered = event_store.recover()
+    if recovered is not None:
+        restore_state(recovered)
+    else:
+        event_store.snapshot(capture_state())
+
+def snapshot_if_due():
+    """
+    Start a background snapshot once the log has grown enough
+
+    Runs on the command loop between batches, so the copy is consistent
+    at the log's current sequence; pickling and fsyncing it happen on the
+    event store's thread.
+    """
+    if event_store and event_store.snapshot_due():
+        started = time.perf_counter()
+        sequence = event_store.sequence
+        event_store.snapshot_in_background(snapshot_copy()).add_done_callback(
+            lambda future: future.exception() and log.error(
+                "event_store.snapshot_failed", sequence=sequence, error=str(future.exception())))
+        log.info("event_store.snapshot_started", sequence=sequence,
+                 copy_ms=round((time.perf_counter() - started) * 1000, 2))
+
+@app.on_event("shutdown")
+async def close_event_store():
+    # A clean shutdown leaves a snapshot, so the next start replays nothing
+    if event_store:
+        event_store.snapshot(capture_state())
+        event_store.close()
+
+def event_topics(event_type: str, data: Any) -> Dict[str, Set[str]]:
+    """
+    Topics a broadcast event can be subscribed by
+
+    The kind is the event type's prefix in the singular ("task_updated" and
+    "tasks_archived" are both "task"). Robots, task types and locations
+    are collected from every entity in the payload, including nested ones
+    such as the robot and station of a charging update. Tables match by
+    location name ("Table 5") and, for orders, also by table id.
+    """
+    prefix = event_type.split("_", 1)[0]
+    topics = {
+        "event": {event_type},
+        "kind": {prefix[:-1] if prefix.endswith("s") else prefix},
+        "robot": set(),
+        "task_type": set(),
+        "table": set()
+    }
+    items = list(data) if isinstance(data, list) else [data]
+    while items:
+        item = items.pop()
+        if not isinstance(item, Mapping):
+            continue
+        items.extend(value for value in item.values() if isinstance(value, Mapping))
+        for key in ("assigned_robot", "robot_id"):
+            if item.get(key):
+                topics["robot"].add(item[key])
+        if "battery_level" in item:
+            topics["robot"].add(item["id"])
+        if "waypoints" in item or "route" in item:
+            topics["task_type"].add(getattr(item.get("type"), "value", item.get("type")))
+            topics["table"].update(item.get("waypoints") or item.get("route") or ())
+        if item.get("table_id"):
+            topics["table"].update(filter(None, (item["table_id"], table_location(item["table_id"]))))
+    return topics
+
+# WebSocket manager for real-time updates. Messages go through each
+# connection's bounded outbox, so a slow client never holds up the others
+# or the command loop; one that falls too far behind is disconnected.
 class ConnectionManager:
-    def __init__(self):
+    def __init__(self, outbox_size: int = DEFAULT_OUTBOX_SIZE):
         self.active_connections: List[WebSocket] = []
+        self.subscriptions = SubscriptionIndex()
+        self.outboxes: Dict[WebSocket, ConnectionOutbox] = {}
+        self.outbox_size = outbox_size
+        self.dropped_connections = 0
 
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
+        self.attach(websocket)
+
+    def attach(self, websocket: WebSocket):
+        """Register an accepted connection and start its outbox"""
         self.active_connections.append(websocket)
+        self.outboxes[websocket] = ConnectionOutbox(
+            websocket.send_text, lambda reason: self._drop(websocket), self.outbox_size
+        )
+        # Until a client subscribes it receives every event, as before
+        self.subscriptions.subscribe(websocket, DEFAULT_SUBSCRIPTION, {})
 
     def disconnect(self, websocket: WebSocket):
+        outbox = self.outboxes.pop(websocket, None)
+        if outbox is None:
+            return
+        outbox.close()
         self.active_connections.remove(websocket)
+        self.subscriptions.remove_connection(websocket)
+
+    def _drop(self, websocket: WebSocket):
+        # The outbox overflowed or its send failed: forget the client and
+        # close the socket, which ends its handler's receive loop
+        self.dropped_connections += 1
+        self.disconnect(websocket)
+        close = getattr(websocket, "close", None)
+        if close is not None:
+            asyncio.ensure_future(close(code=status.WS_1013_TRY_AGAIN_LATER)).add_done_callback(
+                lambda future: future.cancelled() or future.exception()
+            )
+
+    async def drain(self, timeout: Optional[float] = None):
+        """Wait until every connection's outbox has sent what is queued"""
+        await asyncio.gather(*(outbox.drain(timeout) for outbox in list(self.outboxes.values())))
+
+    def handle_message(self, websocket: WebSocket, message: str) -> Dict[str, Any]:
+        """
+        Apply a subscription command from a client and return the reply
+
+        Commands are JSON objects:
+            {"action": "subscribe", "id": "kitchen", "filter": {"kind": "task", "task_type": "delivery"}}
+            {"action": "unsubscribe", "id": "kitchen"}
+            {"action": "subscriptions"}
+        The first subscribe replaces the default subscription to every event.
+        """
+        try:
+            command = json.loads(message)
+            if not isinstance(command, dict):
+                raise InvalidSubscription("message must be a JSON object")
+            action = command.get("action")
+            if action == "subscribe":
+                sub_id = str(command.get("id") or "default")
+                subscription_filter = parse_filter(command.get("filter", {}))
+                if sub_id != DEFAULT_SUBSCRIPTION:
+                    self.subscriptions.unsubscribe(websocket, DEFAULT_SUBSCRIPTION)
+                subscription = self.subscriptions.subscribe(websocket, sub_id, subscription_filter)
+                return {"type": "subscribed", "data": subscription.to_dict()}
+            if action == "unsubscribe":
+                removed = self.subscriptions.unsubscribe(websocket, str(command.get("id")))
+                return {"type": "unsubscribed", "data": {"id": command.get("id"), "removed": removed}}
+            if action == "subscriptions":
+                return {"type": "subscriptions", "data": [s.to_dict() for s in self.subscriptions.subscriptions(websocket)]}
+            raise InvalidSubscription("action must be subscribe, unsubscribe or subscriptions")
+        except (ValueError, InvalidSubscription) as e:
+            return {"type": "error", "data": {"detail": str(e)}}
 
     async def send_personal_message(self, message: str, websocket: WebSocket):
-        await websocket.send_text(message)
+        outbox = self.outboxes.get(websocket)
+        if outbox is not None:
+            outbox.put(message)
+
+    async def broadcast_event(self, event_type: str, data: Any):
+        await self.broadcast_events([(event_type, data)])
+
+    async def broadcast_events(self, events: List[Tuple[str, Any]]):
+        """
+        Send events to the connections subscribed to them
+
+        Each event is encoded once. A connection matching several events
+        gets them in a single {"type": "batch", "data": [...]} message.
+        Messages are only queued on the outboxes; nothing here waits on a
+        client.
+        """
+        per_connection: Dict[WebSocket, List[int]] = {}
+        for n, (event_type, data) in enumerate(events):
+            for connection in self.subscriptions.match(event_topics(event_type, data)):
+                per_connection.setdefault(connection, []).append(n)
+        if not per_connection:
+            return
+        # jsonable_encoder handles the datetimes and enums held in system state
+        encoded: Dict[int, str] = {}
+        for connection, indices in per_connection.items():
+            for n in indices:
+                if n not in encoded:
+                    event_type, data = events[n]
+                    encoded[n] = json.dumps({"type": event_type, "data": jsonable_encoder(data)})
+            if len(indices) == 1:
+                message = encoded[indices[0]]
+            else:
+                message = '{"type": "batch", "data": [' + ", ".join(encoded[n] for n in indices) + ']}'
+            outbox = self.outboxes.get(connection)
+            if outbox is not None:
+                outbox.put(message)
+
+# Subscription every new connection starts with; it matches every event
+DEFAULT_SUBSCRIPTION = "default"
+
+# Messages a WebSocket client may fall behind by before it is disconnected
+WS_OUTBOX_SIZE = int(os.getenv("WS_OUTBOX_SIZE", DEFAULT_OUTBOX_SIZE))
+manager = ConnectionManager(WS_OUTBOX_SIZE)
+
+# Every mutation handler submits its change here; one writer applies them
+# in batches and broadcasts each batch's events together
+command_loop = CommandLoop(manager.broadcast_events, after_batch=snapshot_if_due)
+
+@app.on_event("startup")
+async def start_command_loop():
+    await command_loop.start()
+
+@app.on_event("shutdown")
+async def stop_command_loop():
+    await command_loop.stop()
+
+# Loop lag, slow callback and per-handler CPU monitoring; cheap enough to
+# leave on (see benchmarks/diagnostics_bench.py). DIAGNOSTICS=0 turns it off.
+DIAGNOSTICS_ENABLED = os.getenv("DIAGNOSTICS", "1") not in ("", "0", "false")
+SLOW_CALLBACK_MS = float(os.getenv("SLOW_CALLBACK_MS", DEFAULT_SLOW_CALLBACK * 1000))
+diagnostics = LoopDiagnostics(slow_callback=SLOW_CALLBACK_MS / 1000)
+
+@app.on_event("startup")
+async def start_diagnostics():
+    if DIAGNOSTICS_ENABLED:
+        diagnostics.register_endpoints(getattr(route, "endpoint", None) for route in app.routes)
+        diagnostics.start()
+
+@app.on_event("shutdown")
+async def stop_diagnostics():
+    await diagnostics.stop()
+
+# Base priority and time to deadline per task type
+TASK_BASE_PRIORITIES = {
+    "delivery": 100,
+    "payment": 80,
+    "ordering": 70,
+    "collection": 50,
+    "charging": 40
+}
+
+TASK_DEADLINES = {
+    "delivery": timedelta(minutes=10),
+    "payment": timedelta(minutes=10),
+    "ordering": timedelta(minutes=10),
+    "collection": timedelta(minutes=20),
+    "charging": timedelta(minutes=30)
+}
+
+def build_task(task_type: str, waypoints: List[str], order_id: Optional[str] = None) -> Dict[str, Any]:
+    """Create a READY task, append it to the task list and return it"""
+    base_priority = TASK_BASE_PRIORITIES.get(task_type, 50)
+    now = datetime.now()
+    new_task = system_state.tasks.add({
+        "id": ids.next_id("T"),
+        "type": task_type,
+        "base_priority": base_priority,
+        "release_time": now,
+        "deadline": now + TASK_DEADLINES.get(task_type, timedelta(minutes=15)),
+        "operator_override": 0,
+        "effective_priority": base_priority,
+        "waypoints": waypoints,
+        "state": TaskState.READY,
+        "assigned_robot": None,
+        "order_id": order_id,
+        "created_at": now
+    })
+    record("tasks", new_task)
+    return new_task
 
-    async def broadcast(self, message: str):
-        for connection in self.active_connections:
-            await connection.send_text(message)
+def table_location(table_id: str) -> Optional[str]:
+    table = next((t for t in system_state.tables if t["id"] == table_id), None)
+    return table["name"] if table else None
+
+# Orders flow through the kitchen in the background; handlers only enqueue
+order_pipeline = OrderPipeline(
+    system_state.orders,
+    create_task=build_task,
+    publish=manager.broadcast_event,
+    table_name=table_location,
+    on_order_saved=lambda order: record("orders", order),
+    new_id=lambda: ids.next_id("O")
+)
 
-manager = ConnectionManager()
+# Groups READY delivery/collection tasks into multi-stop trips over the floor plan
+trip_planner = TripPlanner(build_location_index(system_state.tables, system_state.points))
+
+# Nearest-robot/charger/table queries; robots and stations re-sync in record()
+floor_index = FloorIndex(
+    system_state.tables, system_state.points, system_state.robots, system_state.charging_stations
+)
+
+# Time each robot spends IDLE, MOVING, CHARGING and in ERROR, fed by
+# record(). The clock reads datetime.now() so simulated time drives it too.
+ROBOT_SHIFT_HOURS = float(os.getenv("ROBOT_SHIFT_HOURS", DEFAULT_SHIFT_HOURS))
+robot_states = RobotStateTracker(
+    system_state.robots,
+    clock=lambda: datetime.now().timestamp(),
+    windows={**DEFAULT_WINDOWS, "shift": ROBOT_SHIFT_HOURS * 3600}
+)
+
+# DONE tasks move to the archived_tasks table TASK_ARCHIVE_TTL seconds after
+# completion, so the in-memory task set stays proportional to open work
+TASK_ARCHIVE_TTL = float(os.getenv("TASK_ARCHIVE_TTL", DEFAULT_TTL))
+TASK_ARCHIVE_INTERVAL = float(os.getenv("TASK_ARCHIVE_INTERVAL", DEFAULT_INTERVAL))
+task_archive = TaskArchive(SessionLocal)
+task_archiver: Optional[asyncio.Task] = None
+
+async def archive_finished_tasks(now: Optional[datetime] = None) -> List[str]:
+    """Move tasks DONE for longer than TASK_ARCHIVE_TTL to the archive and return their ids"""
+    expired = await command_loop.submit(expired_tasks, now or datetime.now())
+    if not expired:
+        return []
+    await task_archive.put(expired)
+    return await command_loop.submit(drop_archived_tasks, expired)
+
+def expired_tasks(now: datetime) -> List[Dict[str, Any]]:
+    """Tasks DONE for longer than TASK_ARCHIVE_TTL at `now`"""
+    tasks = system_state.tasks
+    done = tasks.mask(state=TaskState.DONE)
+    completed_at = tasks.column("completed_at")
+    # Tasks finished before completion times were kept start their TTL now
+    for task in tasks.select(done & np.isnan(completed_at)):
+        task["completed_at"] = now
+        record("tasks", task)
+    return tasks.select(done & (tasks.column("completed_at") <= now.timestamp() - TASK_ARCHIVE_TTL))
+
+def drop_archived_tasks(expired: List[Dict[str, Any]]) -> List[str]:
+    """Remove archived tasks from memory, except any reopened while the archive write was in flight"""
+    tasks = system_state.tasks
+    archived = [
+        task["id"] for task in expired
+        if task["state"] == TaskState.DONE and tasks.get(task["id"]) is task
+    ]
+    tasks.remove_many(archived)
+    for task_id in archived:
+        record_deleted("tasks", task_id)
+    if archived:
+        command_loop.emit("tasks_archived", {"task_ids": archived})
+    drop_finished_trips({task["trip_id"] for task in expired if task.get("trip_id")})
+    return archived
+
+def drop_finished_trips(trip_ids: Set[str]):
+    """Remove the trips, of those given, none of whose tasks is left in memory"""
+    tasks = system_state.tasks
+    finished = [
+        trip_id for trip_id in trip_ids
+        if (trip := system_state.trips.get(trip_id)) is not None
+        and not any(task_id in tasks for task_id in trip["task_ids"])
+    ]
+    system_state.trips.remove_many(finished)
+    for trip_id in finished:
+        record_deleted("trips", trip_id)
+
+async def run_task_archiver():
+    while True:
+        await asyncio.sleep(TASK_ARCHIVE_INTERVAL)
+        try:
+            await archive_finished_tasks()
+        except Exception as e:
+            log.error("task_archive.failed", error=str(e))
+
+@app.on_event("startup")
+async def start_task_archiver():
+    global task_archiver
+    task_archiver = asyncio.create_task(run_task_archiver())
+
+@app.on_event("shutdown")
+async def stop_task_archiver():
+    if task_archiver:
+        task_archiver.cancel()
+    task_archive.close()
+
+# Finished tasks and assignment log entries, kept as NumPy columns for the
+# history reports; an empty ANALYTICS_DIR keeps them in memory only
+ANALYTICS_DIR = os.getenv("ANALYTICS_DIR", "analytics")
+task_history = TaskHistory(ANALYTICS_DIR or None)
+task_history_checkpointer: Optional[asyncio.Task] = None
+
+# Rows not yet in a full chunk are written this often, in seconds
+TASK_HISTORY_CHECKPOINT_INTERVAL = float(os.getenv("TASK_HISTORY_CHECKPOINT_INTERVAL", DEFAULT_CHECKPOINT_INTERVAL))
+
+async def run_task_history_checkpoints():
+    while True:
+        await asyncio.sleep(TASK_HISTORY_CHECKPOINT_INTERVAL)
+        try:
+            task_history.checkpoint()
+        except Exception as e:
+            log.error("task_history.checkpoint_failed", error=str(e))
+
+@app.on_event("startup")
+async def start_task_history_checkpoints():
+    global task_history_checkpointer
+    if ANALYTICS_DIR:
+        task_history_checkpointer = asyncio.create_task(run_task_history_checkpoints())
+
+@app.on_event("shutdown")
+async def close_task_history():
+    if task_history_checkpointer:
+        task_history_checkpointer.cancel()
+    task_history.close()
+
+def log_assignment(task: Dict[str, Any], log_entry: Dict[str, Any], kind: str):
+    """Append an entry of one of analytics.ASSIGNMENT_KINDS to the assignment log; call from a command"""
+    system_state.assignment_logs.append(log_entry)
+    record("assignment_logs", log_entry)
+    task_history.add_assignment(log_entry, kind, task["type"])
+
+@app.on_event("startup")
+async def start_order_pipeline():
+    await order_pipeline.start()
+
+@app.on_event("shutdown")
+async def stop_order_pipeline():
+    await order_pipeline.stop()
 
 # Dependency
 def get_db():
@@ -391,11 +934,28 @@ class Order(BaseModel):
     status: str
     created_at: datetime
 
+class OrderCreate(BaseModel):
+    table_id: str
+    items: List[dict]
+
+class OrderStatusUpdate(BaseModel):
+    status: str
+
 class TaskCreate(BaseModel):
     type: str
     table: str
     priority: str
 
+class TaskBatchCreate(BaseModel):
+    tasks: List[TaskCreate]
+
+class TaskStatusChange(BaseModel):
+    task_id: str
+    state: str
+
+class TaskStatusBatch(BaseModel):
+    updates: List[TaskStatusChange]
+
 class RobotCommand(BaseModel):
     command: str
 
@@ -403,6 +963,14 @@ class PriorityUpdate(BaseModel):
     boost: int
     reason: str
 
+class TaskPriorityChange(BaseModel):
+    task_id: str
+    boost: int
+    reason: str
+
+class TaskPriorityBatch(BaseModel):
+    updates: List[TaskPriorityChange]
+
 class TaskOverride(BaseModel):
     boost: int
     reason: str
@@ -423,29 +991,54 @@ class CustomerUpdate(BaseModel):
     membership: Optional[str] = None
 
 # Authentication endpoints
+def require_role(*roles: str):
+    """Dependency rejecting tokens whose role is not one of roles"""
+    async def check(request: Request) -> Dict[str, Any]:
+        user = request.state.user
+        if user["role"] not in roles:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Insufficient role")
+        return user
+    return check
+
 @app.post("/api/auth/login", response_model=Token)
 async def login(form_data: OAuth2PasswordRequestForm = Depends()):
-    # In a real application, you would verify credentials against a database
-    # For demo purposes, we'll accept any non-empty username/password
-    if not form_data.username or not form_data.password:
+    # Password hashes are checked on a worker thread, off the event loop
+    user = await authenticator.authenticate(form_data.username, form_data.password)
+    if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    # Generate a fake token for demo
-    token = str(uuid.uuid4())
+    token = authenticator.issue(form_data.username, user["role"])
     return {"access_token": token, "token_type": "bearer"}
 
 @app.post("/api/auth/logout")
-async def logout():
+async def logout(token: str = Depends(oauth2_scheme)):
+    authenticator.revoke(token)
     return {"message": "Logged out successfully"}
 
+@app.post("/api/auth/revoke")
+async def revoke_user_tokens(revoke_data: dict, admin: Dict[str, Any] = Depends(require_role("administrator"))):
+    username = revoke_data.get("username")
+    if not username:
+        raise HTTPException(status_code=400, detail="Username is required")
+    evicted = authenticator.revoke_user(username)
+    return {"message": f"Tokens issued to {username} revoked", "evicted": evicted}
+
 @app.get("/api/auth/me")
-async def get_current_user(token: str = Depends(oauth2_scheme)):
-    # In a real application, you would verify the token
-    return {"username": "admin", "role": "administrator"}
+async def get_current_user(request: Request, token: str = Depends(oauth2_scheme)):
+    user = request.state.user
+    return {"username": user["sub"], "role": user["role"]}
+
+@app.get("/api/auth/metrics")
+async def get_auth_metrics():
+    return authenticator.stats()
+
+@app.on_event("shutdown")
+async def close_authenticator():
+    authenticator.close()
 
 # Tables endpoints
 @app.get("/api/tables", response_model=List[Table])
@@ -473,8 +1066,55 @@ async def get_point(point_id: str):
 
 @app.get("/api/points/type/{point_type}", response_model=List[Point])
 async def get_points_by_type(point_type: str):
-    points = [p for p in system_state.points if p["type"] == point_type]
-    return points
+    return floor_index.points_by_type.get(point_type, [])
+
+# Spatial query endpoints
+@app.get("/api/spatial/nearest")
+async def get_nearest(
+    kind: str,
+    near: Optional[str] = None,
+    x: Optional[float] = None,
+    y: Optional[float] = None,
+    k: int = 1,
+    status: Optional[str] = None,
+    type: Optional[str] = None,
+    max_distance: Optional[float] = None
+):
+    """
+    Closest robots, tables, points or chargers to a location
+
+    The origin is either `near`, a table/point name or a robot id, or `x`
+    and `y`. `status` (robots, tables, chargers) and `type` (points) take
+    comma-separated values, e.g. ?kind=robot&near=Table 5&status=IDLE&k=3
+    """
+    if kind not in FLOOR_KINDS:
+        raise HTTPException(status_code=400, detail=f"kind must be one of {', '.join(FLOOR_KINDS)}")
+    if not 1 <= k <= 100:
+        raise HTTPException(status_code=400, detail="k must be between 1 and 100")
+
+    if near is not None:
+        origin = floor_index.locate(near)
+        robot = system_state.robots.get(near) if origin is None else None
+        if robot is not None:
+            origin = floor_index.robot_position(robot)
+        if origin is None:
+            raise HTTPException(status_code=404, detail=f"Location '{near}' is not on the floor plan")
+    elif x is not None and y is not None:
+        origin = (x, y)
+    else:
+        raise HTTPException(status_code=400, detail="Either near or both x and y are required")
+
+    groups = status if kind != "point" else type
+    found = floor_index.nearest(
+        kind, origin, k,
+        groups=groups.split(",") if groups else None,
+        max_distance=max_distance
+    )
+    return {
+        "kind": kind,
+        "origin": {"x": origin[0], "y": origin[1]},
+        "results": [{**entity, "distance": round(distance, 2)} for distance, entity in found]
+    }
 
 # Orders endpoints
 @app.get("/api/orders", response_model=List[Order])
@@ -483,113 +1123,335 @@ async def get_orders():
 
 @app.get("/api/orders/{order_id}")
 async def get_order(order_id: str):
-    order = next((o for o in system_state.orders if o["id"] == order_id), None)
+    order = order_pipeline.get_order(order_id)
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
     return order
 
+# New orders and kitchen transitions are accepted (202) and processed by the
+# pipeline; a full pipeline sheds load with 503 rather than blocking.
+@app.post("/api/orders", status_code=202)
+async def create_order(order: OrderCreate):
+    if not table_location(order.table_id):
+        raise HTTPException(status_code=404, detail="Table not found")
+    try:
+        accepted = order_pipeline.submit_order(order.table_id, order.items)
+    except (PipelineFull, PipelineStopped) as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    return {"message": "Order accepted", "order": accepted}
+
+@app.put("/api/orders/{order_id}/status", status_code=202)
+async def update_order_status(order_id: str, status_update: OrderStatusUpdate):
+    try:
+        order_pipeline.submit_status(order_id, status_update.status)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Order not found")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except (PipelineFull, PipelineStopped) as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    return {"message": f"Order {order_id} status change to {status_update.status} accepted"}
+
+@app.get("/api/commands/metrics")
+async def get_command_metrics():
+    return command_loop.metrics()
+
+@app.get("/api/admission/metrics")
+async def get_admission_metrics():
+    return admission.stats()
+
+@app.get("/api/diagnostics/metrics")
+async def get_diagnostics_metrics():
+    return diagnostics.stats()
+
+@app.get("/api/diagnostics/profile", response_class=PlainTextResponse)
+async def profile_event_loop(
+    seconds: float = 5.0,
+    interval_ms: float = 5.0,
+    admin: Dict[str, Any] = Depends(require_role("administrator"))
+):
+    """Sample the event loop's stacks for `seconds`; collapsed stacks for flamegraph.pl or speedscope"""
+    if not 0 < seconds <= 60 or not 1 <= interval_ms <= 100:
+        raise HTTPException(status_code=400, detail="seconds must be in (0, 60] and interval_ms in [1, 100]")
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(None, diagnostics.profile, seconds, interval_ms / 1000)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.get("/api/venue")
+async def get_venue():
+    return {"venue_id": VENUE_ID, "worker_id": WORKER_ID, "pid": os.getpid()}
+
+@app.get("/api/logs/metrics")
+async def get_log_metrics():
+    return structured_log.pipeline.stats()
+
+@app.get("/api/cache/metrics")
+async def get_cache_metrics():
+    return response_cache.stats()
+
+@app.get("/api/pipeline/metrics")
+async def get_pipeline_metrics():
+    return order_pipeline.metrics()
+
 # Tasks endpoints
 @app.get("/api/tasks", response_model=List[dict])
-async def get_tasks():
-    return system_state.tasks
+async def get_tasks(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: int = DEFAULT_QUERY_LIMIT
+):
+    # Without a time range only the in-memory tasks are listed
+    if since is None and until is None:
+        return list(system_state.tasks)
+    
+    # A time range also covers archived tasks, filtered on created_at
+    hot = [
+        t for t in system_state.tasks
+        if (since is None or t["created_at"] >= since) and (until is None or t["created_at"] < until)
+    ]
+    archived = [t for t in await task_archive.query(since, until, limit) if t["id"] not in system_state.tasks]
+    return sorted(hot + archived, key=lambda t: t["created_at"])[:limit]
 
 @app.get("/api/tasks/{task_id}")
 async def get_task(task_id: str):
-    task = next((t for t in system_state.tasks if t["id"] == task_id), None)
+    task = system_state.tasks.get(task_id) or await task_archive.get(task_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     return task
 
-@app.post("/api/tasks", response_model=dict)
-async def create_task(task: TaskCreate):
-    # Determine base priority based on task type
-    base_priority_map = {
-        "delivery": 100,
-        "payment": 80,
-        "ordering": 70,
-        "collection": 50,
-        "charging": 40
-    }
-    base_priority = base_priority_map.get(task.type, 50)
-    
-    new_task = {
-        "id": f"T-{len(system_state.tasks) + 100}",
-        "type": task.type,
-        "base_priority": base_priority,
-        "release_time": datetime.now(),
-        "deadline": datetime.now() + timedelta(minutes=15),
-        "operator_override": 0,
-        "effective_priority": base_priority,
-        "waypoints": [task.table],
-        "state": TaskState.READY,
-        "assigned_robot": None,
-        "created_at": datetime.now()
-    }
+def create_task_command(task: TaskCreate):
+    new_task = build_task(task.type, [task.table])
     
-    system_state.tasks.append(new_task)
-    
-    # Broadcast update to all connected clients
-    await manager.broadcast(json.dumps({
-        "type": "task_created",
-        "data": new_task
-    }))
+    # Broadcast once this command's batch is applied
+    command_loop.emit("task_created", new_task)
     
     return new_task
 
-@app.put("/api/tasks/{task_id}/status")
-async def update_task_status(task_id: str, status_update: dict):
-    task = next((t for t in system_state.tasks if t["id"] == task_id), None)
+@app.post("/api/tasks", response_model=dict)
+async def create_task(task: TaskCreate):
+    return await command_loop.submit(create_task_command, task)
+
+def apply_task_state(task: Dict[str, Any], new_state: str):
+    """Move a task to a new state, updating its robot; call from a command"""
+    old_state = task["state"]
+    task["state"] = new_state
+    
+    # Update robot status if task is assigned
+    if task["assigned_robot"] and new_state == TaskState.RUNNING:
+        robot = system_state.robots.get(task["assigned_robot"])
+        if robot:
+            robot["status"] = RobotStatus.MOVING
+            robot["current_task_id"] = task["id"]
+            record("robots", robot)
+    elif new_state == TaskState.DONE:
+        if old_state != TaskState.DONE:
+            task["completed_at"] = datetime.now()
+            task_history.add_task(task)
+        
+        # Free up robot once every task on its trip is done
+        robot = system_state.robots.get(task["assigned_robot"])
+        next_task = next_trip_task(task)
+        if robot and next_task:
+            robot["current_task_id"] = next_task["id"]
+            record("robots", robot)
+        elif robot:
+            robot["status"] = RobotStatus.IDLE
+            robot["current_task_id"] = None
+            robot["last_active"] = datetime.now()
+            record("robots", robot)
+    elif new_state == TaskState.PAUSED:
+        # Update robot status if assigned
+        if task["assigned_robot"]:
+            robot = system_state.robots.get(task["assigned_robot"])
+            if robot:
+                robot["status"] = RobotStatus.IDLE
+                record("robots", robot)
+    record("tasks", task)
+
+def update_task_status_command(task_id: str, status_update: dict):
+    task = system_state.tasks.get(task_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     
     new_state = status_update.get("state")
     if new_state and new_state in TaskState.__members__.values():
-        old_state = task["state"]
-        task["state"] = new_state
-        
-        # Update robot status if task is assigned
-        if task["assigned_robot"] and new_state == TaskState.RUNNING:
-            robot = next((r for r in system_state.robots if r["id"] == task["assigned_robot"]), None)
-            if robot:
-                robot["status"] = RobotStatus.MOVING
-                robot["current_task_id"] = task_id
-        elif new_state == TaskState.DONE:
-            # Free up robot
-            robot = next((r for r in system_state.robots if r["id"] == task["assigned_robot"]), None)
-            if robot:
-                robot["status"] = RobotStatus.IDLE
-                robot["current_task_id"] = None
-                robot["last_active"] = datetime.now()
-        elif new_state == TaskState.PAUSED:
-            # Update robot status if assigned
-            if task["assigned_robot"]:
-                robot = next((r for r in system_state.robots if r["id"] == task["assigned_robot"]), None)
-                if robot:
-                    robot["status"] = RobotStatus.IDLE
-    
-    # Broadcast update to all connected clients
-    await manager.broadcast(json.dumps({
-        "type": "task_updated",
-        "data": task
-    }))
+        apply_task_state(task, new_state)
+    
+    # Broadcast once this command's batch is applied
+    command_loop.emit("task_updated", task)
     
     return {"message": "Task status updated", "task": task}
 
+@app.put("/api/tasks/{task_id}/status")
+async def update_task_status(task_id: str, status_update: dict):
+    return await command_loop.submit(update_task_status_command, task_id, status_update)
+
+# Batch endpoints for POS and kitchen systems. A batch is one command: it
+# is validated as a whole and either fully applied or rejected with 422
+# and an error per failing item, and all of it goes out as one broadcast
+# event whose data lists the changed tasks.
+TASK_BATCH_LIMIT = int(os.getenv("TASK_BATCH_LIMIT", 1000))
+
+def check_batch(items: List[Any], errors: List[Dict[str, Any]]):
+    """Reject an oversized batch, or one with any invalid item, before anything is applied"""
+    if len(items) > TASK_BATCH_LIMIT:
+        raise HTTPException(status_code=413, detail=f"Batches are limited to {TASK_BATCH_LIMIT} items")
+    if errors:
+        raise HTTPException(
+            status_code=422,
+            detail={"message": f"{len(errors)} of {len(items)} items are invalid; nothing was applied", "errors": errors}
+        )
+
+def compact_task(task: Dict[str, Any], *fields: str) -> Dict[str, Any]:
+    """The fields of a task a batch broadcast carries, plus those its subscribers are matched on"""
+    return {key: task.get(key) for key in ("id", "type", "assigned_robot", "waypoints", *fields)}
+
+def create_tasks_command(batch: TaskBatchCreate):
+    task_types = {task_type.value for task_type in TaskType}
+    errors = [
+        {"index": n, "error": f"Unknown task type {task.type!r}" if task.type not in task_types else "Table is required"}
+        for n, task in enumerate(batch.tasks)
+        if task.type not in task_types or not task.table
+    ]
+    check_batch(batch.tasks, errors)
+    
+    created = [build_task(task.type, [task.table]) for task in batch.tasks]
+    if created:
+        command_loop.emit("tasks_created", created)
+    return {
+        "created": len(created),
+        "results": [{"index": n, "task_id": task["id"], "status": "created"} for n, task in enumerate(created)]
+    }
+
+@app.post("/api/tasks/batch")
+async def create_tasks(batch: TaskBatchCreate):
+    return await command_loop.submit(create_tasks_command, batch)
+
+def update_task_statuses_command(batch: TaskStatusBatch):
+    states = set(TaskState.__members__.values())
+    errors = []
+    for n, update in enumerate(batch.updates):
+        if update.task_id not in system_state.tasks:
+            errors.append({"index": n, "task_id": update.task_id, "error": "Task not found"})
+        elif update.state not in states:
+            errors.append({"index": n, "task_id": update.task_id, "error": f"Unknown state {update.state!r}"})
+    check_batch(batch.updates, errors)
+    
+    changed = {}
+    for update in batch.updates:
+        task = system_state.tasks.get(update.task_id)
+        apply_task_state(task, update.state)
+        changed[task["id"]] = task
+    if changed:
+        command_loop.emit("tasks_updated", [compact_task(task, "state") for task in changed.values()])
+    return {
+        "updated": len(batch.updates),
+        "results": [
+            {"index": n, "task_id": update.task_id, "status": "updated", "state": update.state}
+            for n, update in enumerate(batch.updates)
+        ]
+    }
+
+@app.put("/api/tasks/status/batch")
+async def update_task_statuses(batch: TaskStatusBatch):
+    return await command_loop.submit(update_task_statuses_command, batch)
+
+# Trip planning endpoints
+def next_trip_task(task: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Return the next unfinished task on the same trip as task, if any"""
+    trip = system_state.trips.get(task.get("trip_id"))
+    if not trip:
+        return None
+    for task_id in trip["task_ids"]:
+        other = system_state.tasks.get(task_id)
+        if other and other is not task and other["state"] != TaskState.DONE:
+            return other
+    return None
+
+@app.get("/api/trips", response_model=List[dict])
+async def get_trips():
+    return list(system_state.trips)
+
+def plan_trips_command(dry_run: bool = False):
+    now = datetime.now()
+    trips = trip_planner.plan(system_state.tasks, system_state.robots, now)
+    if dry_run:
+        return {"trips": trips, "applied": False}
+    
+    for trip in trips:
+        trip["id"] = ids.next_id("TRIP")
+        trip["created_at"] = now
+        robot = system_state.robots.get(trip["robot_id"])
+        robot["current_task_id"] = trip["task_ids"][0]
+        record("robots", robot)
+        
+        for task_id in trip["task_ids"]:
+            task = system_state.tasks.get(task_id)
+            task["assigned_robot"] = robot["id"]
+            task["state"] = TaskState.CLAIMED
+            task["trip_id"] = trip["id"]
+            
+            # Log each task against the consolidated trip it rides on
+            log_entry = {
+                "id": ids.next_int(),
+                "task_id": task_id,
+                "robot_id": robot["id"],
+                "assignment_time": now,
+                "score": task["effective_priority"],
+                "reason": f"Consolidated trip {trip['id']} ({len(trip['task_ids'])} task(s)): {' -> '.join(trip['route'])}",
+                "effective_priority": task["effective_priority"],
+                "trip_id": trip["id"]
+            }
+            record("tasks", task)
+            log_assignment(task, log_entry, "assignment")
+        system_state.trips.append(trip)
+        record("trips", trip)
+    
+    if trips:
+        command_loop.emit("trips_planned", trips)
+    
+    return {"trips": trips, "applied": True}
+
+@app.post("/api/trips/plan")
+async def plan_trips(dry_run: bool = False):
+    return await command_loop.submit(plan_trips_command, dry_run)
+
 # Robots endpoints
 @app.get("/api/robots", response_model=List[dict])
 async def get_robots():
-    return system_state.robots
+    return list(system_state.robots)
+
+def robot_state_summary(window: str, robot_ids: Optional[List[str]] = None) -> Dict[str, Any]:
+    if window != ROBOT_STATES_TOTAL and window not in robot_states.windows:
+        raise HTTPException(
+            status_code=422, detail=f"window must be one of {', '.join([*robot_states.windows, ROBOT_STATES_TOTAL])}"
+        )
+    return robot_states.summary(window, robot_ids)
+
+@app.get("/api/robots/utilization")
+async def get_fleet_utilization(window: str = "shift"):
+    return robot_state_summary(window)
+
+@app.get("/api/robots/{robot_id}/utilization")
+async def get_robot_utilization(robot_id: str, window: str = "shift"):
+    if robot_id not in robot_states.timelines:
+        raise HTTPException(status_code=404, detail="Robot not found")
+    summary = robot_state_summary(window, [robot_id])
+    robot = summary.pop("robots")[robot_id]
+    del summary["fleet"]
+    return {**summary, "robot_id": robot_id, **robot}
 
 @app.get("/api/robots/{robot_id}")
 async def get_robot(robot_id: str):
-    robot = next((r for r in system_state.robots if r["id"] == robot_id), None)
+    robot = system_state.robots.get(robot_id)
     if not robot:
         raise HTTPException(status_code=404, detail="Robot not found")
     return robot
 
-@app.post("/api/robots/{robot_id}/command")
-async def send_robot_command(robot_id: str, command: RobotCommand):
-    robot = next((r for r in system_state.robots if r["id"] == robot_id), None)
+def robot_command(robot_id: str, command: RobotCommand):
+    robot = system_state.robots.get(robot_id)
     if not robot:
         raise HTTPException(status_code=404, detail="Robot not found")
     
@@ -598,76 +1460,142 @@ async def send_robot_command(robot_id: str, command: RobotCommand):
         robot["status"] = RobotStatus.MOVING
         robot["current_location"] = "Returning to base"
     elif command.command == "START_CHARGING":
-        robot["status"] = RobotStatus.CHARGING
-        robot["current_location"] = "Charging Station"
-        
-        # Update charging station status
-        for station in system_state.charging_stations:
-            if station["status"] == "available":
+        # Claim the free station closest to the robot unless it already holds one
+        if robot_id not in floor_index.stations_by_robot:
+            station = floor_index.nearest_free_charger(floor_index.robot_position(robot))
+            if station:
                 station["status"] = "occupied"
                 station["robot_id"] = robot_id
-                break
+                record("charging_stations", station)
+        robot["status"] = RobotStatus.CHARGING
+        robot["current_location"] = "Charging Station"
     elif command.command == "STOP_CHARGING":
         robot["status"] = RobotStatus.IDLE
         robot["current_location"] = "Base Station"
         
         # Update charging station status
-        for station in system_state.charging_stations:
-            if station["robot_id"] == robot_id:
-                station["status"] = "available"
-                station["robot_id"] = None
-                break
-    
-    # Broadcast update to all connected clients
-    await manager.broadcast(json.dumps({
-        "type": "robot_updated",
-        "data": robot
-    }))
+        station = floor_index.stations_by_robot.get(robot_id)
+        if station:
+            station["status"] = "available"
+            station["robot_id"] = None
+            record("charging_stations", station)
+    record("robots", robot)
+    
+    # Broadcast once this command's batch is applied
+    command_loop.emit("robot_updated", robot)
     
     return {"message": f"Command {command.command} sent to robot {robot_id}"}
 
+async def apply_robot_ack(robot_id: str, command: str, args: Dict[str, Any], ack: Dict[str, Any]):
+    return await command_loop.submit(robot_command, robot_id, RobotCommand(command=command))
+
+# Commands to robots with a connected agent are delivered over the robot's
+# session and applied only once it acknowledges them. With
+# REQUIRE_ROBOT_AGENTS unset, robots without an agent are still updated
+# directly, as in the demo.
+ROBOT_ACK_TIMEOUT = float(os.getenv("ROBOT_ACK_TIMEOUT", DEFAULT_ACK_TIMEOUT))
+REQUIRE_ROBOT_AGENTS = os.getenv("REQUIRE_ROBOT_AGENTS", "") not in ("", "0", "false")
+robot_bus = RobotBus(apply_robot_ack, ack_timeout=ROBOT_ACK_TIMEOUT)
+
+@app.post("/api/robots/{robot_id}/command")
+async def send_robot_command(robot_id: str, command: RobotCommand):
+    if robot_id not in system_state.robots:
+        raise HTTPException(status_code=404, detail="Robot not found")
+    if not robot_bus.connected(robot_id) and not REQUIRE_ROBOT_AGENTS:
+        return await command_loop.submit(robot_command, robot_id, command)
+    try:
+        delivery = await robot_bus.send(robot_id, command.command)
+    except RobotOffline as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except CommandRejected as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except CommandTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    return {"message": f"Command {command.command} acknowledged by robot {robot_id}", **delivery}
+
+@app.get("/api/robot-bus/metrics")
+async def get_robot_bus_metrics():
+    return robot_bus.stats()
+
 # Queue management endpoints
 @app.get("/api/queue/tasks")
 async def get_queue_tasks():
-    return system_state.tasks
+    return list(system_state.tasks)
 
 @app.get("/api/queue/tasks/ready")
 async def get_ready_tasks():
-    return [t for t in system_state.tasks if t["state"] == TaskState.READY]
+    return system_state.tasks.where(state=TaskState.READY)
 
-@app.put("/api/queue/tasks/{task_id}/priority")
-async def update_task_priority(task_id: str, priority_data: PriorityUpdate):
-    task = next((t for t in system_state.tasks if t["id"] == task_id), None)
-    if not task:
-        raise HTTPException(status_code=404, detail="Task not found")
-    
-    # Apply operator override
-    task["operator_override"] = priority_data.boost
-    task["effective_priority"] = task["base_priority"] + priority_data.boost
+def boost_task_priority(task: Dict[str, Any], boost: int, reason: str) -> Dict[str, Any]:
+    """Apply an operator boost to a task and log it; call from a command"""
+    task["operator_override"] = boost
+    task["effective_priority"] = task["base_priority"] + boost
     
     # Log the override
     log_entry = {
-        "id": len(system_state.assignment_logs) + 1,
-        "task_id": task_id,
+        "id": ids.next_int(),
+        "task_id": task["id"],
         "robot_id": task.get("assigned_robot"),
         "assignment_time": datetime.now(),
         "score": task["effective_priority"],
-        "reason": priority_data.reason,
+        "reason": reason,
         "effective_priority": task["effective_priority"]
     }
-    system_state.assignment_logs.append(log_entry)
+    record("tasks", task)
+    log_assignment(task, log_entry, "priority_boost")
+    return log_entry
+
+def update_task_priority_command(task_id: str, priority_data: PriorityUpdate):
+    task = system_state.tasks.get(task_id)
+    if not task:
+        raise HTTPException(status_code=404, detail="Task not found")
+    
+    # Apply operator override
+    log_entry = boost_task_priority(task, priority_data.boost, priority_data.reason)
     
-    # Broadcast update to all connected clients
-    await manager.broadcast(json.dumps({
-        "type": "task_priority_updated",
-        "data": task
-    }))
+    # Broadcast once this command's batch is applied
+    command_loop.emit("task_priority_updated", task)
     
     return {"message": "Task priority updated", "task": task, "log": log_entry}
 
-@app.post("/api/queue/tasks/{task_id}/override")
-async def apply_task_override(task_id: str, override_data: TaskOverride):
-    task = next((t for t in system_state.tasks if t["id"] == task_id), None)
+@app.put("/api/queue/tasks/{task_id}/priority")
+async def update_task_priority(task_id: str, priority_data: PriorityUpdate):
+    return await command_loop.submit(update_task_priority_command, task_id, priority_data)
+
+def update_task_priorities_command(batch: TaskPriorityBatch):
+    errors = [
+        {"index": n, "task_id": update.task_id, "error": "Task not found"}
+        for n, update in enumerate(batch.updates)
+        if update.task_id not in system_state.tasks
+    ]
+    check_batch(batch.updates, errors)
+    
+    changed = {}
+    results = []
+    for n, update in enumerate(batch.updates):
+        task = system_state.tasks.get(update.task_id)
+        log_entry = boost_task_priority(task, update.boost, update.reason)
+        changed[task["id"]] = task
+        results.append({
+            "index": n,
+            "task_id": update.task_id,
+            "status": "updated",
+            "effective_priority": task["effective_priority"],
+            "log_id": log_entry["id"]
+        })
+    if changed:
+        command_loop.emit(
+            "tasks_priority_updated",
+            [compact_task(task, "operator_override", "effective_priority") for task in changed.values()]
+        )
+    return {"updated": len(results), "results": results}
+
+@app.put("/api/queue/tasks/priority/batch")
+async def update_task_priorities(batch: TaskPriorityBatch):
+    return await command_loop.submit(update_task_priorities_command, batch)
+
+def apply_task_override_command(task_id: str, override_data: TaskOverride):
+    task = system_state.tasks.get(task_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     
@@ -678,7 +1606,7 @@ async def apply_task_override(task_id: str, override_data: TaskOverride):
     
     # Log the override
     log_entry = {
-        "id": len(system_state.assignment_logs) + 1,
+        "id": ids.next_int(),
         "task_id": task_id,
         "robot_id": task.get("assigned_robot"),
         "assignment_time": datetime.now(),
@@ -686,19 +1614,20 @@ async def apply_task_override(task_id: str, override_data: TaskOverride):
         "reason": override_data.reason,
         "effective_priority": task["effective_priority"]
     }
-    system_state.assignment_logs.append(log_entry)
+    record("tasks", task)
+    log_assignment(task, log_entry, "override")
     
-    # Broadcast update to all connected clients
-    await manager.broadcast(json.dumps({
-        "type": "task_override_applied",
-        "data": task
-    }))
+    # Broadcast once this command's batch is applied
+    command_loop.emit("task_override_applied", task)
     
     return {"message": "Task marked as critical", "task": task, "log": log_entry}
 
-@app.delete("/api/queue/tasks/{task_id}/override")
-async def remove_task_override(task_id: str):
-    task = next((t for t in system_state.tasks if t["id"] == task_id), None)
+@app.post("/api/queue/tasks/{task_id}/override")
+async def apply_task_override(task_id: str, override_data: TaskOverride):
+    return await command_loop.submit(apply_task_override_command, task_id, override_data)
+
+def remove_task_override_command(task_id: str):
+    task = system_state.tasks.get(task_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     
@@ -708,7 +1637,7 @@ async def remove_task_override(task_id: str):
     
     # Log the removal
     log_entry = {
-        "id": len(system_state.assignment_logs) + 1,
+        "id": ids.next_int(),
         "task_id": task_id,
         "robot_id": task.get("assigned_robot"),
         "assignment_time": datetime.now(),
@@ -716,16 +1645,18 @@ async def remove_task_override(task_id: str):
         "reason": "Operator override removed",
         "effective_priority": task["effective_priority"]
     }
-    system_state.assignment_logs.append(log_entry)
+    record("tasks", task)
+    log_assignment(task, log_entry, "override_removed")
     
-    # Broadcast update to all connected clients
-    await manager.broadcast(json.dumps({
-        "type": "task_override_removed",
-        "data": task
-    }))
+    # Broadcast once this command's batch is applied
+    command_loop.emit("task_override_removed", task)
     
     return {"message": "Task override removed", "task": task, "log": log_entry}
 
+@app.delete("/api/queue/tasks/{task_id}/override")
+async def remove_task_override(task_id: str):
+    return await command_loop.submit(remove_task_override_command, task_id)
+
 @app.get("/api/queue/assignment-log")
 async def get_assignment_log():
     return system_state.assignment_logs
@@ -752,18 +1683,22 @@ async def get_charging_policy():
         "auto_charging_enabled": True
     }
 
-@app.post("/api/charging/manual-request")
-async def request_manual_charging(robot_data: dict):
+def request_manual_charging_command(robot_data: dict):
     robot_id = robot_data.get("robot_id")
     if not robot_id:
         raise HTTPException(status_code=400, detail="Robot ID is required")
     
-    robot = next((r for r in system_state.robots if r["id"] == robot_id), None)
+    robot = system_state.robots.get(robot_id)
     if not robot:
         raise HTTPException(status_code=404, detail="Robot not found")
     
-    # Find available charging station
-    available_station = next((s for s in system_state.charging_stations if s["status"] == "available"), None)
+    # A repeated request keeps the station the robot already holds
+    held_station = floor_index.stations_by_robot.get(robot_id)
+    if held_station:
+        return {"message": f"Robot {robot_id} is already at {held_station['id']}", "success": True}
+    
+    # Find the closest available charging station
+    available_station = floor_index.nearest_free_charger(floor_index.robot_position(robot))
     if not available_station:
         return {"message": "No charging stations available", "success": False}
     
@@ -774,28 +1709,30 @@ async def request_manual_charging(robot_data: dict):
     # Update robot status
     robot["status"] = RobotStatus.CHARGING
     robot["current_location"] = "Charging Station"
+    record("charging_stations", available_station)
+    record("robots", robot)
     
-    # Broadcast update to all connected clients
-    await manager.broadcast(json.dumps({
-        "type": "charging_updated",
-        "data": {
-            "robot": robot,
-            "station": available_station
-        }
-    }))
+    # Broadcast once this command's batch is applied
+    command_loop.emit("charging_updated", {
+        "robot": robot,
+        "station": available_station
+    })
     
     return {"message": f"Manual charging request for robot {robot_id} accepted", "success": True}
 
+@app.post("/api/charging/manual-request")
+async def request_manual_charging(robot_data: dict):
+    return await command_loop.submit(request_manual_charging_command, robot_data)
+
 # Task state machine endpoints
-@app.post("/api/tasks/{task_id}/confirm-step")
-async def confirm_task_step(task_id: str):
-    task = next((t for t in system_state.tasks if t["id"] == task_id), None)
+def confirm_task_step_command(task_id: str):
+    task = system_state.tasks.get(task_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     
     # For demo, we'll just log the confirmation
     log_entry = {
-        "id": len(system_state.assignment_logs) + 1,
+        "id": ids.next_int(),
         "task_id": task_id,
         "robot_id": task.get("assigned_robot"),
         "assignment_time": datetime.now(),
@@ -803,19 +1740,20 @@ async def confirm_task_step(task_id: str):
         "reason": f"Step confirmed for task {task_id}",
         "effective_priority": task["effective_priority"]
     }
-    system_state.assignment_logs.append(log_entry)
+    log_assignment(task, log_entry, "step_confirmed")
     
-    # Broadcast update to all connected clients
-    await manager.broadcast(json.dumps({
-        "type": "task_step_confirmed",
-        "data": task
-    }))
+    # Broadcast once this command's batch is applied
+    command_loop.emit("task_step_confirmed", task)
     
     return {"message": f"Step confirmed for task {task_id}", "task": task, "log": log_entry}
 
+@app.post("/api/tasks/{task_id}/confirm-step")
+async def confirm_task_step(task_id: str):
+    return await command_loop.submit(confirm_task_step_command, task_id)
+
 @app.get("/api/tasks/{task_id}/current-step")
 async def get_current_task_step(task_id: str):
-    task = next((t for t in system_state.tasks if t["id"] == task_id), None)
+    task = system_state.tasks.get(task_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     
@@ -837,61 +1775,137 @@ async def get_current_task_step(task_id: str):
     
     return {"step": 1, "total_steps": 1, "description": "Initial step"}
 
-@app.put("/api/tasks/{task_id}/pause")
-async def pause_task(task_id: str):
-    task = next((t for t in system_state.tasks if t["id"] == task_id), None)
+def pause_task_command(task_id: str):
+    task = system_state.tasks.get(task_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     
     task["state"] = TaskState.PAUSED
+    record("tasks", task)
     
     # Update robot status if assigned
     if task["assigned_robot"]:
-        robot = next((r for r in system_state.robots if r["id"] == task["assigned_robot"]), None)
+        robot = system_state.robots.get(task["assigned_robot"])
         if robot:
             robot["status"] = RobotStatus.IDLE
+            record("robots", robot)
     
-    # Broadcast update to all connected clients
-    await manager.broadcast(json.dumps({
-        "type": "task_paused",
-        "data": task
-    }))
+    # Broadcast once this command's batch is applied
+    command_loop.emit("task_paused", task)
     
     return {"message": f"Task {task_id} paused", "task": task}
 
-@app.put("/api/tasks/{task_id}/resume")
-async def resume_task(task_id: str):
-    task = next((t for t in system_state.tasks if t["id"] == task_id), None)
+@app.put("/api/tasks/{task_id}/pause")
+async def pause_task(task_id: str):
+    return await command_loop.submit(pause_task_command, task_id)
+
+def resume_task_command(task_id: str):
+    task = system_state.tasks.get(task_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     
     task["state"] = TaskState.READY
+    record("tasks", task)
     
-    # Broadcast update to all connected clients
-    await manager.broadcast(json.dumps({
-        "type": "task_resumed",
-        "data": task
-    }))
+    # Broadcast once this command's batch is applied
+    command_loop.emit("task_resumed", task)
     
     return {"message": f"Task {task_id} resumed", "task": task}
 
+@app.put("/api/tasks/{task_id}/resume")
+async def resume_task(task_id: str):
+    return await command_loop.submit(resume_task_command, task_id)
+
 # Customer management endpoints
 @app.get("/api/customers", response_model=List[dict])
 async def get_customers():
-    return system_state.customers
+    return system_state.customers.all()
+
+# Registered before /api/customers/{customer_id} so "search" is not parsed as an id
+@app.get("/api/customers/search", response_model=List[dict])
+async def search_customers(
+    q: Optional[str] = None,
+    fuzzy: bool = False,
+    email: Optional[str] = None,
+    phone: Optional[str] = None,
+    membership: Optional[str] = None,
+    sort_by: Optional[str] = None,
+    ascending: bool = False,
+    min_value: Optional[float] = None,
+    max_value: Optional[float] = None,
+    limit: int = 50
+):
+    limit = max(1, min(limit, 1000))
+    try:
+        return system_state.customers.search(
+            q=q,
+            fuzzy=fuzzy,
+            email=email,
+            phone=phone,
+            membership=membership,
+            sort_by=sort_by,
+            ascending=ascending,
+            min_value=min_value,
+            max_value=max_value,
+            limit=limit
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Bulk customer import/export, streamed in both directions
+@app.post("/api/customers/import")
+async def import_customers_bulk(request: Request, format: Optional[str] = None, dry_run: bool = False):
+    try:
+        fmt = detect_format(request.headers.get("content-type"), format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    async def sync_batch(customers: List[Dict[str, Any]]):
+        for customer in customers:
+            record("customers", customer)
+        if not external_api:
+            return
+        # One grouped external API call per validated chunk instead of one per row
+        try:
+            await external_api.upsert_customers_batch(customers)
+        except Exception as e:
+            log.warning("customers.sync_failed", action="import", customers=len(customers), error=str(e))
+    
+    report = await import_customers(
+        request.stream(), fmt, system_state.customers, sync_batch=sync_batch, dry_run=dry_run
+    )
+    
+    # Broadcast a single summary instead of one event per imported row
+    if not dry_run and (report["created"] or report["updated"]):
+        await manager.broadcast_event("customers_imported", {"created": report["created"], "updated": report["updated"]})
+    
+    return report
+
+@app.get("/api/customers/export")
+async def export_customers_bulk(format: str = "ndjson"):
+    try:
+        fmt = detect_format(None, format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    media_type = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        export_customers(system_state.customers, fmt),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="customers.{fmt}"'}
+    )
 
 @app.get("/api/customers/{customer_id}")
 async def get_customer(customer_id: int):
-    customer = next((c for c in system_state.customers if c["id"] == customer_id), None)
+    customer = system_state.customers.get(customer_id)
     if not customer:
         raise HTTPException(status_code=404, detail="Customer not found")
     return customer
 
-@app.post("/api/customers", response_model=dict)
-async def create_customer(customer: CustomerCreate):
+def create_customer_command(customer: CustomerCreate):
     # Create new customer
     new_customer = {
-        "id": max([c["id"] for c in system_state.customers], default=0) + 1,
+        "id": system_state.customers.allocate_id(),
         "name": customer.name,
         "email": customer.email,
         "phone": customer.phone,
@@ -903,90 +1917,90 @@ async def create_customer(customer: CustomerCreate):
     }
     
     # Add to system state
-    system_state.customers.append(new_customer)
+    system_state.customers.add(new_customer)
+    record("customers", new_customer)
+    command_loop.emit("customer_created", new_customer)
+    return new_customer
+
+@app.post("/api/customers", response_model=dict)
+async def create_customer(customer: CustomerCreate):
+    new_customer = await command_loop.submit(create_customer_command, customer)
     
     # Send to external API
-    try:
-        external_response = send_to_external_api("customers", new_customer)
-        print(f"Customer data sent to external API: {external_response}")
-    except Exception as e:
-        print(f"Failed to send customer data to external API: {e}")
-        # Note: We don't raise an exception here to ensure the local operation succeeds
-        # even if the external API fails
-    
-    # Broadcast update to all connected clients
-    await manager.broadcast(json.dumps({
-        "type": "customer_created",
-        "data": new_customer
-    }))
+    if external_api:
+        try:
+            await external_api.create_customer(new_customer)
+        except Exception as e:
+            log.warning("customers.sync_failed", action="create", customer_id=new_customer["id"], error=str(e))
+            # Note: We don't raise an exception here to ensure the local operation succeeds
+            # even if the external API fails
     
     return new_customer
 
-@app.put("/api/customers/{customer_id}", response_model=dict)
-async def update_customer(customer_id: int, customer_update: CustomerUpdate):
-    customer = next((c for c in system_state.customers if c["id"] == customer_id), None)
-    if not customer:
+def update_customer_command(customer_id: int, update_data: Dict[str, Any]):
+    if customer_id not in system_state.customers:
         raise HTTPException(status_code=404, detail="Customer not found")
     
-    # Update customer data
+    # Update customer data, keeping the directory indexes in sync
+    customer = system_state.customers.update(
+        customer_id, {key: value for key, value in update_data.items() if value is not None}
+    )
+    record("customers", customer)
+    command_loop.emit("customer_updated", customer)
+    return customer
+
+@app.put("/api/customers/{customer_id}", response_model=dict)
+async def update_customer(customer_id: int, customer_update: CustomerUpdate):
     update_data = customer_update.dict(exclude_unset=True)
-    for key, value in update_data.items():
-        if value is not None:
-            customer[key] = value
-    
-    # Send to external API
-    try:
-        external_response = send_to_external_api(f"customers/{customer_id}", update_data)
-        print(f"Customer data updated in external API: {external_response}")
-    except Exception as e:
-        print(f"Failed to update customer data in external API: {e}")
+    customer = await command_loop.submit(update_customer_command, customer_id, update_data)
     
-    # Broadcast update to all connected clients
-    await manager.broadcast(json.dumps({
-        "type": "customer_updated",
-        "data": customer
-    }))
+    # Send to external API; rapid updates to the same customer are coalesced
+    if external_api:
+        try:
+            await external_api.update_customer(customer_id, update_data)
+        except Exception as e:
+            log.warning("customers.sync_failed", action="update", customer_id=customer_id, error=str(e))
     
     return customer
 
-@app.delete("/api/customers/{customer_id}")
-async def delete_customer(customer_id: int):
-    customer = next((c for c in system_state.customers if c["id"] == customer_id), None)
+def delete_customer_command(customer_id: int):
+    # Remove from system state
+    customer = system_state.customers.remove(customer_id)
     if not customer:
         raise HTTPException(status_code=404, detail="Customer not found")
-    
-    # Remove from system state
-    system_state.customers = [c for c in system_state.customers if c["id"] != customer_id]
+    record_deleted("customers", customer_id)
+    command_loop.emit("customer_deleted", {"id": customer_id})
+
+@app.delete("/api/customers/{customer_id}")
+async def delete_customer(customer_id: int):
+    await command_loop.submit(delete_customer_command, customer_id)
     
     # Send to external API
-    try:
-        external_response = send_to_external_api(f"customers/{customer_id}", {"action": "delete"})
-        print(f"Customer deletion sent to external API: {external_response}")
-    except Exception as e:
-        print(f"Failed to delete customer in external API: {e}")
-    
-    # Broadcast update to all connected clients
-    await manager.broadcast(json.dumps({
-        "type": "customer_deleted",
-        "data": {"id": customer_id}
-    }))
+    if external_api:
+        try:
+            await external_api.delete_customer(customer_id)
+        except Exception as e:
+            log.warning("customers.sync_failed", action="delete", customer_id=customer_id, error=str(e))
     
     return {"message": f"Customer {customer_id} deleted"}
 
 # Reports endpoints
 @app.get("/api/reports/daily")
 async def get_daily_report():
-    # Calculate daily statistics
-    total_tasks = len(system_state.tasks)
-    completed_tasks = len([t for t in system_state.tasks if t["state"] == TaskState.DONE])
-    failed_tasks = len([t for t in system_state.tasks if t["state"] == TaskState.PAUSED])
+    # Calculate daily statistics; archived tasks are all DONE
+    archived_tasks = sum((await task_archive.counts()).values())
+    total_tasks = len(system_state.tasks) + archived_tasks
+    completed_tasks = system_state.tasks.count(state=TaskState.DONE) + archived_tasks
+    failed_tasks = system_state.tasks.count(state=TaskState.PAUSED)
     
-    # Calculate average completion time (simplified)
-    avg_completion_time = "2.5 minutes"
+    # Average completion time of tasks completed today
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    mean_seconds = (await task_history.completion_times(since=today))["mean_seconds"]
+    avg_completion_time = f"{mean_seconds / 60:.1f} minutes" if mean_seconds is not None else "n/a"
     
-    # Calculate robot utilization
-    active_robots = len([r for r in system_state.robots if r["status"] != RobotStatus.IDLE])
-    robot_utilization = f"{int((active_robots / len(system_state.robots)) * 100)}%"
+    # Share of the last day the fleet spent moving
+    utilization = robot_states.summary("day")["fleet"]["utilization"]
+    robot_utilization = f"{int(utilization * 100)}%" if utilization is not None else "n/a"
     
     return {
         "date": datetime.now().date().isoformat(),
@@ -999,12 +2013,13 @@ async def get_daily_report():
 
 @app.get("/api/reports/tasks")
 async def get_task_statistics():
-    # Count tasks by type
-    delivery_tasks = len([t for t in system_state.tasks if t["type"] == TaskType.DELIVERY])
-    collection_tasks = len([t for t in system_state.tasks if t["type"] == TaskType.COLLECTION])
-    ordering_tasks = len([t for t in system_state.tasks if t["type"] == TaskType.ORDERING])
-    payment_tasks = len([t for t in system_state.tasks if t["type"] == TaskType.PAYMENT])
-    charging_tasks = len([t for t in system_state.tasks if t["type"] == TaskType.CHARGING])
+    # Count tasks by type, in memory and archived
+    archived = await task_archive.counts()
+    delivery_tasks = system_state.tasks.count(type=TaskType.DELIVERY) + archived.get(TaskType.DELIVERY.value, 0)
+    collection_tasks = system_state.tasks.count(type=TaskType.COLLECTION) + archived.get(TaskType.COLLECTION.value, 0)
+    ordering_tasks = system_state.tasks.count(type=TaskType.ORDERING) + archived.get(TaskType.ORDERING.value, 0)
+    payment_tasks = system_state.tasks.count(type=TaskType.PAYMENT) + archived.get(TaskType.PAYMENT.value, 0)
+    charging_tasks = system_state.tasks.count(type=TaskType.CHARGING) + archived.get(TaskType.CHARGING.value, 0)
     
     return {
         "delivery_tasks": delivery_tasks,
@@ -1039,6 +2054,94 @@ async def get_performance_report():
         "uptime": uptime
     }
 
+# History reports, over every task completed since the history began
+@app.get("/api/reports/completion-times")
+async def get_completion_time_report(since: Optional[datetime] = None, until: Optional[datetime] = None):
+    return await task_history.completion_times(since, until)
+
+@app.get("/api/reports/throughput")
+async def get_throughput_report(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    interval: str = "hour"
+):
+    if interval not in INTERVALS:
+        raise HTTPException(status_code=422, detail=f"interval must be one of {', '.join(INTERVALS)}")
+    try:
+        return await task_history.throughput(since, until, interval)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+@app.get("/api/reports/deadlines")
+async def get_deadline_report(since: Optional[datetime] = None, until: Optional[datetime] = None):
+    return await task_history.deadline_misses(since, until)
+
+@app.get("/api/reports/overrides")
+async def get_override_report(since: Optional[datetime] = None, until: Optional[datetime] = None):
+    return await task_history.overrides(since, until)
+
+@app.get("/api/history/metrics")
+async def get_history_metrics():
+    return task_history.stats()
+
+# Traffic capture endpoints
+def start_traffic_capture(name: Optional[str] = None) -> str:
+    """
+    Start capturing to TRAFFIC_CAPTURE_DIR/<name>-w<worker id>.capture
+
+    Raises:
+        ValueError: If name has characters other than letters, digits, '-', '_' and '.'
+        RuntimeError: If a capture is already running
+    """
+    name = name or datetime.now().strftime("%Y%m%d-%H%M%S")
+    if not name.replace("-", "").replace("_", "").replace(".", "").isalnum() or name.startswith("."):
+        raise ValueError("name may only contain letters, digits, '-', '_' and '.'")
+    path = os.path.join(TRAFFIC_CAPTURE_DIR, f"{name}-w{WORKER_ID}.capture")
+    traffic_capture.start(path, dump_state(capture_state()), {"venue_id": VENUE_ID, "worker_id": WORKER_ID})
+    log.info("capture.started", path=path)
+    return path
+
+async def stop_traffic_capture() -> Dict[str, Any]:
+    # The state is taken on the loop; the writer's final flush runs off it
+    state = dump_state(capture_state())
+    stats = await asyncio.get_running_loop().run_in_executor(None, traffic_capture.stop, state)
+    log.info("capture.stopped", **{key: stats[key] for key in ("requests", "written", "dropped")})
+    return stats
+
+@app.on_event("startup")
+async def start_configured_capture():
+    if os.getenv("TRAFFIC_CAPTURE") == "1":
+        start_traffic_capture()
+
+@app.on_event("shutdown")
+async def stop_running_capture():
+    if traffic_capture.active:
+        await stop_traffic_capture()
+
+@app.post("/api/capture/start")
+async def start_capture(capture_data: Optional[dict] = None, admin: Dict[str, Any] = Depends(require_role("administrator"))):
+    try:
+        path = start_traffic_capture((capture_data or {}).get("name"))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"message": "Capture started", "path": path}
+
+@app.post("/api/capture/stop")
+async def stop_capture(admin: Dict[str, Any] = Depends(require_role("administrator"))):
+    if not traffic_capture.active:
+        raise HTTPException(status_code=409, detail="No capture is running")
+    try:
+        return await stop_traffic_capture()
+    except RuntimeError as e:
+        # Another stop got there first
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.get("/api/capture/metrics")
+async def get_capture_metrics():
+    return traffic_capture.stats()
+
 # WebSocket endpoint
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
@@ -1046,11 +2149,66 @@ async def websocket_endpoint(websocket: WebSocket):
     try:
         while True:
             data = await websocket.receive_text()
-            # Echo the message back (in a real app, you might process it)
-            await manager.send_personal_message(f"You sent: {data}", websocket)
+            reply = manager.handle_message(websocket, data)
+            await manager.send_personal_message(json.dumps(reply), websocket)
     except WebSocketDisconnect:
+        pass
+    finally:
         manager.disconnect(websocket)
-        await manager.broadcast("A client disconnected")
+
+# Robot agent sessions for the command bus
+@app.websocket("/ws/robots/{robot_id}")
+async def robot_agent_endpoint(websocket: WebSocket, robot_id: str):
+    # A robot's token only attaches its own agent: the account is named after the robot
+    user = websocket.state.user
+    allowed = user["role"] == "administrator" or (user["role"] == "robot" and user["sub"] == robot_id)
+    if not allowed or robot_id not in system_state.robots:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await websocket.accept()
+    session = robot_bus.attach(robot_id, websocket.send_text)
+    writer = asyncio.create_task(session.run())
+
+    def writer_done(task: asyncio.Task):
+        # A session that can no longer send is detached at once, so new
+        # commands fail as offline instead of queuing behind a dead writer
+        if task.cancelled() or task.exception() is None:
+            return
+        log.warning("robot_bus.session_failed", robot_id=robot_id, error=str(task.exception()))
+        robot_bus.detach(robot_id, session)
+        asyncio.ensure_future(websocket.close(code=status.WS_1011_INTERNAL_ERROR))
+
+    writer.add_done_callback(writer_done)
+    try:
+        while True:
+            robot_bus.receive(robot_id, await websocket.receive_text())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        robot_bus.detach(robot_id, session)
+        writer.cancel()
+        await asyncio.gather(writer, return_exceptions=True)
+
+# Serve static files from React build. This catch-all is registered last so
+# that it never shadows the API routes above.
+FRONTEND_DIST = os.path.abspath("dist")
+
+@app.get("/{full_path:path}", response_class=HTMLResponse)
+async def serve_react_app(full_path: str):
+    # Unknown API routes are a 404, not the React app
+    if full_path.startswith("api/"):
+        raise HTTPException(status_code=404, detail="Not found")
+    
+    # Try to serve static files first
+    file_path = os.path.abspath(os.path.join(FRONTEND_DIST, full_path))
+    if file_path.startswith(FRONTEND_DIST + os.sep) and os.path.isfile(file_path):
+        return FileResponse(file_path)
+    
+    # For all other routes, serve index.html for React Router
+    index_path = os.path.join(FRONTEND_DIST, "index.html")
+    if os.path.isfile(index_path):
+        return FileResponse(index_path)
+    raise HTTPException(status_code=404, detail="Frontend not built. Run 'python build_frontend.py' first.")
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,269 @@
+import asyncio
+import json
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Mapping, Optional, Tuple
+from urllib.parse import parse_qs
+
+from jose import JWTError, jwt
+from passlib.context import CryptContext
+
+DEFAULT_ALGORITHM = "HS256"
+
+# Lifetime of an issued access token, in seconds
+DEFAULT_TOKEN_TTL = 3600
+
+# Verified tokens kept, and how long one is trusted before its signature
+# is checked again
+DEFAULT_CACHE_SIZE = 10_000
+DEFAULT_CACHE_TTL = 300
+
+# pbkdf2_sha256 rather than bcrypt: passlib 1.7.4's bcrypt backend fails
+# with bcrypt >= 4.1, which requirements.txt does not rule out
+pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
+
+
+class InvalidToken(Exception):
+    pass
+
+
+def load_users(path: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Accounts from a JSON file mapping username -> {"role", "password_hash"}
+
+    Hashes are made with pwd_context.hash(password).
+
+    Raises:
+        ValueError: If the file is not such an object, or an account lacks a role or hash
+    """
+    with open(path) as f:
+        users = json.load(f)
+    if not isinstance(users, dict) or not users:
+        raise ValueError(f"{path} must be a non-empty JSON object of username -> account")
+    for username, user in users.items():
+        if not isinstance(user, dict) or not user.get("role") or not user.get("password_hash"):
+            raise ValueError(f"Account {username!r} in {path} needs a role and a password_hash")
+        if not pwd_context.identify(user["password_hash"]):
+            raise ValueError(f"Account {username!r} in {path} has an unrecognized password_hash")
+    return users
+
+
+class Authenticator:
+    """
+    Issues and verifies signed JWT access tokens
+
+    Tokens carry the username (sub), role, a unique id (jti) and issue and
+    expiry times. Verified claims are kept in an LRU cache keyed by the raw
+    token, so a repeated request costs a dictionary lookup instead of a
+    signature check; an entry is trusted for at most cache_ttl seconds and
+    never past the token's expiry. Revoking a token, or every token of a
+    user, evicts the matching cache entries.
+
+    Password checks are deliberately slow and run on a small thread pool so
+    logins never block the event loop.
+    """
+
+    def __init__(
+        self,
+        secret: str,
+        users: Mapping[str, Dict[str, Any]],
+        token_ttl: float = DEFAULT_TOKEN_TTL,
+        cache_size: int = DEFAULT_CACHE_SIZE,
+        cache_ttl: float = DEFAULT_CACHE_TTL,
+        algorithm: str = DEFAULT_ALGORITHM
+    ):
+        """
+        Args:
+            secret (str): HMAC signing key
+            users: Username -> {"role", "password_hash"}
+            token_ttl (float): Seconds an issued token is valid
+            cache_size (int): Most verified tokens cached; 0 disables the cache
+            cache_ttl (float): Seconds a cached verification is trusted
+            algorithm (str): JWT signing algorithm
+        """
+        self._secret = secret
+        self.users = users
+        self.token_ttl = token_ttl
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.algorithm = algorithm
+        self._hasher = ThreadPoolExecutor(max_workers=2, thread_name_prefix="password-hash")
+        # token -> (claims, trusted until)
+        self._cache: "OrderedDict[str, Tuple[Dict[str, Any], float]]" = OrderedDict()
+        # jti -> token expiry, kept until the token would have expired anyway
+        self._revoked: Dict[str, float] = {}
+        # username -> tokens issued at or before this time are revoked
+        self._revoked_before: Dict[str, float] = {}
+        # Checked against unknown usernames so they take as long as known ones
+        self._dummy_hash = next((user["password_hash"] for user in users.values()), pwd_context.hash(""))
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+
+    async def authenticate(self, username: str, password: str) -> Optional[Dict[str, Any]]:
+        """Return the user if the password matches, checking it off the event loop"""
+        user = self.users.get(username)
+        hashed = user["password_hash"] if user else self._dummy_hash
+        loop = asyncio.get_running_loop()
+        matches = await loop.run_in_executor(self._hasher, pwd_context.verify, password, hashed)
+        return user if matches and user else None
+
+    def issue(self, username: str, role: str) -> str:
+        now = time.time()
+        claims = {"sub": username, "role": role, "jti": uuid.uuid4().hex, "iat": now, "exp": int(now + self.token_ttl)}
+        return jwt.encode(claims, self._secret, algorithm=self.algorithm)
+
+    def verify(self, token: str) -> Dict[str, Any]:
+        """
+        Claims of a valid token
+
+        Raises:
+            InvalidToken: If the token is malformed, badly signed, expired or revoked
+        """
+        now = time.time()
+        entry = self._cache.get(token)
+        if entry is not None:
+            if entry[1] > now:
+                self._cache.move_to_end(token)
+                self.hits += 1
+                return entry[0]
+            del self._cache[token]
+
+        self.misses += 1
+        try:
+            claims = jwt.decode(token, self._secret, algorithms=[self.algorithm])
+        except JWTError as e:
+            self.rejected += 1
+            raise InvalidToken(str(e)) from e
+        if not all(field in claims for field in ("sub", "role", "jti", "iat")):
+            self.rejected += 1
+            raise InvalidToken("Token is missing required claims")
+        if claims["jti"] in self._revoked or claims["iat"] <= self._revoked_before.get(claims["sub"], -1):
+            self.rejected += 1
+            raise InvalidToken("Token has been revoked")
+
+        if self.cache_size > 0:
+            self._cache[token] = (claims, min(claims["exp"], now + self.cache_ttl))
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return claims
+
+    def revoke(self, token: str) -> None:
+        """Revoke one token; a token that does not verify is already unusable"""
+        try:
+            claims = self.verify(token)
+        except InvalidToken:
+            return
+        now = time.time()
+        self._revoked = {jti: exp for jti, exp in self._revoked.items() if exp > now}
+        self._revoked[claims["jti"]] = claims["exp"]
+        self._cache.pop(token, None)
+
+    def revoke_user(self, username: str) -> int:
+        """Revoke every token issued to a user so far and return how many cached ones were evicted"""
+        self._revoked_before[username] = time.time()
+        evicted = [token for token, (claims, _) in self._cache.items() if claims["sub"] == username]
+        for token in evicted:
+            del self._cache[token]
+        return len(evicted)
+
+    def clear_cache(self) -> None:
+        """Drop every cached verification, e.g. after rotating the signing key"""
+        self._cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "cached_tokens": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "rejected": self.rejected,
+            "revoked_tokens": len(self._revoked),
+            "revoked_users": len(self._revoked_before),
+        }
+
+    def close(self) -> None:
+        self._hasher.shutdown(wait=False)
+
+
+def bearer_token(scope) -> Optional[str]:
+    """
+    Token from an "Authorization: Bearer" header, or for WebSockets only a
+    ?token= query parameter (browsers cannot set WebSocket headers). Plain
+    HTTP requests never read the query, so tokens stay out of access logs.
+    """
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            return token.strip() if scheme.lower() == "bearer" and token.strip() else None
+    if scope["type"] != "websocket":
+        return None
+    tokens = parse_qs(scope.get("query_string", b"").decode("latin-1")).get("token")
+    return tokens[0] if tokens else None
+
+
+class AuthMiddleware:
+    """
+    ASGI middleware requiring a valid token on every API request and WebSocket
+
+    Verified claims are placed in scope["state"]["user"] (request.state.user
+    in handlers). Roles in read_only_roles may only use GET and HEAD, except
+    on self-service paths such as logout. Added after ResponseCacheMiddleware
+    so it wraps it, and cached responses are never served to unauthenticated
+    clients.
+    """
+
+    def __init__(
+        self,
+        app,
+        authenticator: Authenticator,
+        prefix: str = "/api/",
+        public_paths: Iterable[str] = (),
+        self_service_paths: Iterable[str] = (),
+        read_only_roles: Iterable[str] = ()
+    ):
+        self.app = app
+        self.authenticator = authenticator
+        self.prefix = prefix
+        self.public_paths = frozenset(public_paths)
+        self.self_service_paths = frozenset(self_service_paths)
+        self.read_only_roles = frozenset(read_only_roles)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "websocket":
+            try:
+                claims = self.authenticator.verify(bearer_token(scope) or "")
+            except InvalidToken:
+                # Reject the handshake; the client sees it closed with 1008 (policy violation)
+                await receive()
+                await send({"type": "websocket.close", "code": 1008})
+                return
+            scope.setdefault("state", {})["user"] = claims
+        elif scope["type"] == "http" and scope["path"].startswith(self.prefix) and scope["path"] not in self.public_paths:
+            token = bearer_token(scope)
+            if token is None:
+                await self._deny(send, 401, "Not authenticated")
+                return
+            try:
+                claims = self.authenticator.verify(token)
+            except InvalidToken as e:
+                await self._deny(send, 401, str(e))
+                return
+            if (claims["role"] in self.read_only_roles and scope["method"] not in ("GET", "HEAD")
+                    and scope["path"] not in self.self_service_paths):
+                await self._deny(send, 403, f"Role '{claims['role']}' is read-only")
+                return
+            scope.setdefault("state", {})["user"] = claims
+        await self.app(scope, receive, send)
+
+    @staticmethod
+    async def _deny(send, status: int, detail: str) -> None:
+        body = json.dumps({"detail": detail}).encode()
+        headers = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+        if status == 401:
+            headers.append((b"www-authenticate", b"Bearer"))
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
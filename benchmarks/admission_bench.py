@@ -0,0 +1,167 @@
+"""
+Benchmark latency of critical robot commands under an overload of task and customer writes
+
+Run from the project root:
+
+    python -m benchmarks.admission_bench [--rate 6000] [--clients 500] [--seconds 3]
+
+Loads the app with an in-memory database and no event log and drives the
+ASGI app directly (no sockets). An open-loop flood offers task and
+customer creations at a fixed rate, spread over many clients with their
+own tokens, well beyond what one event loop can serve; requests arrive
+whether or not earlier ones have finished, as they would from real
+clients. An operator meanwhile sends a robot command every few
+milliseconds for the length of the overload, and the latency of each is
+recorded once it completes. The run is repeated with
+admission control off (its routes removed) and on: off, the backlog and
+command latency grow for as long as the overload lasts; on, the flood is
+shed with 429 and critical commands keep a bounded p99.
+"""
+import argparse
+import asyncio
+import json
+import time
+from collections import Counter
+
+from simulator import load_app
+
+
+async def call(asgi, method, path, token, payload=None):
+    body = json.dumps(payload).encode() if payload is not None else b""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method,
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"",
+        "headers": [(b"host", b"bench"), (b"authorization", b"Bearer " + token.encode()),
+                    (b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        "client": ("127.0.0.1", 1), "server": ("bench", 80),
+    }
+    status = {}
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status["code"] = message["status"]
+
+    await asgi(scope, receive, send)
+    return status["code"]
+
+
+async def flood_request(asgi, token, n, statuses):
+    if n % 2:
+        code = await call(asgi, "POST", "/api/tasks", token,
+                          {"type": "delivery", "table": f"Table {n % 5 + 1}", "priority": "normal"})
+    else:
+        code = await call(asgi, "POST", "/api/customers", token,
+                          {"name": f"Guest {n}", "email": f"guest{n}@example.com", "phone": "555"})
+    statuses[code] += 1
+
+
+async def flood(asgi, tokens, rate, statuses, pending, stop):
+    """Start requests at `rate` per second regardless of how many are still running"""
+    started = time.perf_counter()
+    sent = 0
+    while not stop.is_set():
+        due = int((time.perf_counter() - started) * rate)
+        for n in range(sent, due):
+            pending.add(asyncio.create_task(flood_request(asgi, tokens[n % len(tokens)], n, statuses)))
+        sent = due
+        pending.difference_update([task for task in pending if task.done()])
+        await asyncio.sleep(0.001)
+
+
+async def robot_command(asgi, token, n, due, latencies, statuses):
+    started = due
+    code = await call(asgi, "POST", f"/api/robots/R{n % 4 + 1}/command", token,
+                      {"command": ("RETURN_TO_BASE", "STOP_CHARGING")[n % 2]})
+    latencies.append(time.perf_counter() - started)
+    statuses[code] += 1
+
+
+async def operator(asgi, token, seconds, interval, latencies, statuses):
+    """
+    Send a command every `interval` for `seconds`, without waiting for earlier ones
+
+    Latency counts from when a command was due, not when this loop got
+    round to sending it: a real operator's request would have been waiting
+    in the socket for a saturated server all that time.
+    """
+    commands = []
+    started = time.perf_counter()
+    for n in range(int(seconds / interval)):
+        due = started + n * interval
+        delay = due - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        commands.append(asyncio.create_task(robot_command(asgi, token, n, due, latencies, statuses)))
+    return commands
+
+
+async def run_case(app, args, enabled):
+    asgi = app.app
+    routes = app.admission.routes
+    if not enabled:
+        app.admission.routes = []
+    tokens = [app.authenticator.issue(f"client-{n}", "operator") for n in range(args.clients)]
+    operator_token = app.authenticator.issue("operator", "operator")
+
+    stop = asyncio.Event()
+    flood_statuses, operator_statuses = Counter(), Counter()
+    latencies = []
+    pending = set()
+    generator = asyncio.create_task(flood(asgi, tokens, args.rate, flood_statuses, pending, stop))
+    await asyncio.sleep(0.2)
+    started = time.perf_counter()
+    commands = await operator(asgi, operator_token, args.seconds, args.interval, latencies, operator_statuses)
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await generator
+    await asyncio.gather(*commands)
+    # Requests still queued when the overload ends are abandoned, not drained
+    backlog = sum(not task.done() for task in pending)
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+    app.admission.routes = routes
+
+    latencies.sort()
+    return {
+        "p50": latencies[len(latencies) // 2] * 1000,
+        "p99": latencies[int(len(latencies) * 0.99)] * 1000,
+        "max": latencies[-1] * 1000,
+        "flood ok/s": flood_statuses[200] / elapsed,
+        "flood 429/s": flood_statuses[429] / elapsed,
+        "backlog": backlog,
+        "operator": dict(operator_statuses),
+    }
+
+
+async def run(args):
+    app = load_app()
+    await app.command_loop.start()
+    print(f"{args.seconds:.0f} s flood of {args.rate:,.0f} requests/s from {args.clients} clients, a robot command "
+          f"every {args.interval * 1000:.0f} ms, max {app.admission.max_in_flight} requests in flight")
+    print(f"{'admission':<11}{'cmd p50 ms':>11}{'cmd p99 ms':>11}{'cmd max ms':>11}{'flood ok/s':>12}{'flood 429/s':>13}"
+          f"{'backlog':>9}  commands")
+    results = {}
+    for label, enabled in (("off", False), ("on", True)):
+        result = results[label] = await run_case(app, args, enabled)
+        print(f"{label:<11}{result['p50']:>11.1f}{result['p99']:>11.1f}{result['max']:>11.1f}"
+              f"{result['flood ok/s']:>12,.0f}{result['flood 429/s']:>13,.0f}{result['backlog']:>9,}  {result['operator']}")
+    print(f"critical p99 {results['off']['p99'] / results['on']['p99']:.0f}x lower with admission control")
+    print(app.admission.stats())
+    await app.command_loop.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rate", type=float, default=6000)
+    parser.add_argument("--clients", type=int, default=500)
+    parser.add_argument("--seconds", type=float, default=3)
+    parser.add_argument("--interval", type=float, default=0.01)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Benchmark history reports over months of tasks, columnar against row dicts
+
+Run from the project root:
+
+    python -m benchmarks.analytics_bench [--days 180] [--tasks-per-day 3000]
+
+Fills a TaskHistory with `--days` of synthetic completed tasks and
+assignment log entries, writes it to a temporary directory and loads it
+back as a restarted server would. Times each report over the whole
+history and over its last week, and the same reports computed the way a
+report over task dicts would: one Python loop over a list of rows.
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from analytics import ASSIGNMENT_KINDS, DEFAULT_PERCENTILES, TASK_TYPES, TaskHistory
+
+REPEATS = 5
+
+
+def synthetic_history(days, tasks_per_day, seed=1):
+    """Completed tasks and assignment log entries, oldest first"""
+    rng = random.Random(seed)
+    end = datetime.now().replace(minute=0, second=0, microsecond=0)
+    start = end - timedelta(days=days)
+    step = 86400 / tasks_per_day
+    tasks, entries = [], []
+    for n in range(days * tasks_per_day):
+        completed_at = start + timedelta(seconds=n * step)
+        created_at = completed_at - timedelta(seconds=rng.lognormvariate(5.5, 0.5))
+        task = {
+            "completed_at": completed_at,
+            "created_at": created_at,
+            "deadline": created_at + timedelta(minutes=10) if rng.random() < 0.9 else None,
+            "type": rng.choice(TASK_TYPES),
+            "operator_override": 50 if rng.random() < 0.03 else 0,
+        }
+        tasks.append(task)
+        entries.append(({"assignment_time": created_at}, "assignment", task["type"]))
+        if task["operator_override"]:
+            entries.append(({"assignment_time": created_at}, rng.choice(ASSIGNMENT_KINDS[1:3]), task["type"]))
+    return tasks, entries
+
+
+def row_reports(tasks, entries, since):
+    """The four reports by looping over dict rows"""
+    rows = [task for task in tasks if task["completed_at"] >= since]
+    seconds = sorted((task["completed_at"] - task["created_at"]).total_seconds() for task in rows)
+    percentiles = [seconds[min(len(seconds) - 1, int(len(seconds) * p / 100))] for p in DEFAULT_PERCENTILES]
+    by_type = {}
+    for task in rows:
+        by_type.setdefault(task["type"], []).append((task["completed_at"] - task["created_at"]).total_seconds())
+    type_means = {task_type: statistics.fmean(values) for task_type, values in by_type.items()}
+    hours = {}
+    for task in rows:
+        hour = task["completed_at"].replace(minute=0, second=0, microsecond=0)
+        hours[hour] = hours.get(hour, 0) + 1
+    missed = sum(1 for task in rows if task["deadline"] and task["completed_at"] > task["deadline"])
+    overrides = sum(1 for entry, kind, _ in entries if kind in ("priority_boost", "override") and entry["assignment_time"] >= since)
+    return percentiles, type_means, len(hours), missed, overrides
+
+
+def best_of(function):
+    timings = []
+    for _ in range(REPEATS):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return min(timings) * 1000
+
+
+async def run(args):
+    started = time.perf_counter()
+    tasks, entries = synthetic_history(args.days, args.tasks_per_day)
+    print(f"{len(tasks):,} tasks and {len(entries):,} log entries over {args.days} days "
+          f"(generated in {time.perf_counter() - started:.1f} s)")
+
+    with tempfile.TemporaryDirectory() as directory:
+        history = TaskHistory(directory)
+        started = time.perf_counter()
+        for task in tasks:
+            history.add_task(task)
+        for entry in entries:
+            history.add_assignment(*entry)
+        ingest = (time.perf_counter() - started) / (len(tasks) + len(entries)) * 1e6
+        history.close()
+
+        started = time.perf_counter()
+        history = TaskHistory(directory)
+        load = time.perf_counter() - started
+        stats = history.stats()
+        print(f"ingest {ingest:.1f} µs per row; loaded {stats['tasks']['chunks'] + stats['assignments']['chunks']} "
+              f"chunks from disk in {load * 1000:.0f} ms")
+
+        print(f"{'range':<12}{'report':<20}{'columnar ms':>12}{'row dicts ms':>14}")
+        end = tasks[-1]["completed_at"] + timedelta(seconds=1)
+        for label, since, interval in (
+            ("all", tasks[0]["completed_at"], "day"),
+            ("last week", end - timedelta(days=7), "hour"),
+        ):
+            total = 0.0
+            for name, query in (
+                ("completion times", lambda: history.completion_times(since)),
+                ("throughput", lambda: history.throughput(since, end, interval)),
+                ("deadline misses", lambda: history.deadline_misses(since)),
+                ("overrides", lambda: history.overrides(since)),
+            ):
+                timings = []
+                for _ in range(REPEATS):
+                    started = time.perf_counter()
+                    await query()
+                    timings.append(time.perf_counter() - started)
+                total += min(timings) * 1000
+                print(f"{label:<12}{name:<20}{min(timings) * 1000:>12.1f}")
+            rows_ms = best_of(lambda: row_reports(tasks, entries, since))
+            print(f"{label:<12}{'all four':<20}{total:>12.1f}{rows_ms:>14.1f}")
+        history.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--days", type=int, default=180)
+    parser.add_argument("--tasks-per-day", type=int, default=3000)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
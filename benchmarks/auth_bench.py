@@ -0,0 +1,112 @@
+"""
+Benchmark per-request authentication cost with and without the verified-token cache
+
+Run from the project root:
+
+    python -m benchmarks.auth_bench [--requests 5000] [--logins 20]
+
+Loads the app with an in-memory database and no event log and drives the
+ASGI app directly (no sockets). Times Authenticator.verify alone on a
+cache hit and on a miss (full JWT decode and signature check), then a
+cheap authenticated endpoint end to end, once with the cache warm and
+once with it disabled. Finally runs concurrent logins while a heartbeat
+task measures event loop lag, with password checks on the hashing pool
+and inline on the loop.
+"""
+import argparse
+import asyncio
+import time
+
+from auth import pwd_context
+from simulator import load_app
+from benchmarks.response_cache_bench import AUTH_HEADERS, call
+
+PATH = "/api/auth/me"
+
+
+def per_call(fn, count):
+    started = time.perf_counter()
+    for _ in range(count):
+        fn()
+    return (time.perf_counter() - started) / count
+
+
+async def per_request(asgi, count):
+    started = time.perf_counter()
+    for _ in range(count):
+        status, _, _ = await call(asgi, PATH)
+        assert status == 200
+    return (time.perf_counter() - started) / count
+
+
+async def login_lag(app, logins, inline):
+    """Largest event loop stall, in ms, while `logins` logins run"""
+    authenticator = app.authenticator
+    lag = 0.0
+    running = True
+
+    async def heartbeat():
+        nonlocal lag
+        while running:
+            started = time.perf_counter()
+            await asyncio.sleep(0.001)
+            lag = max(lag, time.perf_counter() - started - 0.001)
+
+    async def login():
+        if inline:
+            # What login did with the hash check on the event loop
+            user = authenticator.users["admin"]
+            assert pwd_context.verify("admin", user["password_hash"])
+        else:
+            assert await authenticator.authenticate("admin", "admin")
+
+    monitor = asyncio.create_task(heartbeat())
+    await asyncio.sleep(0.01)
+    started = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+    running = False
+    await monitor
+    return lag * 1000, elapsed * 1000
+
+
+async def run(args):
+    app = load_app()
+    authenticator = app.authenticator
+    token = authenticator.issue("bench", "administrator")
+    AUTH_HEADERS.append((b"authorization", b"Bearer " + token.encode()))
+    asgi = app.app
+
+    authenticator.verify(token)
+    hit = per_call(lambda: authenticator.verify(token), args.requests)
+    cache_size = authenticator.cache_size
+    authenticator.cache_size = 0
+    authenticator.clear_cache()
+    miss = per_call(lambda: authenticator.verify(token), args.requests)
+
+    request_miss = await per_request(asgi, args.requests)
+    authenticator.cache_size = cache_size
+    request_hit = await per_request(asgi, args.requests)
+
+    print(f"{args.requests} calls per case")
+    print(f"{'case':<28}{'cache hit us':>14}{'cache miss us':>15}")
+    print(f"{'verify()':<28}{hit * 1e6:>14.1f}{miss * 1e6:>15.1f}")
+    print(f"{'GET ' + PATH + ' end to end':<28}{request_hit * 1e6:>14.1f}{request_miss * 1e6:>15.1f}")
+    print(f"a cache hit saves {(miss - hit) * 1e6:.0f} us per request ({miss / hit:.0f}x cheaper to verify)")
+
+    for mode, inline in (("on the event loop", True), ("on the hashing pool", False)):
+        lag, elapsed = await login_lag(app, args.logins, inline)
+        print(f"{args.logins} logins, password checks {mode:<20}: {elapsed:>5.0f} ms total, worst loop stall {lag:>5.1f} ms")
+    print(authenticator.stats())
+    authenticator.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--logins", type=int, default=20)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Benchmark the cost of traffic capture on the request path
+
+Run from the project root:
+
+    python -m benchmarks.capture_bench [--requests 5000]
+
+Loads the app with an in-memory database and no event log and sends
+`--requests` calls, a mix of task creation, status and priority changes
+and polled reads, through the full ASGI stack from 20 concurrent clients,
+with capture off and on. Reports the time per request, the capture's
+file size per request and the writer's queue and drops. Admission rate
+limits are lifted so that only the work is measured.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+
+from simulator import load_app
+from benchmarks.write_load_bench import reset
+
+CLIENTS = 20
+REPEATS = 5
+
+
+async def call(asgi, headers, method, path, body=None):
+    payload = json.dumps(body).encode() if body is not None else b""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method,
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"",
+        "headers": headers + [(b"content-type", b"application/json"), (b"content-length", str(len(payload)).encode())],
+        "client": ("127.0.0.1", 1), "server": ("bench", 80),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": payload, "more_body": False}
+
+    async def send(message):
+        pass
+
+    await asgi(scope, receive, send)
+
+
+def workload(app, requests, seed=1):
+    rng = random.Random(seed)
+    task_ids = [task["id"] for task in app.system_state.tasks]
+    calls = []
+    for n in range(requests):
+        roll = rng.random()
+        if roll < 0.2:
+            calls.append(("POST", "/api/tasks", {"type": "delivery", "table": f"Table {n % 12 + 1}", "priority": "high"}))
+        elif roll < 0.35:
+            calls.append(("PUT", f"/api/tasks/{rng.choice(task_ids)}/status", {"state": "RUNNING"}))
+        elif roll < 0.5:
+            calls.append(("PUT", f"/api/queue/tasks/{rng.choice(task_ids)}/priority", {"boost": 5, "reason": "bench"}))
+        else:
+            calls.append(("GET", rng.choice(("/api/robots", "/api/tables", "/api/charging/status")), None))
+    return calls
+
+
+async def run_case(app, headers, requests, directory):
+    reset(app, robots=4, stations=2, tasks=200)
+    calls = workload(app, requests)
+    capture = app.traffic_capture
+    if directory:
+        capture.start(os.path.join(directory, "bench.capture"), app.dump_state(app.capture_state()))
+    pending = iter(calls)
+
+    async def client():
+        for call_args in pending:
+            await call(app.app, headers, *call_args)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(CLIENTS)))
+    await app.command_loop.stop()
+    elapsed = time.perf_counter() - started
+    stats = capture.stop(app.dump_state(app.capture_state())) if directory else None
+    return elapsed, stats
+
+
+async def run(args):
+    app = load_app()
+    headers = [(b"host", b"bench"), (b"authorization", b"Bearer " + app.authenticator.issue("bench", "administrator").encode())]
+    for lane in app.admission.lanes.values():
+        lane.rate = lane.burst = float("inf")
+
+    print(f"{args.requests} requests from {CLIENTS} clients, best of {REPEATS}")
+    print(f"{'capture':<10}{'µs/request':>12}{'bytes/request':>15}{'dropped':>9}")
+    with tempfile.TemporaryDirectory() as directory:
+        for label, target in (("off", None), ("on", directory)):
+            runs = [await run_case(app, headers, args.requests, target) for _ in range(REPEATS)]
+            elapsed, stats = min(runs, key=lambda result: result[0])
+            size = f"{stats['bytes'] / args.requests:.0f}" if stats else "-"
+            dropped = stats["dropped"] if stats else "-"
+            print(f"{label:<10}{elapsed / args.requests * 1e6:>12.1f}{size:>15}{dropped:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=5000)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
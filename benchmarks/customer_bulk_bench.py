@@ -0,0 +1,123 @@
+"""
+Benchmark streaming bulk customer import and export
+
+Run from the project root:
+
+    python -m benchmarks.customer_bulk_bench [--rows 1000000]
+
+The upload is generated on the fly in 64 KiB chunks, the way Starlette
+hands a request body to the endpoint, so the file itself never exists in
+memory. Parse/validate memory is measured with tracemalloc on a dry run;
+the full import reports throughput and how many grouped external-API
+calls it would make.
+"""
+import argparse
+import asyncio
+import csv
+import io
+import json
+import time
+import tracemalloc
+
+from customer_bulk import CSV_COLUMNS, export_customers, import_customers
+from customer_directory import CustomerDirectory
+from benchmarks.customer_directory_bench import make_customers
+
+CHUNK_BYTES = 64 * 1024
+
+
+async def ndjson_body(rows, stats):
+    buffer = []
+    size = 0
+    for customer in make_customers(rows):
+        del customer["id"]
+        line = json.dumps(customer) + "\n"
+        buffer.append(line)
+        size += len(line)
+        if size >= CHUNK_BYTES:
+            chunk = "".join(buffer).encode()
+            stats["bytes"] += len(chunk)
+            yield chunk
+            buffer, size = [], 0
+    if buffer:
+        chunk = "".join(buffer).encode()
+        stats["bytes"] += len(chunk)
+        yield chunk
+
+
+async def csv_body(rows, stats):
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator="\n")
+    writer.writerow(CSV_COLUMNS)
+    for customer in make_customers(rows):
+        writer.writerow(["", customer["name"], customer["email"], customer["phone"], customer["totalVisits"],
+                         customer["totalSpent"], "Pad Thai;Tom Yum Soup", customer["lastVisit"],
+                         customer["membership"]])
+        if out.tell() >= CHUNK_BYTES:
+            chunk = out.getvalue().encode()
+            stats["bytes"] += len(chunk)
+            yield chunk
+            out.seek(0)
+            out.truncate()
+    chunk = out.getvalue().encode()
+    stats["bytes"] += len(chunk)
+    yield chunk
+
+
+async def run_import(label, body, rows, directory, dry_run=False, trace=False):
+    stats = {"bytes": 0, "sync_calls": 0, "synced": 0}
+
+    async def sync_batch(customers):
+        stats["sync_calls"] += 1
+        stats["synced"] += len(customers)
+
+    if trace:
+        tracemalloc.start()
+    start = time.perf_counter()
+    report = await import_customers(body(rows, stats), body.__name__.split("_")[0], directory,
+                                    sync_batch=sync_batch, dry_run=dry_run)
+    elapsed = time.perf_counter() - start
+    peak = None
+    if trace:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    print(f"{label}")
+    print(f"  {rows:,} rows, {stats['bytes'] / 2 ** 20:.0f} MiB body in {elapsed:.2f}s "
+          f"({rows / elapsed:,.0f} rows/s)")
+    print(f"  created={report['created']:,} rejected={report['rejected']:,} "
+          f"external calls={stats['sync_calls']:,} for {stats['synced']:,} customers")
+    if peak is not None:
+        print(f"  peak traced memory while streaming: {peak / 2 ** 20:.1f} MiB")
+
+
+async def run_export(directory, fmt):
+    start = time.perf_counter()
+    total = 0
+    peak_chunk = 0
+    async for chunk in export_customers(directory, fmt):
+        total += len(chunk)
+        peak_chunk = max(peak_chunk, len(chunk))
+    elapsed = time.perf_counter() - start
+    print(f"Export {fmt}: {len(directory):,} customers, {total / 2 ** 20:.0f} MiB in {elapsed:.2f}s "
+          f"(largest chunk {peak_chunk / 1024:.0f} KiB)")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark streaming bulk customer import and export")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    await run_import("NDJSON dry run (parse + validate only)", ndjson_body, args.rows,
+                     CustomerDirectory(), dry_run=True, trace=True)
+    await run_import("CSV dry run (parse + validate only)", csv_body, args.rows,
+                     CustomerDirectory(), dry_run=True, trace=True)
+
+    directory = CustomerDirectory()
+    await run_import("NDJSON import", ndjson_body, args.rows, directory)
+    await run_export(directory, "ndjson")
+    await run_export(directory, "csv")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,109 @@
+"""
+Benchmark the indexed customer directory against the plain list it replaced
+
+Run from the project root:
+
+    python -m benchmarks.customer_directory_bench [--customers 1000000]
+"""
+import argparse
+import random
+import resource
+import time
+
+from customer_directory import CustomerDirectory
+
+FIRST_NAMES = [
+    "John", "Sarah", "Michael", "Emily", "David", "Jessica", "Daniel", "Ashley", "Matthew", "Amanda",
+    "Somchai", "Malee", "Niran", "Ploy", "Arthit", "Kanya", "Chaiya", "Suda", "Anan", "Pim",
+]
+LAST_NAMES = [
+    "Smith", "Johnson", "Chen", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis", "Wilson",
+    "Srisuk", "Wongsa", "Boonmee", "Chaiyaporn", "Kittisak", "Rattana", "Saetang", "Thongchai",
+]
+MEMBERSHIPS = ["regular"] * 8 + ["premium"] * 3 + ["vip"]
+
+
+def make_customers(count, seed=42):
+    rng = random.Random(seed)
+    for i in range(1, count + 1):
+        first = rng.choice(FIRST_NAMES)
+        # A unique-ish suffix keeps the name vocabulary realistic in size
+        last = rng.choice(LAST_NAMES) + ("" if rng.random() < 0.7 else str(rng.randint(1, 5000)))
+        yield {
+            "id": i,
+            "name": f"{first} {last}",
+            "email": f"{first.lower()}.{i}@example.com",
+            "phone": f"(555) {i // 10000:03d}-{i % 10000:04d}",
+            "totalVisits": rng.randint(0, 200),
+            "totalSpent": round(rng.uniform(0, 20000), 2),
+            "favoriteItems": [],
+            "lastVisit": "2024-06-15",
+            "membership": rng.choice(MEMBERSHIPS),
+        }
+
+
+def timed(label, fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<42} {elapsed / repeat * 1e6:>12.1f} us/op")
+    return result
+
+
+def rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--customers", type=int, default=1_000_000)
+    args = parser.parse_args()
+    n = args.customers
+
+    customers = list(make_customers(n))
+    base_rss = rss_mb()
+
+    start = time.perf_counter()
+    directory = CustomerDirectory(customers)
+    print(f"Bulk load of {n:,} customers: {time.perf_counter() - start:.2f}s, "
+          f"+{rss_mb() - base_rss:.0f} MB peak RSS for indexes")
+
+    rng = random.Random(7)
+    probe_ids = [rng.randint(1, n) for _ in range(1000)]
+    probe_emails = [customers[i - 1]["email"] for i in probe_ids]
+    probe_phones = [customers[i - 1]["phone"] for i in probe_ids]
+    it = iter(range(10 ** 9))
+
+    print("Point lookups")
+    timed("list scan by email (baseline)",
+          lambda: next((c for c in customers if c["email"] == probe_emails[next(it) % 1000]), None), 20)
+    timed("directory by id", lambda: directory.get(probe_ids[next(it) % 1000]), 100_000)
+    timed("directory by email", lambda: directory.find_by_email(probe_emails[next(it) % 1000]), 100_000)
+    timed("directory by phone", lambda: directory.find_by_phone(probe_phones[next(it) % 1000]), 100_000)
+
+    print("Name search")
+    timed("prefix 'som wong' (limit 50)", lambda: directory.search_name("som wong"), 200)
+    timed("prefix 'kittisak12' (limit 50)", lambda: directory.search_name("kittisak12"), 200)
+    timed("fuzzy 'jonh smtih' (limit 20)", lambda: directory.fuzzy_search_name("jonh smtih"), 5)
+
+    print("Ranking and segments")
+    timed("max(totalSpent) list scan (baseline)", lambda: max(customers, key=lambda c: c["totalSpent"]), 3)
+    timed("top 10 by totalSpent", lambda: directory.top("totalSpent", 10), 10_000)
+    timed("top 10 vip by totalVisits", lambda: directory.top("totalVisits", 10, membership="vip"), 1_000)
+    timed("totalSpent in [5000, 5010] (limit 50)", lambda: directory.in_range("totalSpent", 5000, 5010), 10_000)
+
+    print("Mutations")
+    timed("max(ids) + 1 id allocation (baseline)", lambda: max(c["id"] for c in customers) + 1, 3)
+    new_ids = []
+    timed("add customer", lambda: new_ids.append(directory.add({
+        "name": "Bench Customer", "email": "bench@example.com", "phone": "(555) 000-0000",
+        "totalVisits": 1, "totalSpent": 10.0, "membership": "regular",
+    })["id"]), 10_000)
+    timed("update totalSpent", lambda: directory.update(probe_ids[next(it) % 1000],
+                                                        {"totalSpent": rng.uniform(0, 20000)}), 10_000)
+    timed("remove customer", lambda: directory.remove(new_ids.pop()), 10_000)
+
+
+if __name__ == "__main__":
+    main()
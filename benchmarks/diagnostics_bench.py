@@ -0,0 +1,80 @@
+"""
+Benchmark the overhead of the always-on loop diagnostics and of a running profile
+
+Run from the project root:
+
+    python -m benchmarks.diagnostics_bench [--seconds 2] [--rounds 5]
+
+Loads the app with an in-memory database and no event log and drives the
+ASGI app directly (no sockets) with a cheap authenticated GET, the case
+where a fixed per-second cost shows most. Rounds of `--seconds` alternate
+between diagnostics off, on (heartbeat and 100 Hz sampling), and on with
+a profile being captured at 200 Hz; the best round of each is reported
+with the CPU time the monitor thread itself used.
+"""
+import argparse
+import asyncio
+import time
+
+from simulator import load_app
+from benchmarks.response_cache_bench import AUTH_HEADERS, call
+
+PATH = "/api/auth/me"
+
+
+async def requests_per_second(asgi, seconds):
+    count = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        status, _, _ = await call(asgi, PATH)
+        assert status == 200
+        count += 1
+    return count / (time.perf_counter() - started)
+
+
+async def run_round(app, seconds, mode):
+    diagnostics = app.diagnostics
+    if mode != "off":
+        diagnostics.start()
+    profile = None
+    if mode == "profiling":
+        profile = asyncio.get_running_loop().run_in_executor(None, diagnostics.profile, seconds, 0.005)
+    sampling_before = diagnostics.sampling_seconds
+    rate = await requests_per_second(app.app, seconds)
+    sampling = diagnostics.sampling_seconds - sampling_before
+    if profile is not None:
+        await profile
+    await diagnostics.stop()
+    return rate, sampling
+
+
+async def run(args):
+    app = load_app()
+    AUTH_HEADERS.append((b"authorization", b"Bearer " + app.authenticator.issue("bench", "administrator").encode()))
+    await requests_per_second(app.app, 0.5)
+
+    modes = ("off", "on", "profiling")
+    best = {mode: (0.0, 0.0) for mode in modes}
+    for _ in range(args.rounds):
+        for mode in modes:
+            rate, sampling = await run_round(app, args.seconds, mode)
+            if rate > best[mode][0]:
+                best[mode] = (rate, sampling)
+
+    print(f"GET {PATH} for {args.seconds:.0f} s per round, best of {args.rounds}")
+    print(f"{'diagnostics':<14}{'requests/s':>12}{'overhead':>10}{'monitor cpu ms':>16}")
+    for mode in modes:
+        rate, sampling = best[mode]
+        print(f"{mode:<14}{rate:>12,.0f}{1 - rate / best['off'][0]:>10.1%}{sampling * 1000:>16.1f}")
+    print(app.diagnostics.stats()["handlers"][:4])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--seconds", type=float, default=2)
+    parser.add_argument("--rounds", type=int, default=5)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Exercise the external API clients against a local mock server
+
+Run from the project root:
+
+    python -m benchmarks.external_api_client_bench
+
+Each scenario prints its measurements and a PASS/FAIL line for the
+behaviour it checks: pooled throughput, retries under injected failures,
+fail-fast behind the circuit breaker, update coalescing and batching.
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from external_api_client import (
+    AsyncExternalApiClient, CircuitBreaker, CircuitOpenError, ExternalApiClient
+)
+from benchmarks.mock_external_api import MockExternalApi, free_port
+
+results = []
+
+
+def check(label, ok):
+    results.append(ok)
+    print(f"  [{'PASS' if ok else 'FAIL'}] {label}")
+
+
+def customer(i):
+    return {"id": i, "name": f"Customer {i}", "email": f"c{i}@example.com", "phone": "(555) 000-0000"}
+
+
+async def throughput(mock, calls=500):
+    print(f"Throughput: {calls} creates, 20 ms server latency")
+    mock.configure(latency=0.02, failure_rate=0.0)
+
+    sync_client = ExternalApiClient(mock.url)
+    sample = 50
+    start = time.perf_counter()
+    for i in range(sample):
+        sync_client.create_customer(customer(i))
+    sync_rate = sample / (time.perf_counter() - start)
+    print(f"  sync client, sequential:          {sync_rate:8.0f} calls/s")
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        await asyncio.gather(*(loop.run_in_executor(pool, sync_client.create_customer, customer(i))
+                               for i in range(calls)))
+        threaded_rate = calls / (time.perf_counter() - start)
+    print(f"  sync client, 8 threads:           {threaded_rate:8.0f} calls/s")
+
+    rates = {}
+    for concurrency in (5, 10, 20):
+        async with AsyncExternalApiClient(mock.url, max_concurrency=concurrency,
+                                          max_connections=concurrency) as client:
+            start = time.perf_counter()
+            await asyncio.gather(*(client.create_customer(customer(i)) for i in range(calls)))
+            rates[concurrency] = calls / (time.perf_counter() - start)
+        print(f"  async client, concurrency {concurrency:<3}:    {rates[concurrency]:8.0f} calls/s")
+    check("async client with 10 in flight beats the sequential sync client by 5x", rates[10] > 5 * sync_rate)
+
+    data = customer(1)
+    async with AsyncExternalApiClient(mock.url) as client:
+        await client.create_customer(data)
+    check("create_customer leaves the caller's dict unchanged", "created_at" not in data)
+
+
+async def retries(mock, calls=300):
+    print(f"Retries: {calls} creates, 30% injected 503s")
+    mock.configure(reset=True, latency=0.0, failure_rate=0.3)
+    # A breaker threshold above the expected failure streaks keeps it closed
+    async with AsyncExternalApiClient(mock.url, backoff_base=0.01, max_retries=4,
+                                      breaker=CircuitBreaker(failure_threshold=50)) as client:
+        outcomes = await asyncio.gather(*(client.create_customer(customer(i)) for i in range(calls)),
+                                        return_exceptions=True)
+    succeeded = sum(not isinstance(o, Exception) for o in outcomes)
+    requests = mock.state()["requests"]
+    print(f"  succeeded {succeeded}/{calls} using {requests['POST /customers']} requests "
+          f"({requests['injected failures']} injected failures)")
+    check("at least 99% of calls succeed despite a 30% failure rate", succeeded >= 0.99 * calls)
+
+
+async def dead_api(calls=50):
+    print("Circuit breaker: API unreachable (closed port)")
+    url = f"http://127.0.0.1:{free_port()}"
+    async with AsyncExternalApiClient(url, backoff_base=0.05, max_retries=2,
+                                      breaker=CircuitBreaker(failure_threshold=5, reset_timeout=60)) as client:
+        latencies = []
+        open_errors = 0
+        for i in range(calls):
+            start = time.perf_counter()
+            try:
+                await client.create_customer(customer(i))
+            except CircuitOpenError:
+                open_errors += 1
+            except Exception:
+                pass
+            latencies.append(time.perf_counter() - start)
+    tail = latencies[5:]
+    print(f"  first call {latencies[0] * 1000:.1f} ms, later calls avg {sum(tail) / len(tail) * 1e6:.1f} us, "
+          f"{open_errors}/{calls} rejected by the open circuit")
+    check("calls fail fast (<1 ms) once the circuit is open", max(tail) < 0.001)
+
+
+async def coalescing(mock, updates=200):
+    print(f"Coalescing: {updates} concurrent updates to one customer")
+    mock.configure(reset=True, latency=0.01, failure_rate=0.0)
+    async with AsyncExternalApiClient(mock.url) as client:
+        await asyncio.gather(*(client.update_customer(42, {"totalVisits": i, f"field{i % 3}": i})
+                               for i in range(updates)))
+    state = mock.state()
+    puts = state["requests"].get("PUT /customers/{id}", 0)
+    final = state["last_update"]["42"]
+    print(f"  {puts} PUT request(s) reached the server, final payload {final}")
+    check("updates are merged into a single request", puts == 1)
+    check("the merged payload carries the latest value of every field",
+          final["totalVisits"] == updates - 1
+          and all(final[f"field{k}"] == max(i for i in range(updates) if i % 3 == k) for k in range(3)))
+
+
+async def batching(mock, count=10_000):
+    print(f"Batching: upsert {count:,} customers")
+    mock.configure(reset=True, latency=0.01, failure_rate=0.0)
+    async with AsyncExternalApiClient(mock.url, batch_size=500) as client:
+        start = time.perf_counter()
+        responses = await client.upsert_customers_batch([customer(i) for i in range(count)])
+        elapsed = time.perf_counter() - start
+    print(f"  {mock.requests('POST /customers/batch')} requests, {elapsed * 1000:.0f} ms")
+    check("customers are sent in batch_size groups", len(responses) == count // 500
+          and sum(r["count"] for r in responses) == count)
+
+
+async def main():
+    with MockExternalApi() as mock:
+        await throughput(mock)
+        await retries(mock)
+        await coalescing(mock)
+        await batching(mock)
+    await dead_api()
+    print(f"{sum(results)}/{len(results)} checks passed")
+    if not all(results):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,91 @@
+"""
+Stress test id allocation across worker processes
+
+Run from the project root:
+
+    python -m benchmarks.id_allocator_bench [--workers 8] [--ids 200000] [--rounds 2]
+
+Each round starts `--workers` processes that claim worker ids from a
+shared lease directory, as uvicorn workers of app.py do, and allocate
+`--ids` ids each as fast as they can. Rounds reuse the directory, so later
+processes take over leases released by earlier ones. Fails unless every id
+from every process is distinct, each process's ids strictly increase, and
+the text form of the ids sorts in the same order as their values.
+"""
+import argparse
+import multiprocessing
+import sys
+import tempfile
+import time
+from array import array
+
+from id_allocator import EPOCH_MS, SEQUENCE_BITS, WORKER_BITS, IdAllocator, claim_worker_id, encode_id
+
+
+def allocate(lease_dir, count, start, results):
+    worker_id, lease = claim_worker_id(lease_dir)
+    allocator = IdAllocator(worker_id)
+    start.wait()
+    started = time.perf_counter()
+    ids = array("q", (allocator.next_int() for _ in range(count)))
+    elapsed = time.perf_counter() - started
+    lead_ms = (ids[-1] >> (WORKER_BITS + SEQUENCE_BITS)) + EPOCH_MS - time.time() * 1000
+    results.put((worker_id, elapsed, lead_ms, ids.tobytes()))
+    lease.close()
+
+
+def run_round(lease_dir, workers, count):
+    start = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=allocate, args=(lease_dir, count, start, results)) for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    started = time.perf_counter()
+    start.set()
+    batches = [results.get() for _ in processes]
+    elapsed = time.perf_counter() - started
+    for process in processes:
+        process.join()
+    return batches, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--ids", type=int, default=200_000)
+    parser.add_argument("--rounds", type=int, default=2)
+    args = parser.parse_args()
+
+    seen = set()
+    ok = True
+    with tempfile.TemporaryDirectory() as lease_dir:
+        for round_number in range(1, args.rounds + 1):
+            batches, elapsed = run_round(lease_dir, args.workers, args.ids)
+            worker_ids = sorted(worker_id for worker_id, _, _, _ in batches)
+            increasing = True
+            for _, _, _, raw in batches:
+                ids = array("q")
+                ids.frombytes(raw)
+                increasing &= all(a < b for a, b in zip(ids, ids[1:]))
+                seen.update(ids)
+            total = args.workers * args.ids * round_number
+            per_worker = max(args.ids / worker_elapsed for _, worker_elapsed, _, _ in batches)
+            lead = max(lead_ms for _, _, lead_ms, _ in batches)
+            print(f"round {round_number}: workers {worker_ids}, {args.workers * args.ids / elapsed:,.0f} ids/s in all, "
+                  f"up to {per_worker:,.0f} ids/s per worker, ids at most {max(lead, 0.0):.1f} ms ahead of the clock")
+            print(f"  {len(seen):,} distinct of {total:,} allocated, each worker increasing: {increasing}")
+            ok &= len(seen) == total and increasing and len(set(worker_ids)) == args.workers
+
+    sample = sorted(seen)[:: max(1, len(seen) // 100_000)]
+    text_order = sorted(sample, key=encode_id) == sample
+    print(f"text order matches numeric order: {text_order}")
+    print(f"example task id: T-{encode_id(sample[-1])}")
+    ok &= text_order
+    print("PASS" if ok else "FAIL")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Benchmark the cost of logging on the request path
+
+Run from the project root:
+
+    python -m benchmarks.logging_bench [--records 100000] [--seconds 2]
+
+Part one times the caller's side of one log record: print(), the
+standard logging module with a JSON formatter, and the structured_log
+pipeline, which only queues the record. Each writes to /dev/null and to
+a sink that takes 1 ms per write, like a slow disk or a full pipe; the
+pipeline's writer thread runs alongside and its batches are counted.
+
+Part two drives the ASGI app directly (no sockets) with a cheap
+authenticated GET for `--seconds` per round, with logging at error level
+and at info level (an access record per request), best of three rounds.
+"""
+import argparse
+import asyncio
+import io
+import json
+import logging
+import os
+import time
+
+import structured_log
+from simulator import load_app
+from benchmarks.response_cache_bench import AUTH_HEADERS, call
+
+PATH = "/api/auth/me"
+
+
+class SlowSink(io.TextIOBase):
+    """A stream taking a fixed time per write"""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.writes = 0
+
+    def write(self, text):
+        self.writes += 1
+        time.sleep(self.delay)
+        return len(text)
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        return json.dumps({
+            "ts": self.formatTime(record),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "event": record.getMessage(),
+            **getattr(record, "fields", {}),
+        })
+
+
+def fields(i):
+    return {"method": "GET", "path": "/api/robots", "status": 200, "ms": 0.42, "n": i}
+
+
+def time_print(stream, records):
+    started = time.perf_counter()
+    for i in range(records):
+        print(json.dumps({"event": "http.request", **fields(i)}), file=stream, flush=True)
+    return time.perf_counter() - started
+
+
+def time_stdlib(stream, records):
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(JsonFormatter())
+    logger = logging.getLogger("bench")
+    logger.handlers[:] = [handler]
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    started = time.perf_counter()
+    for i in range(records):
+        logger.info("http.request", extra={"fields": fields(i)})
+    return time.perf_counter() - started
+
+
+def time_pipeline(stream, records):
+    pipeline = structured_log.configure(stream=stream, capacity=records)
+    log = structured_log.get_logger("bench")
+    started = time.perf_counter()
+    for i in range(records):
+        log.info("http.request", **fields(i))
+    elapsed = time.perf_counter() - started
+    pipeline.close()
+    return elapsed, pipeline.stats()
+
+
+def caller_costs(records):
+    print(f"Caller's cost per record, {records:,} records")
+    print(f"{'':<24}{'/dev/null':>12}{'1 ms/write sink':>18}")
+    with open(os.devnull, "w") as devnull:
+        slow_records = max(1, records // 100)
+        for name, timer in (("print", time_print), ("stdlib logging + JSON", time_stdlib)):
+            fast = timer(devnull, records) / records
+            slow = timer(SlowSink(0.001), slow_records) / slow_records
+            print(f"{name:<24}{fast * 1e6:>10.2f}us{slow * 1e6:>16.1f}us")
+        fast, _ = time_pipeline(devnull, records)
+        slow, stats = time_pipeline(SlowSink(0.001), records)
+        print(f"{'structured_log':<24}{fast / records * 1e6:>10.2f}us{slow / records * 1e6:>16.2f}us")
+        print(f"  slow sink: {stats['written']:,} records written in {stats['batches']} batches, "
+              f"{stats['dropped']} dropped")
+
+
+async def requests_per_second(asgi, seconds):
+    count = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        status, _, _ = await call(asgi, PATH)
+        assert status == 200
+        count += 1
+    return count / (time.perf_counter() - started)
+
+
+async def request_path(seconds):
+    app = load_app()
+    AUTH_HEADERS.append((b"authorization", b"Bearer " + app.authenticator.issue("bench", "administrator").encode()))
+    await requests_per_second(app.app, 0.5)
+    print(f"\nGET {PATH}, {seconds:.0f} s per round, best of 3")
+    with open(os.devnull, "w") as devnull:
+        best = {}
+        for _ in range(3):
+            for level in ("error", "info"):
+                pipeline = structured_log.configure(stream=devnull, level=level)
+                rate = await requests_per_second(app.app, seconds)
+                best[level] = max(best.get(level, 0.0), rate)
+                pipeline.close()
+        for level, rate in best.items():
+            print(f"  LOG_LEVEL={level:<8}{rate:>10,.0f} requests/s{1 - rate / best['error']:>8.1%} overhead")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--records", type=int, default=100_000)
+    parser.add_argument("--seconds", type=float, default=2)
+    args = parser.parse_args()
+    caller_costs(args.records)
+    asyncio.run(request_path(args.seconds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Local stand-in for the external customer API
+
+Serves the endpoints AsyncExternalApiClient talks to on a random localhost
+port, with injectable latency and failure rate, and counts the requests it
+receives per route. It runs in its own process so that its CPU time does
+not compete with the client being measured; /_control reads and changes
+its settings.
+"""
+import asyncio
+import multiprocessing
+import random
+import socket
+import time
+from collections import Counter
+from typing import Any, Dict
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+
+def route_key(method: str, path: str) -> str:
+    """Group requests by route, e.g. "PUT /customers/{id}" """
+    parts = ["{id}" if part.isdigit() else part for part in path.split("/")]
+    return f"{method} {'/'.join(parts)}"
+
+
+def create_mock_app(seed: int = 0) -> FastAPI:
+    mock = FastAPI()
+    state: Dict[str, Any] = {
+        "latency": 0.0,
+        "failure_rate": 0.0,
+        "requests": Counter(),
+        "last_update": {},
+    }
+    rng = random.Random(seed)
+
+    @mock.middleware("http")
+    async def inject_faults(request: Request, call_next):
+        if request.url.path.startswith("/_control"):
+            return await call_next(request)
+        state["requests"][route_key(request.method, request.url.path)] += 1
+        if state["latency"]:
+            await asyncio.sleep(state["latency"])
+        if rng.random() < state["failure_rate"]:
+            state["requests"]["injected failures"] += 1
+            return JSONResponse({"detail": "Injected failure"}, status_code=503)
+        return await call_next(request)
+
+    @mock.get("/_control")
+    async def read_state():
+        return {
+            "latency": state["latency"],
+            "failure_rate": state["failure_rate"],
+            "requests": state["requests"],
+            "last_update": state["last_update"],
+        }
+
+    @mock.post("/_control")
+    async def configure(settings: dict):
+        if settings.pop("reset", False):
+            state["requests"].clear()
+            state["last_update"].clear()
+        state.update(settings)
+        return {"status": "ok"}
+
+    @mock.post("/customers")
+    async def create_customer(customer: dict):
+        return {"status": "created", "id": customer.get("id")}
+
+    @mock.put("/customers/{customer_id}")
+    async def update_customer(customer_id: int, customer: dict):
+        state["last_update"][customer_id] = customer
+        return {"status": "updated", "id": customer_id}
+
+    @mock.delete("/customers/{customer_id}")
+    async def delete_customer(customer_id: int):
+        return {"status": "deleted", "id": customer_id}
+
+    @mock.post("/customers/batch")
+    async def upsert_batch(body: dict):
+        return {"status": "upserted", "count": len(body["customers"])}
+
+    @mock.post("/customers/batch/delete")
+    async def delete_batch(body: dict):
+        return {"status": "deleted", "count": len(body["ids"])}
+
+    return mock
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _serve(port: int, seed: int) -> None:
+    uvicorn.run(create_mock_app(seed), host="127.0.0.1", port=port, log_level="error", access_log=False)
+
+
+class MockExternalApi:
+    """Run the mock API in a child process for the duration of a with block"""
+
+    def __init__(self, seed: int = 0):
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self._process = multiprocessing.Process(target=_serve, args=(self.port, seed), daemon=True)
+
+    def configure(self, reset: bool = False, **settings: Any) -> None:
+        httpx.post(f"{self.url}/_control", json={"reset": reset, **settings}).raise_for_status()
+
+    def state(self) -> Dict[str, Any]:
+        return httpx.get(f"{self.url}/_control").json()
+
+    def requests(self, route: str) -> int:
+        return self.state()["requests"].get(route, 0)
+
+    def __enter__(self) -> "MockExternalApi":
+        self._process.start()
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                httpx.get(f"{self.url}/_control")
+                return self
+            except httpx.TransportError:
+                if time.monotonic() > deadline:
+                    self._process.terminate()
+                    raise RuntimeError("Mock external API did not start")
+                time.sleep(0.05)
+
+    def __exit__(self, *exc_info) -> None:
+        self._process.terminate()
+        self._process.join(timeout=10)
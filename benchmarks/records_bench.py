@@ -0,0 +1,122 @@
+"""
+Benchmark memory per task and scan speed of TaskRecords against plain dicts
+
+Run from the project root:
+
+    python -m benchmarks.records_bench [--tasks 1000000]
+
+Builds the same task population twice, once as the dicts app.py used to
+keep and once as TaskRecords in a RecordTable, and measures the memory
+each retains per task with tracemalloc. Task fields are built the way
+requests produce them: fresh strings and datetimes per task, so the dicts
+hold their own copies while records intern locations and share enum
+members. Then times the scans the dispatcher and reports run: counting
+READY tasks, the ten highest priorities among READY tasks, and READY
+tasks past their deadline, as a Python loop over dicts, a loop over
+records and a vectorized query over the table's columns.
+"""
+import argparse
+import gc
+import random
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from records import RecordTable, TaskRecord, TaskState
+
+STATES = ["WAITING", "READY", "CLAIMED", "RUNNING", "PAUSED", "DONE"]
+TYPES = ["delivery", "collection", "payment", "ordering", "charging"]
+
+
+def task_fields(count, seed=5):
+    """Yield task dicts shaped like app.build_task output"""
+    rng = random.Random(seed)
+    start = datetime(2024, 6, 15, 17, 0)
+    for n in range(count):
+        created = start + timedelta(seconds=n * 0.05)
+        task_type = rng.choice(TYPES)
+        yield {
+            "id": f"T-{n + 101}",
+            "type": task_type,
+            "base_priority": 100,
+            "release_time": created,
+            "deadline": created + timedelta(minutes=rng.choice((10, 20, 30))),
+            "operator_override": 0,
+            "effective_priority": rng.randint(40, 200),
+            "waypoints": ["Kitchen", "Table %d" % rng.randint(1, 40)],
+            "state": rng.choices(STATES, weights=(5, 20, 5, 5, 5, 60))[0],
+            "assigned_robot": None,
+            "order_id": "O%d" % (n // 3),
+            "created_at": created,
+        }
+
+
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    collection = build()
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return collection, size
+
+
+def best_of(function, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - started)
+    return result, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--tasks", type=int, default=1_000_000)
+    args = parser.parse_args()
+    count = args.tasks
+    now = datetime(2024, 6, 15, 17, 0) + timedelta(seconds=count * 0.05 / 2)
+    now_ts = now.timestamp()
+
+    dicts, dict_bytes = measure(lambda: list(task_fields(count)))
+    table, record_bytes = measure(lambda: RecordTable(TaskRecord, task_fields(count)))
+    print(f"{count:,} tasks")
+    print(f"{'storage':<14}{'bytes/task':>11}{'total MB':>10}")
+    print(f"{'dicts':<14}{dict_bytes / count:>11.0f}{dict_bytes / 2**20:>10.1f}")
+    print(f"{'TaskRecords':<14}{record_bytes / count:>11.0f}{record_bytes / 2**20:>10.1f}")
+    print(f"records use {record_bytes / dict_bytes:.0%} of the dict memory")
+
+    ready = TaskState.READY
+    records = list(table)
+    scans = {
+        "count READY": (
+            lambda: sum(1 for t in dicts if t["state"] == "READY"),
+            lambda: sum(1 for t in records if t["state"] == ready),
+            lambda: table.count(state=ready),
+        ),
+        "top 10 READY": (
+            lambda: [t["effective_priority"] for t in sorted((t for t in dicts if t["state"] == "READY"),
+                                                             key=lambda t: -t["effective_priority"])[:10]],
+            lambda: [t["effective_priority"] for t in sorted((t for t in records if t["state"] == ready),
+                                                             key=lambda t: -t["effective_priority"])[:10]],
+            lambda: [t["effective_priority"] for t in table.top("effective_priority", 10, table.mask(state=ready))],
+        ),
+        "overdue READY": (
+            lambda: sum(1 for t in dicts if t["state"] == "READY" and t["deadline"] < now),
+            lambda: sum(1 for t in records if t["state"] == ready and t["deadline"] < now),
+            lambda: int((table.mask(state=ready) & (table.column("deadline") < now_ts)).sum()),
+        ),
+    }
+    print(f"{'scan':<16}{'dicts ms':>10}{'records ms':>12}{'columns ms':>12}{'speedup':>9}  match")
+    for name, (over_dicts, over_records, over_columns) in scans.items():
+        expected, dict_time = best_of(over_dicts)
+        from_records, record_time = best_of(over_records)
+        from_columns, column_time = best_of(over_columns)
+        # Top-k is compared by priority; which of several tied tasks is picked may differ
+        match = from_records == expected and from_columns == expected
+        print(f"{name:<16}{dict_time * 1000:>10.1f}{record_time * 1000:>12.1f}{column_time * 1000:>12.1f}"
+              f"{dict_time / column_time:>8.0f}x  {'yes' if match else 'NO'}")
+
+
+if __name__ == "__main__":
+    main()
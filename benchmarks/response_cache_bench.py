@@ -0,0 +1,113 @@
+"""
+Benchmark request cost of cached GET endpoints against rendering every poll
+
+Run from the project root:
+
+    python -m benchmarks.response_cache_bench [--robots 200] [--requests 5000]
+
+Loads the app with an in-memory database and no event log, fills the fleet
+and task list to dashboard scale, and drives the ASGI app directly (no
+sockets) so the numbers are the server's own cost per request, including
+token verification (a cache hit, as for any client polling). Each polled
+endpoint is timed three ways: with its cache route removed (the endpoint
+runs and JSON-encodes every time), as a cache hit returning the stored
+bytes, and as a conditional request answered with 304. A mutation between
+polls is then checked to invalidate the entry.
+"""
+import argparse
+import asyncio
+import time
+
+from simulator import load_app
+
+ENDPOINTS = ("/api/robots", "/api/charging/status", "/api/reports/daily", "/api/reports/tasks", "/api/tables")
+
+
+# Set in run() once the app, and its authenticator, is loaded
+AUTH_HEADERS = []
+
+
+async def call(asgi, path, headers=()):
+    """Send one GET through the full middleware stack and return (status, headers, body)"""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"",
+        "headers": [(b"host", b"bench")] + AUTH_HEADERS + list(headers), "client": ("127.0.0.1", 1), "server": ("bench", 80),
+    }
+    response = {"body": b""}
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["headers"] = dict(message["headers"])
+        else:
+            response["body"] += message.get("body", b"")
+
+    await asgi(scope, receive, send)
+    return response["status"], response["headers"], response["body"]
+
+
+async def per_request(asgi, path, count, headers=()):
+    started = time.perf_counter()
+    for _ in range(count):
+        await call(asgi, path, headers)
+    return (time.perf_counter() - started) / count
+
+
+def populate(app, robots, tasks):
+    for n in range(len(app.system_state.robots), robots):
+        app.system_state.robots.add({
+            "id": f"R{n + 1}", "current_location": "Kitchen", "battery_level": 50 + n % 50,
+            "status": app.RobotStatus.IDLE, "current_task_id": None, "last_active": app.datetime.now(),
+        })
+    for n in range(tasks):
+        app.build_task(("delivery", "collection", "payment")[n % 3], [f"Table {n % 30 + 1}"])
+
+
+async def run(args):
+    app = load_app()
+    AUTH_HEADERS.append((b"authorization", b"Bearer " + app.authenticator.issue("bench", "administrator").encode()))
+    populate(app, args.robots, args.tasks)
+    asgi = app.app
+    cache = app.response_cache
+
+    print(f"{args.robots} robots, {len(app.system_state.tasks)} tasks, {args.requests} requests per case")
+    print(f"{'endpoint':<24}{'bytes':>8}{'uncached us':>13}{'hit us':>9}{'304 us':>9}{'speedup':>9}")
+    for path in ENDPOINTS:
+        route = cache.routes.pop(path)
+        uncached = await per_request(asgi, path, args.requests)
+        cache.routes[path] = route
+
+        status, headers, body = await call(asgi, path)
+        etag = headers[b"etag"]
+        hit = await per_request(asgi, path, args.requests)
+        not_modified = await per_request(asgi, path, args.requests, [(b"if-none-match", etag)])
+        print(f"{path:<24}{len(body):>8}{uncached * 1e6:>13.0f}{hit * 1e6:>9.0f}{not_modified * 1e6:>9.0f}"
+              f"{uncached / hit:>8.1f}x")
+
+    # A mutation must invalidate exactly the responses built from the changed collection
+    _, headers, _ = await call(asgi, "/api/robots")
+    _, tables_headers, _ = await call(asgi, "/api/tables")
+    robot = app.system_state.robots[0]
+    robot["battery_level"] -= 1
+    app.record("robots", robot)
+    status, _, body = await call(asgi, "/api/robots", [(b"if-none-match", headers[b"etag"])])
+    tables_status, _, _ = await call(asgi, "/api/tables", [(b"if-none-match", tables_headers[b"etag"])])
+    fresh = status == 200 and f'"battery_level":{robot["battery_level"]}'.encode() in body
+    print(f"after a robot update: /api/robots {status} ({'fresh' if fresh else 'STALE'}), /api/tables {tables_status}")
+    print(cache.stats())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--robots", type=int, default=200)
+    parser.add_argument("--tasks", type=int, default=2000)
+    parser.add_argument("--requests", type=int, default=5000)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Benchmark command round trips and throughput through the robot command bus
+
+Run from the project root:
+
+    python -m benchmarks.robot_bus_bench [--robots 500] [--commands 20] [--window 32] [--drop-rate 0.02]
+
+Loads the app with an in-memory database and no event log, serves it with
+uvicorn on a local port and connects one simulated agent per robot over a
+real WebSocket (robot_agent.py). Every robot is then sent `--commands`
+commands at once, and each is awaited until the robot has acknowledged it
+and its state change has been applied. The run is repeated stop-and-wait
+(one command in flight per robot), pipelined (`--window` in flight) and
+pipelined with the agents ignoring `--drop-rate` of deliveries, so that
+commands are only carried out after a resend. Afterwards every command
+must have been carried out exactly once.
+"""
+import argparse
+import asyncio
+import socket
+import time
+
+import uvicorn
+
+from robot_agent import SimulatedRobotAgent
+from simulator import load_app
+
+COMMANDS = ("RETURN_TO_BASE", "START_CHARGING", "STOP_CHARGING")
+
+
+def reset(app, robots, stations):
+    state = app.system_state
+    state.robots = app.RecordTable(app.RobotRecord, (
+        {"id": f"R{n + 1}", "current_location": "Kitchen", "battery_level": 80, "status": app.RobotStatus.IDLE,
+         "current_task_id": None, "last_active": app.datetime.now()}
+        for n in range(robots)
+    ))
+    state.charging_stations = [
+        {"id": f"station_{n + 1}", "status": "available", "robot_id": None, "charging_level": 100, "max_capacity": 100}
+        for n in range(stations)
+    ]
+    app.floor_index = app.FloorIndex(state.tables, state.points, state.robots, state.charging_stations)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def run_case(app, agents, args, window, drop_rate, ack_timeout):
+    bus = app.robot_bus
+    bus.window = window
+    bus.ack_timeout = ack_timeout
+    for agent in agents:
+        agent.drop_rate = drop_rate
+    before = bus.stats()
+    executed_before = sum(sum(agent.executed.values()) for agent in agents)
+
+    started = time.perf_counter()
+    # Submit every command at once; the bus keeps `window` per robot in flight
+    await asyncio.gather(*(
+        bus.send(agent.robot_id, COMMANDS[n % len(COMMANDS)]) for agent in agents for n in range(args.commands)
+    ))
+    elapsed = time.perf_counter() - started
+
+    after = bus.stats()
+    executed = sum(sum(agent.executed.values()) for agent in agents) - executed_before
+    commands = len(agents) * args.commands
+    assert executed == commands, f"{executed} commands carried out for {commands} sent"
+    return {
+        "elapsed": elapsed,
+        "per_s": commands / elapsed,
+        "round_trip": after["round_trip_ms"],
+        "resent": after["resent"] - before["resent"],
+        "duplicate_acks": after["duplicate_acks"] - before["duplicate_acks"],
+        "executed": executed,
+    }
+
+
+async def run(args):
+    app = load_app()
+    reset(app, args.robots, max(1, args.robots // 10))
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app.app, host="127.0.0.1", port=port, log_level="warning"))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+
+    agents = [SimulatedRobotAgent(f"R{n + 1}", seed=n) for n in range(args.robots)]
+    sessions = [
+        asyncio.create_task(agent.run(f"ws://127.0.0.1:{port}", app.authenticator.issue(agent.robot_id, "robot")))
+        for agent in agents
+    ]
+    while app.robot_bus.stats()["connected"] < args.robots:
+        await asyncio.sleep(0.05)
+
+    total = args.robots * args.commands
+    print(f"{args.robots} robots over local WebSockets, {args.commands} commands each ({total:,} per case)")
+    print(f"{'case':<30}{'seconds':>8}{'commands/s':>12}{'rtt p50 ms':>12}{'rtt p99 ms':>12}{'resent':>8}{'dup acks':>9}")
+    cases = (
+        ("stop-and-wait (window 1)", 1, 0.0, 10.0),
+        (f"pipelined (window {args.window})", args.window, 0.0, 10.0),
+        (f"pipelined, {args.drop_rate:.0%} dropped", args.window, args.drop_rate, args.ack_timeout),
+    )
+    for label, window, drop_rate, ack_timeout in cases:
+        # Each case starts with fresh round-trip samples
+        app.robot_bus._round_trips.clear()
+        result = await run_case(app, agents, args, window, drop_rate, ack_timeout)
+        rtt = result["round_trip"]
+        print(f"{label:<30}{result['elapsed']:>8.2f}{result['per_s']:>12,.0f}{rtt['p50']:>12.1f}{rtt['p99']:>12.1f}"
+              f"{result['resent']:>8,}{result['duplicate_acks']:>9,}")
+    print(f"every command carried out exactly once; {app.robot_bus.stats()}")
+
+    for session in sessions:
+        session.cancel()
+    await asyncio.gather(*sessions, return_exceptions=True)
+    server.should_exit = True
+    await serving
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--robots", type=int, default=500)
+    parser.add_argument("--commands", type=int, default=20)
+    parser.add_argument("--window", type=int, default=32)
+    parser.add_argument("--drop-rate", type=float, default=0.02)
+    parser.add_argument("--ack-timeout", type=float, default=0.5)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Benchmark robot state-duration tracking against summing a transition log
+
+Run from the project root:
+
+    python -m benchmarks.robot_states_bench [--robots 500] [--days 3] [--transitions-per-hour 60]
+
+Drives a RobotStateTracker through `--days` of simulated status changes
+for `--robots` robots and reports the cost of recording a transition and
+of summarizing each window for the whole fleet. The baseline keeps every
+transition in one list and sums the durations in a window on each query.
+"""
+import argparse
+import random
+import time
+
+from robot_states import DEFAULT_WINDOWS, STATES, TOTAL, RobotStateTracker
+
+REPEATS = 5
+
+
+def log_summary(log, robots, start, now):
+    """Seconds in each state per robot in [start, now), from a full transition log"""
+    current = {}
+    seconds = {robot_id: dict.fromkeys(STATES, 0.0) for robot_id in robots}
+    for at, robot_id, state in log:
+        previous = current.get(robot_id)
+        if previous is not None and at > start:
+            seconds[robot_id][previous[1]] += at - max(previous[0], start)
+        current[robot_id] = (at, state)
+    for robot_id, (at, state) in current.items():
+        seconds[robot_id][state] += now - max(at, start)
+    return seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--robots", type=int, default=500)
+    parser.add_argument("--days", type=float, default=3)
+    parser.add_argument("--transitions-per-hour", type=float, default=60)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    clock = [0.0]
+    robots = [{"id": f"R{n + 1}", "status": "IDLE"} for n in range(args.robots)]
+    tracker = RobotStateTracker(robots, clock=lambda: clock[0])
+    log = [(0.0, robot["id"], "IDLE") for robot in robots]
+
+    total = int(args.robots * args.days * 24 * args.transitions_per_hour)
+    step = args.days * 86400 / total
+    changes = [(robots[rng.randrange(args.robots)]["id"], rng.choice(STATES)) for _ in range(total)]
+    started = time.perf_counter()
+    for n, (robot_id, state) in enumerate(changes):
+        clock[0] = n * step
+        tracker.observe(robot_id, state)
+    per_transition = (time.perf_counter() - started) / total * 1e6
+    for n, (robot_id, state) in enumerate(changes):
+        log.append((n * step, robot_id, state))
+    now = clock[0]
+
+    retained = sum(len(timeline.history) for timeline in tracker.timelines.values())
+    print(f"{args.robots} robots, {total:,} status changes over {args.days:g} days")
+    print(f"tracker: {per_transition:.2f} µs per change, {retained:,} transitions retained")
+    print(f"{'window':<8}{'tracker ms':>12}{'log scan ms':>13}{'max error s':>13}")
+    ids = [robot["id"] for robot in robots]
+    for window in (*DEFAULT_WINDOWS, TOTAL):
+        timings = []
+        for _ in range(REPEATS):
+            started = time.perf_counter()
+            summary = tracker.summary(window)
+            timings.append(time.perf_counter() - started)
+        start = now - DEFAULT_WINDOWS[window] if window != TOTAL else 0.0
+        started = time.perf_counter()
+        expected = log_summary(log, ids, start, now)
+        scan = time.perf_counter() - started
+        error = max(
+            abs(summary["robots"][robot_id]["seconds"][state] - expected[robot_id][state])
+            for robot_id in ids for state in STATES
+        )
+        print(f"{window:<8}{min(timings) * 1000:>12.2f}{scan * 1000:>13.1f}{error:>13.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Benchmark nearest-robot, charger and table queries on the grid index against linear scans and a KD-tree
+
+Run from the project root:
+
+    python -m benchmarks.spatial_index_bench [--robots 5000] [--tables 4000] [--halls 4]
+
+Lays out several dining halls side by side, each with a grid of tables,
+service points and charging stations, and scatters robots across them
+with mixed statuses. Then times k-nearest queries filtered by status or
+type three ways: the linear filter-and-sort the endpoints used before,
+scipy's cKDTree (built per layer; a moving robot means a rebuild, timed
+separately) and FloorIndex. Robots keep moving between queries; the
+index results must match the scan.
+"""
+import argparse
+import heapq
+import math
+import random
+import time
+
+from scipy.spatial import cKDTree
+
+from spatial_index import FloorIndex
+
+HALL_WIDTH = 2000
+HALL_HEIGHT = 1500
+STATUSES = ("IDLE", "MOVING", "CHARGING", "ERROR")
+POINT_TYPES = ("kitchen", "billing", "collection", "delivery", "charging")
+
+
+def make_floor(halls, tables, robots, stations, seed=1):
+    rng = random.Random(seed)
+    per_hall = max(1, tables // halls)
+    columns = max(1, round(math.sqrt(per_hall * HALL_WIDTH / HALL_HEIGHT)))
+    floor_tables, points = [], []
+    for hall in range(halls):
+        x0 = hall * (HALL_WIDTH + 200)
+        for n in range(per_hall):
+            row, column = divmod(n, columns)
+            floor_tables.append({
+                "id": f"H{hall}T{n}", "name": f"Hall {hall} Table {n + 1}", "status": rng.choice(("available", "occupied", "reserved")),
+                "position": {"x": x0 + 40 + column * (HALL_WIDTH - 80) / columns, "y": 200 + row * 60},
+            })
+        for n, point_type in enumerate(POINT_TYPES * 4):
+            points.append({
+                "id": f"H{hall}P{n}", "name": f"Hall {hall} {point_type} {n}", "type": point_type,
+                "position": {"x": x0 + rng.uniform(0, HALL_WIDTH), "y": rng.uniform(0, HALL_HEIGHT)},
+            })
+    charging = [p["name"] for p in points if p["type"] == "charging"]
+    floor_stations = [
+        {"id": f"station_{n + 1}", "status": rng.choice(("available", "occupied")), "robot_id": None,
+         "location": charging[n % len(charging)]}
+        for n in range(stations)
+    ]
+    width = halls * (HALL_WIDTH + 200)
+    floor_robots = [
+        {"id": f"R{n + 1}", "status": rng.choice(STATUSES),
+         "position": {"x": rng.uniform(0, width), "y": rng.uniform(0, HALL_HEIGHT)}}
+        for n in range(robots)
+    ]
+    return floor_tables, points, floor_robots, floor_stations
+
+
+def scan(entities, position_of, origin, k, accept):
+    """The old way: filter every entity, then sort by distance"""
+    x, y = origin
+    candidates = []
+    for entity in entities:
+        if accept(entity):
+            px, py = position_of(entity)
+            candidates.append((math.hypot(px - x, py - y), entity["id"]))
+    return [distance for distance, _ in heapq.nsmallest(k, candidates)]
+
+
+def position_of(entity):
+    return (entity["position"]["x"], entity["position"]["y"])
+
+
+def timed(fn, queries):
+    started = time.perf_counter()
+    results = [fn(query) for query in queries]
+    return (time.perf_counter() - started) / len(queries), results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--robots", type=int, default=5000)
+    parser.add_argument("--tables", type=int, default=4000)
+    parser.add_argument("--stations", type=int, default=400)
+    parser.add_argument("--halls", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+
+    tables, points, robots, stations = make_floor(args.halls, args.tables, args.robots, args.stations)
+    started = time.perf_counter()
+    index = FloorIndex(tables, points, robots, stations)
+    build_seconds = time.perf_counter() - started
+    station_position = {s["id"]: index.locate(s["location"]) for s in stations}
+
+    rng = random.Random(2)
+    origins = [position_of(rng.choice(tables)) for _ in range(args.queries)]
+    cases = [
+        ("idle robot, k=1", "robot", robots, position_of, 1, ["IDLE"]),
+        ("idle robot, k=5", "robot", robots, position_of, 5, ["IDLE"]),
+        ("free charger", "charger", stations, lambda s: station_position[s["id"]], 1, ["available"]),
+        ("free table, k=10", "table", tables, position_of, 10, ["available"]),
+        ("billing point", "point", points, position_of, 1, ["billing"]),
+    ]
+
+    print(f"{args.halls} halls, {len(tables):,} tables, {len(points)} points, {len(stations)} chargers, "
+          f"{len(robots):,} robots; index built in {build_seconds * 1000:.0f} ms")
+    print(f"{'query':<18}{'scan us':>9}{'kd-tree us':>12}{'index us':>10}{'speedup':>9}  same")
+    for name, kind, entities, locate, k, groups in cases:
+        field = "type" if kind == "point" else "status"
+        accept = lambda entity, groups=groups, field=field: entity[field] in groups
+        scan_seconds, expected = timed(lambda origin: scan(entities, locate, origin, k, accept), origins)
+        index_seconds, found = timed(
+            lambda origin: [d for d, _ in index.nearest(kind, origin, k, groups)], origins)
+        layer = [locate(entity) for entity in entities if accept(entity)]
+        tree = cKDTree(layer)
+        tree_seconds, _ = timed(lambda origin: tree.query(origin, k), origins)
+        same = all(
+            len(a) == len(b) and all(math.isclose(x, y) for x, y in zip(a, b))
+            for a, b in zip(expected, found)
+        )
+        print(f"{name:<18}{scan_seconds * 1e6:>9.0f}{tree_seconds * 1e6:>12.1f}{index_seconds * 1e6:>10.1f}"
+              f"{scan_seconds / index_seconds:>8.0f}x  {'yes' if same else 'NO'}")
+
+    # Robots move and change status all the time; the grid updates in place
+    # where a KD-tree over the idle layer has to be rebuilt
+    width = args.halls * (HALL_WIDTH + 200)
+    moves = []
+    for _ in range(args.queries):
+        robot = rng.choice(robots)
+        robot["position"] = {"x": rng.uniform(0, width), "y": rng.uniform(0, HALL_HEIGHT)}
+        robot["status"] = rng.choice(STATUSES)
+        moves.append(robot)
+    update_seconds, _ = timed(index.sync_robot, moves)
+    idle = [position_of(robot) for robot in robots if robot["status"] == "IDLE"]
+    rebuild_seconds, _ = timed(lambda _: cKDTree(idle), range(50))
+    _, expected = timed(lambda origin: scan(robots, position_of, origin, 5, lambda r: r["status"] == "IDLE"), origins)
+    _, found = timed(lambda origin: [d for d, _ in index.nearest("robot", origin, 5, ["IDLE"])], origins)
+    same = all(all(math.isclose(x, y) for x, y in zip(a, b)) and len(a) == len(b) for a, b in zip(expected, found))
+    print(f"robot move: index update {update_seconds * 1e6:.1f} us, kd-tree rebuild {rebuild_seconds * 1e6:.0f} us; "
+          f"results after moves match scan: {'yes' if same else 'NO'}")
+
+
+if __name__ == "__main__":
+    main()
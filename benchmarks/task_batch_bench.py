@@ -0,0 +1,119 @@
+"""
+Benchmark batch task endpoints against one call per task
+
+Run from the project root:
+
+    python -m benchmarks.task_batch_bench [--updates 1000] [--connections 200]
+
+Loads the app with an in-memory database and no event log, attaches fake
+WebSocket clients subscribed to every event, and sends `--updates` status
+changes and priority changes through the full ASGI stack (auth,
+admission, validation) three ways: one call per task in sequence, one
+call per task from 50 concurrent clients, and a single batch call.
+Admission rate limits are lifted so that only the work is measured.
+Reports wall time, broadcast messages and bytes sent to the clients.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from simulator import load_app
+from benchmarks.write_load_bench import FakeConnection, reset
+
+CLIENTS = 50
+
+
+async def send_json(asgi, headers, method, path, body):
+    payload = json.dumps(body).encode()
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method,
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"",
+        "headers": headers + [(b"content-type", b"application/json"), (b"content-length", str(len(payload)).encode())],
+        "client": ("127.0.0.1", 1), "server": ("bench", 80),
+    }
+    status = {}
+
+    async def receive():
+        return {"type": "http.request", "body": payload, "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status["code"] = message["status"]
+
+    await asgi(scope, receive, send)
+    assert status["code"] == 200, status
+    return status["code"]
+
+
+def single_calls(kind, task_ids):
+    if kind == "status":
+        return [("PUT", f"/api/tasks/{task_id}/status", {"state": "RUNNING"}) for task_id in task_ids]
+    return [("PUT", f"/api/queue/tasks/{task_id}/priority", {"boost": 10, "reason": "bench"}) for task_id in task_ids]
+
+
+def batch_call(kind, task_ids):
+    if kind == "status":
+        return "PUT", "/api/tasks/status/batch", {"updates": [{"task_id": t, "state": "RUNNING"} for t in task_ids]}
+    return "PUT", "/api/queue/tasks/priority/batch", {
+        "updates": [{"task_id": t, "boost": 10, "reason": "bench"} for t in task_ids]
+    }
+
+
+async def run_case(app, args, headers, kind, mode):
+    reset(app, robots=4, stations=2, tasks=args.updates)
+    task_ids = [task["id"] for task in app.system_state.tasks]
+    manager = app.manager
+    connections = [FakeConnection() for _ in range(args.connections)]
+    for connection in connections:
+        manager.attach(connection)
+
+    asgi = app.app
+    started = time.perf_counter()
+    if mode == "sequential":
+        for call in single_calls(kind, task_ids):
+            await send_json(asgi, headers, *call)
+    elif mode == "concurrent":
+        calls = iter(single_calls(kind, task_ids))
+
+        async def client():
+            for call in calls:
+                await send_json(asgi, headers, *call)
+
+        await asyncio.gather(*(client() for _ in range(CLIENTS)))
+    else:
+        await send_json(asgi, headers, *batch_call(kind, task_ids))
+    await app.command_loop.stop()
+    await manager.drain()
+    elapsed = time.perf_counter() - started
+
+    for connection in connections:
+        manager.disconnect(connection)
+    return elapsed, sum(c.messages for c in connections), sum(c.bytes for c in connections)
+
+
+async def run(args):
+    app = load_app()
+    headers = [(b"host", b"bench"), (b"authorization", b"Bearer " + app.authenticator.issue("bench", "administrator").encode())]
+    for lane in app.admission.lanes.values():
+        lane.rate = lane.burst = float("inf")
+
+    print(f"{args.updates} updates, {args.connections} subscribed WebSocket clients")
+    print(f"{'updates':<10}{'sent as':<24}{'ms':>9}{'updates/s':>11}{'messages':>10}{'MB sent':>9}")
+    for kind in ("status", "priority"):
+        for mode, label in (("sequential", "single calls"), ("concurrent", f"single calls, {CLIENTS} clients"),
+                            ("batch", "one batch")):
+            elapsed, messages, sent = await run_case(app, args, headers, kind, mode)
+            print(f"{kind:<10}{label:<24}{elapsed * 1000:>9.1f}{args.updates / elapsed:>11,.0f}"
+                  f"{messages:>10,}{sent / 1e6:>9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--updates", type=int, default=1000)
+    parser.add_argument("--connections", type=int, default=200)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Benchmark multi-stop trip consolidation against one task per trip
+
+Run from the project root:
+
+    python -m benchmarks.trip_planner_bench [--robots 3] [--capacity 3]
+
+Simulates a peak hour on a generated floor: delivery and collection tasks
+arrive at random tables, and whenever a robot is free the planner is asked
+for trips over the READY backlog. Robots follow each planned route at the
+planner's speed and service time. The same arrivals are replayed with
+capacity 1 (every task its own trip) and with consolidation, and trips per
+hour, delivery latency (release to drop-off) and distance are compared.
+"""
+import argparse
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from trip_planner import TripPlanner, route_length
+
+DEADLINES = {"delivery": 600, "collection": 1200}
+
+
+def make_floor(tables, seed=7):
+    """Kitchen and washing machine in opposite corners, tables on a jittered grid"""
+    rng = random.Random(seed)
+    positions = {"Kitchen": (40.0, 40.0), "Washing Machine": (760.0, 560.0)}
+    columns = max(1, int(tables ** 0.5))
+    for n in range(tables):
+        row, column = divmod(n, columns)
+        positions[f"Table {n + 1}"] = (
+            120 + column * 600 / columns + rng.uniform(-15, 15),
+            120 + row * 420 / max(1, (tables + columns - 1) // columns) + rng.uniform(-15, 15),
+        )
+    return positions
+
+
+def make_arrivals(tables, hours, deliveries_per_hour, collections_per_hour, seed=11):
+    """Poisson arrivals of delivery and collection tasks, sorted by release time (seconds)"""
+    rng = random.Random(seed)
+    arrivals = []
+    for task_type, rate in (("delivery", deliveries_per_hour), ("collection", collections_per_hour)):
+        t = 0.0
+        while rate > 0:
+            t += rng.expovariate(rate / 3600)
+            if t >= hours * 3600:
+                break
+            table = f"Table {rng.randint(1, tables)}"
+            waypoints = ["Kitchen", table] if task_type == "delivery" else [table, "Washing Machine"]
+            arrivals.append((t, task_type, waypoints))
+    arrivals.sort()
+    return arrivals
+
+
+def simulate(planner, arrivals, robot_count, start=datetime(2024, 6, 15, 18, 0)):
+    robots = [
+        {"id": f"R{n + 1}", "status": "IDLE", "current_task_id": None, "battery_level": 100,
+         "current_location": "Kitchen", "free_at": 0.0}
+        for n in range(robot_count)
+    ]
+    ready = []
+    released = {}
+    latencies = []
+    trips = 0
+    distance = 0.0
+    late = 0
+    plan_seconds = 0.0
+    next_arrival = 0
+    now = 0.0
+
+    while True:
+        while next_arrival < len(arrivals) and arrivals[next_arrival][0] <= now:
+            t, task_type, waypoints = arrivals[next_arrival]
+            task_id = f"T-{next_arrival}"
+            ready.append({
+                "id": task_id, "type": task_type, "waypoints": waypoints, "state": "READY",
+                "assigned_robot": None, "effective_priority": 100 if task_type == "delivery" else 50,
+                "deadline": start + timedelta(seconds=t + DEADLINES[task_type]),
+            })
+            released[task_id] = t
+            next_arrival += 1
+
+        free = [r for r in robots if r["free_at"] <= now]
+        if ready and free:
+            began = time.perf_counter()
+            planned = planner.plan(ready, free, start + timedelta(seconds=now))
+            plan_seconds += time.perf_counter() - began
+            done = set()
+            for trip in planned:
+                robot = next(r for r in robots if r["id"] == trip["robot_id"])
+                robot["free_at"] = now + trip["duration_s"]
+                robot["current_location"] = trip["route"][-1]
+                trips += 1
+                distance += route_length(trip["route"], planner.positions)
+                for task_id in trip["task_ids"]:
+                    finished = now + trip["finish_offsets_s"][task_id]
+                    latencies.append(finished - released[task_id])
+                    done.add(task_id)
+                    deadline = next(t["deadline"] for t in ready if t["id"] == task_id)
+                    if start + timedelta(seconds=finished) > deadline:
+                        late += 1
+            ready = [t for t in ready if t["id"] not in done]
+
+        upcoming = [r["free_at"] for r in robots if r["free_at"] > now]
+        if next_arrival < len(arrivals):
+            upcoming.append(arrivals[next_arrival][0])
+        if not upcoming:
+            break
+        now = min(upcoming)
+
+    makespan = max([r["free_at"] for r in robots] + [now])
+    latencies.sort()
+    return {
+        "tasks": len(latencies),
+        "trips": trips,
+        "trips_per_hour": trips / (makespan / 3600),
+        "tasks_per_hour": len(latencies) / (makespan / 3600),
+        "tasks_per_trip": len(latencies) / max(1, trips),
+        "mean_latency_s": statistics.fmean(latencies),
+        "p95_latency_s": latencies[int(len(latencies) * 0.95) - 1],
+        "late": late,
+        "distance": distance,
+        "makespan_min": makespan / 60,
+        "plan_ms": plan_seconds * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--robots", type=int, default=3)
+    parser.add_argument("--capacity", type=int, default=3)
+    parser.add_argument("--tables", type=int, default=30)
+    parser.add_argument("--hours", type=float, default=1.0)
+    parser.add_argument("--deliveries", type=float, default=90, help="delivery tasks per hour")
+    parser.add_argument("--collections", type=float, default=45, help="collection tasks per hour")
+    args = parser.parse_args()
+
+    positions = make_floor(args.tables)
+    arrivals = make_arrivals(args.tables, args.hours, args.deliveries, args.collections)
+    print(f"{len(arrivals)} tasks over {args.hours:g}h, {args.robots} robots, {args.tables} tables")
+    print(f"{'mode':<14}{'trips':>7}{'trips/h':>9}{'tasks/h':>9}{'tasks/trip':>12}{'mean lat':>10}{'p95 lat':>10}"
+          f"{'late':>6}{'distance':>10}{'makespan':>10}{'plan ms':>9}")
+    results = {}
+    for mode, capacity in (("single", 1), ("consolidated", args.capacity)):
+        result = simulate(TripPlanner(positions, capacity=capacity), arrivals, args.robots)
+        results[mode] = result
+        print(f"{mode:<14}{result['trips']:>7}{result['trips_per_hour']:>9.1f}{result['tasks_per_hour']:>9.1f}"
+              f"{result['tasks_per_trip']:>12.2f}{result['mean_latency_s']:>9.0f}s{result['p95_latency_s']:>9.0f}s{result['late']:>6}"
+              f"{result['distance']:>10.0f}{result['makespan_min']:>9.1f}m{result['plan_ms']:>9.1f}")
+
+    single, consolidated = results["single"], results["consolidated"]
+    print(f"consolidation: {single['trips'] / consolidated['trips']:.2f}x fewer trips, "
+          f"mean latency {single['mean_latency_s'] / consolidated['mean_latency_s']:.2f}x lower, "
+          f"{1 - consolidated['distance'] / single['distance']:.0%} less distance")
+
+
+if __name__ == "__main__":
+    main()
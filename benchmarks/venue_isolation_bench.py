@@ -0,0 +1,133 @@
+"""
+Benchmark how far a hot venue's load reaches a quiet venue's latency
+
+Run from the project root:
+
+    python -m benchmarks.venue_isolation_bench [--seconds 5] [--hot-clients 2] [--tasks 1000]
+
+Starts two app.py venue workers and the venue gateway in front of them,
+as `python venue_gateway.py` does, with in-memory storage. The hot venue
+gets `--hot-clients` clients sending back-to-back batch status updates of
+`--tasks` tasks; an operator at the quiet venue polls GET /api/robots
+every 20 ms, its latency measured from when each poll was due. Three runs:
+the quiet venue alone, both venues sharing one worker (a single-process
+deployment), and each venue on its own worker.
+"""
+import argparse
+import asyncio
+import os
+import secrets
+import subprocess
+import sys
+import time
+
+import httpx
+
+from venue_gateway import start_venue_worker, wait_until_listening
+
+WORKER_PORTS = (8711, 8712)
+GATEWAY_PORT = 8710
+POLL_INTERVAL = 0.02
+
+
+def start_gateway(venues):
+    return subprocess.Popen(
+        [sys.executable, "venue_gateway.py", "--port", str(GATEWAY_PORT)]
+        + [arg for venue, url in venues.items() for arg in ("--venue", f"{venue}={url}")],
+        stdout=subprocess.DEVNULL
+    )
+
+
+async def hot_client(client, headers, task_ids, stop):
+    states = ("RUNNING", "PAUSED")
+    sent = 0
+    while not stop.is_set():
+        updates = [{"task_id": task_id, "state": states[sent % 2]} for task_id in task_ids]
+        response = await client.put("/venues/hot/api/tasks/status/batch", headers=headers, json={"updates": updates})
+        assert response.status_code == 200, response.text
+        sent += 1
+    return sent
+
+
+async def quiet_operator(client, headers, seconds):
+    latencies = []
+    started = time.perf_counter()
+    due = started
+    while due - started < seconds:
+        await asyncio.sleep(max(0.0, due - time.perf_counter()))
+        response = await client.get("/venues/quiet/api/robots", headers=headers)
+        assert response.status_code == 200
+        latencies.append(time.perf_counter() - due)
+        due += POLL_INTERVAL
+    return latencies
+
+
+async def run_case(args, hot):
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{GATEWAY_PORT}", timeout=60) as client:
+        login = await client.post("/venues/hot/api/auth/login", data={"username": "admin", "password": "admin"})
+        headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+        hot_batches = 0
+        if hot:
+            tasks = [{"type": "delivery", "table": f"Table {n % 30 + 1}", "priority": "normal"} for n in range(args.tasks)]
+            created = await client.post("/venues/hot/api/tasks/batch", headers=headers, json={"tasks": tasks})
+            task_ids = [result["task_id"] for result in created.json()["results"]]
+            stop = asyncio.Event()
+            hot_load = [asyncio.ensure_future(hot_client(client, headers, task_ids, stop)) for _ in range(args.hot_clients)]
+            await asyncio.sleep(0.5)
+        latencies = sorted(await quiet_operator(client, headers, args.seconds))
+        if hot:
+            stop.set()
+            hot_batches = sum(await asyncio.gather(*hot_load))
+    return latencies, hot_batches
+
+
+def report(label, latencies, hot_batches, seconds):
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+    hot_rate = f"{hot_batches / seconds:>15.1f}" if hot_batches else f"{'-':>15}"
+    print(f"{label:<26}{percentile(0.5):>8.1f}{percentile(0.99):>8.1f}{latencies[-1] * 1000:>9.1f}{hot_rate}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--hot-clients", type=int, default=2)
+    parser.add_argument("--tasks", type=int, default=1000)
+    args = parser.parse_args()
+
+    env = {
+        "JWT_SECRET": secrets.token_urlsafe(32), "VENUE_EVENT_STORE_DIR": "", "VENUE_DATABASE_URL": "sqlite://",
+        "VENUE_ANALYTICS_DIR": "", "EXTERNAL_API_URL": "", "LOG_LEVEL": "error", "DIAGNOSTICS": "0",
+        "DEMO_AUTH": "1",
+    }
+    os.environ.update(env)
+    urls = [f"http://127.0.0.1:{port}" for port in WORKER_PORTS]
+    workers = [start_venue_worker(venue, port) for venue, port in zip(("hot", "quiet"), WORKER_PORTS)]
+    try:
+        wait_until_listening(urls)
+        print(f"quiet venue GET /api/robots every {POLL_INTERVAL * 1000:.0f} ms for {args.seconds:.0f} s; "
+              f"hot venue: {args.hot_clients} clients sending {args.tasks}-task status batches")
+        print(f"{'deployment':<26}{'p50 ms':>8}{'p99 ms':>8}{'max ms':>9}{'hot batches/s':>15}")
+        for label, venues, hot in (
+            ("quiet venue alone", {"hot": urls[0], "quiet": urls[1]}, False),
+            ("one shared worker", {"hot": urls[0], "quiet": urls[0]}, True),
+            ("worker per venue", {"hot": urls[0], "quiet": urls[1]}, True),
+        ):
+            gateway = start_gateway(venues)
+            try:
+                wait_until_listening([f"http://127.0.0.1:{GATEWAY_PORT}/venues"])
+                latencies, hot_batches = asyncio.run(run_case(args, hot))
+            finally:
+                gateway.terminate()
+                gateway.wait()
+            report(label, latencies, hot_batches, args.seconds)
+    finally:
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Benchmark sustained write throughput through the command loop, batched against one command per broadcast
+
+Run from the project root:
+
+    python -m benchmarks.write_load_bench [--writers 200] [--connections 200]
+
+Loads the app with an in-memory database and no event log, attaches fake
+WebSocket clients that subscribe to every event, and runs concurrent
+writers calling the mutation handlers directly: operator priority boosts
+on a small set of hot tasks and START_CHARGING/STOP_CHARGING commands on
+robots competing for fewer stations than robots. The same workload runs
+with max_batch=1, where every command is followed by its own broadcast,
+and with the default batching, where a loop tick's commands share one
+broadcast. Afterwards no station may be held by two robots and no robot
+may hold two stations.
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from simulator import load_app
+
+
+class FakeConnection:
+    """Stands in for a WebSocket; each send yields to the loop like a socket write"""
+
+    def __init__(self):
+        self.messages = 0
+        self.bytes = 0
+
+    async def send_text(self, message):
+        self.messages += 1
+        self.bytes += len(message)
+        await asyncio.sleep(0)
+
+
+def reset(app, robots, stations, tasks):
+    state = app.system_state = app.SystemState()
+    state.robots = app.RecordTable(app.RobotRecord, (
+        {"id": f"R{n + 1}", "current_location": "Kitchen", "battery_level": 50, "status": app.RobotStatus.IDLE,
+         "current_task_id": None, "last_active": app.datetime.now()}
+        for n in range(robots)
+    ))
+    state.charging_stations = [
+        {"id": f"station_{n + 1}", "status": "available", "robot_id": None, "charging_level": 100, "max_capacity": 100}
+        for n in range(stations)
+    ]
+    state.tasks = app.RecordTable(app.TaskRecord)
+    for n in range(tasks):
+        app.build_task(("delivery", "collection", "payment")[n % 3], [f"Table {n % 30 + 1}"])
+
+
+def double_claims(app):
+    held = [station["robot_id"] for station in app.system_state.charging_stations if station["robot_id"]]
+    return len(held) - len(set(held))
+
+
+async def writer(app, rng, operations, latencies):
+    task_ids = [task["id"] for task in app.system_state.tasks]
+    robot_ids = [robot["id"] for robot in app.system_state.robots]
+    for _ in range(operations):
+        started = time.perf_counter()
+        if rng.random() < 0.6:
+            boost = app.PriorityUpdate(boost=rng.randint(0, 20), reason="bench")
+            await app.update_task_priority(rng.choice(task_ids), boost)
+        else:
+            command = rng.choice(("START_CHARGING", "STOP_CHARGING"))
+            await app.send_robot_command(rng.choice(robot_ids), app.RobotCommand(command=command))
+        latencies.append(time.perf_counter() - started)
+
+
+async def run_case(app, args, max_batch):
+    reset(app, args.robots, args.stations, args.tasks)
+    manager = app.manager
+    # Room for every message, so both modes deliver everything and the
+    # time includes sending it, rather than dropping clients that fall behind
+    manager.outbox_size = args.writers * args.operations
+    connections = [FakeConnection() for _ in range(args.connections)]
+    for connection in connections:
+        manager.attach(connection)
+
+    loop = app.CommandLoop(manager.broadcast_events, max_batch=max_batch)
+    app.command_loop = loop
+    await loop.start()
+    latencies = []
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        writer(app, random.Random(n), args.operations, latencies) for n in range(args.writers)
+    ))
+    await loop.stop()
+    await manager.drain()
+    elapsed = time.perf_counter() - started
+
+    for connection in connections:
+        manager.disconnect(connection)
+    latencies.sort()
+    return {
+        "commands/s": len(latencies) / elapsed,
+        "p50 ms": latencies[len(latencies) // 2] * 1000,
+        "p99 ms": latencies[int(len(latencies) * 0.99)] * 1000,
+        "messages": sum(connection.messages for connection in connections),
+        "metrics": loop.metrics(),
+        "double claims": double_claims(app),
+    }
+
+
+async def run(args):
+    app = load_app()
+    original_loop = app.command_loop
+    total = args.writers * args.operations
+    print(f"{args.writers} writers x {args.operations} operations, {args.connections} clients, "
+          f"{args.robots} robots, {args.stations} stations")
+    print(f"{'mode':<12}{'commands/s':>12}{'p50 ms':>9}{'p99 ms':>9}{'messages':>10}{'avg batch':>11}"
+          f"{'coalesced':>11}{'double claims':>15}")
+    results = {}
+    for mode, max_batch in (("per-command", 1), ("batched", args.max_batch)):
+        result = results[mode] = await run_case(app, args, max_batch)
+        assert result["metrics"]["commands"] == total
+        print(f"{mode:<12}{result['commands/s']:>12,.0f}{result['p50 ms']:>9.2f}{result['p99 ms']:>9.2f}"
+              f"{result['messages']:>10,}{result['metrics']['avg_batch']:>11}"
+              f"{result['metrics']['events_coalesced']:>11,}{result['double claims']:>15}")
+    app.command_loop = original_loop
+    speedup = results["batched"]["commands/s"] / results["per-command"]["commands/s"]
+    print(f"batching sustains {speedup:.1f}x the write throughput")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--writers", type=int, default=200)
+    parser.add_argument("--operations", type=int, default=50)
+    parser.add_argument("--connections", type=int, default=200)
+    parser.add_argument("--robots", type=int, default=50)
+    parser.add_argument("--stations", type=int, default=10)
+    parser.add_argument("--tasks", type=int, default=500)
+    parser.add_argument("--max-batch", type=int, default=256)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
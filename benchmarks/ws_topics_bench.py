@@ -0,0 +1,83 @@
+"""
+Benchmark WebSocket event matching with the subscription index against a scan of every client
+
+Run from the project root:
+
+    python -m benchmarks.ws_topics_bench [--connections 10000]
+
+Subscribes a mix of dashboard clients: a few that want every event, robot
+panels following one robot, table tablets following one table and
+kitchen displays following delivery tasks. Then matches a stream of
+task, robot and charging events, once through SubscriptionIndex and once
+by testing every subscription. The two must select the same connections;
+the index should cost in proportion to the matching subscribers.
+"""
+import argparse
+import random
+import time
+
+from ws_topics import SubscriptionIndex, parse_filter
+
+
+def make_subscriptions(connections, robots, tables, seed=1):
+    rng = random.Random(seed)
+    for n in range(connections):
+        roll = rng.random()
+        if roll < 0.01:
+            yield n, {}
+        elif roll < 0.4:
+            yield n, {"robot": f"R{rng.randint(1, robots)}"}
+        elif roll < 0.9:
+            yield n, {"table": f"Table {rng.randint(1, tables)}"}
+        else:
+            yield n, {"kind": "task", "task_type": "delivery"}
+
+
+def make_events(count, robots, tables, seed=2):
+    rng = random.Random(seed)
+    events = []
+    for _ in range(count):
+        roll = rng.random()
+        robot = f"R{rng.randint(1, robots)}"
+        if roll < 0.5:
+            events.append({"event": {"robot_updated"}, "kind": {"robot"}, "robot": {robot},
+                           "task_type": set(), "table": set()})
+        else:
+            task_type = rng.choice(["delivery", "collection", "payment"])
+            events.append({"event": {"task_updated"}, "kind": {"task"}, "robot": {robot},
+                           "task_type": {task_type}, "table": {"Kitchen", f"Table {rng.randint(1, tables)}"}})
+    return events
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--connections", type=int, default=10_000)
+    parser.add_argument("--robots", type=int, default=50)
+    parser.add_argument("--tables", type=int, default=200)
+    parser.add_argument("--events", type=int, default=2_000)
+    args = parser.parse_args()
+
+    index = SubscriptionIndex()
+    subscriptions = []
+    for connection, raw in make_subscriptions(args.connections, args.robots, args.tables):
+        subscriptions.append(index.subscribe(connection, "main", parse_filter(raw)))
+    events = make_events(args.events, args.robots, args.tables)
+
+    started = time.perf_counter()
+    indexed = [index.match(topics) for topics in events]
+    index_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    scanned = [{s.connection for s in subscriptions if s.matches(topics)} for topics in events]
+    scan_seconds = time.perf_counter() - started
+
+    recipients = sum(len(matched) for matched in indexed) / len(events)
+    print(f"{args.connections:,} connections, {args.events:,} events, {recipients:.0f} recipients per event on average")
+    print(f"{'method':<10}{'us/event':>10}")
+    print(f"{'scan':<10}{scan_seconds / len(events) * 1e6:>10.1f}")
+    print(f"{'index':<10}{index_seconds / len(events) * 1e6:>10.1f}")
+    print(f"index is {scan_seconds / index_seconds:.0f}x faster, same recipients: {'yes' if indexed == scanned else 'NO'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,47 +1,196 @@
+import argparse
+import hashlib
+import json
 import os
 import subprocess
 import sys
+from datetime import datetime
 
-def build_frontend():
-    """Build the React frontend application"""
-    print("Building React frontend...")
+DIST_DIR = 'dist'
+NODE_MODULES_DIR = 'node_modules'
+
+# The manifest lives inside the build output so a stale or partial dist is
+# never mistaken for a fresh one; the dependency stamp lives with the
+# installed packages it describes.
+MANIFEST_PATH = os.path.join(DIST_DIR, '.build-manifest.json')
+DEPS_STAMP_PATH = os.path.join(NODE_MODULES_DIR, '.deps-hash')
+
+# Inputs that decide whether `npm install` has to run
+DEPENDENCY_INPUTS = ['package.json', 'package-lock.json']
+
+# Inputs that decide whether `npm run build` has to run
+SOURCE_INPUTS = [
+    'src',
+    'public',
+    'index.html',
+    'components.json',
+    'postcss.config.js',
+    'tailwind.config.ts',
+    'tsconfig.json',
+    'tsconfig.app.json',
+    'tsconfig.node.json',
+    'vite.config.ts',
+]
+
+def _iter_files(path):
+    """Yield every file under path (or path itself) in a stable order"""
+    if os.path.isfile(path):
+        yield path
+        return
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            yield os.path.join(root, name)
+
+def hash_inputs(paths):
+    """
+    Compute a content hash over a list of files and directories
+
+    Args:
+        paths (list): Files or directories, relative to the project root
+
+    Returns:
+        str: Hex digest that changes whenever a file is added, removed,
+            renamed or edited
+    """
+    digest = hashlib.sha256()
+    for path in paths:
+        if not os.path.exists(path):
+            # Record absence so creating the file later invalidates the hash
+            digest.update(f'missing:{path}\0'.encode())
+            continue
+        for file_path in _iter_files(path):
+            digest.update(file_path.replace(os.sep, '/').encode() + b'\0')
+            with open(file_path, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 16), b''):
+                    digest.update(block)
+            digest.update(b'\0')
+    return digest.hexdigest()
+
+def compute_build_key():
+    """Return (deps_hash, source_hash, build_key) for the current tree"""
+    deps_hash = hash_inputs(DEPENDENCY_INPUTS)
+    source_hash = hash_inputs(SOURCE_INPUTS)
+    build_key = hashlib.sha256(f'{deps_hash}:{source_hash}'.encode()).hexdigest()
+    return deps_hash, source_hash, build_key
 
-    # Check if Node.js is installed
+def _read_json(path):
     try:
-        subprocess.run(['node', '--version'], check=True, capture_output=True)
-        print("Node.js found")
-    except (subprocess.CalledProcessError, FileNotFoundError):
-        print("Error: Node.js is not installed. Please install Node.js to build the frontend.")
-        return False
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _read_text(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
 
-    # Check if npm is installed
+def read_manifest():
+    """Return the manifest of the current dist build, or None"""
+    return _read_json(MANIFEST_PATH)
+
+def is_build_current(build_key=None):
+    """Check whether dist was produced from the current sources and dependencies"""
+    if build_key is None:
+        build_key = compute_build_key()[2]
+    manifest = read_manifest()
+    return (
+        manifest is not None
+        and manifest.get('build_key') == build_key
+        and os.path.isfile(os.path.join(DIST_DIR, 'index.html'))
+    )
+
+def dependencies_installed(deps_hash):
+    """Check whether node_modules was installed from the current lockfile"""
+    return os.path.isdir(NODE_MODULES_DIR) and _read_text(DEPS_STAMP_PATH) == deps_hash
+
+def _check_tool(name):
     try:
-        subprocess.run(['npm', '--version'], check=True, capture_output=True)
-        print("npm found")
+        subprocess.run([name, '--version'], check=True, capture_output=True)
+        print(f"{name} found")
+        return True
     except (subprocess.CalledProcessError, FileNotFoundError):
-        print("Error: npm is not installed. Please install npm to build the frontend.")
+        print(f"Error: {name} is not installed. Please install {name} to build the frontend.")
         return False
 
-    # Install dependencies
-    print("Installing frontend dependencies...")
-    try:
-        subprocess.run(['npm', 'install'], check=True)
-        print("Dependencies installed successfully")
-    except subprocess.CalledProcessError:
-        print("Error: Failed to install frontend dependencies")
+def _write_manifest(deps_hash, source_hash, build_key):
+    manifest = {
+        'build_key': build_key,
+        'deps_hash': deps_hash,
+        'source_hash': source_hash,
+        'built_at': datetime.now().isoformat(),
+    }
+    tmp_path = MANIFEST_PATH + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, MANIFEST_PATH)
+
+def build_frontend(force=False):
+    """
+    Build the React frontend application if its inputs changed
+
+    Dependencies are reinstalled only when package.json or the lockfile
+    changed since node_modules was populated, and the Vite build runs only
+    when the sources, configs or dependencies differ from the manifest
+    recorded in dist. A no-op run needs neither Node.js nor the network.
+
+    Args:
+        force (bool): Reinstall and rebuild even if nothing changed
+
+    Returns:
+        bool: True if dist is up to date when the function returns
+    """
+    deps_hash, source_hash, build_key = compute_build_key()
+
+    if not force and is_build_current(build_key):
+        print("Frontend build is up to date, skipping build")
+        return True
+
+    print("Building React frontend...")
+
+    # Check if Node.js and npm are installed
+    if not _check_tool('node') or not _check_tool('npm'):
         return False
 
+    # Install dependencies
+    if not force and dependencies_installed(deps_hash):
+        print("Frontend dependencies are up to date, skipping install")
+    else:
+        print("Installing frontend dependencies...")
+        # npm ci wipes node_modules first. That is right when the lockfile
+        # changed since the stamp, but a node_modules installed by hand,
+        # without a stamp, only needs topping up to the lockfile.
+        unstamped = not force and os.path.isdir(NODE_MODULES_DIR) and _read_text(DEPS_STAMP_PATH) is None
+        install_cmd = ['npm', 'ci'] if os.path.exists('package-lock.json') and not unstamped else ['npm', 'install']
+        try:
+            subprocess.run(install_cmd + ['--prefer-offline', '--no-audit', '--no-fund'], check=True)
+            with open(DEPS_STAMP_PATH, 'w') as f:
+                f.write(deps_hash)
+            print("Dependencies installed successfully")
+        except subprocess.CalledProcessError:
+            print("Error: Failed to install frontend dependencies")
+            return False
+
     # Build the frontend
     print("Building frontend application...")
     try:
         subprocess.run(['npm', 'run', 'build'], check=True)
-        print("Frontend built successfully")
-        return True
     except subprocess.CalledProcessError:
         print("Error: Failed to build frontend application")
         return False
 
+    _write_manifest(deps_hash, source_hash, build_key)
+    print("Frontend built successfully")
+    return True
+
 if __name__ == '__main__':
-    success = build_frontend()
+    parser = argparse.ArgumentParser(description="Incrementally build the React frontend")
+    parser.add_argument('--force', action='store_true', help="reinstall dependencies and rebuild even if nothing changed")
+    args = parser.parse_args()
+
+    success = build_frontend(force=args.force)
     if not success:
-        sys.exit(1)
\ No newline at end of file
+        sys.exit(1)
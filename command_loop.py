@@ -0,0 +1,185 @@
+import asyncio
+import time
+from collections.abc import Mapping
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from structured_log import correlation_id, get_logger
+
+# Most commands applied in one batch before its events are broadcast
+DEFAULT_MAX_BATCH = 256
+
+# Commands that may wait in the queue before submit() applies backpressure
+DEFAULT_CAPACITY = 10_000
+
+Event = Tuple[str, Any]
+
+log = get_logger("commands")
+
+
+class CommandLoop:
+    """
+    Single writer for state mutations
+
+    Handlers submit a command, a plain function that reads and mutates
+    state without awaiting, and await its result. One writer task drains
+    the queue: every command waiting at the start of a loop tick (up to
+    max_batch) is applied in order, and the events those commands emit
+    are published together once the batch is done. Since only the writer
+    mutates state and a command never yields mid-way, a check and the
+    write that depends on it (is the station free? claim it) can no
+    longer interleave with another request.
+
+    Events are coalesced per batch: an entity emitted several times under
+    the same event type is published once, holding its latest state.
+    Each command runs under the correlation id of the request that
+    submitted it, and a batch's "commands.broadcast" log record lists the
+    ids of the requests whose events it published.
+    """
+
+    def __init__(
+        self,
+        publish: Callable[[List[Event]], Awaitable[None]],
+        max_batch: int = DEFAULT_MAX_BATCH,
+        capacity: int = DEFAULT_CAPACITY,
+        after_batch: Optional[Callable[[], None]] = None
+    ):
+        """
+        Args:
+            publish: Coroutine function handing a batch of (event_type, data)
+                events to the clients' outboxes; awaited between batches, so
+                it must not wait on any client
+            max_batch (int): Most commands applied before publishing
+            capacity (int): Queue size; submit() waits while it is full
+            after_batch: Called once every batch is applied and before its
+                events are published, while no command is mid-way; it must
+                not block (e.g. it may hand state copies to a thread)
+        """
+        self._publish = publish
+        self.after_batch = after_batch
+        self.max_batch = max_batch
+        self.capacity = capacity
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer: Optional[asyncio.Task] = None
+        self._outbox: Optional[Dict[Any, Event]] = None
+        self._emitted = 0
+        self.commands = 0
+        self.batches = 0
+        self.events_published = 0
+        self.events_coalesced = 0
+        self.largest_batch = 0
+        self.busy_seconds = 0.0
+
+    def _ensure_writer(self) -> None:
+        # The writer belongs to the running loop; a new loop (tests, the
+        # simulator) gets a fresh queue and writer
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._writer is None or self._writer.done():
+            self._loop = loop
+            self._queue = asyncio.Queue(self.capacity)
+            self._writer = loop.create_task(self._run())
+
+    async def start(self) -> None:
+        self._ensure_writer()
+
+    async def stop(self) -> None:
+        """Apply every queued command, then stop the writer"""
+        if self._writer is None or self._writer.done():
+            return
+        await self._queue.join()
+        self._writer.cancel()
+        try:
+            await self._writer
+        except asyncio.CancelledError:
+            pass
+        self._writer = None
+
+    async def submit(self, command: Callable[..., Any], *args: Any) -> Any:
+        """
+        Queue a command and wait for its result
+
+        Exceptions raised by the command (e.g. HTTPException) are re-raised
+        here, in the submitting handler.
+        """
+        self._ensure_writer()
+        future = self._loop.create_future()
+        await self._queue.put((command, args, future, correlation_id.get()))
+        return await future
+
+    def emit(self, event_type: str, data: Any) -> None:
+        """Queue an event for the current batch's broadcast; only valid inside a command"""
+        if self._outbox is None:
+            raise RuntimeError("emit() called outside a command")
+        self._emitted += 1
+        entity_id = data.get("id") if isinstance(data, Mapping) else None
+        key = (event_type, entity_id) if entity_id is not None else object()
+        if key in self._outbox:
+            # Keep one copy, ordered by its latest emission
+            del self._outbox[key]
+            self.events_coalesced += 1
+        self._outbox[key] = (event_type, data)
+
+    async def _run(self) -> None:
+        queue = self._queue
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < self.max_batch and not queue.empty():
+                batch.append(queue.get_nowait())
+
+            started = time.perf_counter()
+            self._outbox = {}
+            request_ids = []
+            for command, args, future, request_id in batch:
+                if future.cancelled():
+                    continue
+                correlation_id.set(request_id)
+                emitted = self._emitted
+                try:
+                    result = command(*args)
+                except Exception as e:
+                    future.set_exception(e)
+                else:
+                    future.set_result(result)
+                if request_id is not None and self._emitted != emitted:
+                    request_ids.append(request_id)
+            correlation_id.set(None)
+            events, self._outbox = list(self._outbox.values()), None
+            self.busy_seconds += time.perf_counter() - started
+            self.commands += len(batch)
+            self.batches += 1
+            self.largest_batch = max(self.largest_batch, len(batch))
+            if self.after_batch is not None:
+                try:
+                    self.after_batch()
+                except Exception as e:
+                    log.error("commands.after_batch_failed", error=str(e))
+
+            if events:
+                self.events_published += len(events)
+                publish_started = time.perf_counter()
+                try:
+                    await self._publish(events)
+                except Exception as e:
+                    log.error("commands.broadcast_failed", events=len(events), correlation_ids=request_ids, error=str(e))
+                else:
+                    log.info(
+                        "commands.broadcast",
+                        events=len(events),
+                        types=sorted({event_type for event_type, _ in events}),
+                        correlation_ids=request_ids,
+                        ms=round((time.perf_counter() - publish_started) * 1000, 2),
+                    )
+            for _ in batch:
+                queue.task_done()
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "commands": self.commands,
+            "batches": self.batches,
+            "avg_batch": round(self.commands / self.batches, 2) if self.batches else 0.0,
+            "largest_batch": self.largest_batch,
+            "events_published": self.events_published,
+            "events_coalesced": self.events_coalesced,
+            "busy_ms": round(self.busy_seconds * 1000, 1),
+        }
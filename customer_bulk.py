@@ -0,0 +1,257 @@
+import codecs
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel, ValidationError
+
+from customer_directory import CustomerDirectory
+
+# Rows validated, applied and synced to the external API as one group
+IMPORT_CHUNK_SIZE = 1000
+
+# Only the first errors are echoed back so a bad file cannot blow up the report
+MAX_REPORTED_ERRORS = 100
+
+# Customers serialized per chunk of an export stream
+EXPORT_BATCH_SIZE = 1000
+
+CSV_COLUMNS = ["id", "name", "email", "phone", "totalVisits", "totalSpent", "favoriteItems", "lastVisit", "membership"]
+
+# favoriteItems is a list; in CSV it is a single cell joined with this separator
+CSV_LIST_SEPARATOR = ";"
+
+FORMATS = ("ndjson", "csv")
+
+
+class CustomerImportRow(BaseModel):
+    id: Optional[int] = None
+    name: str
+    email: str
+    phone: str
+    totalVisits: int = 0
+    totalSpent: float = 0.0
+    favoriteItems: List[str] = []
+    lastVisit: Optional[str] = None
+    membership: str = "regular"
+
+
+def detect_format(content_type: Optional[str], requested: Optional[str] = None) -> str:
+    """
+    Pick the bulk format from an explicit request or the Content-Type header
+
+    Raises:
+        ValueError: If the format is not supported
+    """
+    if requested:
+        fmt = requested.lower()
+    elif content_type and "csv" in content_type:
+        fmt = "csv"
+    else:
+        fmt = "ndjson"
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported format {fmt!r}; expected one of {', '.join(FORMATS)}")
+    return fmt
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Split a byte stream into text lines without holding more than one partial line"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in chunks:
+        text = pending + decoder.decode(chunk)
+        lines = text.split("\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip("\r")
+
+
+async def iter_ndjson_rows(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, Any]]:
+    """Yield (line_number, parsed_value) for each non-blank NDJSON line"""
+    line_number = 0
+    async for line in iter_lines(chunks):
+        line_number += 1
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError as e:
+            yield line_number, e
+
+
+async def iter_csv_rows(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, Any]]:
+    """
+    Yield (line_number, row_dict) for each CSV record after the header
+
+    Quoted cells may span lines; a record is only parsed once its quotes
+    balance, so it is never split across network chunks.
+    """
+    header: Optional[List[str]] = None
+    record = ""
+    start_line = 0
+    line_number = 0
+    async for line in iter_lines(chunks):
+        line_number += 1
+        if not record:
+            start_line = line_number
+            record = line
+        else:
+            record += "\n" + line
+        if record.count('"') % 2:
+            continue
+
+        text, record = record, ""
+        if not text.strip():
+            continue
+        values = next(csv.reader([text]))
+        if header is None:
+            header = [column.strip() for column in values]
+            continue
+        if len(values) != len(header):
+            yield start_line, ValueError(f"expected {len(header)} columns, got {len(values)}")
+            continue
+        yield start_line, _csv_row_to_dict(header, values)
+
+    if record:
+        yield start_line, ValueError("unterminated quoted field")
+
+
+def _csv_row_to_dict(header: List[str], values: List[str]) -> Dict[str, Any]:
+    row: Dict[str, Any] = {}
+    for column, value in zip(header, values):
+        # Empty cells fall back to the model defaults
+        if value == "":
+            continue
+        if column == "favoriteItems":
+            row[column] = [item.strip() for item in value.split(CSV_LIST_SEPARATOR) if item.strip()]
+        else:
+            row[column] = value
+    return row
+
+
+def _validate_chunk(rows: List[Tuple[int, Any]]) -> Tuple[List[CustomerImportRow], List[Dict[str, Any]]]:
+    """Validate a chunk of parsed rows, returning (customers, errors)"""
+    customers = []
+    errors = []
+    for line_number, row in rows:
+        if isinstance(row, Exception):
+            errors.append({"line": line_number, "error": str(row)})
+            continue
+        if not isinstance(row, dict):
+            errors.append({"line": line_number, "error": "expected a JSON object"})
+            continue
+        try:
+            customers.append(CustomerImportRow.model_validate(row))
+        except ValidationError as e:
+            errors.append({
+                "line": line_number,
+                "error": "; ".join(f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors()),
+            })
+    return customers, errors
+
+
+async def import_customers(
+    chunks: AsyncIterator[bytes],
+    fmt: str,
+    directory: CustomerDirectory,
+    sync_batch: Optional[Callable[[List[Dict[str, Any]]], Awaitable[Any]]] = None,
+    chunk_size: int = IMPORT_CHUNK_SIZE,
+    dry_run: bool = False
+) -> Dict[str, Any]:
+    """
+    Stream customers from an NDJSON or CSV body into the directory
+
+    The body is parsed line by line and validated in chunks. Each chunk is
+    applied and handed to sync_batch before the next one is read, so memory
+    stays bounded by the chunk size rather than the upload size. Rows with
+    an id that already exists update that customer with the fields the row
+    sets; other rows are created.
+
+    Args:
+        chunks: Async iterator over the raw request body
+        fmt (str): "ndjson" or "csv"
+        directory (CustomerDirectory): Customer store to import into
+        sync_batch: Called once per applied chunk with the affected customers
+        chunk_size (int): Rows per validation/apply/sync group
+        dry_run (bool): Validate only, without applying or syncing
+
+    Returns:
+        dict: Counts of processed, created, updated and rejected rows, plus
+            the first MAX_REPORTED_ERRORS row errors
+    """
+    rows = iter_csv_rows(chunks) if fmt == "csv" else iter_ndjson_rows(chunks)
+    default_visit = datetime.now().date().isoformat()
+    report: Dict[str, Any] = {"processed": 0, "created": 0, "updated": 0, "rejected": 0, "chunks": 0, "errors": []}
+
+    async def flush(pending: List[Tuple[int, Any]]) -> None:
+        customers, errors = _validate_chunk(pending)
+        report["processed"] += len(pending)
+        report["rejected"] += len(errors)
+        report["chunks"] += 1
+        room = MAX_REPORTED_ERRORS - len(report["errors"])
+        if room > 0:
+            report["errors"].extend(errors[:room])
+        if dry_run or not customers:
+            return
+
+        applied = []
+        for row in customers:
+            if row.id is not None and row.id in directory:
+                # Only the columns present in the row overwrite the stored customer
+                applied.append(directory.update(row.id, row.model_dump(exclude_unset=True)))
+                report["updated"] += 1
+            else:
+                customer = row.model_dump()
+                if customer["lastVisit"] is None:
+                    customer["lastVisit"] = default_visit
+                applied.append(directory.add(customer))
+                report["created"] += 1
+        if sync_batch is not None:
+            await sync_batch(applied)
+
+    pending: List[Tuple[int, Any]] = []
+    async for row in rows:
+        pending.append(row)
+        if len(pending) >= chunk_size:
+            await flush(pending)
+            pending = []
+    if pending:
+        await flush(pending)
+    return report
+
+
+async def export_customers(directory: CustomerDirectory, fmt: str,
+                           batch_size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[bytes]:
+    """
+    Serialize the directory as an NDJSON or CSV byte stream
+
+    The id list is captured up front and customers are resolved batch by
+    batch, so concurrent deletes are skipped instead of breaking the
+    iteration.
+    """
+    ids = directory.ids()
+    if fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        writer.writerow(CSV_COLUMNS)
+        yield buffer.getvalue().encode()
+
+    for start in range(0, len(ids), batch_size):
+        batch = [c for c in (directory.get(cid) for cid in ids[start:start + batch_size]) if c is not None]
+        if fmt == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer, lineterminator="\n")
+            for customer in batch:
+                writer.writerow([
+                    CSV_LIST_SEPARATOR.join(customer.get(column) or []) if column == "favoriteItems"
+                    else customer.get(column, "")
+                    for column in CSV_COLUMNS
+                ])
+            yield buffer.getvalue().encode()
+        else:
+            yield "".join(json.dumps(customer, separators=(",", ":")) + "\n" for customer in batch).encode()
@@ -0,0 +1,664 @@
+import heapq
+import itertools
+import re
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
+from difflib import SequenceMatcher
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+
+# Numeric fields that keep a sorted (value, id) index for top-k and range queries
+SORTABLE_FIELDS = ("totalSpent", "totalVisits")
+
+_TOKEN_RE = re.compile(r"[^\W_]+", re.UNICODE)
+_NON_DIGITS_RE = re.compile(r"\D+")
+
+# Hash index buckets hold a bare id until a second customer shares the key
+Bucket = Union[int, Set[int]]
+
+
+def normalize_email(email: Optional[str]) -> str:
+    return (email or "").strip().lower()
+
+
+def normalize_phone(phone: Optional[str]) -> str:
+    """Reduce a phone number to its digits so formatting does not matter"""
+    return _NON_DIGITS_RE.sub("", phone or "")
+
+
+def name_tokens(name: Optional[str]) -> List[str]:
+    return _TOKEN_RE.findall((name or "").lower())
+
+
+def _bigrams(token: str) -> Set[str]:
+    padded = f" {token} "
+    return {padded[i:i + 2] for i in range(len(padded) - 1)}
+
+
+class _SortedIndex:
+    """
+    Sorted list of (value, id) pairs split into bounded chunks
+
+    Inserts and deletes shift at most one chunk instead of the whole list,
+    which keeps mutations cheap at millions of entries while iteration and
+    bisection stay as simple as on a flat list.
+    """
+
+    CHUNK_SIZE = 1000
+
+    def __init__(self, entries: Iterable[Tuple[float, int]] = ()):
+        self._chunks: List[List[Tuple[float, int]]] = []
+        self._maxes: List[Tuple[float, int]] = []
+        self._len = 0
+        self.rebuild(entries)
+
+    def __len__(self) -> int:
+        return self._len
+
+    def rebuild(self, entries: Iterable[Tuple[float, int]]) -> None:
+        ordered = sorted(entries)
+        half = self.CHUNK_SIZE // 2
+        self._chunks = [ordered[i:i + half] for i in range(0, len(ordered), half)]
+        self._maxes = [chunk[-1] for chunk in self._chunks]
+        self._len = len(ordered)
+
+    def add(self, entry: Tuple[float, int]) -> None:
+        if not self._chunks:
+            self._chunks.append([entry])
+            self._maxes.append(entry)
+            self._len = 1
+            return
+        position = min(bisect_left(self._maxes, entry), len(self._chunks) - 1)
+        chunk = self._chunks[position]
+        insort(chunk, entry)
+        self._maxes[position] = chunk[-1]
+        self._len += 1
+        if len(chunk) > self.CHUNK_SIZE:
+            half = len(chunk) // 2
+            self._chunks[position:position + 1] = [chunk[:half], chunk[half:]]
+            self._maxes[position:position + 1] = [chunk[half - 1], chunk[-1]]
+
+    def discard(self, entry: Tuple[float, int]) -> None:
+        position = bisect_left(self._maxes, entry)
+        if position == len(self._chunks):
+            return
+        chunk = self._chunks[position]
+        offset = bisect_left(chunk, entry)
+        if offset == len(chunk) or chunk[offset] != entry:
+            return
+        del chunk[offset]
+        self._len -= 1
+        if chunk:
+            self._maxes[position] = chunk[-1]
+        else:
+            del self._chunks[position]
+            del self._maxes[position]
+
+    def __iter__(self) -> Iterator[Tuple[float, int]]:
+        return itertools.chain.from_iterable(self._chunks)
+
+    def __reversed__(self) -> Iterator[Tuple[float, int]]:
+        return itertools.chain.from_iterable(reversed(chunk) for chunk in reversed(self._chunks))
+
+    def irange(self, low: Tuple[float, int], high: Tuple[float, int]) -> Iterator[Tuple[float, int]]:
+        """Iterate entries with low <= entry <= high in ascending order"""
+        position = bisect_left(self._maxes, low)
+        if position == len(self._chunks):
+            return
+        offset = bisect_left(self._chunks[position], low)
+        for chunk in itertools.islice(self._chunks, position, None):
+            for entry in itertools.islice(chunk, offset, None):
+                if entry > high:
+                    return
+                yield entry
+            offset = 0
+
+    def irange_reversed(self, low: Tuple[float, int], high: Tuple[float, int]) -> Iterator[Tuple[float, int]]:
+        """Iterate entries with low <= entry <= high in descending order"""
+        if not self._chunks:
+            return
+        position = min(bisect_left(self._maxes, high), len(self._chunks) - 1)
+        offset = bisect_right(self._chunks[position], high)
+        for index in range(position, -1, -1):
+            chunk = self._chunks[index]
+            for entry_index in range(offset - 1, -1, -1):
+                entry = chunk[entry_index]
+                if entry < low:
+                    return
+                yield entry
+            if index:
+                offset = len(self._chunks[index - 1])
+
+
+class CustomerDirectory:
+    """
+    In-memory customer store with secondary indexes
+
+    Customers are kept as plain dicts (the API response shape) in an
+    id-keyed dict, alongside:
+
+    - hash indexes on normalized email and phone for O(1) lookups
+    - an inverted index from name tokens to ids, with a sorted token
+      vocabulary for prefix search and a bigram index over the vocabulary
+      for fuzzy search
+    - sorted (value, id) indexes on totalSpent and totalVisits for top-k and
+      range queries
+    - a membership -> ids index for segment queries
+
+    Ids come from id_source if given (e.g. IdAllocator.next_int, unique
+    across processes), else from a monotonically increasing counter; either
+    way they are never reused, even after the highest id is deleted.
+    """
+
+    # Close vocabulary words kept per query word in fuzzy search
+    FUZZY_WORDS_PER_TOKEN = 25
+    # Distinct query words looked up in fuzzy search; later ones are ignored
+    FUZZY_MAX_WORDS = 8
+    # Query words a full fuzzy match has to cover, the most selective ones;
+    # the combinations tried grow as FUZZY_WORDS_PER_TOKEN to this power
+    FUZZY_MAX_MATCHED_WORDS = 3
+    # Word combinations tried for full fuzzy matches before falling back to partial ones
+    FUZZY_MAX_COMBINATIONS = 2000
+    FUZZY_MIN_BIGRAM_DICE = 0.4
+
+    def __init__(
+        self,
+        customers: Optional[Iterable[Dict[str, Any]]] = None,
+        id_source: Optional[Callable[[], int]] = None
+    ):
+        self._by_id: Dict[int, Dict[str, Any]] = {}
+        self._by_email: Dict[str, Bucket] = {}
+        self._by_phone: Dict[str, Bucket] = {}
+        self._by_membership: Dict[str, Set[int]] = defaultdict(set)
+        self._by_token: Dict[str, Set[int]] = {}
+        self._vocabulary: List[str] = []
+        self._token_bigrams: Dict[str, Set[str]] = defaultdict(set)
+        self._sorted: Dict[str, _SortedIndex] = {field: _SortedIndex() for field in SORTABLE_FIELDS}
+        self._next_id = 1
+        self._id_source = id_source
+
+        if customers is not None:
+            self.bulk_load(customers)
+
+    # Container protocol -------------------------------------------------
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return iter(self._by_id.values())
+
+    def __contains__(self, customer_id: int) -> bool:
+        return customer_id in self._by_id
+
+    def all(self) -> List[Dict[str, Any]]:
+        return list(self._by_id.values())
+
+    def ids(self) -> List[int]:
+        return list(self._by_id)
+
+    # Id allocation ------------------------------------------------------
+
+    def allocate_id(self) -> int:
+        if self._id_source is not None:
+            return self._id_source()
+        customer_id = self._next_id
+        self._next_id += 1
+        return customer_id
+
+    def _claim_id(self, customer: Dict[str, Any]) -> int:
+        customer_id = customer.get("id")
+        if customer_id is None:
+            customer_id = customer["id"] = self.allocate_id()
+        elif customer_id in self._by_id:
+            raise ValueError(f"Customer {customer_id} already exists")
+        elif customer_id >= self._next_id:
+            self._next_id = customer_id + 1
+        return customer_id
+
+    # Mutations ----------------------------------------------------------
+
+    def add(self, customer: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Insert a customer, allocating an id if it has none
+
+        Args:
+            customer (dict): Customer record; stored as-is, not copied
+
+        Returns:
+            dict: The stored customer
+        """
+        customer_id = self._claim_id(customer)
+        self._by_id[customer_id] = customer
+        self._index_keys(customer_id, customer)
+        self._index_name(customer_id, customer.get("name"))
+        for field in SORTABLE_FIELDS:
+            self._sorted[field].add((self._sort_value(customer, field), customer_id))
+        return customer
+
+    def bulk_load(self, customers: Iterable[Dict[str, Any]]) -> None:
+        """Insert many customers, sorting the numeric indexes once at the end"""
+        pending: Dict[str, List[Tuple[float, int]]] = {
+            field: list(self._sorted[field]) for field in SORTABLE_FIELDS
+        }
+        new_tokens: Set[str] = set()
+        for customer in customers:
+            customer_id = self._claim_id(customer)
+            self._by_id[customer_id] = customer
+            self._index_keys(customer_id, customer)
+            for token in name_tokens(customer.get("name")):
+                ids = self._by_token.get(token)
+                if ids is None:
+                    ids = self._by_token[token] = set()
+                    new_tokens.add(token)
+                ids.add(customer_id)
+            for field in SORTABLE_FIELDS:
+                pending[field].append((self._sort_value(customer, field), customer_id))
+
+        for token in new_tokens:
+            for gram in _bigrams(token):
+                self._token_bigrams[gram].add(token)
+        self._vocabulary = sorted(set(self._vocabulary) | new_tokens)
+        for field in SORTABLE_FIELDS:
+            self._sorted[field].rebuild(pending[field])
+
+    def update(self, customer_id: int, changes: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Apply field changes to a customer, keeping every index in sync
+
+        Args:
+            customer_id (int): ID of the customer
+            changes (dict): Fields to overwrite
+
+        Returns:
+            dict: The updated customer, or None if it does not exist
+        """
+        customer = self._by_id.get(customer_id)
+        if customer is None:
+            return None
+
+        changes = {k: v for k, v in changes.items() if k != "id"}
+        self._unindex_keys(customer_id, customer)
+        if "name" in changes:
+            self._unindex_name(customer_id, customer.get("name"))
+        for field in SORTABLE_FIELDS:
+            if field in changes:
+                self._sorted[field].discard((self._sort_value(customer, field), customer_id))
+
+        customer.update(changes)
+
+        self._index_keys(customer_id, customer)
+        if "name" in changes:
+            self._index_name(customer_id, customer.get("name"))
+        for field in SORTABLE_FIELDS:
+            if field in changes:
+                self._sorted[field].add((self._sort_value(customer, field), customer_id))
+        return customer
+
+    def remove(self, customer_id: int) -> Optional[Dict[str, Any]]:
+        customer = self._by_id.pop(customer_id, None)
+        if customer is None:
+            return None
+        self._unindex_keys(customer_id, customer)
+        self._unindex_name(customer_id, customer.get("name"))
+        for field in SORTABLE_FIELDS:
+            self._sorted[field].discard((self._sort_value(customer, field), customer_id))
+        return customer
+
+    # Point lookups ------------------------------------------------------
+
+    def get(self, customer_id: int) -> Optional[Dict[str, Any]]:
+        return self._by_id.get(customer_id)
+
+    def find_by_email(self, email: str) -> List[Dict[str, Any]]:
+        return self._resolve_bucket(self._by_email.get(normalize_email(email)))
+
+    def find_by_phone(self, phone: str) -> List[Dict[str, Any]]:
+        return self._resolve_bucket(self._by_phone.get(normalize_phone(phone)))
+
+    # Name search --------------------------------------------------------
+
+    def search_name(self, query: str, limit: int = 50, membership: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Prefix search on name tokens
+
+        Every word of the query must be a prefix of some word of the name,
+        so "jo sm" matches "John Smith". Results are in id order.
+        """
+        tokens = name_tokens(query)
+        if not tokens:
+            return []
+
+        candidate_sets = []
+        for token in tokens:
+            matches: Set[int] = set()
+            for word in self._tokens_with_prefix(token):
+                matches |= self._by_token[word]
+            if not matches:
+                return []
+            candidate_sets.append(matches)
+        if membership:
+            candidate_sets.append(self._by_membership.get(membership, set()))
+
+        candidate_sets.sort(key=len)
+        ids = candidate_sets[0].intersection(*candidate_sets[1:])
+        return self._resolve(heapq.nsmallest(limit, ids))
+
+    def fuzzy_search_name(self, query: str, limit: int = 20, cutoff: float = 0.7,
+                          membership: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Typo-tolerant name search
+
+        Each query word is matched against the name vocabulary through a
+        bigram index. Customers whose names contain a close match for every
+        query word rank first, by the sum of the similarity ratios, followed
+        by partial matches. Ties are broken by id.
+
+        The cost is bounded whatever the query: only the first
+        FUZZY_MAX_WORDS distinct words are looked up, a full match covers
+        the FUZZY_MAX_MATCHED_WORDS of them matching the fewest customers,
+        and word combinations are tried best first, at most
+        FUZZY_MAX_COMBINATIONS of them.
+        """
+        tokens = list(dict.fromkeys(name_tokens(query)))[:self.FUZZY_MAX_WORDS]
+        if not tokens:
+            return []
+
+        allowed = self._by_membership.get(membership, set()) if membership else None
+        per_token = [
+            sorted(self._similar_tokens(token, cutoff), key=lambda m: -m[1])[:self.FUZZY_WORDS_PER_TOKEN]
+            for token in tokens
+        ]
+
+        ranked: Dict[int, float] = {}
+
+        def collect(groups: Iterable[Tuple[float, List[str]]]) -> bool:
+            for score, words in groups:
+                sets = sorted((self._by_token[w] for w in words), key=len)
+                if allowed is not None:
+                    sets.append(allowed)
+                ids = sets[0].intersection(*sets[1:])
+                for customer_id in sorted(ids):
+                    if customer_id not in ranked:
+                        ranked[customer_id] = score
+                        if len(ranked) >= limit:
+                            return True
+            return False
+
+        # Full matches: one close word per query token, best combinations first
+        if all(per_token):
+            selective = sorted(
+                per_token, key=lambda matches: sum(len(self._by_token[word]) for word, _ in matches)
+            )[:self.FUZZY_MAX_MATCHED_WORDS]
+            combos = itertools.islice(self._best_combinations(selective), self.FUZZY_MAX_COMBINATIONS)
+            if collect(combos):
+                return self._resolve(ranked)
+
+        # Partial matches: any single query token
+        singles = sorted(
+            ((ratio, [word]) for matches in per_token for word, ratio in matches),
+            key=lambda group: -group[0],
+        )
+        collect(singles)
+        return self._resolve(ranked)
+
+    @staticmethod
+    def _best_combinations(per_token: List[List[Tuple[str, float]]]) -> Iterator[Tuple[float, List[str]]]:
+        """
+        Yield one word per token, as (summed ratio, words), highest sum first
+
+        Each list must be sorted by descending ratio. Combinations are
+        generated lazily from a heap, so taking the first n costs
+        O(n * tokens * log n) rather than the size of the full product.
+        """
+        start = (0,) * len(per_token)
+        heap = [(-sum(matches[0][1] for matches in per_token), start)]
+        seen = {start}
+        while heap:
+            negative_score, indexes = heapq.heappop(heap)
+            yield -negative_score, [per_token[n][i][0] for n, i in enumerate(indexes)]
+            for n, i in enumerate(indexes):
+                if i + 1 < len(per_token[n]):
+                    following = indexes[:n] + (i + 1,) + indexes[n + 1:]
+                    if following not in seen:
+                        seen.add(following)
+                        score = sum(per_token[k][j][1] for k, j in enumerate(following))
+                        heapq.heappush(heap, (-score, following))
+
+    # Ranking and segments -----------------------------------------------
+
+    def top(self, field: str, k: int = 10, membership: Optional[str] = None,
+            ascending: bool = False) -> List[Dict[str, Any]]:
+        """Return the k customers with the highest (or lowest) value of a sortable field"""
+        index = self._sorted_index(field)
+        segment = self._by_membership.get(membership, set()) if membership else None
+
+        # Filtering a walk over the index touches about k * N / |segment|
+        # entries, so only tiny segments are cheaper to rank directly.
+        if segment is not None and len(segment) ** 2 < k * len(index):
+            pick = heapq.nsmallest if ascending else heapq.nlargest
+            return self._resolve(pick(k, segment, key=lambda cid: (self._sort_value(self._by_id[cid], field), cid)))
+
+        results = []
+        for _, customer_id in (iter(index) if ascending else reversed(index)):
+            if segment is not None and customer_id not in segment:
+                continue
+            results.append(self._by_id[customer_id])
+            if len(results) >= k:
+                break
+        return results
+
+    def in_range(self, field: str, low: Optional[float] = None, high: Optional[float] = None,
+                 membership: Optional[str] = None, limit: int = 50,
+                 ascending: bool = True) -> List[Dict[str, Any]]:
+        """
+        Return customers whose field lies in [low, high]
+
+        Descending order starts from the top of the range, so the first
+        page holds the highest values in it.
+        """
+        index = self._sorted_index(field)
+        low_key = (float("-inf") if low is None else float(low), float("-inf"))
+        high_key = (float("inf") if high is None else float(high), float("inf"))
+        segment = self._by_membership.get(membership, set()) if membership else None
+        entries = index.irange(low_key, high_key) if ascending else index.irange_reversed(low_key, high_key)
+
+        results = []
+        for _, customer_id in entries:
+            if segment is not None and customer_id not in segment:
+                continue
+            results.append(self._by_id[customer_id])
+            if len(results) >= limit:
+                break
+        return results
+
+    def segment(self, membership: str) -> List[Dict[str, Any]]:
+        return self._resolve(sorted(self._by_membership.get(membership, ())))
+
+    def segment_counts(self) -> Dict[str, int]:
+        return {level: len(ids) for level, ids in self._by_membership.items() if ids}
+
+    def search(self, q: Optional[str] = None, fuzzy: bool = False, email: Optional[str] = None,
+               phone: Optional[str] = None, membership: Optional[str] = None,
+               sort_by: Optional[str] = None, ascending: bool = False,
+               min_value: Optional[float] = None, max_value: Optional[float] = None,
+               limit: int = 50) -> List[Dict[str, Any]]:
+        """
+        Combined query used by the search endpoint
+
+        Exact email/phone matches take precedence, then name search, then a
+        top-k or range walk over sort_by. Every branch honours the
+        membership filter and the [min_value, max_value] range on sort_by.
+
+        Raises:
+            ValueError: If sort_by is not sortable, or a range is given without sort_by
+        """
+        ranged = min_value is not None or max_value is not None
+        if ranged and not sort_by:
+            raise ValueError("min_value and max_value bound sort_by; give sort_by too")
+        if sort_by:
+            self._sorted_index(sort_by)
+
+        if email or phone:
+            results = self.find_by_email(email) if email else self.find_by_phone(phone)
+            if email and phone:
+                wanted = normalize_phone(phone)
+                results = [c for c in results if normalize_phone(c.get("phone")) == wanted]
+            if membership:
+                results = [c for c in results if c.get("membership") == membership]
+        elif q:
+            if fuzzy:
+                results = self.fuzzy_search_name(q, limit=limit, membership=membership)
+            else:
+                # Rank the full match set, not just the first page
+                results = self.search_name(q, limit=len(self._by_id) if sort_by else limit,
+                                           membership=membership)
+        elif sort_by and ranged:
+            return self.in_range(sort_by, min_value, max_value, membership=membership, limit=limit,
+                                 ascending=ascending)
+        elif sort_by:
+            return self.top(sort_by, k=limit, membership=membership, ascending=ascending)
+        elif membership:
+            results = self.segment(membership)
+        else:
+            results = self.all()
+
+        if ranged:
+            low = float("-inf") if min_value is None else float(min_value)
+            high = float("inf") if max_value is None else float(max_value)
+            results = [c for c in results if low <= self._sort_value(c, sort_by) <= high]
+        if sort_by:
+            results = sorted(results, key=lambda c: (self._sort_value(c, sort_by), c["id"]),
+                             reverse=not ascending)
+        return results[:limit]
+
+    # Index maintenance --------------------------------------------------
+
+    def _resolve(self, ids: Iterable[int]) -> List[Dict[str, Any]]:
+        return [self._by_id[customer_id] for customer_id in ids]
+
+    def _resolve_bucket(self, bucket: Optional[Bucket]) -> List[Dict[str, Any]]:
+        if bucket is None:
+            return []
+        if isinstance(bucket, int):
+            return [self._by_id[bucket]]
+        return self._resolve(sorted(bucket))
+
+    def _sorted_index(self, field: str) -> _SortedIndex:
+        if field not in self._sorted:
+            raise ValueError(f"Cannot sort customers by {field!r}; expected one of {', '.join(SORTABLE_FIELDS)}")
+        return self._sorted[field]
+
+    @staticmethod
+    def _sort_value(customer: Dict[str, Any], field: str) -> float:
+        value = customer.get(field)
+        return float(value) if value is not None else 0.0
+
+    def _index_keys(self, customer_id: int, customer: Dict[str, Any]) -> None:
+        email = normalize_email(customer.get("email"))
+        if email:
+            _bucket_add(self._by_email, email, customer_id)
+        phone = normalize_phone(customer.get("phone"))
+        if phone:
+            _bucket_add(self._by_phone, phone, customer_id)
+        self._by_membership[customer.get("membership") or "regular"].add(customer_id)
+
+    def _unindex_keys(self, customer_id: int, customer: Dict[str, Any]) -> None:
+        _bucket_discard(self._by_email, normalize_email(customer.get("email")), customer_id)
+        _bucket_discard(self._by_phone, normalize_phone(customer.get("phone")), customer_id)
+        _discard(self._by_membership, customer.get("membership") or "regular", customer_id)
+
+    def _index_name(self, customer_id: int, name: Optional[str]) -> None:
+        for token in name_tokens(name):
+            ids = self._by_token.get(token)
+            if ids is None:
+                ids = self._by_token[token] = set()
+                insort(self._vocabulary, token)
+                for gram in _bigrams(token):
+                    self._token_bigrams[gram].add(token)
+            ids.add(customer_id)
+
+    def _unindex_name(self, customer_id: int, name: Optional[str]) -> None:
+        for token in name_tokens(name):
+            ids = self._by_token.get(token)
+            if ids is None:
+                continue
+            ids.discard(customer_id)
+            if not ids:
+                del self._by_token[token]
+                position = bisect_left(self._vocabulary, token)
+                if position < len(self._vocabulary) and self._vocabulary[position] == token:
+                    del self._vocabulary[position]
+                for gram in _bigrams(token):
+                    _discard(self._token_bigrams, gram, token)
+
+    def _tokens_with_prefix(self, prefix: str) -> Iterator[str]:
+        position = bisect_left(self._vocabulary, prefix)
+        while position < len(self._vocabulary) and self._vocabulary[position].startswith(prefix):
+            yield self._vocabulary[position]
+            position += 1
+
+    def _similar_tokens(self, token: str, cutoff: float) -> List[Tuple[str, float]]:
+        grams = _bigrams(token)
+        shared: Dict[str, int] = defaultdict(int)
+        for gram in grams:
+            for word in self._token_bigrams.get(gram, ()):
+                shared[word] += 1
+
+        # Words with a weak bigram overlap (Dice coefficient, with the word's
+        # bigram count bounded by its length + 1) cannot reach the cutoff in
+        # practice. The rest are tried strongest overlap first (closest
+        # length on ties), with a bounded number of cheap and full checks.
+        size = len(grams)
+        overlaps = []
+        for word, count in shared.items():
+            dice = 2.0 * count / (size + len(word) + 1)
+            if dice >= self.FUZZY_MIN_BIGRAM_DICE:
+                overlaps.append((dice, -abs(len(word) - len(token)), word))
+        candidates = heapq.nlargest(self.FUZZY_WORDS_PER_TOKEN * 40, overlaps)
+
+        matches = []
+        full_checks = self.FUZZY_WORDS_PER_TOKEN * 4
+        matcher = SequenceMatcher(b=token, autojunk=False)
+        for _, _, word in candidates:
+            matcher.set_seq1(word)
+            if matcher.real_quick_ratio() < cutoff or matcher.quick_ratio() < cutoff:
+                continue
+            ratio = matcher.ratio()
+            if ratio >= cutoff:
+                matches.append((word, ratio))
+            full_checks -= 1
+            if not full_checks:
+                break
+        return matches
+
+
+def _bucket_add(index: Dict[str, Bucket], key: str, customer_id: int) -> None:
+    bucket = index.get(key)
+    if bucket is None:
+        index[key] = customer_id
+    elif isinstance(bucket, int):
+        if bucket != customer_id:
+            index[key] = {bucket, customer_id}
+    else:
+        bucket.add(customer_id)
+
+
+def _bucket_discard(index: Dict[str, Bucket], key: str, customer_id: int) -> None:
+    bucket = index.get(key)
+    if bucket is None:
+        return
+    if isinstance(bucket, int):
+        if bucket == customer_id:
+            del index[key]
+        return
+    bucket.discard(customer_id)
+    if len(bucket) == 1:
+        index[key] = next(iter(bucket))
+
+
+def _discard(index: Dict[Any, Set[Any]], key: Any, value: Any) -> None:
+    bucket = index.get(key)
+    if bucket is not None:
+        bucket.discard(value)
+        if not bucket:
+            del index[key]
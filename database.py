@@ -1,13 +1,18 @@
+import os
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
 
 # For demo purposes, we'll use SQLite
 # In production, you would use PostgreSQL
-SQLALCHEMY_DATABASE_URL = "sqlite:///./robot_control.db"
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./robot_control.db")
+
+# An in-memory SQLite database lives in one connection; share it across threads
+pool_options = {"poolclass": StaticPool} if SQLALCHEMY_DATABASE_URL in ("sqlite://", "sqlite:///:memory:") else {}
 
 engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}, **pool_options
 )
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -0,0 +1,314 @@
+import asyncio
+import asyncio.base_events
+import asyncio.events
+import asyncio.runners
+import bisect
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional
+
+from structured_log import get_logger
+
+# Seconds between event loop heartbeats; lag is how late each one wakes
+DEFAULT_LAG_INTERVAL = 0.05
+
+# The loop going this many seconds without a heartbeat is reported as a
+# slow callback
+DEFAULT_SLOW_CALLBACK = 0.1
+
+# Seconds between samples of the loop thread for per-handler CPU time
+DEFAULT_SAMPLE_INTERVAL = 0.01
+
+# Upper bounds, in milliseconds, of the loop lag histogram buckets
+LAG_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+# Slow callbacks kept for the metrics endpoint
+SLOW_CALLBACK_HISTORY = 100
+
+# Innermost frames of a blocked loop thread reported with a slow callback
+SLOW_CALLBACK_FRAMES = 8
+
+# Frames from asyncio's own files are loop machinery, not work
+_LOOP_DIR = os.path.dirname(asyncio.__file__) + os.sep
+
+# Frames that run callbacks; the frame below the innermost one is the work
+# being done. uvloop runs callbacks from C, straight below Runner.run.
+_DISPATCH_CODES = frozenset(
+    function.__code__ for function in (
+        asyncio.events.Handle._run,
+        asyncio.base_events.BaseEventLoop.run_forever,
+        asyncio.base_events.BaseEventLoop.run_until_complete,
+        asyncio.runners.run,
+        getattr(asyncio.runners, "Runner", None) and asyncio.runners.Runner.run,
+    ) if function is not None
+)
+_RUN_ONCE_CODE = asyncio.base_events.BaseEventLoop._run_once.__code__
+
+IDLE = "(idle)"
+
+log = get_logger("diagnostics")
+
+
+def frame_label(code) -> str:
+    return f"{getattr(code, 'co_qualname', code.co_name)} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def stack_of(thread_id: int) -> List[Any]:
+    """Code objects of a thread's current stack, outermost first"""
+    frame = sys._current_frames().get(thread_id)
+    codes = []
+    while frame is not None:
+        codes.append(frame.f_code)
+        frame = frame.f_back
+    codes.reverse()
+    return codes
+
+
+def _thread_cpu_clock(thread_id: int) -> Optional[Callable[[], float]]:
+    """CPU time of another thread, where the platform can read it"""
+    try:
+        clock = time.pthread_getcpuclockid(thread_id)
+        time.clock_gettime(clock)
+    except (AttributeError, OSError):
+        return None
+    return lambda: time.clock_gettime(clock)
+
+
+class LoopDiagnostics:
+    """
+    Event loop lag, slow callbacks and CPU time per handler, cheap enough to leave on
+
+    A heartbeat task sleeps lag_interval at a time and records how late it
+    wakes in a histogram. A monitor thread samples the loop thread every
+    sample_interval: the CPU time the loop thread used since the previous
+    sample is charged to the endpoint on its stack (see
+    register_endpoints), else to the task coroutine running, else to idle.
+    When the heartbeat is overdue by slow_callback the monitor records the
+    loop thread's stack while it is still blocked, so the report names the
+    blocking call as well as the handler. Sampling keeps the cost fixed
+    per second rather than per callback, and works on any event loop
+    (asyncio's or uvloop).
+
+    profile() samples the loop thread at a higher rate for a few seconds
+    and returns collapsed stacks ("frame;frame;frame count" lines), the
+    input format of flamegraph.pl and speedscope.
+    """
+
+    def __init__(
+        self,
+        lag_interval: float = DEFAULT_LAG_INTERVAL,
+        slow_callback: float = DEFAULT_SLOW_CALLBACK,
+        sample_interval: float = DEFAULT_SAMPLE_INTERVAL
+    ):
+        """
+        Args:
+            lag_interval (float): Seconds between loop heartbeats
+            slow_callback (float): Seconds without a heartbeat before the loop is reported as blocked
+            sample_interval (float): Seconds between samples of the loop thread
+        """
+        self.lag_interval = lag_interval
+        self.slow_callback = slow_callback
+        self.sample_interval = sample_interval
+        self._lag_counts = [0] * (len(LAG_BUCKETS_MS) + 1)
+        self._lag_total = 0.0
+        self._lag_max = 0.0
+        self._last_beat = 0.0
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._monitor: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._loop_thread: Optional[int] = None
+        self._endpoints: Dict[Any, str] = {}
+        # label -> [samples, cpu seconds]
+        self.handlers: Dict[str, List[float]] = {}
+        self.samples = 0
+        self.sampling_seconds = 0.0
+        # A stall seen by the monitor and not yet reported by the heartbeat
+        self._stall: Optional[Dict[str, Any]] = None
+        self.slow_callbacks: Deque[Dict[str, Any]] = deque(maxlen=SLOW_CALLBACK_HISTORY)
+        self._profiling = threading.Lock()
+
+    def register_endpoints(self, endpoints: Iterable[Callable]) -> None:
+        """Name CPU time after these functions whenever they are on the loop thread's stack"""
+        for endpoint in endpoints:
+            code = getattr(endpoint, "__code__", None)
+            if code is not None:
+                self._endpoints[code] = endpoint.__name__
+
+    @property
+    def running(self) -> bool:
+        return self._heartbeat is not None and not self._heartbeat.done()
+
+    def start(self) -> None:
+        """Start on the running loop; a no-op if already running"""
+        if self.running:
+            return
+        self._loop_thread = threading.get_ident()
+        self._last_beat = time.perf_counter()
+        self._heartbeat = asyncio.get_running_loop().create_task(self._beat())
+        self._stopped.clear()
+        self._monitor = threading.Thread(target=self._watch, name="loop-monitor", daemon=True)
+        self._monitor.start()
+
+    async def stop(self) -> None:
+        self._stopped.set()
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+            await asyncio.gather(self._heartbeat, return_exceptions=True)
+            self._heartbeat = None
+
+    async def _beat(self) -> None:
+        while True:
+            await asyncio.sleep(self.lag_interval)
+            now = time.perf_counter()
+            lag = max(0.0, now - self._last_beat - self.lag_interval)
+            self._last_beat = now
+            self._lag_counts[bisect.bisect_left(LAG_BUCKETS_MS, lag * 1000)] += 1
+            self._lag_total += lag
+            self._lag_max = max(self._lag_max, lag)
+            stall, self._stall = self._stall, None
+            if stall is not None:
+                self._report_slow(stall, lag)
+
+    def label(self, stack: List[Any]) -> str:
+        """What a loop thread stack is working on: an endpoint, else the running callback or task, else idle"""
+        start = 0
+        for depth, code in enumerate(stack):
+            name = self._endpoints.get(code)
+            if name is not None:
+                return name
+            if code in _DISPATCH_CODES:
+                start = depth + 1
+        if start >= len(stack) or stack[start] is _RUN_ONCE_CODE:
+            return IDLE
+        return getattr(stack[start], "co_qualname", stack[start].co_name)
+
+    def _watch(self) -> None:
+        """Monitor thread: sample the loop thread and catch it while blocked"""
+        read_cpu = _thread_cpu_clock(self._loop_thread)
+        own_cpu = time.thread_time
+        last_cpu = read_cpu() if read_cpu else 0.0
+        blocked_beat = 0.0
+        while not self._stopped.wait(self.sample_interval):
+            sampling_started = own_cpu()
+            stack = stack_of(self._loop_thread)
+            label = self.label(stack)
+            if read_cpu:
+                cpu = read_cpu()
+                used, last_cpu = cpu - last_cpu, cpu
+            else:
+                used = 0.0 if label == IDLE else self.sample_interval
+            entry = self.handlers.get(label)
+            if entry is None:
+                entry = self.handlers[label] = [0, 0.0]
+            entry[0] += 1
+            entry[1] += used
+            self.samples += 1
+
+            beat = self._last_beat
+            if beat != blocked_beat and time.perf_counter() - beat > self.lag_interval + self.slow_callback:
+                # Report each stall once, with the stack that is blocking it
+                blocked_beat = beat
+                self._stall = {"handler": label, "stack": stack}
+            self.sampling_seconds += own_cpu() - sampling_started
+
+    def _report_slow(self, stall: Dict[str, Any], lag: float) -> None:
+        blocked_at = [
+            frame_label(code) for code in stall["stack"] if not code.co_filename.startswith(_LOOP_DIR)
+        ][-SLOW_CALLBACK_FRAMES:]
+        report = {
+            "handler": stall["handler"],
+            "at": time.time(),
+            "blocked_ms": round((lag + self.lag_interval) * 1000, 1),
+            "blocked_at": blocked_at,
+        }
+        self.slow_callbacks.append(report)
+        log.warning(
+            "loop.slow_callback",
+            handler=report["handler"],
+            blocked_ms=report["blocked_ms"],
+            blocked_at=blocked_at[-1] if blocked_at else None,
+        )
+
+    def profile(self, seconds: float, interval: float = 0.005) -> str:
+        """
+        Sample the loop thread's stack for `seconds` (call from another thread)
+
+        Returns:
+            str: Collapsed stacks, heaviest first, one "outer;...;inner count" line each
+
+        Raises:
+            RuntimeError: If the loop is not being monitored or another profile is running
+        """
+        if self._loop_thread is None:
+            raise RuntimeError("Loop diagnostics are not running")
+        if not self._profiling.acquire(blocking=False):
+            raise RuntimeError("A profile is already being captured")
+        try:
+            samples: Counter = Counter()
+            deadline = time.perf_counter() + seconds
+            while time.perf_counter() < deadline:
+                samples[tuple(stack_of(self._loop_thread))] += 1
+                time.sleep(interval)
+        finally:
+            self._profiling.release()
+
+        labels: Dict[Any, str] = {}
+
+        def label(code) -> str:
+            if code not in labels:
+                labels[code] = frame_label(code).replace(";", ",")
+            return labels[code]
+
+        return "".join(
+            f"{';'.join(label(code) for code in stack) or IDLE} {count}\n" for stack, count in samples.most_common()
+        )
+
+    def lag_stats(self) -> Dict[str, Any]:
+        beats = sum(self._lag_counts)
+        histogram = {f"<={bound}ms": count for bound, count in zip(LAG_BUCKETS_MS, self._lag_counts)}
+        histogram[f">{LAG_BUCKETS_MS[-1]}ms"] = self._lag_counts[-1]
+        return {
+            "interval_ms": self.lag_interval * 1000,
+            "beats": beats,
+            "mean_ms": round(self._lag_total / beats * 1000, 3) if beats else 0.0,
+            "p99_ms": self._lag_percentile(0.99),
+            "max_ms": round(self._lag_max * 1000, 3),
+            "histogram": histogram,
+        }
+
+    def _lag_percentile(self, p: float) -> Optional[float]:
+        """Upper bound of the bucket holding the p-th heartbeat; None if it is past the last bucket or there are none"""
+        beats = sum(self._lag_counts)
+        seen = 0
+        for bound, count in zip(LAG_BUCKETS_MS, self._lag_counts):
+            seen += count
+            if beats and seen >= p * beats:
+                return bound
+        return None
+
+    def handler_stats(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """Handlers by sampled CPU time, heaviest first"""
+        # The sampler thread adds labels and bumps counts meanwhile; list()
+        # copies the items in one step, and the counts are read once each,
+        # so the total and the ranking come from the same snapshot
+        snapshot = [(label, samples, cpu) for label, (samples, cpu) in list(self.handlers.items())]
+        total = sum(cpu for _, _, cpu in snapshot) or 1.0
+        ranked = sorted(snapshot, key=lambda item: item[2], reverse=True)[:limit]
+        return [
+            {"handler": label, "samples": int(samples), "cpu_ms": round(cpu * 1000, 1), "share": round(cpu / total, 4)}
+            for label, samples, cpu in ranked
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "loop_lag": self.lag_stats(),
+            "slow_callback_ms": self.slow_callback * 1000,
+            "slow_callbacks": list(self.slow_callbacks),
+            "sample_interval_ms": self.sample_interval * 1000,
+            "samples": self.samples,
+            "sampling_cpu_ms": round(self.sampling_seconds * 1000, 1),
+            "handlers": self.handler_stats(),
+        }
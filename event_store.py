@@ -0,0 +1,350 @@
+import gc
+import glob
+import io
+import mmap
+import os
+import pickle
+import struct
+import zlib
+from collections.abc import Mapping
+from concurrent.futures import Future, ThreadPoolExecutor
+from enum import Enum, IntEnum
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Frame header: payload length, CRC32 of the payload, sequence number, event type
+FRAME_HEADER = struct.Struct("<IIQB")
+
+# Log segments are preallocated and memory-mapped at this size; a record
+# that does not fit rolls over to a new segment
+SEGMENT_SIZE = 64 * 1024 * 1024
+
+# Events between automatic snapshots. Recovery replays at most this many.
+SNAPSHOT_EVERY = 50_000
+
+SEGMENT_PATTERN = "events-*.log"
+SNAPSHOT_PATTERN = "snapshot-*.pickle"
+
+
+class EventType(IntEnum):
+    SAVED = 1    # data is the full entity; replaces any entity with the same id
+    DELETED = 2  # data is the id of the removed entity
+
+
+class _StatePickler(pickle.Pickler):
+    # Enums are stored as their plain values so the log does not depend on
+    # the module that defined them (app vs __main__). str/int enums compare
+    # equal to their values, so replayed state behaves the same. Mapping
+    # records are stored as plain dicts for the same reason.
+    def reducer_override(self, obj):
+        if isinstance(obj, Enum):
+            return type(obj.value), (obj.value,)
+        if isinstance(obj, Mapping) and not isinstance(obj, dict):
+            return dict, (dict(obj.items()),)
+        return NotImplemented
+
+
+def dumps(obj: Any) -> bytes:
+    buffer = io.BytesIO()
+    _StatePickler(buffer, protocol=pickle.HIGHEST_PROTOCOL).dump(obj)
+    return buffer.getvalue()
+
+
+def apply_event(collections: Dict[str, Dict[Any, Dict[str, Any]]], event_type: int,
+                collection: str, data: Any) -> None:
+    """Apply one event to collections keyed by entity id"""
+    if event_type == EventType.SAVED:
+        collections.setdefault(collection, {})[data["id"]] = data
+    elif event_type == EventType.DELETED:
+        collections.get(collection, {}).pop(data, None)
+
+
+class LogSegment:
+    """
+    One memory-mapped, append-only file of framed events
+
+    Records are written straight into the mapping. A zero length marks the
+    end of the written region; a CRC mismatch or a sequence gap marks a torn
+    write, and everything from there on is ignored and later overwritten.
+    """
+
+    def __init__(self, path: str, first_sequence: int, size: int = SEGMENT_SIZE):
+        self.path = path
+        self.first_sequence = first_sequence
+        self._file = open(path, "r+b" if os.path.exists(path) else "w+b")
+        if os.fstat(self._file.fileno()).st_size < size:
+            self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        self.size = len(self._map)
+        # A new segment starts empty; an existing one is positioned by records()
+        self.offset = 0
+        self.last_sequence = first_sequence - 1
+
+    @staticmethod
+    def sequence_from_path(path: str) -> int:
+        return int(os.path.basename(path)[len("events-"):-len(".log")])
+
+    def records(self) -> Iterator[Tuple[int, int, bytes]]:
+        """Yield (sequence, event_type, payload) for every intact record, advancing the end offset"""
+        view = self._map
+        offset = 0
+        expected = self.first_sequence
+        header_size = FRAME_HEADER.size
+        while offset + header_size <= self.size:
+            length, crc, sequence, event_type = FRAME_HEADER.unpack_from(view, offset)
+            end = offset + header_size + length
+            if length == 0 or end > self.size or sequence != expected:
+                break
+            payload = view[offset + header_size:end]
+            if zlib.crc32(payload) != crc:
+                break
+            offset = end
+            expected += 1
+            self.offset = offset
+            self.last_sequence = sequence
+            yield sequence, event_type, payload
+
+    def append(self, sequence: int, event_type: int, payload: bytes) -> bool:
+        """Write one record; returns False if the segment has no room for it"""
+        start = self.offset
+        end = start + FRAME_HEADER.size + len(payload)
+        if end > self.size:
+            return False
+        self._map[start + FRAME_HEADER.size:end] = payload
+        FRAME_HEADER.pack_into(self._map, start, len(payload), zlib.crc32(payload), sequence, event_type)
+        self.offset = end
+        self.last_sequence = sequence
+        return True
+
+    def flush(self) -> None:
+        self._map.flush()
+
+    def close(self) -> None:
+        self._map.flush()
+        self._map.close()
+        # Drop the unused preallocated tail; it is re-extended if reopened
+        self._file.truncate(self.offset)
+        self._file.close()
+
+
+class EventStore:
+    """
+    Append-only event log with periodic snapshots
+
+    Every state change is appended as a typed event to memory-mapped log
+    segments. Once snapshot_every events have been appended, snapshot_due()
+    turns true and the owner hands over a copy of the full state between
+    batches of writes; the log rolls to a new segment right there, and the
+    snapshot is pickled, written and fsynced on the store's own thread while
+    appends carry on. Once it is in place, segments covered by it are
+    deleted. Recovery loads the latest snapshot and replays only the events
+    after it.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        snapshot_every: int = SNAPSHOT_EVERY,
+        segment_size: int = SEGMENT_SIZE
+    ):
+        """
+        Args:
+            directory (str): Where segments and snapshots are kept
+            snapshot_every (int): Events between automatic snapshots; 0 disables them
+            segment_size (int): Preallocated size of each log segment in bytes
+        """
+        self.directory = directory
+        self.snapshot_every = snapshot_every
+        self.segment_size = segment_size
+        self.sequence = 0
+        self.snapshot_sequence = 0
+        self._since_snapshot = 0
+        self._segment: Optional[LogSegment] = None
+        self._snapshotter: Optional[ThreadPoolExecutor] = None
+        self._pending: Optional[Future] = None
+        os.makedirs(directory, exist_ok=True)
+
+    # Recovery ----------------------------------------------------------
+
+    def _snapshot_paths(self) -> List[str]:
+        return sorted(glob.glob(os.path.join(self.directory, SNAPSHOT_PATTERN)))
+
+    def _segment_paths(self) -> List[str]:
+        return sorted(glob.glob(os.path.join(self.directory, SEGMENT_PATTERN)))
+
+    def recover(self) -> Optional[Dict[str, List[Dict[str, Any]]]]:
+        """
+        Rebuild the state from the latest snapshot and the log tail after it
+
+        Returns:
+            dict: Collection name -> list of entities, or None if the store is empty
+        """
+        # Recovery allocates millions of objects and frees none; cyclic GC
+        # passes over the growing heap would more than double its cost
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return self._recover()
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+
+    def _recover(self) -> Optional[Dict[str, List[Dict[str, Any]]]]:
+        collections: Dict[str, Dict[Any, Dict[str, Any]]] = {}
+        found = False
+        snapshots = self._snapshot_paths()
+        if snapshots:
+            with open(snapshots[-1], "rb") as f:
+                snapshot = pickle.load(f)
+            self.snapshot_sequence = self.sequence = snapshot["sequence"]
+            collections = {
+                name: {entity["id"]: entity for entity in entities}
+                for name, entities in snapshot["collections"].items()
+            }
+            found = True
+
+        loads = pickle.loads
+        paths = self._segment_paths()
+        for index, path in enumerate(paths):
+            first = LogSegment.sequence_from_path(path)
+            if first > self.sequence + 1:
+                # Events before this segment were lost (torn write), so
+                # nothing from here on can be replayed in order
+                for stale in paths[index:]:
+                    os.remove(stale)
+                break
+            segment = LogSegment(path, first, self.segment_size)
+            last = self.sequence
+            for sequence, event_type, payload in segment.records():
+                if sequence <= last:
+                    continue
+                collection, data = loads(payload)
+                apply_event(collections, event_type, collection, data)
+                self.sequence = sequence
+                found = True
+            if self._segment is not None:
+                self._segment.close()
+                self._segment = None
+            # Only a segment ending at the current sequence can take further appends
+            if segment.last_sequence == self.sequence:
+                self._segment = segment
+            else:
+                segment.close()
+
+        self._since_snapshot = self.sequence - self.snapshot_sequence
+        if not found:
+            return None
+        return {name: list(entities.values()) for name, entities in collections.items()}
+
+    # Writing -----------------------------------------------------------
+
+    def _open_segment(self, first_sequence: int, size: int) -> LogSegment:
+        path = os.path.join(self.directory, f"events-{first_sequence:020d}.log")
+        return LogSegment(path, first_sequence, size)
+
+    def append(self, event_type: int, collection: str, data: Any) -> int:
+        """
+        Append an event and return its sequence number
+
+        data is serialized immediately, so later in-place changes to it are
+        not reflected in the log.
+        """
+        payload = dumps((collection, data))
+        sequence = self.sequence + 1
+        if self._segment is None or not self._segment.append(sequence, event_type, payload):
+            if self._segment is not None:
+                self._segment.close()
+            size = max(self.segment_size, FRAME_HEADER.size + len(payload))
+            self._segment = self._open_segment(sequence, size)
+            self._segment.append(sequence, event_type, payload)
+        self.sequence = sequence
+        self._since_snapshot += 1
+        return sequence
+
+    def snapshot_due(self) -> bool:
+        """
+        Whether snapshot_every events have been appended since the last
+        snapshot and none is being written; a background snapshot that
+        failed makes the next one due at once
+        """
+        if self._pending is not None:
+            if not self._pending.done():
+                return False
+            failed = self._pending.exception() is not None
+            self._pending = None
+            if failed:
+                return True
+        return bool(self.snapshot_every) and self._since_snapshot >= self.snapshot_every
+
+    def snapshot_in_background(self, collections: Dict[str, List[Dict[str, Any]]]) -> Future:
+        """
+        Snapshot the state as of the current sequence on the store's own thread
+
+        Call it between writes: the log rolls over here, so the snapshot
+        and the segments it supersedes end at the same sequence. collections
+        is pickled later, on the snapshot thread, so it must not be mutated
+        from here on; pass copies of the entities, not the live ones.
+
+        Returns:
+            Future: Resolves once the snapshot is on disk; raises if writing it failed
+        """
+        self.wait_for_snapshot()
+        sequence = self._roll()
+        if self._snapshotter is None:
+            self._snapshotter = ThreadPoolExecutor(max_workers=1, thread_name_prefix="event-store-snapshot")
+        self._pending = self._snapshotter.submit(self._write_snapshot, sequence, collections)
+        return self._pending
+
+    def snapshot(self, collections: Dict[str, List[Dict[str, Any]]]) -> None:
+        """Write a snapshot of the state as of the current sequence and drop the log it covers"""
+        self.wait_for_snapshot()
+        self._write_snapshot(self._roll(), collections)
+
+    def wait_for_snapshot(self) -> None:
+        """Wait for a background snapshot to finish, if one is being written"""
+        pending, self._pending = self._pending, None
+        if pending is not None:
+            try:
+                pending.result()
+            except Exception:
+                # The log it would have replaced is still there
+                pass
+
+    def _roll(self) -> int:
+        # Later events go to a fresh segment so every older one becomes
+        # disposable once the snapshot is written
+        if self._segment is not None:
+            self._segment.close()
+            self._segment = None
+        self._since_snapshot = 0
+        return self.sequence
+
+    def _write_snapshot(self, sequence: int, collections: Dict[str, List[Dict[str, Any]]]) -> None:
+        path = os.path.join(self.directory, f"snapshot-{sequence:020d}.pickle")
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(dumps({"sequence": sequence, "collections": collections}))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+        for old in self._snapshot_paths():
+            if old != path:
+                os.remove(old)
+        for old in self._segment_paths():
+            if LogSegment.sequence_from_path(old) <= sequence:
+                os.remove(old)
+        self.snapshot_sequence = sequence
+
+    def flush(self) -> None:
+        """Ask the OS to write mapped log pages to disk"""
+        if self._segment is not None:
+            self._segment.flush()
+
+    def close(self) -> None:
+        self.wait_for_snapshot()
+        if self._snapshotter is not None:
+            self._snapshotter.shutdown()
+            self._snapshotter = None
+        if self._segment is not None:
+            self._segment.close()
+            self._segment = None
@@ -1,8 +1,16 @@
+import asyncio
+import random
+import time
 import requests
+import httpx
 import json
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Set
 from datetime import datetime
 
+from structured_log import correlation_id, get_logger
+
+log = get_logger("external_api")
+
 class ExternalApiClient:
     def __init__(self, base_url: str, api_key: Optional[str] = None):
         """
@@ -34,12 +42,12 @@ class ExternalApiClient:
             dict: Response from the external API
         """
         try:
-            # Add timestamp to customer data
-            customer_data['created_at'] = datetime.now().isoformat()
+            # Add timestamp to a copy so the caller's dict is left untouched
+            payload = {**customer_data, 'created_at': datetime.now().isoformat()}
             
             response = self.session.post(
                 f"{self.base_url}/customers",
-                json=customer_data,
+                json=payload,
                 timeout=30
             )
             
@@ -48,10 +56,10 @@ class ExternalApiClient:
             
             return response.json()
         except requests.exceptions.RequestException as e:
-            print(f"Error sending customer data to external API: {e}")
+            log.error("external_api.create_customer_failed", error=str(e))
             raise
         except json.JSONDecodeError as e:
-            print(f"Error decoding JSON response: {e}")
+            log.error("external_api.bad_response", error=str(e))
             raise
     
     def update_customer(self, customer_id: int, customer_data: Dict[str, Any]) -> Dict[str, Any]:
@@ -76,7 +84,7 @@ class ExternalApiClient:
             
             return response.json()
         except requests.exceptions.RequestException as e:
-            print(f"Error updating customer data in external API: {e}")
+            log.error("external_api.update_customer_failed", customer_id=customer_id, error=str(e))
             raise
     
     def delete_customer(self, customer_id: int) -> Dict[str, Any]:
@@ -99,8 +107,332 @@ class ExternalApiClient:
             
             return response.json()
         except requests.exceptions.RequestException as e:
-            print(f"Error deleting customer from external API: {e}")
+            log.error("external_api.delete_customer_failed", customer_id=customer_id, error=str(e))
+            raise
+
+class CircuitOpenError(Exception):
+    """Raised when the circuit breaker rejects a call without trying it"""
+
+
+class ExternalApiError(Exception):
+    """Raised when a request still fails after all retries"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class CircuitBreaker:
+    """
+    Fail fast while the external API is down
+
+    After failure_threshold consecutive failures the circuit opens and every
+    call is rejected for reset_timeout seconds. The first call after that is
+    let through as a probe: success closes the circuit, failure reopens it,
+    and a probe abandoned without an answer (cancelled) lets the next call
+    probe instead.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+        if self.state == self.HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+    def record_abandoned(self) -> None:
+        """A call ended without telling whether the API is healthy"""
+        self._probe_in_flight = False
+
+
+class AsyncExternalApiClient:
+    """
+    Async client for the external customer API
+
+    Connections are pooled and kept alive by a shared httpx.AsyncClient, and
+    a semaphore bounds the number of requests in flight. Failed requests
+    (transport errors, timeouts, 429 and 5xx) are retried with full-jitter
+    exponential backoff, and a circuit breaker turns a dead API into an
+    immediate CircuitOpenError instead of a timeout per call.
+
+    Updates to the same customer that arrive within coalesce_window seconds
+    are merged into a single PUT whose result is shared by every caller.
+
+    Keep max_concurrency modest: httpcore's pool bookkeeping grows with
+    the number of open connections, and past a few dozen it costs more CPU
+    than the extra parallelism saves.
+    """
+
+    RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+    def __init__(
+        self,
+        base_url: str,
+        api_key: Optional[str] = None,
+        timeout: float = 5.0,
+        max_connections: int = 10,
+        max_concurrency: int = 10,
+        max_retries: int = 3,
+        backoff_base: float = 0.2,
+        backoff_max: float = 5.0,
+        breaker: Optional[CircuitBreaker] = None,
+        coalesce_window: float = 0.05,
+        batch_size: int = 500,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        """
+        Initialize the async external API client
+        
+        Args:
+            base_url (str): Base URL of the external API
+            api_key (str, optional): API key for authentication
+            timeout (float): Per-attempt timeout in seconds
+            max_connections (int): Size of the keep-alive connection pool
+            max_concurrency (int): Requests allowed in flight at once
+            max_retries (int): Retries after the first attempt
+            backoff_base (float): First backoff ceiling in seconds
+            backoff_max (float): Largest backoff ceiling in seconds
+            breaker (CircuitBreaker, optional): Shared circuit breaker
+            coalesce_window (float): Seconds to wait for more updates to the same customer
+            batch_size (int): Customers per batch request
+            transport (httpx.AsyncBaseTransport, optional): Custom transport, mainly for tests
+        """
+        self.base_url = base_url.rstrip('/')
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        self.coalesce_window = coalesce_window
+        self.batch_size = batch_size
+
+        headers = {'Content-Type': 'application/json'}
+        if api_key:
+            headers['Authorization'] = f'Bearer {api_key}'
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers=headers,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            transport=transport
+        )
+        self._max_concurrency = max_concurrency
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._pending_updates: Dict[Any, Dict[str, Any]] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def __aenter__(self) -> "AsyncExternalApiClient":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        """Flush pending coalesced updates and close the connection pool"""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self._client.aclose()
+
+    async def _request(self, method: str, path: str, payload: Optional[Any] = None) -> Dict[str, Any]:
+        if self._semaphore is None:
+            # Created lazily so the client can be built outside a running loop
+            self._semaphore = asyncio.Semaphore(self._max_concurrency)
+
+        # The request's correlation id goes out as X-Request-ID, so the
+        # external API's logs can be matched with ours
+        request_id = correlation_id.get()
+        headers = {"X-Request-ID": request_id} if request_id else None
+        started = time.perf_counter()
+        last_error: Optional[Exception] = None
+        for attempt in range(self.max_retries + 1):
+            if not self.breaker.allow():
+                log.warning("external_api.circuit_open", method=method, path=path)
+                raise CircuitOpenError(f"External API circuit is open; {method} {path} not sent")
+            try:
+                async with self._semaphore:
+                    response = await self._client.request(method, path, json=payload, headers=headers)
+            except (httpx.TransportError, httpx.TimeoutException) as e:
+                self.breaker.record_failure()
+                last_error = ExternalApiError(f"{method} {path} failed: {e!r}")
+            except asyncio.CancelledError:
+                self.breaker.record_abandoned()
+                raise
+            except Exception:
+                # Not retried (a redirect loop, a payload that will not
+                # encode), but the attempt is over; a half-open probe must
+                # not stay in flight forever
+                self.breaker.record_failure()
+                raise
+            else:
+                if response.status_code in self.RETRY_STATUS_CODES:
+                    self.breaker.record_failure()
+                    last_error = ExternalApiError(
+                        f"{method} {path} returned {response.status_code}", response.status_code
+                    )
+                elif response.is_error:
+                    # Client errors will not succeed on retry and say nothing about API health
+                    self.breaker.record_success()
+                    log.warning("external_api.rejected", method=method, path=path, status=response.status_code)
+                    raise ExternalApiError(f"{method} {path} returned {response.status_code}", response.status_code)
+                else:
+                    self.breaker.record_success()
+                    log.info(
+                        "external_api.request",
+                        method=method,
+                        path=path,
+                        status=response.status_code,
+                        attempts=attempt + 1,
+                        ms=round((time.perf_counter() - started) * 1000, 2),
+                    )
+                    return response.json() if response.content else {}
+
+            if attempt < self.max_retries:
+                log.warning("external_api.retry", method=method, path=path, attempt=attempt + 1, error=str(last_error))
+                ceiling = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+                await asyncio.sleep(random.uniform(0, ceiling))
+        log.error("external_api.failed", method=method, path=path, attempts=self.max_retries + 1, error=str(last_error))
+        raise last_error
+
+    def _spawn(self, coro) -> asyncio.Task:
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def create_customer(self, customer_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Send customer data to external API
+        
+        Args:
+            customer_data (dict): Customer information; not modified
+            
+        Returns:
+            dict: Response from the external API
+        """
+        payload = {**customer_data, 'created_at': datetime.now().isoformat()}
+        return await self._request("POST", "/customers", payload)
+
+    async def update_customer(self, customer_id: int, customer_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Update customer data in external API, coalescing rapid repeats
+        
+        Args:
+            customer_id (int): ID of the customer
+            customer_data (dict): Updated customer information
+            
+        Returns:
+            dict: Response to the (possibly merged) update
+        """
+        pending = self._pending_updates.get(customer_id)
+        if pending is not None:
+            # Later fields win; every caller gets the single request's result
+            pending['payload'].update(customer_data)
+            return await asyncio.shield(pending['future'])
+
+        future = asyncio.get_running_loop().create_future()
+        # Mark failures as retrieved even if every waiter has been cancelled
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._pending_updates[customer_id] = {'payload': dict(customer_data), 'future': future}
+        self._spawn(self._flush_update(customer_id))
+        return await asyncio.shield(future)
+
+    async def _flush_update(self, customer_id: int) -> None:
+        await asyncio.sleep(self.coalesce_window)
+        pending = self._pending_updates.pop(customer_id, None)
+        if pending is None:
+            # Superseded by a delete
+            return
+        try:
+            result = await self._request("PUT", f"/customers/{customer_id}", pending['payload'])
+        except Exception as e:
+            pending['future'].set_exception(e)
+        else:
+            pending['future'].set_result(result)
+
+    async def delete_customer(self, customer_id: int) -> Dict[str, Any]:
+        """
+        Delete customer from external API
+        
+        A coalesced update still waiting to be sent is dropped, and its
+        callers receive the delete's result.
+        
+        Args:
+            customer_id (int): ID of the customer to delete
+            
+        Returns:
+            dict: Response from the external API
+        """
+        pending = self._pending_updates.pop(customer_id, None)
+        try:
+            result = await self._request("DELETE", f"/customers/{customer_id}")
+        except Exception as e:
+            if pending is not None:
+                pending['future'].set_exception(e)
             raise
+        if pending is not None:
+            pending['future'].set_result(result)
+        return result
+
+    async def upsert_customers_batch(self, customers: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Create or update many customers with grouped requests
+        
+        Args:
+            customers (list): Customer records, each with an id
+            
+        Returns:
+            list: One response per batch of batch_size customers
+        """
+        batches = [customers[i:i + self.batch_size] for i in range(0, len(customers), self.batch_size)]
+        return await asyncio.gather(*(
+            self._request("POST", "/customers/batch", {"customers": batch}) for batch in batches
+        ))
+
+    async def delete_customers_batch(self, customer_ids: List[int]) -> List[Dict[str, Any]]:
+        """
+        Delete many customers with grouped requests
+        
+        Args:
+            customer_ids (list): IDs of the customers to delete
+            
+        Returns:
+            list: One response per batch of batch_size ids
+        """
+        for customer_id in customer_ids:
+            pending = self._pending_updates.pop(customer_id, None)
+            if pending is not None:
+                pending['future'].set_result({"message": "Superseded by delete"})
+        batches = [customer_ids[i:i + self.batch_size] for i in range(0, len(customer_ids), self.batch_size)]
+        return await asyncio.gather(*(
+            self._request("POST", "/customers/batch/delete", {"ids": batch}) for batch in batches
+        ))
 
 # Example usage
 if __name__ == "__main__":
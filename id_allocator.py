@@ -0,0 +1,151 @@
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, IO, Tuple
+
+# Ids count milliseconds from this instant (2024-01-01T00:00:00Z)
+EPOCH_MS = 1_704_067_200_000
+
+# Bit layout of an id, most significant first: milliseconds since EPOCH_MS,
+# worker, sequence within the millisecond. 53 bits in all, so ids are exact
+# as JavaScript numbers; the timestamp lasts until 2093.
+TIMESTAMP_BITS = 41
+WORKER_BITS = 5
+SEQUENCE_BITS = 7
+
+MAX_WORKERS = 1 << WORKER_BITS
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+
+# Seconds a worker out of sequence numbers waits for the clock to move on
+CLOCK_WAIT = 0.002
+
+# Crockford's base32: no I, L, O or U, so ids read aloud and retype cleanly
+ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+_DIGITS = {char: value for value, char in enumerate(ALPHABET)}
+
+# Base32 digits of a 53-bit id; fixed width so text order is numeric order
+ENCODED_LENGTH = 11
+
+
+def encode_id(value: int) -> str:
+    """Fixed-width base32 text of an id, e.g. 0A95ZPPV4C0"""
+    chars = []
+    for _ in range(ENCODED_LENGTH):
+        value, digit = divmod(value, 32)
+        chars.append(ALPHABET[digit])
+    return "".join(reversed(chars))
+
+
+def decode_id(text: str) -> int:
+    """
+    Inverse of encode_id; accepts a prefixed id such as "T-0A95ZPPV4C0"
+
+    Raises:
+        ValueError: If the text is not an encoded id
+    """
+    digits = text.rsplit("-", 1)[-1].upper()
+    if len(digits) != ENCODED_LENGTH or any(char not in _DIGITS for char in digits):
+        raise ValueError(f"Not an allocated id: {text!r}")
+    value = 0
+    for char in digits:
+        value = value * 32 + _DIGITS[char]
+    return value
+
+
+def describe_id(value: int) -> Dict[str, Any]:
+    """When, and by which worker, an id was allocated"""
+    return {
+        "allocated_at": datetime.fromtimestamp(((value >> (WORKER_BITS + SEQUENCE_BITS)) + EPOCH_MS) / 1000, timezone.utc),
+        "worker_id": (value >> SEQUENCE_BITS) & (MAX_WORKERS - 1),
+        "sequence": value & MAX_SEQUENCE,
+    }
+
+
+def claim_worker_id(lease_dir: str) -> Tuple[int, IO]:
+    """
+    Claim a worker id no other live process on this host holds
+
+    Each id is a lock file in lease_dir, locked for as long as the returned
+    file stays open; the operating system releases it when the process
+    exits, however it exits. Workers on different hosts must be given
+    distinct ids (WORKER_ID) instead, or share lease_dir over a filesystem
+    with working locks.
+
+    Returns:
+        Tuple[int, IO]: The worker id and the open lease file, to keep open
+
+    Raises:
+        RuntimeError: If all MAX_WORKERS ids are held, or locks are unsupported here
+    """
+    try:
+        import fcntl
+    except ImportError:
+        raise RuntimeError("Worker id leases need fcntl; set WORKER_ID on this platform")
+    os.makedirs(lease_dir, exist_ok=True)
+    for worker_id in range(MAX_WORKERS):
+        lease = open(os.path.join(lease_dir, f"worker-{worker_id}.lock"), "a")
+        try:
+            fcntl.flock(lease, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lease.close()
+            continue
+        return worker_id, lease
+    raise RuntimeError(f"All {MAX_WORKERS} worker ids in {lease_dir} are held")
+
+
+class IdAllocator:
+    """
+    Time-ordered ids, unique across workers without coordination per id
+
+    An id is the millisecond it was allocated in, the worker's id and a
+    sequence number within that millisecond (the snowflake layout, cut to
+    53 bits). Workers never share an id as long as each holds a distinct
+    worker_id, which is claimed once at startup (see claim_worker_id).
+    Ids from one worker strictly increase, and ids from all workers sort by
+    allocation time to the millisecond, so they work as keyset pagination
+    cursors and as creation order.
+
+    A worker that uses up a millisecond's MAX_SEQUENCE + 1 ids waits for
+    the next one, which caps it at 128,000 ids a second. If the clock has
+    stepped back, or does not move within CLOCK_WAIT, it carries on from
+    its last timestamp plus one instead: ids stay unique and increasing,
+    running slightly ahead of the clock until it catches up.
+    """
+
+    def __init__(self, worker_id: int, clock: Callable[[], float] = time.time):
+        """
+        Args:
+            worker_id (int): This process's id, in [0, MAX_WORKERS)
+            clock: Seconds since the Unix epoch
+        """
+        if not 0 <= worker_id < MAX_WORKERS:
+            raise ValueError(f"worker_id must be in [0, {MAX_WORKERS})")
+        self.worker_id = worker_id
+        self._clock = clock
+        self._last_ms = -1
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def next_int(self) -> int:
+        """A new id as an integer"""
+        with self._lock:
+            now = self._now_ms()
+            if now > self._last_ms:
+                self._last_ms, self._sequence = now, 0
+            elif self._sequence < MAX_SEQUENCE:
+                self._sequence += 1
+            else:
+                if now == self._last_ms:
+                    deadline = time.perf_counter() + CLOCK_WAIT
+                    while now <= self._last_ms and time.perf_counter() < deadline:
+                        now = self._now_ms()
+                self._last_ms, self._sequence = max(now, self._last_ms + 1), 0
+            return (self._last_ms << (WORKER_BITS + SEQUENCE_BITS)) | (self.worker_id << SEQUENCE_BITS) | self._sequence
+
+    def _now_ms(self) -> int:
+        return int(self._clock() * 1000) - EPOCH_MS
+
+    def next_id(self, prefix: str) -> str:
+        """A new id as text, e.g. next_id("T") -> "T-0A95ZPPV4C0" """
+        return f"{prefix}-{encode_id(self.next_int())}"
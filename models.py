@@ -60,4 +60,22 @@ class AssignmentLog(Base):
     assignment_time = Column(DateTime, default=datetime.utcnow)
     score = Column(Float)
     reason = Column(Text)
-    effective_priority = Column(Integer)
\ No newline at end of file
+    effective_priority = Column(Integer)
+
+class ArchivedTask(Base):
+    __tablename__ = "archived_tasks"
+    
+    id = Column(String, primary_key=True, index=True)
+    type = Column(String, index=True)
+    base_priority = Column(Integer)
+    release_time = Column(DateTime)
+    deadline = Column(DateTime, nullable=True)
+    operator_override = Column(Integer, default=0)
+    effective_priority = Column(Integer)
+    waypoints = Column(JSON)
+    state = Column(String)
+    assigned_robot = Column(String, nullable=True)
+    order_id = Column(String, nullable=True)
+    trip_id = Column(String, nullable=True)
+    created_at = Column(DateTime, index=True)
+    completed_at = Column(DateTime, index=True)
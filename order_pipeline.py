@@ -0,0 +1,369 @@
+import asyncio
+import time
+from collections import deque
+from datetime import datetime
+from enum import Enum
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from structured_log import get_logger
+
+log = get_logger("order_pipeline")
+
+
+class OrderStatus(str, Enum):
+    RECEIVED = "received"
+    PREPARING = "preparing"
+    READY = "ready"
+    SERVED = "served"
+    BILL_REQUESTED = "bill_requested"
+    PAID = "paid"
+
+
+# Kitchen state machine: the statuses each status may move to
+ORDER_TRANSITIONS: Dict[str, Tuple[str, ...]] = {
+    OrderStatus.RECEIVED: (OrderStatus.PREPARING,),
+    OrderStatus.PREPARING: (OrderStatus.READY,),
+    OrderStatus.READY: (OrderStatus.SERVED,),
+    OrderStatus.SERVED: (OrderStatus.BILL_REQUESTED, OrderStatus.PAID),
+    OrderStatus.BILL_REQUESTED: (OrderStatus.PAID,),
+    OrderStatus.PAID: (),
+}
+
+# Robot tasks generated when an order enters a status. "{table}" is replaced
+# with the name of the order's table.
+TASKS_ON_STATUS: Dict[str, List[Tuple[str, Tuple[str, ...]]]] = {
+    OrderStatus.READY: [("delivery", ("Kitchen", "{table}"))],
+    OrderStatus.SERVED: [("collection", ("{table}", "Washing Machine"))],
+    OrderStatus.BILL_REQUESTED: [("payment", ("Reception", "{table}"))],
+}
+
+# Queue capacity per stage. A full ingest queue rejects new work; a full
+# downstream queue makes the stage above wait, which backs work up towards
+# ingest instead of piling up unbounded in memory.
+DEFAULT_CAPACITY = {"ingest": 1000, "kitchen": 500, "tasks": 500, "publish": 1000}
+
+# Seconds of history behind the throughput figures
+THROUGHPUT_WINDOW = 10
+
+
+class PipelineFull(Exception):
+    """Raised when the ingest queue is at capacity"""
+
+
+class PipelineStopped(Exception):
+    """Raised when work is submitted while the pipeline is not running"""
+
+
+class StageMetrics:
+    def __init__(self, name: str, queue: asyncio.Queue):
+        self.name = name
+        self.queue = queue
+        self.processed = 0
+        self.errors = 0
+        self.max_depth = 0
+        self.busy_seconds = 0.0
+        # (second, count) buckets for a sliding-window throughput
+        self._buckets: Deque[List[int]] = deque()
+
+    def observe_depth(self) -> None:
+        depth = self.queue.qsize()
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+    def record(self, elapsed: float, ok: bool = True) -> None:
+        if ok:
+            self.processed += 1
+        else:
+            self.errors += 1
+        self.busy_seconds += elapsed
+        second = int(time.monotonic())
+        if self._buckets and self._buckets[-1][0] == second:
+            self._buckets[-1][1] += 1
+        else:
+            self._buckets.append([second, 1])
+            while self._buckets and self._buckets[0][0] <= second - THROUGHPUT_WINDOW:
+                self._buckets.popleft()
+
+    def throughput(self) -> float:
+        horizon = int(time.monotonic()) - THROUGHPUT_WINDOW
+        return sum(count for second, count in self._buckets if second > horizon) / THROUGHPUT_WINDOW
+
+    def snapshot(self) -> Dict[str, Any]:
+        handled = self.processed + self.errors
+        return {
+            "queue_depth": self.queue.qsize(),
+            "queue_capacity": self.queue.maxsize,
+            "max_queue_depth": self.max_depth,
+            "processed": self.processed,
+            "errors": self.errors,
+            "throughput_per_sec": round(self.throughput(), 2),
+            "avg_service_ms": round(self.busy_seconds / handled * 1000, 3) if handled else 0.0,
+        }
+
+
+class OrderPipeline:
+    """
+    Staged asyncio stream from order events to robot tasks
+
+    ingest -> kitchen -> tasks -> publish
+
+    - ingest: handlers enqueue order events without waiting; when the queue
+      is full the event is rejected with PipelineFull so the API can answer
+      503 instead of stalling the request.
+    - kitchen: creates orders and applies status transitions, enforcing
+      ORDER_TRANSITIONS.
+    - tasks: generates delivery, collection and payment tasks per
+      TASKS_ON_STATUS through the create_task callback.
+    - publish: hands order and task events to the publish callback
+      (the WebSocket broadcast), draining whatever has queued up.
+
+    Each stage is one consumer task reading a bounded queue and awaiting
+    space in the next one, so a slow stage exerts backpressure upstream.
+    """
+
+    def __init__(
+        self,
+        orders: List[Dict[str, Any]],
+        create_task: Callable[[str, List[str], Optional[str]], Dict[str, Any]],
+        publish: Callable[[str, Any], Awaitable[None]],
+        table_name: Callable[[str], Optional[str]],
+        capacity: Optional[Dict[str, int]] = None,
+        on_order_saved: Optional[Callable[[Dict[str, Any]], None]] = None,
+        new_id: Optional[Callable[[], str]] = None
+    ):
+        """
+        Args:
+            orders (list): Order list to own; new orders are appended to it
+            create_task: Builds and stores a task from (type, waypoints, order_id)
+            publish: Async callback receiving (event_type, data)
+            table_name: Maps a table id to the location name used in waypoints
+            capacity (dict, optional): Per-stage queue capacity overrides
+            on_order_saved (optional): Called with each order the kitchen
+                stage creates or changes, e.g. to persist it
+            new_id (optional): Allocates order ids; by default O1, O2, ...
+                counting on from the highest numbered order
+        """
+        self.orders = orders
+        self._orders_by_id: Dict[str, Dict[str, Any]] = {o["id"]: o for o in orders}
+        self._create_task = create_task
+        self._publish = publish
+        self._table_name = table_name
+        self._capacity = {**DEFAULT_CAPACITY, **(capacity or {})}
+        self._on_order_saved = on_order_saved
+        self._next_order_number = 1 + max(
+            (int(o["id"][1:]) for o in orders if o["id"][1:].isdigit()), default=0
+        )
+        self._new_id = new_id or self._number_order
+        # Order id -> (its status once its queued transitions are applied, how many are queued)
+        self._queued_status: Dict[str, Tuple[str, int]] = {}
+        self._stages: Dict[str, StageMetrics] = {}
+        self._workers: List[asyncio.Task] = []
+        self.accepted = 0
+        self.rejected = 0
+
+    # Lifecycle ---------------------------------------------------------
+
+    @property
+    def running(self) -> bool:
+        return bool(self._workers)
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self._queued_status = {}
+        handlers = [
+            ("ingest", self._ingest),
+            ("kitchen", self._kitchen),
+            ("tasks", self._generate_tasks),
+            ("publish", None),
+        ]
+        self._stages = {
+            name: StageMetrics(name, asyncio.Queue(maxsize=self._capacity[name])) for name, _ in handlers
+        }
+        names = [name for name, _ in handlers]
+        for index, (name, handler) in enumerate(handlers):
+            if handler is None:
+                worker = self._run_publisher(self._stages[name])
+            else:
+                worker = self._run_stage(self._stages[name], handler, self._stages[names[index + 1]])
+            self._workers.append(asyncio.create_task(worker, name=f"order-pipeline-{name}"))
+
+    async def stop(self, drain: bool = True) -> None:
+        """Stop the stage workers, first letting queued work finish if drain is set"""
+        if not self.running:
+            return
+        if drain:
+            for stage in self._stages.values():
+                await stage.queue.join()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        if not drain:
+            # Orders and transitions still queued were dropped with the queues
+            self._orders_by_id = {o["id"]: o for o in self.orders}
+            self._queued_status = {}
+
+    async def join(self) -> None:
+        """Wait until every event submitted so far has been published"""
+        for stage in self._stages.values():
+            await stage.queue.join()
+
+    # Submission --------------------------------------------------------
+
+    def submit_order(self, table_id: str, items: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Queue a new order for the kitchen
+
+        The order is known to get_order() and submit_status() at once, so a
+        status change may follow before the kitchen has created it.
+
+        Returns:
+            dict: The order as it will be created, with its allocated id
+
+        Raises:
+            PipelineFull: If the ingest queue is at capacity
+            PipelineStopped: If the pipeline is not running
+        """
+        order = {
+            "id": self._new_id(),
+            "table_id": table_id,
+            "items": items,
+            "status": OrderStatus.RECEIVED.value,
+            "created_at": datetime.now(),
+        }
+        self._enqueue(("create", order))
+        self._orders_by_id[order["id"]] = order
+        return order
+
+    def _number_order(self) -> str:
+        order_id = f"O{self._next_order_number}"
+        self._next_order_number += 1
+        return order_id
+
+    def submit_status(self, order_id: str, status: str) -> None:
+        """
+        Queue a kitchen status transition
+
+        The transition is checked here against the status the order will
+        have once the transitions already queued for it are applied, so an
+        accepted change is never dropped by the kitchen later.
+
+        Raises:
+            KeyError: If the order does not exist
+            ValueError: If the status is unknown or not reachable from the order's status
+            PipelineFull: If the ingest queue is at capacity
+            PipelineStopped: If the pipeline is not running
+        """
+        order = self._orders_by_id.get(order_id)
+        if order is None:
+            raise KeyError(order_id)
+        if status not in ORDER_TRANSITIONS:
+            raise ValueError(f"Unknown order status {status!r}")
+        current, queued = self._queued_status.get(order_id, (order["status"], 0))
+        if status not in ORDER_TRANSITIONS[current]:
+            raise ValueError(f"Order {order_id} cannot move from {current!r} to {status!r}")
+        self._enqueue(("status", order_id, status))
+        self._queued_status[order_id] = (status, queued + 1)
+
+    def get_order(self, order_id: str) -> Optional[Dict[str, Any]]:
+        return self._orders_by_id.get(order_id)
+
+    def _enqueue(self, event: tuple) -> None:
+        if not self.running:
+            raise PipelineStopped("Order pipeline is not running")
+        stage = self._stages["ingest"]
+        try:
+            stage.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise PipelineFull("Order pipeline is at capacity")
+        self.accepted += 1
+        stage.observe_depth()
+
+    # Stages ------------------------------------------------------------
+
+    async def _run_stage(self, stage: StageMetrics, handler, downstream: StageMetrics) -> None:
+        while True:
+            item = await stage.queue.get()
+            start = time.perf_counter()
+            try:
+                outputs = handler(item)
+            except Exception as e:
+                stage.record(time.perf_counter() - start, ok=False)
+                log.error("order_pipeline.stage_failed", stage=stage.name, item=repr(item), error=str(e))
+                stage.queue.task_done()
+                continue
+            stage.record(time.perf_counter() - start)
+            try:
+                for output in outputs:
+                    # Waiting here is the backpressure: this stage stops
+                    # consuming until the next one has room.
+                    await downstream.queue.put(output)
+                    downstream.observe_depth()
+            finally:
+                stage.queue.task_done()
+
+    async def _run_publisher(self, stage: StageMetrics) -> None:
+        while True:
+            batch = [await stage.queue.get()]
+            while not stage.queue.empty() and len(batch) < 100:
+                batch.append(stage.queue.get_nowait())
+            for event_type, data in batch:
+                start = time.perf_counter()
+                try:
+                    await self._publish(event_type, data)
+                    stage.record(time.perf_counter() - start)
+                except Exception as e:
+                    stage.record(time.perf_counter() - start, ok=False)
+                    log.error("order_pipeline.publish_failed", event_type=event_type, error=str(e))
+                finally:
+                    stage.queue.task_done()
+
+    def _ingest(self, event: tuple) -> List[tuple]:
+        # Ingest only decouples handlers from the kitchen; it forwards as-is
+        return [event]
+
+    def _kitchen(self, event: tuple) -> List[tuple]:
+        if event[0] == "create":
+            order = event[1]
+            self.orders.append(order)
+            self._orders_by_id[order["id"]] = order
+            if self._on_order_saved:
+                self._on_order_saved(order)
+            return [("order_created", order, None)]
+
+        _, order_id, status = event
+        queued_status, queued = self._queued_status.pop(order_id, (None, 0))
+        if queued > 1:
+            self._queued_status[order_id] = (queued_status, queued - 1)
+        order = self._orders_by_id[order_id]
+        current = order["status"]
+        if status not in ORDER_TRANSITIONS.get(current, ()):
+            raise ValueError(f"Order {order_id} cannot move from {current!r} to {status!r}")
+        order["status"] = status
+        order["updated_at"] = datetime.now()
+        if self._on_order_saved:
+            self._on_order_saved(order)
+        return [("order_updated", order, status)]
+
+    def _generate_tasks(self, event: tuple) -> List[Tuple[str, Any]]:
+        event_type, order, status = event
+        outputs: List[Tuple[str, Any]] = [(event_type, order)]
+        rules = TASKS_ON_STATUS.get(status, ()) if status else ()
+        if rules:
+            table = self._table_name(order["table_id"]) or order["table_id"]
+            for task_type, template in rules:
+                waypoints = [stop.replace("{table}", table) for stop in template]
+                outputs.append(("task_created", self._create_task(task_type, waypoints, order["id"])))
+        return outputs
+
+    # Metrics -----------------------------------------------------------
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "stages": {name: stage.snapshot() for name, stage in self._stages.items()},
+        }
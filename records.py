@@ -0,0 +1,375 @@
+import itertools
+import math
+import sys
+from collections.abc import MutableMapping
+from datetime import datetime
+from enum import Enum
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Type
+
+import numpy as np
+
+
+class TaskState(str, Enum):
+    WAITING = "WAITING"
+    READY = "READY"
+    CLAIMED = "CLAIMED"
+    RUNNING = "RUNNING"
+    PAUSED = "PAUSED"
+    DONE = "DONE"
+
+class TaskType(str, Enum):
+    ORDERING = "ordering"
+    DELIVERY = "delivery"
+    COLLECTION = "collection"
+    PAYMENT = "payment"
+    CHARGING = "charging"
+
+class RobotStatus(str, Enum):
+    IDLE = "IDLE"
+    MOVING = "MOVING"
+    CHARGING = "CHARGING"
+    ERROR = "ERROR"
+
+
+# Initial row capacity of a RecordTable's columns; doubled as needed
+INITIAL_CAPACITY = 1024
+
+_MISSING = object()
+
+
+def _enum_or_interned(enum_cls: Type[Enum]) -> Callable[[Any], Any]:
+    """Store known values as the shared enum member and anything else as an interned string"""
+    members = {member.value: member for member in enum_cls}
+
+    def coerce(value):
+        if isinstance(value, enum_cls) or value is None:
+            return value
+        member = members.get(value)
+        if member is not None:
+            return member
+        return sys.intern(value) if isinstance(value, str) else value
+    return coerce
+
+
+def _interned(value):
+    return sys.intern(value) if type(value) is str else value
+
+
+def _interned_tuple(value):
+    return tuple(_interned(v) for v in value) if value is not None else None
+
+
+def _enum_code(enum_cls: Type[Enum]) -> Callable[[Any], int]:
+    codes = {member.value: code for code, member in enumerate(enum_cls)}
+    return lambda value: codes.get(getattr(value, "value", value), -1)
+
+
+def _timestamp(value) -> float:
+    return value.timestamp() if isinstance(value, datetime) else math.nan
+
+
+def _number(value) -> float:
+    return value if value is not None else math.nan
+
+
+class Record(MutableMapping):
+    """
+    Slotted record that behaves like the dict it replaces
+
+    Fields live in __slots__ instead of a per-instance dict, enum fields hold
+    the shared enum members and location strings are interned, so a record
+    is a fraction of the size of the equivalent dict. Reading, assigning,
+    iterating and JSON-encoding work exactly as they did on the dict; an
+    unset field is simply absent. Keys outside FIELDS are kept in a small
+    overflow dict created on first use.
+
+    When the record belongs to a RecordTable, assignments to HOT_COLUMNS
+    are written through to the table's NumPy columns.
+    """
+    __slots__ = ("_table", "_row", "_extra")
+
+    FIELDS: Tuple[str, ...] = ()
+    COERCE: Dict[str, Callable[[Any], Any]] = {}
+    # field -> (NumPy dtype, encoder to a column value)
+    HOT_COLUMNS: Dict[str, Tuple[Any, Callable[[Any], Any]]] = {}
+
+    def __init__(self, data: Optional[Dict[str, Any]] = None, **fields):
+        self._table = None
+        self._row = -1
+        self._extra = None
+        if data:
+            fields = {**data, **fields}
+        for key, value in fields.items():
+            self[key] = value
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._FIELD_SET = frozenset(cls.FIELDS)
+
+    def __getitem__(self, key):
+        if key in self._FIELD_SET:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        if self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in self._FIELD_SET:
+            coerce = self.COERCE.get(key)
+            setattr(self, key, coerce(value) if coerce else value)
+            if self._table is not None and key in self.HOT_COLUMNS:
+                self._table._write(self._row, key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self, key):
+        if key in self._FIELD_SET:
+            try:
+                delattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+            if self._table is not None and key in self.HOT_COLUMNS:
+                self._table._write(self._row, key, None)
+        elif self._extra is not None and key in self._extra:
+            del self._extra[key]
+        else:
+            raise KeyError(key)
+
+    def get(self, key, default=None):
+        value = getattr(self, key, _MISSING) if key in self._FIELD_SET else (
+            self._extra.get(key, _MISSING) if self._extra is not None else _MISSING
+        )
+        return default if value is _MISSING else value
+
+    def __contains__(self, key):
+        if key in self._FIELD_SET:
+            return hasattr(self, key)
+        return self._extra is not None and key in self._extra
+
+    def __iter__(self) -> Iterator[str]:
+        for key in self.FIELDS:
+            if hasattr(self, key):
+                yield key
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __eq__(self, other):
+        if isinstance(other, (dict, Record)):
+            return dict(self.items()) == dict(other.items())
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"{type(self).__name__}({dict(self.items())!r})"
+
+    def __reduce__(self):
+        # Pickle only the fields, never the owning table
+        return type(self), (dict(self.items()),)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self.items())
+
+
+class TaskRecord(Record):
+    FIELDS = (
+        "id", "type", "base_priority", "release_time", "deadline", "operator_override",
+        "effective_priority", "waypoints", "state", "assigned_robot", "order_id", "trip_id", "created_at",
+        "completed_at",
+    )
+    __slots__ = FIELDS
+    COERCE = {
+        "id": _interned,
+        "type": _enum_or_interned(TaskType),
+        "state": _enum_or_interned(TaskState),
+        "waypoints": _interned_tuple,
+        "assigned_robot": _interned,
+    }
+    HOT_COLUMNS = {
+        "state": (np.int8, _enum_code(TaskState)),
+        "type": (np.int8, _enum_code(TaskType)),
+        "effective_priority": (np.int32, lambda v: v if v is not None else 0),
+        "deadline": (np.float64, _timestamp),
+        "completed_at": (np.float64, _timestamp),
+    }
+
+
+class RobotRecord(Record):
+    FIELDS = ("id", "current_location", "battery_level", "status", "current_task_id", "last_active")
+    __slots__ = FIELDS
+    COERCE = {
+        "id": _interned,
+        "current_location": _interned,
+        "status": _enum_or_interned(RobotStatus),
+        "current_task_id": _interned,
+    }
+    HOT_COLUMNS = {
+        "status": (np.int8, _enum_code(RobotStatus)),
+        "battery_level": (np.float32, _number),
+    }
+
+
+class TripRecord(Record):
+    FIELDS = (
+        "id", "robot_id", "type", "task_ids", "route", "distance", "duration_s", "finish_offsets_s", "created_at",
+    )
+    __slots__ = FIELDS
+    COERCE = {
+        "id": _interned,
+        "robot_id": _interned,
+        "type": _enum_or_interned(TaskType),
+    }
+
+
+class RecordTable:
+    """
+    Ordered collection of records with an id index and columnar hot fields
+
+    Iterates like the list it replaces and supports append/len/indexing,
+    adds O(1) lookup by id, and mirrors each record's HOT_COLUMNS into
+    NumPy arrays so scans such as "READY tasks past their deadline" run
+    vectorized instead of touching every record.
+    """
+
+    def __init__(self, record_cls: Type[Record], records: Iterable[Any] = (),
+                 capacity: int = INITIAL_CAPACITY):
+        self.record_cls = record_cls
+        self._records: List[Record] = []
+        self._index: Dict[Any, Record] = {}
+        self._columns: Dict[str, np.ndarray] = {
+            name: np.zeros(capacity, dtype=dtype) for name, (dtype, _) in record_cls.HOT_COLUMNS.items()
+        }
+        for record in records:
+            self.add(record)
+
+    # List-compatible API -----------------------------------------------
+
+    def __iter__(self) -> Iterator[Record]:
+        return iter(self._records)
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __getitem__(self, index):
+        return self._records[index]
+
+    def __contains__(self, record_id: Any) -> bool:
+        return record_id in self._index
+
+    def __repr__(self):
+        return f"RecordTable({self.record_cls.__name__}, {len(self)} records)"
+
+    def append(self, entity: Any) -> None:
+        self.add(entity)
+
+    def add(self, entity: Any) -> Record:
+        """
+        Add a record (or a mapping, which is converted) and return the stored record
+
+        An existing record with the same id is replaced in place.
+        """
+        record = entity if isinstance(entity, self.record_cls) and entity._table is None \
+            else self.record_cls(dict(entity.items()))
+        existing = self._index.get(record["id"])
+        if existing is not None:
+            row = existing._row
+            existing._table = None
+        else:
+            row = len(self._records)
+            self._records.append(record)
+            self._ensure_capacity(row + 1)
+        self._records[row] = record
+        self._index[record["id"]] = record
+        record._table = self
+        record._row = row
+        for name, (_, encode) in self.record_cls.HOT_COLUMNS.items():
+            self._columns[name][row] = encode(record.get(name))
+        return record
+
+    def get(self, record_id: Any) -> Optional[Record]:
+        return self._index.get(record_id)
+
+    def remove(self, record_id: Any) -> Optional[Record]:
+        """Remove a record by id and return it, or None if there is none"""
+        removed = self.remove_many([record_id])
+        return removed[0] if removed else None
+
+    def remove_many(self, record_ids: Iterable[Any]) -> List[Record]:
+        """
+        Remove records by id, keeping the rest in order
+
+        The table is compacted once per call, so removing a batch costs
+        the same as removing one record.
+        """
+        removed = [record for record in map(self._index.pop, record_ids, itertools.repeat(None)) if record]
+        if not removed:
+            return []
+        keep = np.ones(len(self._records), dtype=bool)
+        keep[[record._row for record in removed]] = False
+        size = int(keep.sum())
+        for column in self._columns.values():
+            column[:size] = column[:len(keep)][keep]
+        self._records = [record for record, kept in zip(self._records, keep) if kept]
+        for row, record in enumerate(self._records):
+            record._row = row
+        for record in removed:
+            record._table = None
+            record._row = -1
+        return removed
+
+    def _ensure_capacity(self, size: int) -> None:
+        capacity = len(next(iter(self._columns.values()))) if self._columns else size
+        if size <= capacity:
+            return
+        capacity = max(size, capacity * 2)
+        for name, column in self._columns.items():
+            grown = np.zeros(capacity, dtype=column.dtype)
+            grown[:len(column)] = column
+            self._columns[name] = grown
+
+    def _write(self, row: int, name: str, value: Any) -> None:
+        self._columns[name][row] = self.record_cls.HOT_COLUMNS[name][1](value)
+
+    # Columnar queries --------------------------------------------------
+
+    def column(self, name: str) -> np.ndarray:
+        """Read-only view of a hot column, one entry per record in table order"""
+        view = self._columns[name][:len(self._records)]
+        view.flags.writeable = False
+        return view
+
+    def mask(self, **equals) -> np.ndarray:
+        """Boolean row mask for hot fields equal to the given values"""
+        result = np.ones(len(self._records), dtype=bool)
+        for name, value in equals.items():
+            encode = self.record_cls.HOT_COLUMNS[name][1]
+            result &= self._columns[name][:len(self._records)] == encode(value)
+        return result
+
+    def select(self, mask: np.ndarray) -> List[Record]:
+        records = self._records
+        return [records[row] for row in np.flatnonzero(mask)]
+
+    def where(self, **equals) -> List[Record]:
+        """Records whose hot fields equal the given values, in table order"""
+        return self.select(self.mask(**equals))
+
+    def count(self, **equals) -> int:
+        return int(np.count_nonzero(self.mask(**equals)))
+
+    def top(self, name: str, k: int, mask: Optional[np.ndarray] = None) -> List[Record]:
+        """The k records with the highest value of a hot column, optionally within a mask"""
+        values = self._columns[name][:len(self._records)]
+        rows = np.flatnonzero(mask) if mask is not None else np.arange(len(values))
+        if len(rows) > k:
+            rows = rows[np.argpartition(-values[rows], k - 1)[:k]]
+        rows = rows[np.argsort(-values[rows], kind="stable")]
+        return [self._records[row] for row in rows]
@@ -0,0 +1,490 @@
+"""
+Replay captured API traffic against an in-process app, at 1x or faster
+
+Loads a capture written while TrafficCapture ran (POST /api/capture/start,
+or TRAFFIC_CAPTURE=1), restores the state the capture started from into
+app.py with an in-memory database and no event log or external API, and
+runs its startup hooks. Every captured request and WebSocket message is
+then sent through the full ASGI stack (auth, admission, cache) at its
+captured offset divided by --speed; --speed 0 sends each as soon as the
+ones it depends on have answered. app.py's clock runs at the same speed
+from the capture's start, so deadlines, ageing and archiving keep their
+proportions. Ids the server generated during the capture, such as new
+task ids, are learned from the write responses and substituted in later
+requests, and a write is always answered before any request captured
+after its response is sent.
+
+Reports latency per route, captured against replayed, responses whose
+status differs, and how the final state differs from the state when the
+capture stopped:
+
+    python replay_traffic.py captures/friday-w0.capture --speed 10
+
+A capture is a pickle file holding customer data; only replay captures
+this server wrote, since unpickling an untrusted file can run any code.
+"""
+import argparse
+import asyncio
+import json
+import os
+import pickle
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode
+
+import numpy as np
+from starlette.routing import Match
+
+from simulator import load_app
+from traffic_capture import HTTP, WS_CLOSE, WS_IN, WS_OPEN, read_capture
+
+# Latency percentiles reported per route
+PERCENTILES = (50, 95, 99)
+
+# Differing entities and statuses shown per collection or route
+EXAMPLES = 3
+
+# Seconds to wait for WebSocket handlers to finish after the last message
+CLOSE_TIMEOUT = 5.0
+
+
+def is_id_key(key: Any) -> bool:
+    return isinstance(key, str) and (key == "id" or key.endswith("_id") or key.endswith("_ids"))
+
+
+class ReplayDatetime(datetime):
+    """Stand-in for datetime inside app.py running at the replay's speed from the capture's start"""
+    origin = datetime.now()
+    started = 0.0
+    speed = 1.0
+    # Captured offset of the latest event sent, the clock when speed is 0
+    offset = 0.0
+
+    @classmethod
+    def now(cls, tz=None):
+        if cls.speed:
+            return cls.origin + timedelta(seconds=(time.perf_counter() - cls.started) * cls.speed)
+        return cls.origin + timedelta(seconds=cls.offset)
+
+
+class IdMap:
+    """
+    Server-generated ids seen in the capture -> the ids the replay got instead
+
+    Learned by walking a captured write response and its replayed twin in
+    step and pairing the values of id-like keys (id, *_id, *_ids) that
+    differ. Applied to later request paths, query strings and JSON bodies,
+    at id-like keys only.
+    """
+
+    def __init__(self):
+        self.ids: Dict[Any, Any] = {}
+        # Path segments and query values are strings, whatever the id's type
+        self.strings: Dict[str, str] = {}
+
+    def learn(self, captured: Any, replayed: Any, key: Any = None) -> None:
+        if isinstance(captured, dict) and isinstance(replayed, dict):
+            for name, value in captured.items():
+                if name in replayed:
+                    self.learn(value, replayed[name], name)
+        elif isinstance(captured, list) and isinstance(replayed, list):
+            for captured_item, replayed_item in zip(captured, replayed):
+                self.learn(captured_item, replayed_item, key)
+        elif (is_id_key(key) and captured != replayed and isinstance(captured, (str, int))
+              and not isinstance(captured, bool)):
+            self.ids[captured] = replayed
+            self.strings[str(captured)] = str(replayed)
+
+    def map(self, value: Any, key: Any = None) -> Any:
+        """value with the ids under id-like keys replaced"""
+        if isinstance(value, dict):
+            return {name: self.map(item, name) for name, item in value.items()}
+        if isinstance(value, list):
+            return [self.map(item, key) for item in value]
+        if is_id_key(key) and isinstance(value, (str, int)) and not isinstance(value, bool):
+            return self.ids.get(value, value)
+        return value
+
+    def path(self, path: str) -> str:
+        if not self.strings:
+            return path
+        return "/".join(self.strings.get(segment, segment) for segment in path.split("/"))
+
+    def query(self, query: bytes) -> bytes:
+        if not self.strings or not query:
+            return query
+        pairs = parse_qsl(query.decode("latin-1"), keep_blank_values=True)
+        return urlencode([(name, self.strings.get(value, value)) for name, value in pairs]).encode("latin-1")
+
+    def body(self, body: bytes) -> bytes:
+        if not self.ids or not body:
+            return body
+        try:
+            return json.dumps(self.map(json.loads(body))).encode()
+        except ValueError:
+            return body
+
+
+class ReplayedWebSocket:
+    """One captured WebSocket connection, driven through the app's ASGI interface"""
+
+    def __init__(self):
+        self.inbox: asyncio.Queue = asyncio.Queue()
+        self.inbox.put_nowait({"type": "websocket.connect"})
+        self.accepted = False
+        self.closed = False
+        self.sent = 0
+        self.received = 0
+
+    def deliver(self, message: Any) -> None:
+        if self.closed:
+            return
+        self.sent += 1
+        key = "text" if isinstance(message, str) else "bytes"
+        self.inbox.put_nowait({"type": "websocket.receive", key: message})
+
+    def close(self) -> None:
+        if not self.closed:
+            self.closed = True
+            self.inbox.put_nowait({"type": "websocket.disconnect", "code": 1000})
+
+    async def run(self, asgi, scope) -> None:
+        async def send(message):
+            if message["type"] == "websocket.accept":
+                self.accepted = True
+            elif message["type"] == "websocket.send":
+                self.received += 1
+            elif message["type"] == "websocket.close":
+                self.close()
+
+        await asgi(scope, self.inbox.get, send)
+
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {f"p{p}": None for p in PERCENTILES} | {"max": None}
+    points = np.percentile(np.array(values) * 1000, PERCENTILES)
+    return {**{f"p{p}": round(float(v), 2) for p, v in zip(PERCENTILES, points)}, "max": round(max(values) * 1000, 2)}
+
+
+def normalize(value: Any, ids: Optional[IdMap] = None, key: Any = None) -> Any:
+    """A state value comparable across runs: times dropped, floats rounded, captured ids mapped"""
+    if isinstance(value, dict):
+        return {name: normalize(item, ids, name) for name, item in value.items() if not isinstance(item, datetime)}
+    if isinstance(value, (list, tuple)):
+        return [normalize(item, ids, key) for item in value if not isinstance(item, datetime)]
+    if isinstance(value, float):
+        return round(value, 1)
+    if ids is not None and is_id_key(key) and isinstance(value, (str, int)) and not isinstance(value, bool):
+        return ids.ids.get(value, value)
+    return value
+
+
+def without_ids(entity: Dict[str, Any]) -> str:
+    return json.dumps({name: value for name, value in entity.items() if not is_id_key(name)}, sort_keys=True, default=str)
+
+
+def state_divergence(expected: Dict[str, List[Dict[str, Any]]], actual: Dict[str, List[Dict[str, Any]]],
+                     ids: IdMap) -> Dict[str, Dict[str, Any]]:
+    """
+    Per collection, how the replay's final state differs from the captured one
+
+    Entities are matched by id, mapped through ids. Those left over on both
+    sides that are equal apart from their id-like fields, e.g. assignment
+    log entries whose ids the server generated without returning them,
+    count as renumbered rather than missing and extra.
+
+    Returns:
+        dict: Collection -> entity counts, and how many were the same,
+            changed, renumbered, missing from the replay or extra in it,
+            with a few examples
+    """
+    report = {}
+    for name in sorted(set(expected) | set(actual)):
+        want = {entity.get("id", n): entity for n, entity in enumerate(normalize(expected.get(name, []), ids))}
+        got = {entity.get("id", n): entity for n, entity in enumerate(normalize(actual.get(name, [])))}
+        changed = [key for key in want if key in got and want[key] != got[key]]
+        missing = Counter(without_ids(want[key]) for key in want if key not in got)
+        extra = Counter(without_ids(got[key]) for key in got if key not in want)
+        renumbered = sum((missing & extra).values())
+        missing, extra = missing - extra, extra - missing
+        report[name] = {
+            "captured": len(want),
+            "replayed": len(got),
+            "same": len(want) - len(changed) - renumbered - sum(missing.values()),
+            "changed": len(changed),
+            "renumbered": renumbered,
+            "missing": sum(missing.values()),
+            "extra": sum(extra.values()),
+            "examples": {
+                "changed": [
+                    {"id": key, **{
+                        field: {"captured": want[key].get(field), "replayed": got[key].get(field)}
+                        for field in set(want[key]) | set(got[key]) if want[key].get(field) != got[key].get(field)
+                    }}
+                    for key in changed[:EXAMPLES]
+                ],
+                "missing": [json.loads(entity) for entity in list(missing)[:EXAMPLES]],
+                "extra": [json.loads(entity) for entity in list(extra)[:EXAMPLES]],
+            },
+        }
+    return report
+
+
+class Replay:
+    """
+    Sends a capture's records to app.py and collects what came back
+
+    Args:
+        app: The loaded app module
+        header (dict): The capture's header
+        speed (float): Replay speed; 0 sends as fast as dependencies allow
+    """
+
+    def __init__(self, app, header: Dict[str, Any], speed: float):
+        self.app = app
+        self.speed = speed
+        self.ids = IdMap()
+        self.tokens: Dict[Tuple[str, str], bytes] = {}
+        self.websockets: Dict[int, ReplayedWebSocket] = {}
+        self.requests: List[asyncio.Task] = []
+        self.connections: List[asyncio.Task] = []
+        # Writes in flight and the captured offset their response went out at
+        self.writes: List[Tuple[float, asyncio.Task]] = []
+        self.latencies: Dict[str, Tuple[List[float], List[float]]] = defaultdict(lambda: ([], []))
+        self.statuses: Counter = Counter()
+        self.skipped = 0
+        self.origin = header["started_at"]
+
+    def headers(self, user: Tuple[str, str], headers: List[Tuple[bytes, bytes]]) -> List[Tuple[bytes, bytes]]:
+        token = self.tokens.get(user)
+        if token is None:
+            token = self.tokens[user] = b"Bearer " + self.app.authenticator.issue(*user).encode()
+        return [(b"host", b"replay"), (b"authorization", token), *headers]
+
+    def route_name(self, scope: Dict[str, Any]) -> str:
+        """Endpoint name for a request the response cache answered before routing"""
+        for route in self.app.app.routes:
+            match, child = route.matches(scope)
+            if match == Match.FULL:
+                return getattr(route, "name", None) or scope["path"]
+        return f"{scope['method']} {scope['path']}"
+
+    async def http(self, record: Tuple[Any, ...]) -> None:
+        _, at, method, path, query, headers, user, body, captured_status, captured_seconds, route, response = record
+        body = self.ids.body(body) if dict(headers).get(b"content-type", b"").startswith(b"application/json") else body
+        path = self.ids.path(path)
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method,
+            "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "",
+            "query_string": self.ids.query(query),
+            "headers": self.headers(user, headers) + [(b"content-length", str(len(body)).encode())],
+            "client": ("127.0.0.1", 1), "server": ("replay", 80),
+        }
+        sent = False
+        replied = {"status": None, "body": []}
+
+        async def receive():
+            nonlocal sent
+            if sent:
+                await asyncio.Event().wait()
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                replied["status"] = message["status"]
+            elif message["type"] == "http.response.body" and response is not None:
+                replied["body"].append(message.get("body", b""))
+
+        started = time.perf_counter()
+        await self.app.app(scope, receive, send)
+        seconds = time.perf_counter() - started
+        route = route or self.route_name(scope)
+        captured, replayed = self.latencies[route]
+        captured.append(captured_seconds)
+        replayed.append(seconds)
+        if replied["status"] != captured_status:
+            self.statuses[(route, captured_status, replied["status"])] += 1
+        if response and replied["body"]:
+            try:
+                self.ids.learn(json.loads(response), json.loads(b"".join(replied["body"])))
+            except ValueError:
+                pass
+
+    def open_websocket(self, record: Tuple[Any, ...]) -> None:
+        _, at, ws, path, query, user = record
+        websocket = self.websockets[ws] = ReplayedWebSocket()
+        path = self.ids.path(path)
+        scope = {
+            "type": "websocket", "asgi": {"version": "3.0"}, "http_version": "1.1", "scheme": "ws",
+            "path": path, "raw_path": path.encode(), "root_path": "", "query_string": self.ids.query(query),
+            "headers": self.headers(user, []), "client": ("127.0.0.1", 1), "server": ("replay", 80),
+            "subprotocols": [],
+        }
+        self.connections.append(asyncio.create_task(websocket.run(self.app.app, scope)))
+
+    async def wait_for_writes(self, at: float) -> None:
+        """Wait for every write whose captured response was sent before `at`"""
+        due = [task for answered, task in self.writes if answered <= at]
+        if due:
+            await asyncio.gather(*due, return_exceptions=True)
+            self.writes = [(answered, task) for answered, task in self.writes if not task.done()]
+
+    async def run(self, records: List[Tuple[Any, ...]]) -> float:
+        """Send every record on schedule and wait for the answers; returns the wall seconds taken"""
+        started = ReplayDatetime.started
+        for record in records:
+            kind, at = record[0], record[1]
+            if self.speed:
+                delay = started + at / self.speed - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            await self.wait_for_writes(at)
+            ReplayDatetime.offset = at
+            if kind == HTTP:
+                if record[7] is None:
+                    self.skipped += 1
+                    continue
+                task = asyncio.create_task(self.http(record))
+                self.requests.append(task)
+                if record[2] not in ("GET", "HEAD"):
+                    self.writes.append((at + record[9], task))
+            elif kind == WS_OPEN:
+                self.open_websocket(record)
+            elif kind == WS_IN and record[2] in self.websockets:
+                self.websockets[record[2]].deliver(record[3])
+            elif kind == WS_CLOSE and record[2] in self.websockets:
+                self.websockets[record[2]].close()
+            # Let the handlers started above run before the next record is due
+            await asyncio.sleep(0)
+        for websocket in self.websockets.values():
+            websocket.close()
+        await asyncio.gather(*self.requests, return_exceptions=True)
+        await asyncio.wait(self.connections, timeout=CLOSE_TIMEOUT) if self.connections else None
+        return time.perf_counter() - started
+
+    def report(self) -> Dict[str, Any]:
+        routes = {}
+        for route, (captured, replayed) in sorted(self.latencies.items(), key=lambda item: -len(item[1][0])):
+            routes[route] = {
+                "requests": len(captured),
+                "captured_ms": percentiles(captured),
+                "replayed_ms": percentiles(replayed),
+            }
+        return {
+            "requests": sum(len(captured) for captured, _ in self.latencies.values()),
+            "skipped": self.skipped,
+            "websockets": len(self.websockets),
+            "websocket_messages": sum(websocket.sent for websocket in self.websockets.values()),
+            "status_mismatches": sum(self.statuses.values()),
+            "statuses": [
+                {"route": route, "captured": captured, "replayed": replayed, "count": count}
+                for (route, captured, replayed), count in self.statuses.most_common()
+            ],
+            "routes": routes,
+        }
+
+
+async def replay(path: str, speed: float, lift_rate_limits: bool = False) -> Dict[str, Any]:
+    """
+    Replay a capture file against app.py in this process
+
+    Args:
+        path (str): Capture file
+        speed (float): Multiple of the captured pace; 0 for as fast as possible
+        lift_rate_limits (bool): Disable admission token buckets, to measure
+            handlers rather than the per-client limits at a higher pace
+
+    Returns:
+        dict: Timing, per-route latency, status and final-state divergence report
+    """
+    header, records, footer = read_capture(path)
+    # Never capture the replay itself
+    os.environ["TRAFFIC_CAPTURE"] = ""
+    app = load_app()
+    app.datetime = ReplayDatetime
+    ReplayDatetime.origin = header["started_at"]
+    ReplayDatetime.speed = speed
+    app.restore_state(pickle.loads(header["state"]))
+    state = app.system_state
+    app.floor_index = app.FloorIndex(state.tables, state.points, state.robots, state.charging_stations)
+    app.robot_states = app.RobotStateTracker(state.robots, clock=lambda: ReplayDatetime.now().timestamp())
+    app.task_history = app.TaskHistory()
+    if speed:
+        app.TASK_ARCHIVE_INTERVAL /= speed
+    if lift_rate_limits:
+        for lane in app.admission.lanes.values():
+            lane.rate = lane.burst = float("inf")
+
+    session = Replay(app, header, speed)
+    ReplayDatetime.started = time.perf_counter()
+    await app.app.router.startup()
+    try:
+        wall = await session.run(records)
+        final = pickle.loads(app.dump_state(app.capture_state()))
+    finally:
+        await app.app.router.shutdown()
+
+    span = records[-1][1] if records else 0.0
+    return {
+        "capture": {
+            "path": path,
+            "venue_id": header.get("venue_id"),
+            "started_at": header["started_at"].isoformat(),
+            "seconds": round(footer["seconds"] if footer else span, 1),
+            "complete": footer is not None,
+        },
+        "speed": speed,
+        "wall_seconds": round(wall, 2),
+        "achieved_speed": round(span / wall, 1) if wall else None,
+        **session.report(),
+        "state": state_divergence(pickle.loads(footer["state"]), final, session.ids) if footer else None,
+    }
+
+
+def _ms(value: Optional[float]) -> str:
+    return f"{value:.1f}" if value is not None else "-"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("capture", help="capture file written by TrafficCapture")
+    parser.add_argument("--speed", type=float, default=1.0, help="multiple of the captured pace; 0 = as fast as possible")
+    parser.add_argument("--lift-rate-limits", action="store_true", help="disable per-client admission rate limits")
+    parser.add_argument("--routes", type=int, default=15, help="busiest routes shown")
+    parser.add_argument("--json", help="write the full report to this file")
+    args = parser.parse_args()
+
+    report = asyncio.run(replay(args.capture, args.speed, args.lift_rate_limits))
+    capture = report["capture"]
+    print(f"{capture['path']}: {capture['seconds']}s captured at venue {capture['venue_id']} "
+          f"from {capture['started_at']}{'' if capture['complete'] else ' (not stopped cleanly, no final state)'}")
+    print(f"replayed {report['requests']:,} requests ({report['skipped']} skipped), {report['websockets']} WebSockets, "
+          f"{report['websocket_messages']:,} messages in {report['wall_seconds']}s ({report['achieved_speed']}x)")
+    print(f"{'route':<34}{'requests':>9}" + "".join(f"{f'p{p} ms':>17}" for p in PERCENTILES) + f"{'max ms':>17}")
+    print(f"{'':<43}" + f"{'captured  replay':>17}" * (len(PERCENTILES) + 1))
+    for route, entry in list(report["routes"].items())[:args.routes]:
+        columns = "".join(
+            f"{_ms(entry['captured_ms'][key]):>9}{_ms(entry['replayed_ms'][key]):>8}"
+            for key in [f"p{p}" for p in PERCENTILES] + ["max"]
+        )
+        print(f"{route[:33]:<34}{entry['requests']:>9}{columns}")
+    print(f"status mismatches: {report['status_mismatches']}")
+    for entry in report["statuses"][:EXAMPLES * 3]:
+        print(f"  {entry['route']}: {entry['captured']} -> {entry['replayed']} x{entry['count']}")
+    if report["state"] is not None:
+        print(f"{'collection':<20}{'captured':>9}{'replayed':>9}{'same':>7}{'changed':>8}{'renumbered':>11}"
+              f"{'missing':>8}{'extra':>6}")
+        for name, entry in report["state"].items():
+            print(f"{name:<20}{entry['captured']:>9}{entry['replayed']:>9}{entry['same']:>7}{entry['changed']:>8}"
+                  f"{entry['renumbered']:>11}{entry['missing']:>8}{entry['extra']:>6}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2, default=str)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import hashlib
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# ASGI response headers are (name, value) byte pairs
+Headers = List[Tuple[bytes, bytes]]
+
+
+class CachedRoute:
+    """A GET path whose response depends only on the given collections (and vary())"""
+
+    def __init__(self, path: str, collections: Iterable[str], vary: Optional[Callable[[], Any]] = None):
+        self.path = path
+        self.collections = tuple(collections)
+        self.vary = vary
+
+
+class ResponseCache:
+    """
+    Pre-encoded GET responses invalidated by per-collection version counters
+
+    Every cached route names the state collections its response is built
+    from. Mutations bump the version of the collection they changed, and
+    an entry is only served while the versions it was built at are still
+    current, so invalidation is exact and needs no explicit purge. Entries
+    hold the encoded body with a strong ETag (a hash of the bytes);
+    conditional requests with a matching If-None-Match get 304.
+    """
+
+    def __init__(self):
+        self.versions: Dict[str, int] = defaultdict(int)
+        self.routes: Dict[str, CachedRoute] = {}
+        # path -> (key, etag, body, headers); only the latest version is kept
+        self._entries: Dict[str, Tuple[Any, bytes, bytes, Headers]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def route(self, path: str, *collections: str, vary: Optional[Callable[[], Any]] = None) -> None:
+        """
+        Cache GET responses for a path
+
+        Args:
+            path (str): Exact request path
+            *collections (str): State collections the response is built from
+            vary: Optional callable whose result is part of the key, for
+                responses that also depend on something like today's date
+        """
+        self.routes[path] = CachedRoute(path, collections, vary)
+
+    def bump(self, collection: str) -> None:
+        """Mark a collection as changed, invalidating every response built from it"""
+        self.versions[collection] += 1
+
+    def key(self, route: CachedRoute, query_string: bytes) -> Tuple[Any, ...]:
+        return (
+            query_string,
+            tuple(self.versions[name] for name in route.collections),
+            route.vary() if route.vary else None,
+        )
+
+    def lookup(self, path: str, key: Tuple[Any, ...]) -> Optional[Tuple[Any, bytes, bytes, Headers]]:
+        entry = self._entries.get(path)
+        return entry if entry is not None and entry[0] == key else None
+
+    def store(self, path: str, key: Tuple[Any, ...], body: bytes, headers: Headers) -> Tuple[Any, bytes, bytes, Headers]:
+        etag = b'"' + hashlib.blake2b(body, digest_size=12).hexdigest().encode() + b'"'
+        kept = [(name, value) for name, value in headers
+                if name.lower() not in (b"content-length", b"etag", b"cache-control")]
+        # Clients may keep the body but must revalidate it on every use
+        kept.append((b"cache-control", b"no-cache"))
+        entry = self._entries[path] = (key, etag, body, kept)
+        return entry
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+            "versions": dict(self.versions),
+        }
+
+
+def _etag_matches(if_none_match: bytes, etag: bytes) -> bool:
+    if if_none_match.strip() == b"*":
+        return True
+    return any(tag.strip().removeprefix(b"W/") == etag for tag in if_none_match.split(b","))
+
+
+class ResponseCacheMiddleware:
+    """
+    ASGI middleware serving ResponseCache routes
+
+    A hit is answered here without running the endpoint: 304 if the
+    client's If-None-Match matches, otherwise the stored bytes. A miss runs
+    the endpoint and stores a 200 response under the versions read before
+    it ran, so a mutation that lands meanwhile makes the entry unreachable
+    rather than stale.
+    """
+
+    def __init__(self, app, cache: ResponseCache):
+        self.app = app
+        self.cache = cache
+
+    async def __call__(self, scope, receive, send):
+        route = self.cache.routes.get(scope["path"]) if scope["type"] == "http" and scope["method"] == "GET" else None
+        if route is None:
+            await self.app(scope, receive, send)
+            return
+
+        cache = self.cache
+        key = cache.key(route, scope["query_string"])
+        entry = cache.lookup(route.path, key)
+        if entry is None:
+            cache.misses += 1
+            entry = await self._fill(scope, receive, send, route, key)
+            if entry is None:
+                return
+        else:
+            cache.hits += 1
+
+        _, etag, body, headers = entry
+        if_none_match = next((value for name, value in scope["headers"] if name == b"if-none-match"), None)
+        if if_none_match is not None and _etag_matches(if_none_match, etag):
+            cache.not_modified += 1
+            await self._send(send, 304, [(b"etag", etag), (b"cache-control", b"no-cache")], b"")
+        else:
+            await self._send(send, 200, headers + [(b"etag", etag), (b"content-length", str(len(body)).encode())], body)
+
+    async def _fill(self, scope, receive, send, route: CachedRoute, key: Tuple[Any, ...]):
+        """Run the endpoint and store its response; non-200 responses are passed through and return None"""
+        start: Dict[str, Any] = {}
+        chunks: List[bytes] = []
+
+        async def capture(message):
+            if message["type"] == "http.response.start":
+                start.update(message)
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+        await self.app(scope, receive, capture)
+        body = b"".join(chunks)
+        headers = list(start.get("headers", []))
+        if start.get("status") != 200:
+            await self._send(send, start.get("status", 500), headers, body)
+            return None
+        return self.cache.store(route.path, key, body, headers)
+
+    @staticmethod
+    async def _send(send, status: int, headers: Headers, body: bytes) -> None:
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
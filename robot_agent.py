@@ -0,0 +1,135 @@
+"""
+Simulated robot agent for the command bus
+
+Connects to /ws/robots/{robot_id}, carries out commands one at a time and
+acknowledges each. Run from the project root against a running server:
+
+    python robot_agent.py --robots R1,R2,R3,R4 [--url ws://localhost:8000] [--drop-rate 0.05]
+
+Each agent logs in as its robot's own account (the robot id, with the
+robot id as password for the demo accounts) unless --token is given.
+"""
+import argparse
+import asyncio
+import json
+import random
+from collections import Counter, OrderedDict
+from typing import Any, Dict, Optional
+
+import httpx
+import websockets
+
+# Commands a robot knows how to carry out
+ROBOT_COMMANDS = frozenset({"RETURN_TO_BASE", "START_CHARGING", "STOP_CHARGING"})
+
+# Acks remembered for answering resent commands; must exceed the bus window
+DEFAULT_HISTORY = 4096
+
+
+class SimulatedRobotAgent:
+    """
+    Stands in for the software on a robot
+
+    Commands are carried out in the order they arrive, each taking
+    work_time seconds. The ack of every recent (epoch, seq) is remembered,
+    so a resent command is acknowledged again without being carried out
+    twice. drop_rate makes the agent ignore that share of deliveries, as
+    if they were lost, to exercise the server's retries.
+    """
+
+    def __init__(
+        self,
+        robot_id: str,
+        work_time: float = 0.0,
+        drop_rate: float = 0.0,
+        seed: Optional[int] = None,
+        history: int = DEFAULT_HISTORY
+    ):
+        self.robot_id = robot_id
+        self.work_time = work_time
+        self.drop_rate = drop_rate
+        self.history = history
+        self._rng = random.Random(seed)
+        self._epoch: Optional[str] = None
+        self._acks: "OrderedDict[int, str]" = OrderedDict()
+        self.executed: Counter = Counter()
+        self.dropped = 0
+        self.duplicates = 0
+
+    async def handle(self, message: str) -> Optional[str]:
+        """Carry out one command message; return the ack to send, or None if it was dropped"""
+        command = json.loads(message)
+        if command.get("type") != "command":
+            return None
+        if command["epoch"] != self._epoch:
+            # The server restarted and numbers commands from 1 again
+            self._epoch = command["epoch"]
+            self._acks.clear()
+        seq = command["seq"]
+        if seq in self._acks:
+            self.duplicates += 1
+            return self._acks[seq]
+        if self.drop_rate and self._rng.random() < self.drop_rate:
+            self.dropped += 1
+            return None
+
+        ack: Dict[str, Any] = {"type": "ack", "epoch": self._epoch, "seq": seq, "ok": True}
+        if command["command"] in ROBOT_COMMANDS:
+            if self.work_time:
+                await asyncio.sleep(self.work_time)
+            self.executed[command["command"]] += 1
+        else:
+            ack.update(ok=False, error=f"Unknown command {command['command']}")
+        reply = self._acks[seq] = json.dumps(ack)
+        if len(self._acks) > self.history:
+            self._acks.popitem(last=False)
+        return reply
+
+    async def run(self, url: str, token: str, reconnect_delay: float = 1.0) -> None:
+        """Serve the robot's session at url (e.g. ws://localhost:8000), reconnecting until cancelled"""
+        endpoint = f"{url.rstrip('/')}/ws/robots/{self.robot_id}?token={token}"
+        while True:
+            try:
+                async with websockets.connect(endpoint) as websocket:
+                    async for message in websocket:
+                        reply = await self.handle(message)
+                        if reply is not None:
+                            await websocket.send(reply)
+            except (OSError, websockets.ConnectionClosed):
+                await asyncio.sleep(reconnect_delay)
+
+
+async def login(url: str, username: str, password: str) -> str:
+    http_url = url.replace("ws://", "http://", 1).replace("wss://", "https://", 1)
+    async with httpx.AsyncClient(base_url=http_url) as client:
+        response = await client.post("/api/auth/login", data={"username": username, "password": password})
+        response.raise_for_status()
+        return response.json()["access_token"]
+
+
+async def run(args):
+    agents = [SimulatedRobotAgent(robot_id, args.work_time, args.drop_rate) for robot_id in args.robots.split(",")]
+    tokens = [args.token or await login(args.url, agent.robot_id, args.password or agent.robot_id) for agent in agents]
+    print(f"Serving {', '.join(agent.robot_id for agent in agents)} from {args.url}")
+    await asyncio.gather(*(agent.run(args.url, token) for agent, token in zip(agents, tokens)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--robots", default="R1,R2,R3,R4", help="comma-separated robot ids")
+    parser.add_argument("--url", default="ws://localhost:8000")
+    parser.add_argument("--token", help="access token of a single robot; each robot logs in if omitted")
+    parser.add_argument("--password", help="password of every robot's account; defaults to the robot id")
+    parser.add_argument("--work-time", type=float, default=0.0, help="seconds each command takes")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="share of command deliveries ignored")
+    args = parser.parse_args()
+    if args.token and "," in args.robots:
+        parser.error("--token belongs to one robot; pass a single robot id with it")
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+import asyncio
+import json
+import time
+import uuid
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+# Least seconds to wait for an acknowledgement before a command is sent
+# again; the wait grows with the robot's measured round trips and doubles
+# on every resend
+DEFAULT_ACK_TIMEOUT = 2.0
+
+# Sends of one command, the first included, before it fails with CommandTimeout
+DEFAULT_MAX_ATTEMPTS = 3
+
+# Unacknowledged commands per robot; later ones wait unsent
+DEFAULT_WINDOW = 32
+
+# Round trips kept for the latency percentiles in stats()
+LATENCY_SAMPLES = 4096
+
+
+class RobotOffline(Exception):
+    pass
+
+
+class CommandTimeout(Exception):
+    pass
+
+
+class CommandRejected(Exception):
+    pass
+
+
+class PendingCommand:
+    __slots__ = ("seq", "command", "args", "message", "future", "attempts", "sent", "round_trip", "timer")
+
+    def __init__(self, seq: int, command: str, args: Dict[str, Any], message: str, future: asyncio.Future):
+        self.seq = seq
+        self.command = command
+        self.args = args
+        self.message = message
+        self.future = future
+        self.attempts = 0
+        self.sent = 0.0
+        self.round_trip = 0.0
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class AgentSession:
+    """One agent connection; a single writer task sends its messages in order"""
+
+    def __init__(self, robot_id: str, send: Callable[[str], Awaitable[None]]):
+        self.robot_id = robot_id
+        self._send = send
+        self._outbox: Deque[str] = deque()
+        self._ready = asyncio.Event()
+
+    def push(self, message: str) -> None:
+        self._outbox.append(message)
+        self._ready.set()
+
+    async def run(self) -> None:
+        """Write queued messages until cancelled"""
+        while True:
+            await self._ready.wait()
+            self._ready.clear()
+            while self._outbox:
+                await self._send(self._outbox.popleft())
+
+
+class RobotChannel:
+    """Sequence numbers and unacknowledged commands of one robot; outlives its sessions"""
+
+    def __init__(self):
+        self.next_seq = 1
+        self.session: Optional[AgentSession] = None
+        # Smoothed round trip and its mean deviation, in seconds
+        self.srtt: Optional[float] = None
+        self.rttvar = 0.0
+        # seq -> command, in the order they were sent
+        self.in_flight: Dict[int, PendingCommand] = {}
+        self.backlog: Deque[PendingCommand] = deque()
+
+
+class RobotBus:
+    """
+    Delivers commands to robot agents over persistent sessions and waits for their acks
+
+    Each robot numbers its commands; up to `window` of them may be in
+    flight at once without waiting for earlier acks, and later ones queue
+    until a slot frees. A command not acknowledged in time is sent again
+    with the same epoch and sequence number, so an agent that already
+    carried it out only acknowledges it again (see robot_agent.py); after
+    max_attempts sends it fails with CommandTimeout. As in TCP, the wait is
+    the robot's smoothed round trip plus four deviations, but at least
+    ack_timeout, and doubles with every resend; only commands acked on
+    their first send are measured. Commands still unacknowledged when an
+    agent reconnects are sent on the new session.
+
+    A positive ack is handed to on_ack, which applies the command to the
+    robot's recorded state, before the sender's await returns: state
+    changes only once the robot confirms. A command lost and sent again
+    may be carried out after later ones; acks, and so the recorded state,
+    follow the order the robot actually ran them in.
+
+    Message formats (JSON text frames):
+        server -> agent: {"type": "command", "epoch", "seq", "command", "args"}
+        agent -> server: {"type": "ack", "epoch", "seq", "ok", "error"?}
+    """
+
+    def __init__(
+        self,
+        on_ack: Callable[[str, str, Dict[str, Any], Dict[str, Any]], Awaitable[Any]],
+        ack_timeout: float = DEFAULT_ACK_TIMEOUT,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        window: int = DEFAULT_WINDOW
+    ):
+        """
+        Args:
+            on_ack: Coroutine function (robot_id, command, args, ack) applying an acknowledged command
+            ack_timeout (float): Least seconds to wait for an ack before sending again
+            max_attempts (int): Sends of a command before it times out
+            window (int): Most unacknowledged commands per robot
+        """
+        self._on_ack = on_ack
+        self.ack_timeout = ack_timeout
+        self.max_attempts = max_attempts
+        self.window = window
+        # Sequence numbers restart with the server; the epoch tells agents so
+        self.epoch = uuid.uuid4().hex[:12]
+        self.channels: Dict[str, RobotChannel] = {}
+        self.sent = 0
+        self.resent = 0
+        self.acked = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.duplicate_acks = 0
+        self._round_trips: Deque[float] = deque(maxlen=LATENCY_SAMPLES)
+
+    def connected(self, robot_id: str) -> bool:
+        channel = self.channels.get(robot_id)
+        return channel is not None and channel.session is not None
+
+    def attach(self, robot_id: str, send: Callable[[str], Awaitable[None]]) -> AgentSession:
+        """
+        Register a robot's newly connected agent
+
+        The session replaces any earlier one of the robot and is sent every
+        command still awaiting an ack. The caller runs session.run() for as
+        long as the connection lasts and calls detach() when it closes.
+        """
+        channel = self.channels.setdefault(robot_id, RobotChannel())
+        session = channel.session = AgentSession(robot_id, send)
+        for pending in channel.in_flight.values():
+            session.push(pending.message)
+        return session
+
+    def detach(self, robot_id: str, session: AgentSession) -> None:
+        """Forget a closed session; its unacknowledged commands wait for a reconnect or time out"""
+        channel = self.channels.get(robot_id)
+        if channel is not None and channel.session is session:
+            channel.session = None
+
+    async def send(self, robot_id: str, command: str, args: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Send a command and wait until the robot has acknowledged it and it has been applied
+
+        Returns:
+            Dict[str, Any]: The command's seq, number of sends and round trip in milliseconds
+
+        Raises:
+            RobotOffline: If the robot has no agent connected
+            CommandRejected: If the agent refused the command
+            CommandTimeout: If no ack came after max_attempts sends
+        """
+        channel = self.channels.get(robot_id)
+        if channel is None or channel.session is None:
+            raise RobotOffline(f"Robot {robot_id} has no agent connected")
+        seq = channel.next_seq
+        channel.next_seq += 1
+        args = args or {}
+        message = json.dumps({"type": "command", "epoch": self.epoch, "seq": seq, "command": command, "args": args})
+        pending = PendingCommand(seq, command, args, message, asyncio.get_running_loop().create_future())
+        channel.backlog.append(pending)
+        self._pump(channel)
+        # The command goes on even if the caller stops waiting
+        await asyncio.shield(pending.future)
+        return {"seq": seq, "attempts": pending.attempts, "round_trip_ms": round(pending.round_trip * 1000, 3)}
+
+    def _pump(self, channel: RobotChannel) -> None:
+        while channel.backlog and len(channel.in_flight) < self.window:
+            pending = channel.backlog.popleft()
+            channel.in_flight[pending.seq] = pending
+            self._transmit(channel, pending)
+
+    def _transmit(self, channel: RobotChannel, pending: PendingCommand) -> None:
+        pending.attempts += 1
+        if pending.attempts == 1:
+            pending.sent = time.perf_counter()
+            self.sent += 1
+        else:
+            self.resent += 1
+        if channel.session is not None:
+            channel.session.push(pending.message)
+        timeout = self.ack_timeout
+        if channel.srtt is not None:
+            timeout = max(timeout, channel.srtt + 4 * channel.rttvar)
+        pending.timer = asyncio.get_running_loop().call_later(
+            timeout * 2 ** (pending.attempts - 1), self._expire, channel, pending
+        )
+
+    def _expire(self, channel: RobotChannel, pending: PendingCommand) -> None:
+        if channel.in_flight.get(pending.seq) is not pending:
+            return
+        if pending.attempts < self.max_attempts:
+            self._transmit(channel, pending)
+            return
+        del channel.in_flight[pending.seq]
+        self.timeouts += 1
+        pending.future.set_exception(
+            CommandTimeout(f"No acknowledgement for {pending.command} after {pending.attempts} attempts")
+        )
+        self._pump(channel)
+
+    def receive(self, robot_id: str, message: str) -> None:
+        """Handle a message from a robot's agent; acks for unknown or settled commands are ignored"""
+        try:
+            ack = json.loads(message)
+        except ValueError:
+            return
+        if not isinstance(ack, dict) or ack.get("type") != "ack" or ack.get("epoch") != self.epoch:
+            return
+        channel = self.channels.get(robot_id)
+        pending = channel.in_flight.pop(ack.get("seq"), None) if channel is not None else None
+        if pending is None:
+            self.duplicate_acks += 1
+            return
+        pending.timer.cancel()
+        pending.round_trip = time.perf_counter() - pending.sent
+        self._round_trips.append(pending.round_trip)
+        if pending.attempts == 1:
+            # A resent command's ack may answer either send, so it is not measured
+            if channel.srtt is None:
+                channel.srtt, channel.rttvar = pending.round_trip, pending.round_trip / 2
+            else:
+                channel.rttvar += (abs(channel.srtt - pending.round_trip) - channel.rttvar) / 4
+                channel.srtt += (pending.round_trip - channel.srtt) / 8
+        self._pump(channel)
+        if ack.get("ok"):
+            self.acked += 1
+            asyncio.get_running_loop().create_task(self._complete(robot_id, pending, ack))
+        else:
+            self.rejected += 1
+            pending.future.set_exception(CommandRejected(ack.get("error") or f"Robot {robot_id} refused {pending.command}"))
+
+    async def _complete(self, robot_id: str, pending: PendingCommand, ack: Dict[str, Any]) -> None:
+        try:
+            await self._on_ack(robot_id, pending.command, pending.args, ack)
+        except Exception as e:
+            pending.future.set_exception(e)
+        else:
+            pending.future.set_result(None)
+
+    def stats(self) -> Dict[str, Any]:
+        round_trips = sorted(self._round_trips)
+
+        def percentile(p: float) -> float:
+            return round(round_trips[min(len(round_trips) - 1, int(len(round_trips) * p))] * 1000, 3) if round_trips else 0.0
+
+        return {
+            "epoch": self.epoch,
+            "connected": sum(channel.session is not None for channel in self.channels.values()),
+            "in_flight": sum(len(channel.in_flight) for channel in self.channels.values()),
+            "backlog": sum(len(channel.backlog) for channel in self.channels.values()),
+            "sent": self.sent,
+            "resent": self.resent,
+            "acked": self.acked,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "duplicate_acks": self.duplicate_acks,
+            "round_trip_ms": {"p50": percentile(0.5), "p99": percentile(0.99), "max": percentile(1.0)},
+        }
@@ -0,0 +1,184 @@
+import time
+from bisect import bisect_right
+from collections import deque
+from datetime import datetime
+from typing import Any, Callable, Deque, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from records import RobotStatus
+
+STATES = tuple(member.value for member in RobotStatus)
+_STATE_CODES = {value: code for code, value in enumerate(STATES)}
+_MOVING = _STATE_CODES[RobotStatus.MOVING.value]
+_CHARGING = _STATE_CODES[RobotStatus.CHARGING.value]
+_ERROR = _STATE_CODES[RobotStatus.ERROR.value]
+
+# Length of a shift, in hours, for the "shift" window
+DEFAULT_SHIFT_HOURS = 8
+
+# Trailing windows summarized, in seconds; transitions are kept for the longest
+DEFAULT_WINDOWS = {"hour": 3600.0, "shift": DEFAULT_SHIFT_HOURS * 3600.0, "day": 86400.0}
+
+# The window covering everything since tracking began
+TOTAL = "total"
+
+
+def _state_code(status: Any) -> Optional[int]:
+    return _STATE_CODES.get(getattr(status, "value", status))
+
+
+class RobotTimeline:
+    """
+    One robot's time in each state
+
+    `totals` holds the seconds spent in each state up to the last
+    transition; the current state's open interval is added at read time.
+    Every transition also appends (time, state entered, totals so far) to a
+    history trimmed to the retention period, so the time in each state
+    over any trailing window is the totals now minus the totals at the
+    window's start, found by binary search. Recording a transition is O(1)
+    amortized: one append and whatever trimming it makes due.
+    """
+    __slots__ = ("state", "since", "tracked_since", "totals", "transitions", "history")
+
+    def __init__(self, state: int, now: float):
+        self.state = state
+        self.since = now
+        self.tracked_since = now
+        self.totals = [0.0] * len(STATES)
+        self.transitions = 0
+        self.history: Deque[Tuple[float, int, Tuple[float, ...]]] = deque([(now, state, tuple(self.totals))])
+
+    def transition(self, state: int, now: float, retention: float) -> None:
+        self.totals[self.state] += max(0.0, now - self.since)
+        self.state = state
+        self.since = now
+        self.transitions += 1
+        self.history.append((now, state, tuple(self.totals)))
+        # Keep the last entry at or before the retention cut, it anchors the oldest window
+        while len(self.history) > 1 and self.history[1][0] <= now - retention:
+            self.history.popleft()
+
+    def totals_at(self, moment: float) -> Tuple[List[float], int]:
+        """Seconds in each state from tracking start to moment, and transitions by then"""
+        index = bisect_right(self.history, moment, key=lambda entry: entry[0]) - 1
+        if index < 0:
+            return [0.0] * len(STATES), 0
+        at, state, totals = self.history[index]
+        totals = list(totals)
+        totals[state] += max(0.0, moment - at)
+        return totals, self.transitions - (len(self.history) - 1 - index)
+
+    def now_totals(self, now: float) -> List[float]:
+        totals = list(self.totals)
+        totals[self.state] += max(0.0, now - self.since)
+        return totals
+
+
+class RobotStateTracker:
+    """
+    Time each robot spends IDLE, MOVING, CHARGING and in ERROR
+
+    Fed with every recorded robot (see sync), it notices status changes
+    and timestamps them with `clock`. Summaries cover a trailing window of
+    `windows` (the last hour, shift and day by default) or everything
+    since tracking began, per robot and for the fleet:
+    - utilization: share of the tracked time spent MOVING
+    - charging_seconds and error_seconds (downtime)
+    Time before the tracker first saw a robot, e.g. before a restart, is
+    not counted; `tracked_seconds` says how much of a window is covered.
+    """
+
+    def __init__(
+        self,
+        robots: Iterable[Mapping[str, Any]] = (),
+        clock: Callable[[], float] = time.time,
+        windows: Optional[Dict[str, float]] = None
+    ):
+        """
+        Args:
+            robots: Robots to track from now on, in their current status
+            clock: Seconds since the Unix epoch
+            windows (dict): Window name -> seconds; DEFAULT_WINDOWS if None
+        """
+        self.clock = clock
+        self.windows = dict(windows or DEFAULT_WINDOWS)
+        self.retention = max(self.windows.values())
+        self.timelines: Dict[Any, RobotTimeline] = {}
+        for robot in robots:
+            self.observe(robot["id"], robot.get("status"))
+
+    def observe(self, robot_id: Any, status: Any) -> None:
+        """Note a robot's current status, recording a transition if it changed"""
+        state = _state_code(status)
+        if state is None:
+            return
+        timeline = self.timelines.get(robot_id)
+        if timeline is None:
+            self.timelines[robot_id] = RobotTimeline(state, self.clock())
+        elif timeline.state != state:
+            timeline.transition(state, self.clock(), self.retention)
+
+    def sync(self, collection: str, entity: Mapping[str, Any]) -> None:
+        """Observe a recorded entity; collections other than robots are ignored"""
+        if collection == "robots":
+            self.observe(entity["id"], entity.get("status"))
+
+    def discard(self, collection: str, entity_id: Any) -> None:
+        if collection == "robots":
+            self.timelines.pop(entity_id, None)
+
+    def _summary(self, seconds: List[float], tracked: float, transitions: int) -> Dict[str, Any]:
+        return {
+            "tracked_seconds": round(tracked, 1),
+            "seconds": {state: round(value, 1) for state, value in zip(STATES, seconds)},
+            "utilization": round(seconds[_MOVING] / tracked, 4) if tracked > 0 else None,
+            "charging_seconds": round(seconds[_CHARGING], 1),
+            "error_seconds": round(seconds[_ERROR], 1),
+            "transitions": transitions,
+        }
+
+    def summary(self, window: str = TOTAL, robot_ids: Optional[Iterable[Any]] = None) -> Dict[str, Any]:
+        """
+        Time in state per robot and for the fleet over a trailing window
+
+        Args:
+            window (str): A key of windows, or TOTAL
+            robot_ids: Robots to include; all tracked robots if None
+
+        Returns:
+            dict: The window's bounds, the fleet totals and one summary per robot
+
+        Raises:
+            KeyError: If the window is unknown, or a robot is not tracked
+        """
+        now = self.clock()
+        start = now - self.windows[window] if window != TOTAL else None
+        fleet = [0.0] * len(STATES)
+        fleet_tracked = 0.0
+        fleet_transitions = 0
+        robots = {}
+        for robot_id in (self.timelines if robot_ids is None else robot_ids):
+            timeline = self.timelines[robot_id]
+            seconds = timeline.now_totals(now)
+            transitions = timeline.transitions
+            tracked = now - timeline.tracked_since
+            if start is not None and start > timeline.tracked_since:
+                before, transitions_before = timeline.totals_at(start)
+                seconds = [total - earlier for total, earlier in zip(seconds, before)]
+                transitions -= transitions_before
+                tracked = now - start
+            robots[robot_id] = {
+                "status": STATES[timeline.state],
+                "since": datetime.fromtimestamp(timeline.since),
+                **self._summary(seconds, tracked, transitions),
+            }
+            fleet = [total + value for total, value in zip(fleet, seconds)]
+            fleet_tracked += tracked
+            fleet_transitions += transitions
+        return {
+            "window": window,
+            "from": datetime.fromtimestamp(start) if start is not None else None,
+            "until": datetime.fromtimestamp(now),
+            "fleet": {"robots": len(robots), **self._summary(fleet, fleet_tracked, fleet_transitions)},
+            "robots": robots,
+        }
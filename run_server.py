@@ -1,10 +1,11 @@
-import os
 import subprocess
 import sys
 import threading
 import time
 import webbrowser
 
+from build_frontend import build_frontend
+
 def run_flask_server():
     """Run the Flask backend server"""
     print("Starting FastAPI server...")
@@ -18,14 +19,10 @@ def build_and_serve():
     """Build frontend and serve the complete application"""
     print("Tom Yum Robot Control Center - Starting up...")
 
-    # Check if frontend is built
-    if not os.path.exists('dist'):
-        print("Frontend build not found. Building now...")
-        try:
-            subprocess.run(['python', 'build_frontend.py'], check=True)
-        except subprocess.CalledProcessError:
-            print("Error: Failed to build frontend")
-            return False
+    # Rebuild the frontend only if its sources or dependencies changed
+    if not build_frontend():
+        print("Error: Failed to build frontend")
+        return False
 
     # Start FastAPI server in a separate thread
     print("Starting backend server...")
@@ -0,0 +1,387 @@
+"""
+Discrete-event restaurant simulator for robot and charger capacity planning
+
+Generates orders, the delivery and collection tasks they cause, robot
+travel and battery drain, and drives the real app.py handlers for task
+creation, trip planning, task state transitions, priority overrides and
+charging. Time is virtual: app.py's clock is replaced with the simulation
+clock, so an evening of service runs in seconds with no network or
+WebSocket clients involved.
+
+Run a parameter sweep, one simulation per combination, in parallel:
+
+    python simulator.py --robots 2,3,4 --chargers 1,2 --orders-per-hour 60,120 --hours 3
+"""
+import argparse
+import asyncio
+import heapq
+import itertools
+import json
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from records import RecordTable, RobotRecord, TaskRecord, TripRecord
+
+SIM_START = datetime(2024, 6, 15, 17, 0)
+
+DEFAULT_CONFIG: Dict[str, Any] = {
+    "robots": 3,
+    "chargers": 1,
+    "tables": 12,
+    "orders_per_hour": 60,
+    "hours": 3.0,
+    # Service keeps running after the last order until the backlog drains
+    "drain_hours": 2.0,
+    # A table's dishes are collected this long after its food is delivered
+    "dining_minutes": 40,
+    "trip_capacity": 3,
+    # Battery % used per map unit travelled, and gained per minute on a charger
+    "battery_per_unit": 0.001,
+    "charge_per_minute": 1.0,
+    "charge_threshold": 30,
+    "charge_target": 95,
+    # An operator boosts READY tasks this close to their deadline
+    "override_margin_s": 120,
+    "override_boost": 50,
+    "seed": 1,
+}
+
+_app = None
+
+
+def load_app():
+    """Import app.py once per process, isolated from the network and disk"""
+    global _app
+    if _app is None:
+        os.environ["EXTERNAL_API_URL"] = ""
+        os.environ["EVENT_STORE_DIR"] = ""
+        os.environ["ANALYTICS_DIR"] = ""
+        os.environ.setdefault("DATABASE_URL", "sqlite://")
+        os.environ.setdefault("WORKER_ID", "0")
+        # Nothing listens on a port; in-process callers issue their own tokens
+        os.environ.setdefault("DEMO_AUTH", "1")
+        # Access and broadcast records would drown the report; errors still show
+        os.environ.setdefault("LOG_LEVEL", "error")
+        import app
+        _app = app
+    return _app
+
+
+class SimulatedDatetime(datetime):
+    """Stand-in for datetime inside app.py whose now() is the simulation clock"""
+    current = SIM_START
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls.current
+
+
+def make_tables(count: int, seed: int) -> List[Dict[str, Any]]:
+    """Lay tables out on a jittered grid inside the dining area of the floor plan"""
+    rng = random.Random(seed)
+    columns = max(1, round(count ** 0.5))
+    rows = (count + columns - 1) // columns
+    tables = []
+    for n in range(count):
+        row, column = divmod(n, columns)
+        tables.append({
+            "id": f"T{n + 1}",
+            "name": f"Table {n + 1}",
+            "status": "available",
+            "position": {
+                "x": round(80 + column * 260 / max(1, columns - 1) + rng.uniform(-8, 8), 1),
+                "y": round(120 + row * 180 / max(1, rows - 1) + rng.uniform(-8, 8), 1),
+            },
+        })
+    return tables
+
+
+class RestaurantSimulation:
+    """
+    One simulated service with a fixed configuration
+
+    Events are kept in a heap ordered by virtual time. After each event the
+    dispatcher applies operator overrides and asks the real trip planner
+    endpoint for trips, then schedules their completions from the planned
+    arrival offsets.
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config = {**DEFAULT_CONFIG, **(config or {})}
+        self.rng = random.Random(self.config["seed"])
+        self.app = load_app()
+        self._events: List[tuple] = []
+        self._sequence = itertools.count()
+        self.now = 0.0
+        self.completed: Dict[str, float] = {}
+        self.missed = 0
+        self.overrides = 0
+        self.busy_seconds = 0.0
+        self.charging_seconds = 0.0
+        self._charging_since: Dict[str, float] = {}
+        self.charge_waits = 0
+        self.max_backlog = 0
+        self._waiting_to_charge: List[str] = []
+
+    # Setup -------------------------------------------------------------
+
+    def _reset_app_state(self) -> None:
+        app = self.app
+        config = self.config
+        app.datetime = SimulatedDatetime
+        SimulatedDatetime.current = SIM_START
+
+        state = app.SystemState()
+        state.tables = make_tables(config["tables"], config["seed"])
+        state.tasks = RecordTable(TaskRecord)
+        state.orders = []
+        state.assignment_logs = []
+        state.trips = RecordTable(TripRecord)
+        state.robots = RecordTable(RobotRecord, (
+            {
+                "id": f"R{n + 1}",
+                "current_location": "Kitchen",
+                "battery_level": 100,
+                "status": app.RobotStatus.IDLE,
+                "current_task_id": None,
+                "last_active": SIM_START,
+            }
+            for n in range(config["robots"])
+        ))
+        state.charging_stations = [
+            {"id": f"station_{n + 1}", "status": "available", "robot_id": None,
+             "charging_level": 100, "max_capacity": 100}
+            for n in range(config["chargers"])
+        ]
+        app.system_state = state
+        app.task_history = app.TaskHistory()
+        # Ids follow the simulation clock, so runs are reproducible
+        app.ids = app.IdAllocator(0, clock=lambda: SimulatedDatetime.current.timestamp())
+        app.floor_index = app.FloorIndex(state.tables, state.points, state.robots, state.charging_stations)
+        app.robot_states = app.RobotStateTracker(state.robots, clock=lambda: SimulatedDatetime.current.timestamp())
+        app.trip_planner = app.TripPlanner(
+            app.build_location_index(state.tables, state.points),
+            capacity=config["trip_capacity"],
+            min_battery=config["charge_threshold"]
+        )
+        self.state = state
+        self.robots = {robot["id"]: robot for robot in state.robots}
+
+    def schedule(self, delay: float, kind: str, payload: Any = None) -> None:
+        heapq.heappush(self._events, (self.now + delay, next(self._sequence), kind, payload))
+
+    # Event handlers ----------------------------------------------------
+
+    async def _on_order(self, _):
+        app = self.app
+        table = self.rng.choice(self.state.tables)["name"]
+        await app.create_task(app.TaskCreate(type="delivery", table=table, priority="normal"))
+        dining = self.config["dining_minutes"] * 60 * self.rng.uniform(0.75, 1.25)
+        self.schedule(dining, "collection", table)
+        self._schedule_next_order()
+
+    async def _on_collection(self, table: str):
+        app = self.app
+        await app.create_task(app.TaskCreate(type="collection", table=table, priority="normal"))
+
+    async def _on_task_done(self, task_id: str):
+        await self.app.update_task_status(task_id, {"state": "DONE"})
+        self.completed[task_id] = self.now
+        task = self.state.tasks.get(task_id)
+        if SimulatedDatetime.current > task["deadline"]:
+            self.missed += 1
+
+    async def _on_trip_end(self, trip: Dict[str, Any]):
+        robot = self.robots[trip["robot_id"]]
+        robot["current_location"] = trip["route"][-1]
+        robot["battery_level"] = max(0.0, robot["battery_level"] - trip["distance"] * self.config["battery_per_unit"])
+        if robot["battery_level"] < self.config["charge_threshold"]:
+            await self._start_charging(robot["id"])
+
+    async def _start_charging(self, robot_id: str):
+        result = await self.app.request_manual_charging({"robot_id": robot_id})
+        if not result["success"]:
+            if robot_id not in self._waiting_to_charge:
+                self._waiting_to_charge.append(robot_id)
+                self.charge_waits += 1
+            return
+        robot = self.robots[robot_id]
+        minutes = max(0.0, self.config["charge_target"] - robot["battery_level"]) / self.config["charge_per_minute"]
+        self._charging_since[robot_id] = self.now
+        self.schedule(minutes * 60, "charged", robot_id)
+
+    async def _on_charged(self, robot_id: str):
+        app = self.app
+        robot = self.robots[robot_id]
+        robot["battery_level"] = self.config["charge_target"]
+        self.charging_seconds += self.now - self._charging_since.pop(robot_id)
+        await app.send_robot_command(robot_id, app.RobotCommand(command="STOP_CHARGING"))
+        # The robot is still physically at the charger when it is released
+        robot["current_location"] = "Charging Station"
+        if self._waiting_to_charge:
+            await self._start_charging(self._waiting_to_charge.pop(0))
+
+    def _schedule_next_order(self) -> None:
+        delay = self.rng.expovariate(self.config["orders_per_hour"] / 3600)
+        if self.now + delay < self.config["hours"] * 3600:
+            self.schedule(delay, "order")
+
+    # Dispatch ----------------------------------------------------------
+
+    async def _dispatch(self) -> None:
+        app = self.app
+        ready = self.state.tasks.where(state=app.TaskState.READY)
+        self.max_backlog = max(self.max_backlog, len(ready))
+        if not ready:
+            return
+
+        margin = timedelta(seconds=self.config["override_margin_s"])
+        for task in ready:
+            if not task["operator_override"] and task["deadline"] - SimulatedDatetime.current < margin:
+                await app.update_task_priority(task["id"], app.PriorityUpdate(
+                    boost=self.config["override_boost"], reason="Deadline at risk"
+                ))
+                self.overrides += 1
+
+        result = await app.plan_trips()
+        for trip in result["trips"]:
+            for task_id in trip["task_ids"]:
+                await app.update_task_status(task_id, {"state": "RUNNING"})
+                self.schedule(trip["finish_offsets_s"][task_id], "task_done", task_id)
+            self.busy_seconds += trip["duration_s"]
+            self.schedule(trip["duration_s"], "trip_end", trip)
+
+    # Run ---------------------------------------------------------------
+
+    async def run(self) -> Dict[str, Any]:
+        self._reset_app_state()
+        handlers = {
+            "order": self._on_order,
+            "collection": self._on_collection,
+            "task_done": self._on_task_done,
+            "trip_end": self._on_trip_end,
+            "charged": self._on_charged,
+        }
+        horizon = (self.config["hours"] + self.config["drain_hours"]) * 3600
+        self._schedule_next_order()
+        started = time.perf_counter()
+
+        while self._events and self._events[0][0] <= horizon:
+            self.now, _, kind, payload = heapq.heappop(self._events)
+            SimulatedDatetime.current = SIM_START + timedelta(seconds=self.now)
+            await handlers[kind](payload)
+            # Events at the same instant are applied before planning
+            if not self._events or self._events[0][0] > self.now:
+                await self._dispatch()
+
+        wall = time.perf_counter() - started
+        return self.report(wall)
+
+    def report(self, wall_seconds: float) -> Dict[str, Any]:
+        tasks = self.state.tasks
+        created = len(tasks)
+        done = len(self.completed)
+        latencies = sorted(
+            self.completed[t["id"]] - (t["created_at"] - SIM_START).total_seconds()
+            for t in tasks if t["id"] in self.completed
+        )
+        elapsed = max(self.now, 1.0)
+        # Charges still in progress count up to the end of the run
+        charging = self.charging_seconds + sum(self.now - since for since in self._charging_since.values())
+        unfinished = created - done
+        return {
+            "config": {k: self.config[k] for k in ("robots", "chargers", "tables", "orders_per_hour",
+                                                   "hours", "trip_capacity", "seed")},
+            "tasks_created": created,
+            "tasks_completed": done,
+            "throughput_per_hour": round(done / (elapsed / 3600), 1),
+            "deadline_miss_rate": round((self.missed + unfinished) / created, 4) if created else 0.0,
+            "mean_latency_s": round(sum(latencies) / len(latencies), 1) if latencies else None,
+            "p95_latency_s": round(latencies[int(len(latencies) * 0.95) - 1], 1) if latencies else None,
+            "robot_utilization": round(self.busy_seconds / (elapsed * self.config["robots"]), 4),
+            "charger_utilization": round(charging / (elapsed * self.config["chargers"]), 4)
+            if self.config["chargers"] else None,
+            "charge_waits": self.charge_waits,
+            "trips": len(self.state.trips),
+            "operator_overrides": self.overrides,
+            "max_backlog": self.max_backlog,
+            "simulated_hours": round(elapsed / 3600, 2),
+            "wall_seconds": round(wall_seconds, 3),
+            "speedup": round(elapsed / wall_seconds) if wall_seconds else None,
+        }
+
+
+def run_simulation(config: Dict[str, Any]) -> Dict[str, Any]:
+    """Run one configuration to completion; picklable entry point for worker processes"""
+    return asyncio.run(RestaurantSimulation(config).run())
+
+
+def sweep(configs: List[Dict[str, Any]], workers: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Run many configurations across processes
+
+    Each worker imports app.py once and resets its state per configuration,
+    so simulations never share state.
+
+    Args:
+        configs (list): Overrides of DEFAULT_CONFIG, one per simulation
+        workers (int, optional): Process count; defaults to the CPU count
+
+    Returns:
+        list: One report per configuration, in input order
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(configs) == 1:
+        return [run_simulation(config) for config in configs]
+    with ProcessPoolExecutor(max_workers=min(workers, len(configs))) as executor:
+        return list(executor.map(run_simulation, configs))
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--robots", type=_int_list, default=[3], help="comma-separated robot counts")
+    parser.add_argument("--chargers", type=_int_list, default=[1], help="comma-separated charger counts")
+    parser.add_argument("--orders-per-hour", type=_int_list, default=[60], help="comma-separated order rates")
+    parser.add_argument("--trip-capacity", type=_int_list, default=[DEFAULT_CONFIG["trip_capacity"]])
+    parser.add_argument("--tables", type=int, default=DEFAULT_CONFIG["tables"])
+    parser.add_argument("--hours", type=float, default=DEFAULT_CONFIG["hours"])
+    parser.add_argument("--seeds", type=int, default=1, help="replications per combination")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--json", help="write the full reports to this file")
+    args = parser.parse_args()
+
+    configs = [
+        {"robots": robots, "chargers": chargers, "orders_per_hour": rate, "trip_capacity": capacity,
+         "tables": args.tables, "hours": args.hours, "seed": seed}
+        for robots, chargers, rate, capacity, seed in itertools.product(
+            args.robots, args.chargers, args.orders_per_hour, args.trip_capacity, range(1, args.seeds + 1)
+        )
+    ]
+    started = time.perf_counter()
+    reports = sweep(configs, args.workers)
+    print(f"{len(configs)} simulations in {time.perf_counter() - started:.1f}s")
+    print(f"{'robots':>6}{'chargers':>9}{'orders/h':>9}{'cap':>4}{'seed':>5}{'tasks/h':>9}{'miss':>7}"
+          f"{'mean lat':>10}{'robot util':>11}{'charger util':>13}{'backlog':>8}{'speedup':>9}")
+    for report in reports:
+        c = report["config"]
+        mean_latency = f"{report['mean_latency_s']:.0f}s" if report["mean_latency_s"] is not None else "-"
+        charger_util = f"{report['charger_utilization']:.0%}" if report["charger_utilization"] is not None else "-"
+        print(f"{c['robots']:>6}{c['chargers']:>9}{c['orders_per_hour']:>9}{c['trip_capacity']:>4}{c['seed']:>5}"
+              f"{report['throughput_per_hour']:>9.1f}{report['deadline_miss_rate']:>7.1%}{mean_latency:>10}"
+              f"{report['robot_utilization']:>11.0%}{charger_util:>13}{report['max_backlog']:>8}"
+              f"{report['speedup']:>8}x")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(reports, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
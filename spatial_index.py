@@ -0,0 +1,305 @@
+import heapq
+import itertools
+import math
+from collections import defaultdict
+from typing import Any, Dict, Hashable, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+from trip_planner import Position, build_location_index
+
+# Side of a grid cell in floor-plan units, about the spacing of two tables
+DEFAULT_CELL_SIZE = 50.0
+
+# Kinds of entity a FloorIndex holds, each split into layers by one field
+FLOOR_KINDS = ("robot", "table", "point", "charger")
+
+
+def _cell(position: Position, cell_size: float) -> Tuple[int, int]:
+    return (math.floor(position[0] / cell_size), math.floor(position[1] / cell_size))
+
+
+def _ring(cx: int, cy: int, r: int) -> Iterator[Tuple[int, int]]:
+    """Cells at Chebyshev distance exactly r from (cx, cy)"""
+    if r == 0:
+        yield (cx, cy)
+        return
+    for dx in range(-r, r + 1):
+        yield (cx + dx, cy - r)
+        yield (cx + dx, cy + r)
+    for dy in range(-r + 1, r):
+        yield (cx - r, cy + dy)
+        yield (cx + r, cy + dy)
+
+
+class GridIndex:
+    """
+    Moving points on a uniform grid, grouped into layers, with k-nearest queries
+
+    Every key sits in one layer (e.g. "robot:IDLE") and one grid cell, so
+    moving a key or changing its layer is a constant-time update. A query
+    searches each requested layer in rings of cells around the query point
+    and stops once no unvisited cell can hold anything closer than the
+    k-th best so far. A sparse layer, where the rings would cover more
+    cells than it occupies, is scanned directly instead, so a query never
+    costs more than a scan of the layers it asks for.
+
+    Equal distances are ordered by when a key was first added, so results
+    are deterministic.
+    """
+
+    def __init__(self, cell_size: float = DEFAULT_CELL_SIZE):
+        self.cell_size = cell_size
+        # layer -> cell -> key -> position
+        self._layers: Dict[str, Dict[Tuple[int, int], Dict[Hashable, Position]]] = {}
+        self._where: Dict[Hashable, Tuple[str, Tuple[int, int]]] = {}
+        self._rank: Dict[Hashable, int] = {}
+        self._ranks = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self._where)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._where
+
+    def layers(self, prefix: str = "") -> List[str]:
+        return [layer for layer in self._layers if layer.startswith(prefix)]
+
+    def update(self, key: Hashable, position: Position, layer: str) -> None:
+        """Add a key, or move it to a new position and/or layer"""
+        cell = _cell(position, self.cell_size)
+        where = self._where.get(key)
+        if where is not None and where != (layer, cell):
+            self.remove(key)
+        self._rank.setdefault(key, next(self._ranks))
+        self._layers.setdefault(layer, {}).setdefault(cell, {})[key] = position
+        self._where[key] = (layer, cell)
+
+    def remove(self, key: Hashable) -> bool:
+        where = self._where.pop(key, None)
+        if where is None:
+            return False
+        layer, cell = where
+        cells = self._layers[layer]
+        del cells[cell][key]
+        if not cells[cell]:
+            del cells[cell]
+            if not cells:
+                del self._layers[layer]
+        return True
+
+    def nearest(
+        self,
+        position: Position,
+        k: int = 1,
+        layers: Optional[Iterable[str]] = None,
+        max_distance: Optional[float] = None
+    ) -> List[Tuple[float, Hashable]]:
+        """
+        The k keys closest to a position
+
+        Args:
+            position: (x, y) to search from
+            k (int): Most results to return
+            layers: Layers to search; every layer if omitted
+            max_distance: Ignore keys farther away than this
+
+        Returns:
+            list: (distance, key) pairs, closest first
+        """
+        if k <= 0:
+            return []
+        candidates: List[Tuple[float, int, Hashable]] = []
+        for layer in (self._layers if layers is None else layers):
+            cells = self._layers.get(layer)
+            if cells:
+                candidates.extend(self._nearest_in(cells, position, k, max_distance))
+        return [(distance, key) for distance, _, key in heapq.nsmallest(k, candidates)]
+
+    def _nearest_in(self, cells, position: Position, k: int, max_distance: Optional[float]):
+        x, y = position
+        rank = self._rank
+        # Max-heap of the k best so far, as (-distance, -rank, key)
+        best: List[Tuple[float, int, Hashable]] = []
+
+        limit = math.inf if max_distance is None else max_distance
+
+        def consider(bucket):
+            nonlocal limit
+            for key, (px, py) in bucket.items():
+                distance = math.hypot(px - x, py - y)
+                if distance > limit:
+                    continue
+                entry = (-distance, -rank[key], key)
+                if len(best) < k:
+                    heapq.heappush(best, entry)
+                elif entry > best[0]:
+                    heapq.heapreplace(best, entry)
+                else:
+                    continue
+                if len(best) == k:
+                    limit = -best[0][0]
+
+        size = self.cell_size
+        cx, cy = _cell(position, size)
+        probed = 0
+        r = 0
+        while True:
+            ring_size = 8 * r if r else 1
+            if probed + ring_size > len(cells):
+                # The next ring is larger than the layer: visit the cells
+                # left in order of their distance, while they can still
+                # hold something closer
+                remaining = sorted(
+                    (math.hypot(max(cell[0] * size - x, 0.0, x - (cell[0] + 1) * size),
+                                max(cell[1] * size - y, 0.0, y - (cell[1] + 1) * size)), cell)
+                    for cell in cells if max(abs(cell[0] - cx), abs(cell[1] - cy)) >= r
+                )
+                for gap, cell in remaining:
+                    if gap > limit:
+                        break
+                    consider(cells[cell])
+                break
+            for cell in _ring(cx, cy, r):
+                bucket = cells.get(cell)
+                if bucket:
+                    consider(bucket)
+            probed += ring_size
+            # Anything in ring r + 1 or beyond is at least r cells away
+            if r * size > limit:
+                break
+            r += 1
+        return [(-distance, -negative_rank, key) for distance, negative_rank, key in best]
+
+
+def _group(value: Any) -> str:
+    return str(getattr(value, "value", value))
+
+
+class FloorIndex:
+    """
+    Spatial index over the floor plan's tables and points, the charging
+    stations and live robot positions
+
+    Tables are layered by status, points by type, chargers by status and
+    robots by status. A robot is placed at its "position" ({"x", "y"}) if
+    it has one, otherwise at its current_location's position on the floor
+    plan; a robot somewhere off the plan (e.g. "Returning to base") is not
+    indexed until it arrives. A charging station is placed at its
+    "location", defaulting to the first charging point. Robots and
+    stations are re-synced whenever they are recorded.
+    """
+
+    def __init__(
+        self,
+        tables: Sequence[Dict[str, Any]],
+        points: Sequence[Dict[str, Any]],
+        robots: Iterable[Mapping[str, Any]] = (),
+        charging_stations: Iterable[Dict[str, Any]] = (),
+        cell_size: float = DEFAULT_CELL_SIZE
+    ):
+        self.grid = GridIndex(cell_size)
+        self.locations: Dict[str, Position] = build_location_index(tables, points)
+        self.entities: Dict[Tuple[str, Any], Mapping[str, Any]] = {}
+        self.points_by_type: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        self.stations_by_robot: Dict[Any, Dict[str, Any]] = {}
+        self._station_holders: Dict[Any, Any] = {}
+        self.default_charger_location = next((p["name"] for p in points if p["type"] == "charging"), None)
+        for table in tables:
+            self._place("table", table, self.locations.get(table["name"]), table.get("status"))
+        for point in points:
+            self.points_by_type[point["type"]].append(point)
+            self._place("point", point, self.locations.get(point["name"]), point["type"])
+        for robot in robots:
+            self.sync_robot(robot)
+        for station in charging_stations:
+            self.sync_station(station)
+
+    def _place(self, kind: str, entity: Mapping[str, Any], position: Optional[Position], group: Any) -> None:
+        key = (kind, entity["id"])
+        if position is None:
+            self.remove(kind, entity["id"])
+            return
+        self.entities[key] = entity
+        self.grid.update(key, position, f"{kind}:{_group(group)}")
+
+    def locate(self, location: str) -> Optional[Position]:
+        """Position of a named table or point"""
+        return self.locations.get(location)
+
+    def robot_position(self, robot: Mapping[str, Any]) -> Optional[Position]:
+        position = robot.get("position")
+        if isinstance(position, Mapping) and "x" in position and "y" in position:
+            return (float(position["x"]), float(position["y"]))
+        return self.locations.get(robot.get("current_location"))
+
+    def sync_robot(self, robot: Mapping[str, Any]) -> None:
+        self._place("robot", robot, self.robot_position(robot), robot.get("status"))
+
+    def sync_station(self, station: Dict[str, Any]) -> None:
+        self._release(station["id"])
+        if station.get("robot_id"):
+            self.stations_by_robot[station["robot_id"]] = station
+            self._station_holders[station["id"]] = station["robot_id"]
+        location = station.get("location") or self.default_charger_location
+        self._place("charger", station, self.locations.get(location), station.get("status"))
+
+    def sync(self, collection: str, entity: Mapping[str, Any]) -> None:
+        """Re-index a recorded entity; collections without positions are ignored"""
+        if collection == "robots":
+            self.sync_robot(entity)
+        elif collection == "charging_stations":
+            self.sync_station(entity)
+
+    def _release(self, station_id: Any) -> None:
+        robot_id = self._station_holders.pop(station_id, None)
+        if robot_id is not None:
+            self.stations_by_robot.pop(robot_id, None)
+
+    def remove(self, kind: str, entity_id: Any) -> None:
+        self.grid.remove((kind, entity_id))
+        self.entities.pop((kind, entity_id), None)
+        if kind == "charger":
+            self._release(entity_id)
+
+    def discard(self, collection: str, entity_id: Any) -> None:
+        if collection == "robots":
+            self.remove("robot", entity_id)
+        elif collection == "charging_stations":
+            self.remove("charger", entity_id)
+
+    def nearest(
+        self,
+        kind: str,
+        position: Position,
+        k: int = 1,
+        groups: Optional[Iterable[Any]] = None,
+        max_distance: Optional[float] = None
+    ) -> List[Tuple[float, Mapping[str, Any]]]:
+        """
+        The k entities of a kind closest to a position
+
+        Args:
+            kind (str): "robot", "table", "point" or "charger"
+            position: (x, y) to search from
+            k (int): Most results to return
+            groups: Statuses (robots, tables, chargers) or types (points)
+                to accept; any if omitted
+            max_distance: Ignore entities farther away than this
+
+        Returns:
+            list: (distance, entity) pairs, closest first
+        """
+        if groups is None:
+            layers = self.grid.layers(f"{kind}:")
+        else:
+            layers = [f"{kind}:{_group(group)}" for group in groups]
+        return [
+            (distance, self.entities[key])
+            for distance, key in self.grid.nearest(position, k, layers, max_distance)
+        ]
+
+    def nearest_free_charger(self, position: Optional[Position]) -> Optional[Dict[str, Any]]:
+        """Closest available charging station, or any available one if the position is unknown"""
+        if position is None:
+            position = self.locations.get(self.default_charger_location, (0.0, 0.0))
+        found = self.nearest("charger", position, 1, ["available"])
+        return found[0][1] if found else None
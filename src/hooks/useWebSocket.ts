@@ -11,7 +11,10 @@ export const useWebSocket = (url: string) => {
   const ws = useRef<WebSocket | null>(null);
 
   useEffect(() => {
-    ws.current = new WebSocket(url);
+    // Browsers cannot set headers on a WebSocket, so the token goes in the query string
+    const token = localStorage.getItem('access_token');
+    const authedUrl = token ? `${url}${url.includes('?') ? '&' : '?'}token=${encodeURIComponent(token)}` : url;
+    ws.current = new WebSocket(authedUrl);
     
     ws.current.onopen = () => {
       setIsConnected(true);
@@ -0,0 +1,361 @@
+import atexit
+import contextvars
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Mapping, Optional, TextIO, Tuple
+
+LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40}
+_LEVEL_NAMES = {value: name for name, value in LEVELS.items()}
+
+# Records waiting for the writer; beyond this new records are dropped and counted
+DEFAULT_CAPACITY = 100_000
+
+# Seconds the writer waits between batches
+DEFAULT_FLUSH_INTERVAL = 0.1
+
+# A warning or error with the same event and error text is written at most
+# ERROR_BURST times per ERROR_WINDOW seconds; the rest are counted and the
+# count is attached to the next one written
+DEFAULT_ERROR_BURST = 5
+DEFAULT_ERROR_WINDOW = 60.0
+
+# Most records formatted into one write
+DEFAULT_MAX_BATCH = 4096
+
+# Rotate the log file at this size, keeping this many old files
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_BACKUPS = 5
+
+# Rate-limit keys remembered before the table is reset
+MAX_RATE_LIMIT_KEYS = 10_000
+
+# Correlation id of the request (or command) being handled; attached to every record
+correlation_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("correlation_id", default=None)
+
+# Incoming X-Request-ID values are reused only if they look like an id
+_VALID_ID = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+Record = Tuple[float, int, str, str, Optional[str], Dict[str, Any]]
+
+
+def new_correlation_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def parse_sample_rates(spec: str) -> Dict[str, float]:
+    """Parse "event=rate,event=rate", e.g. "commands.broadcast=0.1"
+
+    Raises:
+        ValueError: If an entry is malformed or a rate is not in (0, 1]
+    """
+    rates = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        event, _, rate = entry.partition("=")
+        value = float(rate)
+        if not event or not 0 < value <= 1:
+            raise ValueError(f"Bad sample rate {entry!r}")
+        rates[event.strip()] = value
+    return rates
+
+
+class LogPipeline:
+    """
+    JSON-lines logging where the caller only appends to a queue
+
+    Logging a record costs a level check, an optional sampling or
+    rate-limit check and a deque append; timestamps are formatted, JSON
+    encoded and written by a background thread that wakes every
+    flush_interval and writes everything waiting in one call, to stdout or
+    a size-rotated file. The writer starts with the first record.
+
+    Events listed in sample_rates (e.g. {"commands.broadcast": 0.1}) keep
+    one record in every 1/rate, marked with "sampled": 1/rate so counts can
+    be scaled back. Warnings and errors are rate limited per event and
+    error text. Every record carries the current correlation_id, if any.
+    """
+
+    def __init__(
+        self,
+        stream: Optional[TextIO] = None,
+        path: Optional[str] = None,
+        level: str = "info",
+        sample_rates: Optional[Mapping[str, float]] = None,
+        error_burst: int = DEFAULT_ERROR_BURST,
+        error_window: float = DEFAULT_ERROR_WINDOW,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        backups: int = DEFAULT_BACKUPS,
+        capacity: int = DEFAULT_CAPACITY,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL
+    ):
+        """
+        Args:
+            stream: Where records go without a path; sys.stdout by default
+            path (str, optional): Log file, rotated at max_bytes
+            level (str): Least severe level written: debug, info, warning or error
+            sample_rates: Event name -> share of its records kept, in (0, 1]
+            error_burst (int): Repeats of a warning or error written per window
+            error_window (float): Seconds of the rate limit window
+            max_bytes (int): Size at which the log file is rotated
+            backups (int): Rotated files kept
+            capacity (int): Records queued before new ones are dropped
+            flush_interval (float): Seconds between writer batches
+        """
+        self.stream = stream
+        self.path = path
+        self.level = LEVELS[level]
+        self._sample_every = {event: max(1, round(1 / rate)) for event, rate in (sample_rates or {}).items()}
+        self._sample_seen: Dict[str, int] = {}
+        self.error_burst = error_burst
+        self.error_window = error_window
+        # (logger, event, error) -> [window start, written, suppressed]
+        self._error_counts: Dict[Tuple[str, str, str], List[float]] = {}
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self._queue: Deque[Record] = deque()
+        self._writer: Optional[threading.Thread] = None
+        self._writer_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._file: Optional[TextIO] = None
+        self.queued = 0
+        self.written = 0
+        self.dropped = 0
+        self.sampled_out = 0
+        self.rate_limited = 0
+        self.batches = 0
+        self.write_errors = 0
+
+    def log(self, level: int, logger: str, event: str, fields: Dict[str, Any]) -> None:
+        """Queue a record; called on the hot path, so it never blocks or formats"""
+        if level < self.level:
+            return
+        every = self._sample_every.get(event)
+        if every is not None:
+            seen = self._sample_seen[event] = self._sample_seen.get(event, 0) + 1
+            if seen % every:
+                self.sampled_out += 1
+                return
+            fields["sampled"] = every
+        if level >= LEVELS["warning"] and not self._allow_repeat(logger, event, fields):
+            return
+        if len(self._queue) >= self.capacity:
+            self.dropped += 1
+            return
+        self._queue.append((time.time(), level, logger, event, correlation_id.get(), fields))
+        self.queued += 1
+        if self._writer is None:
+            self._start_writer()
+
+    def _allow_repeat(self, logger: str, event: str, fields: Dict[str, Any]) -> bool:
+        key = (logger, event, str(fields.get("error", ""))[:200])
+        now = time.monotonic()
+        entry = self._error_counts.get(key)
+        if entry is None or now - entry[0] >= self.error_window:
+            if len(self._error_counts) >= MAX_RATE_LIMIT_KEYS:
+                self._error_counts.clear()
+            if entry is not None and entry[2]:
+                fields["suppressed"] = int(entry[2])
+            self._error_counts[key] = [now, 1, 0]
+            return True
+        if entry[1] < self.error_burst:
+            entry[1] += 1
+            if entry[2]:
+                fields["suppressed"], entry[2] = int(entry[2]), 0
+            return True
+        entry[2] += 1
+        self.rate_limited += 1
+        return False
+
+    def _start_writer(self) -> None:
+        with self._writer_lock:
+            if self._writer is None:
+                self._stopped.clear()
+                self._writer = threading.Thread(target=self._write_loop, name="log-writer", daemon=True)
+                self._writer.start()
+
+    def _write_loop(self) -> None:
+        while not self._stopped.wait(self.flush_interval):
+            self.flush()
+        self.flush()
+
+    def flush(self) -> None:
+        """Write every queued record, DEFAULT_MAX_BATCH records per write"""
+        while self._queue:
+            self._write_batch()
+
+    def _write_batch(self) -> None:
+        queue = self._queue
+        lines = [self._format(queue.popleft()) for _ in range(min(len(queue), DEFAULT_MAX_BATCH))]
+        try:
+            self._write("".join(lines))
+        except (OSError, ValueError):
+            self.write_errors += 1
+            return
+        self.written += len(lines)
+        self.batches += 1
+
+    @staticmethod
+    def _format(record: Record) -> str:
+        at, level, logger, event, request_id, fields = record
+        entry = {
+            "ts": datetime.fromtimestamp(at, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": _LEVEL_NAMES[level],
+            "logger": logger,
+            "event": event,
+        }
+        if request_id is not None:
+            entry["correlation_id"] = request_id
+        entry.update(fields)
+        return json.dumps(entry, default=str) + "\n"
+
+    def _write(self, text: str) -> None:
+        if self.path is None:
+            stream = self.stream or sys.stdout
+            stream.write(text)
+            stream.flush()
+            return
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+        if self.max_bytes and self._file.tell() + len(text) > self.max_bytes and self._file.tell():
+            self._rotate()
+        self._file.write(text)
+        self._file.flush()
+
+    def _rotate(self) -> None:
+        self._file.close()
+        for n in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{n}"):
+                os.replace(f"{self.path}.{n}", f"{self.path}.{n + 1}")
+        if self.backups:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def close(self) -> None:
+        """Stop the writer after it has written everything queued"""
+        writer = self._writer
+        if writer is not None:
+            self._stopped.set()
+            writer.join()
+            self._writer = None
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "waiting": len(self._queue),
+            "queued": self.queued,
+            "written": self.written,
+            "batches": self.batches,
+            "dropped": self.dropped,
+            "sampled_out": self.sampled_out,
+            "rate_limited": self.rate_limited,
+            "write_errors": self.write_errors,
+        }
+
+
+# Process-wide pipeline used by every Logger; configure() replaces it
+pipeline = LogPipeline()
+
+# Records still queued when the interpreter exits are written, not lost
+atexit.register(lambda: pipeline.close())
+
+
+def configure(**options: Any) -> LogPipeline:
+    """Replace the process-wide pipeline (see LogPipeline for options), closing the old one"""
+    global pipeline
+    old, pipeline = pipeline, LogPipeline(**options)
+    old.close()
+    return pipeline
+
+
+class Logger:
+    """Named source of structured records: log.info("event.name", field=value, ...)"""
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def debug(self, event: str, **fields: Any) -> None:
+        pipeline.log(10, self.name, event, fields)
+
+    def info(self, event: str, **fields: Any) -> None:
+        pipeline.log(20, self.name, event, fields)
+
+    def warning(self, event: str, **fields: Any) -> None:
+        pipeline.log(30, self.name, event, fields)
+
+    def error(self, event: str, **fields: Any) -> None:
+        pipeline.log(40, self.name, event, fields)
+
+
+def get_logger(name: str) -> Logger:
+    return Logger(name)
+
+
+class CorrelationMiddleware:
+    """
+    ASGI middleware giving every request a correlation id and an access log record
+
+    The id is the request's X-Request-ID header if it looks like one, else
+    a new one. It is set in correlation_id for everything the request does
+    (and so attached to its log records, its commands' broadcasts and its
+    external API calls) and returned in the response's X-Request-ID
+    header. Each HTTP request is logged as an "http.request" record when
+    its response starts; WebSockets get an id but no access record.
+    Added last, so it wraps every other middleware.
+    """
+
+    def __init__(self, app, header: str = "x-request-id"):
+        self.app = app
+        self.header = header.encode("latin-1")
+        self.log = get_logger("http")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == self.header:
+                value = value.decode("latin-1")
+                request_id = value if _VALID_ID.match(value) else None
+                break
+        request_id = request_id or new_correlation_id()
+        token = correlation_id.set(request_id)
+        if scope["type"] == "websocket":
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                correlation_id.reset(token)
+            return
+
+        started = time.perf_counter()
+        header = (self.header, request_id.encode("latin-1"))
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []), header]}
+                self.log.info(
+                    "http.request",
+                    method=scope["method"],
+                    path=scope["path"],
+                    status=message["status"],
+                    ms=round((time.perf_counter() - started) * 1000, 2),
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            correlation_id.reset(token)
@@ -0,0 +1,122 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import Session
+
+from models import ArchivedTask
+
+# Seconds a task stays in memory after it is DONE before it is archived
+DEFAULT_TTL = 15 * 60
+
+# Seconds between archive sweeps
+DEFAULT_INTERVAL = 30
+
+# Upper bound on archived tasks returned by one range query
+DEFAULT_QUERY_LIMIT = 1000
+
+ARCHIVED_FIELDS = (
+    "id", "type", "base_priority", "release_time", "deadline", "operator_override",
+    "effective_priority", "waypoints", "state", "assigned_robot", "order_id", "trip_id",
+    "created_at", "completed_at",
+)
+
+
+def _to_row(task: Dict[str, Any]) -> Dict[str, Any]:
+    row = {field: task.get(field) for field in ARCHIVED_FIELDS}
+    for field in ("type", "state"):
+        row[field] = getattr(row[field], "value", row[field])
+    row["waypoints"] = list(row["waypoints"] or [])
+    return row
+
+
+def _to_task(row: ArchivedTask) -> Dict[str, Any]:
+    return {field: getattr(row, field) for field in ARCHIVED_FIELDS}
+
+
+class TaskArchive:
+    """
+    Cold store for finished tasks in the archived_tasks table
+
+    All database work runs on one dedicated thread. That keeps blocking
+    I/O off the event loop, serializes SQLite writes, and gives in-memory
+    SQLite (one database per connection thread) a single consistent view.
+    """
+
+    def __init__(self, session_factory: Callable[[], Session]):
+        """
+        Args:
+            session_factory: Creates a database session, e.g. SessionLocal
+        """
+        self.session_factory = session_factory
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="task-archive")
+
+    async def _run(self, function: Callable, *args) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    # Blocking implementations, only ever called on the archive thread
+
+    def _put(self, rows: List[Dict[str, Any]]) -> None:
+        with self.session_factory() as db:
+            # A crash after the insert but before the tasks left memory would
+            # archive them again; replacing keeps that idempotent
+            db.execute(delete(ArchivedTask).where(ArchivedTask.id.in_([row["id"] for row in rows])))
+            db.execute(insert(ArchivedTask), rows)
+            db.commit()
+
+    def _get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        with self.session_factory() as db:
+            row = db.get(ArchivedTask, task_id)
+            return _to_task(row) if row else None
+
+    def _query(self, since: Optional[datetime], until: Optional[datetime], limit: int) -> List[Dict[str, Any]]:
+        statement = select(ArchivedTask).order_by(ArchivedTask.created_at).limit(limit)
+        if since:
+            statement = statement.where(ArchivedTask.created_at >= since)
+        if until:
+            statement = statement.where(ArchivedTask.created_at < until)
+        with self.session_factory() as db:
+            return [_to_task(row) for row in db.scalars(statement)]
+
+    def _counts(self) -> Dict[str, int]:
+        with self.session_factory() as db:
+            rows = db.execute(select(ArchivedTask.type, func.count()).group_by(ArchivedTask.type))
+            return {task_type: count for task_type, count in rows}
+
+    # Public API
+
+    async def put(self, tasks: List[Dict[str, Any]]) -> None:
+        """Write tasks to the archive, replacing any already archived under the same id"""
+        if tasks:
+            await self._run(self._put, [_to_row(task) for task in tasks])
+
+    async def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        return await self._run(self._get, task_id)
+
+    async def query(
+        self,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        limit: int = DEFAULT_QUERY_LIMIT
+    ) -> List[Dict[str, Any]]:
+        """
+        Archived tasks created in [since, until), oldest first
+
+        Args:
+            since (datetime): Inclusive lower bound on created_at, or None
+            until (datetime): Exclusive upper bound on created_at, or None
+            limit (int): Maximum number of tasks returned
+
+        Returns:
+            list: Task dicts in the same shape as in-memory tasks
+        """
+        return await self._run(self._query, since, until, limit)
+
+    async def counts(self) -> Dict[str, int]:
+        """Number of archived tasks per task type"""
+        return await self._run(self._counts)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
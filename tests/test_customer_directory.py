@@ -0,0 +1,22 @@
+import time
+
+from benchmarks.customer_directory_bench import make_customers
+from customer_directory import CustomerDirectory
+
+
+def test_long_fuzzy_query_runs_in_bounded_time():
+    directory = CustomerDirectory(make_customers(20_000))
+    for query in ("jon jon jon jon jon", "jon jonh jhon jonn johm smth", " ".join(["smtih"] * 40)):
+        started = time.perf_counter()
+        results = directory.fuzzy_search_name(query)
+        assert time.perf_counter() - started < 1.0, query
+        assert results
+
+
+def test_fuzzy_search_ranks_full_matches_first():
+    directory = CustomerDirectory([
+        {"id": 1, "name": "John Smith"},
+        {"id": 2, "name": "John Brown"},
+        {"id": 3, "name": "Jane Smith"},
+    ])
+    assert [customer["id"] for customer in directory.fuzzy_search_name("jonh smtih", limit=3)][0] == 1
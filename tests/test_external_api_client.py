@@ -0,0 +1,77 @@
+import asyncio
+
+import httpx
+import pytest
+
+from external_api_client import AsyncExternalApiClient, CircuitBreaker, CircuitOpenError
+
+
+def half_open_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.0)
+    breaker.record_failure()
+    return breaker
+
+
+def run_client(handler, breaker, call):
+    async def main():
+        client = AsyncExternalApiClient(
+            "http://api.test", max_retries=0, breaker=breaker, transport=httpx.MockTransport(handler)
+        )
+        async with client:
+            return await call(client)
+    return asyncio.run(main())
+
+
+def test_probe_failing_with_a_non_transport_error_reopens_the_circuit():
+    breaker = half_open_breaker()
+
+    def handler(request):
+        raise httpx.DecodingError("garbled response")
+
+    with pytest.raises(httpx.DecodingError):
+        run_client(handler, breaker, lambda client: client.create_customer({"name": "Ann"}))
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker._probe_in_flight
+
+
+def test_probe_failing_before_it_is_sent_reopens_the_circuit():
+    breaker = half_open_breaker()
+
+    with pytest.raises(TypeError):
+        run_client(lambda request: httpx.Response(200), breaker,
+                   lambda client: client.create_customer({"name": object()}))
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker._probe_in_flight
+
+
+def test_cancelled_probe_lets_the_next_call_probe():
+    breaker = half_open_breaker()
+    release = None
+
+    async def handler(request):
+        await release.wait()
+        return httpx.Response(200, json={"id": 1})
+
+    async def call(client):
+        nonlocal release
+        release = asyncio.Event()
+        probe = asyncio.ensure_future(client.create_customer({"name": "Ann"}))
+        await asyncio.sleep(0.01)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        release.set()
+        return await client.create_customer({"name": "Ann"})
+
+    assert run_client(handler, breaker, call) == {"id": 1}
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_open_circuit_rejects_until_reset_timeout():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60.0)
+    breaker.record_failure()
+
+    with pytest.raises(CircuitOpenError):
+        run_client(lambda request: httpx.Response(200), breaker,
+                   lambda client: client.create_customer({"name": "Ann"}))
@@ -0,0 +1,361 @@
+import gzip
+import itertools
+import os
+import pickle
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode
+
+# Format version written in each capture's header
+CAPTURE_VERSION = 1
+
+# Largest request body captured; a larger request is recorded without it
+# and skipped on replay
+DEFAULT_MAX_BODY = 1024 * 1024
+
+# Largest response body captured, for writes only; replay matches the ids
+# the server generated through them
+DEFAULT_MAX_RESPONSE = 64 * 1024
+
+# Records queued for the writer before new ones are dropped
+DEFAULT_CAPACITY = 100_000
+
+# Seconds between writer batches
+DEFAULT_FLUSH_INTERVAL = 0.5
+
+# Request headers kept; everything else, Authorization included, is dropped
+CAPTURED_HEADERS = frozenset({b"content-type", b"accept", b"if-none-match"})
+
+# Record kinds. Every record is a tuple starting with its kind; those after
+# the header start with (kind, seconds since the capture started) and are
+# pickled in lists, one per writer batch:
+#   ("header", info)       info holds "state", the pickled collections at the start
+#   ("http", t, method, path, query, headers, user, body, status, seconds, route, response)
+#   ("ws_open", t, ws, path, query, user)
+#   ("ws_in", t, ws, text or bytes)
+#   ("ws_close", t, ws)
+#   ("footer", info)       info holds "state" at the stop, and the capture's counts
+HEADER, HTTP, WS_OPEN, WS_IN, WS_CLOSE, FOOTER = "header", "http", "ws_open", "ws_in", "ws_close", "footer"
+
+Record = Tuple[Any, ...]
+
+
+def strip_token(query_string: bytes) -> bytes:
+    """A query string without its token parameter"""
+    if b"token=" not in query_string:
+        return query_string
+    pairs = parse_qsl(query_string.decode("latin-1"), keep_blank_values=True)
+    return urlencode([(name, value) for name, value in pairs if name != "token"]).encode("latin-1")
+
+
+def read_capture(path: str) -> Tuple[Dict[str, Any], List[Record], Optional[Dict[str, Any]]]:
+    """
+    Load a capture file
+
+    Captures are pickles: only load files this server wrote, as loading an
+    untrusted one can run arbitrary code.
+
+    Returns:
+        Tuple: The header info, the traffic records in start order, and the
+            footer info, or None if the capture was never stopped cleanly
+
+    Raises:
+        ValueError: If the file is not a capture of a known version
+    """
+    records = []
+    with gzip.open(path, "rb") as file:
+        try:
+            kind, header = pickle.load(file)
+        except (EOFError, pickle.UnpicklingError, OSError, ValueError) as e:
+            raise ValueError(f"{path} is not a traffic capture: {e}")
+        if kind != HEADER or header.get("version") != CAPTURE_VERSION:
+            raise ValueError(f"{path} is not a version {CAPTURE_VERSION} traffic capture")
+        footer = None
+        while True:
+            try:
+                batch = pickle.load(file)
+            except (EOFError, gzip.BadGzipFile):
+                break
+            if isinstance(batch, tuple):
+                footer = batch[1]
+            else:
+                records.extend(batch)
+    records.sort(key=lambda record: record[1])
+    return header, records, footer
+
+
+class TrafficCapture:
+    """
+    Records API traffic to a file for replay_traffic.py
+
+    While a capture runs, CaptureMiddleware hands it one record per HTTP
+    request and per WebSocket connect, message and close: the request as
+    sent (minus credentials), who sent it, when, and how the server
+    answered and how fast. Handing over a record is a deque append; a
+    writer thread pickles the records queued since its last batch into a
+    gzip stream every flush_interval. The header and footer carry the
+    server's state at the start and the stop, so a replay starts from the
+    same state and can compare where it ends up.
+
+    stop() runs off the event loop. From its start until it returns the
+    capture takes no records and start() refuses, so a new capture never
+    replaces the file whose footer is still being written.
+    """
+
+    def __init__(
+        self,
+        capacity: int = DEFAULT_CAPACITY,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        max_body: int = DEFAULT_MAX_BODY,
+        max_response: int = DEFAULT_MAX_RESPONSE
+    ):
+        """
+        Args:
+            capacity (int): Records queued before new ones are dropped
+            flush_interval (float): Seconds between writer batches
+            max_body (int): Largest request body captured
+            max_response (int): Largest write response body captured
+        """
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.max_body = max_body
+        self.max_response = max_response
+        self.path: Optional[str] = None
+        self.started_at: Optional[datetime] = None
+        self._started = 0.0
+        self._queue: Deque[Record] = deque()
+        self._lock = threading.Lock()
+        self._stopping = False
+        self._file = None
+        self._writer: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._websockets = itertools.count(1)
+        self._reset_counts()
+
+    def _reset_counts(self) -> None:
+        self.requests = 0
+        self.websocket_messages = 0
+        self.dropped = 0
+        self.bodies_skipped = 0
+        self.written = 0
+
+    @property
+    def active(self) -> bool:
+        return self.path is not None and not self._stopping
+
+    def start(self, path: str, state: bytes, info: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Start capturing to path
+
+        Args:
+            path (str): Capture file; its directory is created if needed
+            state (bytes): The pickled state collections at this moment
+            info (dict): Anything else to keep in the header, e.g. the venue
+
+        Raises:
+            RuntimeError: If a capture is running or still stopping
+        """
+        with self._lock:
+            if self._stopping:
+                raise RuntimeError(f"The capture to {self.path} is still stopping")
+            if self.path is not None:
+                raise RuntimeError(f"Already capturing to {self.path}")
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._file = gzip.open(path, "wb", compresslevel=1)
+            self.started_at = datetime.now()
+            header = {**(info or {}), "version": CAPTURE_VERSION, "started_at": self.started_at, "state": state}
+            pickle.dump((HEADER, header), self._file, protocol=pickle.HIGHEST_PROTOCOL)
+            self._reset_counts()
+            self._started = time.perf_counter()
+            self._stopped.clear()
+            self._writer = threading.Thread(target=self._write_loop, name="traffic-capture", daemon=True)
+            self._writer.start()
+            self.path = path
+
+    def stop(self, state: bytes) -> Dict[str, Any]:
+        """
+        Stop capturing, writing everything queued and the footer
+
+        Args:
+            state (bytes): The pickled state collections at this moment
+
+        Returns:
+            dict: The capture's counts, as in stats()
+
+        Raises:
+            RuntimeError: If no capture is running, or another stop() is under way
+        """
+        with self._lock:
+            if not self.active:
+                raise RuntimeError("No capture is running")
+            # From here on add() drops records and start() refuses
+            self._stopping = True
+        path = self.path
+        try:
+            self._stopped.set()
+            self._writer.join()
+            self._writer = None
+            self._flush()
+            stats = {**self.stats(), "active": False, "stopping": False, "stopped_at": datetime.now(), "seconds": round(self.offset(), 3)}
+            pickle.dump((FOOTER, {**stats, "state": state}), self._file, protocol=pickle.HIGHEST_PROTOCOL)
+            self._file.close()
+            self._file = None
+            stats["bytes"] = os.path.getsize(path)
+            return stats
+        finally:
+            with self._lock:
+                self.path = None
+                self._stopping = False
+
+    def offset(self) -> float:
+        """Seconds since the capture started"""
+        return time.perf_counter() - self._started
+
+    def next_websocket(self) -> int:
+        return next(self._websockets)
+
+    def add(self, record: Record) -> None:
+        """Queue a record; called on the hot path, so it never blocks or encodes"""
+        if not self.active:
+            return
+        if len(self._queue) >= self.capacity:
+            self.dropped += 1
+            return
+        self._queue.append(record)
+
+    def _write_loop(self) -> None:
+        while not self._stopped.wait(self.flush_interval):
+            self._flush()
+
+    def _flush(self) -> None:
+        queue = self._queue
+        batch = [queue.popleft() for _ in range(len(queue))]
+        if batch:
+            self._file.write(pickle.dumps(batch, protocol=pickle.HIGHEST_PROTOCOL))
+            self.written += len(batch)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": self.active,
+            "stopping": self._stopping,
+            "path": self.path,
+            "started_at": self.started_at,
+            "requests": self.requests,
+            "websocket_messages": self.websocket_messages,
+            "waiting": len(self._queue),
+            "written": self.written,
+            "dropped": self.dropped,
+            "bodies_skipped": self.bodies_skipped,
+        }
+
+
+class CaptureMiddleware:
+    """
+    ASGI middleware feeding API traffic to a TrafficCapture while it runs
+
+    Captures authenticated requests under `prefixes` except `exclude`
+    (logins and the capture controls by default), so it must sit inside
+    AuthMiddleware, where scope["state"]["user"] is set. Tokens are never
+    captured: the user's subject and role are, and replay issues its own
+    tokens. Added after admission control so captured timings include
+    queuing and 429s. Costs one attribute check per request when idle.
+    """
+
+    def __init__(
+        self,
+        app,
+        capture: TrafficCapture,
+        prefixes: Iterable[str] = ("/api/", "/ws"),
+        exclude: Iterable[str] = ("/api/auth/", "/api/capture/")
+    ):
+        self.app = app
+        self.capture = capture
+        self.prefixes = tuple(prefixes)
+        self.exclude = tuple(exclude)
+
+    async def __call__(self, scope, receive, send):
+        capture = self.capture
+        user = scope.get("state", {}).get("user") if capture.active else None
+        if (user is None or scope["type"] not in ("http", "websocket") or not scope["path"].startswith(self.prefixes)
+                or scope["path"].startswith(self.exclude)):
+            await self.app(scope, receive, send)
+            return
+        who = (user.get("sub"), user.get("role"))
+        query = strip_token(scope.get("query_string", b""))
+        if scope["type"] == "websocket":
+            await self._websocket(scope, receive, send, who, query)
+        else:
+            await self._http(scope, receive, send, who, query)
+
+    async def _http(self, scope, receive, send, who, query):
+        capture = self.capture
+        started = time.perf_counter()
+        at = capture.offset()
+        method = scope["method"]
+        chunks: Optional[List[bytes]] = []
+        size = 0
+        response: Optional[List[bytes]] = [] if method not in ("GET", "HEAD") else None
+        response_size = 0
+        status = None
+
+        async def receive_captured():
+            nonlocal chunks, size
+            message = await receive()
+            if message["type"] == "http.request" and chunks is not None:
+                size += len(message.get("body", b""))
+                if size > capture.max_body:
+                    chunks = None
+                else:
+                    chunks.append(message.get("body", b""))
+            return message
+
+        async def send_captured(message):
+            nonlocal status, response, response_size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body" and response is not None:
+                response_size += len(message.get("body", b""))
+                if response_size > capture.max_response:
+                    response = None
+                else:
+                    response.append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive_captured, send_captured)
+        finally:
+            if chunks is None:
+                capture.bodies_skipped += 1
+            endpoint = scope.get("endpoint")
+            capture.requests += 1
+            capture.add((
+                HTTP, at, method, scope["path"], query,
+                [(name, value) for name, value in scope["headers"] if name in CAPTURED_HEADERS],
+                who,
+                b"".join(chunks) if chunks is not None else None,
+                status,
+                time.perf_counter() - started,
+                getattr(endpoint, "__name__", None),
+                b"".join(response) if response is not None else None,
+            ))
+
+    async def _websocket(self, scope, receive, send, who, query):
+        capture = self.capture
+        ws = capture.next_websocket()
+        capture.add((WS_OPEN, capture.offset(), ws, scope["path"], query, who))
+
+        async def receive_captured():
+            message = await receive()
+            if message["type"] == "websocket.receive":
+                capture.websocket_messages += 1
+                text = message.get("text")
+                capture.add((WS_IN, capture.offset(), ws, text if text is not None else message.get("bytes")))
+            return message
+
+        try:
+            await self.app(scope, receive_captured, send)
+        finally:
+            capture.add((WS_CLOSE, capture.offset(), ws))
@@ -0,0 +1,286 @@
+import math
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+Position = Tuple[float, float]
+
+# Task types that can share a trip, with the depot a task uses when its
+# waypoints do not name one. Deliveries start at their depot, collections
+# finish at it.
+CONSOLIDATED_TYPES = {"delivery": "Kitchen", "collection": "Washing Machine"}
+
+# Tasks a robot carries per trip (tray slots)
+DEFAULT_CAPACITY = 3
+
+# Robot speed in map units per second, and time spent at each stop
+ROBOT_SPEED = 10.0
+STOP_SERVICE_SECONDS = 20.0
+
+# Robots below this battery level are left to the charging policy
+MIN_BATTERY_LEVEL = 30
+
+# Upper bound on 2-opt improvement passes per route
+TWO_OPT_MAX_PASSES = 50
+
+
+def build_location_index(*collections: Iterable[Dict[str, Any]]) -> Dict[str, Position]:
+    """
+    Map location names to (x, y) map positions
+
+    Args:
+        collections: Iterables of tables/points with "name" and "position"
+
+    Returns:
+        dict: Location name -> (x, y)
+    """
+    positions: Dict[str, Position] = {}
+    for collection in collections:
+        for item in collection:
+            position = item.get("position") or {}
+            if "x" in position and "y" in position:
+                positions[item["name"]] = (float(position["x"]), float(position["y"]))
+    return positions
+
+
+def route_length(route: Sequence[str], positions: Dict[str, Position]) -> float:
+    """Total distance along a route; unknown locations contribute nothing"""
+    return sum(_distance(positions, a, b) for a, b in zip(route, route[1:]))
+
+
+def nearest_neighbour(start: str, stops: Iterable[str], positions: Dict[str, Position]) -> List[str]:
+    """Order stops greedily by always visiting the closest remaining one"""
+    remaining = list(dict.fromkeys(stops))
+    order: List[str] = []
+    current = start
+    while remaining:
+        closest = min(remaining, key=lambda stop: _distance(positions, current, stop))
+        remaining.remove(closest)
+        order.append(closest)
+        current = closest
+    return order
+
+
+def two_opt(route: List[str], positions: Dict[str, Position], fixed_end: bool = False,
+            max_passes: int = TWO_OPT_MAX_PASSES) -> List[str]:
+    """
+    Improve an open route by reversing segments while that shortens it
+
+    The first stop is always fixed; the last stop is fixed too when
+    fixed_end is set (e.g. a collection trip must finish at its depot).
+    """
+    route = list(route)
+    last = len(route) - (2 if fixed_end else 1)
+    for _ in range(max_passes):
+        improved = False
+        for i in range(1, last):
+            for j in range(i + 1, last + 1):
+                before = _distance(positions, route[i - 1], route[i])
+                after = _distance(positions, route[i - 1], route[j])
+                if j + 1 < len(route):
+                    before += _distance(positions, route[j], route[j + 1])
+                    after += _distance(positions, route[i], route[j + 1])
+                if after < before - 1e-9:
+                    route[i:j + 1] = reversed(route[i:j + 1])
+                    improved = True
+        if not improved:
+            break
+    return route
+
+
+def _distance(positions: Dict[str, Position], a: str, b: str) -> float:
+    pa = positions.get(a)
+    pb = positions.get(b)
+    if pa is None or pb is None or a == b:
+        return 0.0
+    return math.hypot(pa[0] - pb[0], pa[1] - pb[1])
+
+
+def _split_waypoints(task: Dict[str, Any]) -> Tuple[str, List[str], str]:
+    """Return (depot, via_stops, table_stop) for a consolidatable task"""
+    task_type = str(getattr(task["type"], "value", task["type"]))
+    waypoints = list(task.get("waypoints") or [])
+    default_depot = CONSOLIDATED_TYPES[task_type]
+    if task_type == "delivery":
+        if len(waypoints) >= 2:
+            return waypoints[0], waypoints[1:-1], waypoints[-1]
+        return default_depot, [], waypoints[0] if waypoints else default_depot
+    if len(waypoints) >= 2:
+        return waypoints[-1], waypoints[1:-1], waypoints[0]
+    return default_depot, [], waypoints[0] if waypoints else default_depot
+
+
+class TripPlanner:
+    """
+    Groups READY delivery and collection tasks into multi-stop trips
+
+    Tasks are taken in deadline order. Each trip is seeded with the most
+    urgent unplanned task, then grows with the closest compatible tasks
+    (same type and depot) while the robot has capacity and every task on
+    the reordered route still meets its deadline. Stops are ordered with
+    nearest-neighbour followed by 2-opt. Each trip is matched to the idle
+    robot closest to its first stop.
+    """
+
+    def __init__(
+        self,
+        positions: Dict[str, Position],
+        capacity: int = DEFAULT_CAPACITY,
+        speed: float = ROBOT_SPEED,
+        service_seconds: float = STOP_SERVICE_SECONDS,
+        min_battery: float = MIN_BATTERY_LEVEL
+    ):
+        """
+        Args:
+            positions (dict): Location name -> (x, y), see build_location_index
+            capacity (int): Maximum tasks per trip; 1 disables consolidation
+            speed (float): Robot speed in map units per second
+            service_seconds (float): Time spent at each stop
+            min_battery (float): Robots below this level are not planned
+        """
+        self.positions = positions
+        self.capacity = max(1, capacity)
+        self.speed = speed
+        self.service_seconds = service_seconds
+        self.min_battery = min_battery
+
+    def is_plannable(self, task: Dict[str, Any]) -> bool:
+        return (
+            str(getattr(task["state"], "value", task["state"])) == "READY"
+            and not task.get("assigned_robot")
+            and str(getattr(task["type"], "value", task["type"])) in CONSOLIDATED_TYPES
+        )
+
+    def is_available(self, robot: Dict[str, Any]) -> bool:
+        return (
+            str(getattr(robot["status"], "value", robot["status"])) == "IDLE"
+            and not robot.get("current_task_id")
+            and robot.get("battery_level", 100) >= self.min_battery
+        )
+
+    def build_route(self, tasks: List[Dict[str, Any]], start: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Order the stops of a group of same-type, same-depot tasks
+
+        Args:
+            tasks (list): Tasks sharing a trip
+            start (str, optional): Robot location the trip starts from
+
+        Returns:
+            dict: route (list of location names), distance, and for each task
+                id the estimated seconds until its final stop is reached
+        """
+        task_type = str(getattr(tasks[0]["type"], "value", tasks[0]["type"]))
+        depot = _split_waypoints(tasks[0])[0]
+        vias: List[str] = []
+        tables: List[str] = []
+        for task in tasks:
+            _, task_vias, table = _split_waypoints(task)
+            vias.extend(task_vias)
+            tables.append(table)
+        vias = list(dict.fromkeys(vias))
+
+        if task_type == "delivery":
+            # Load at the depot, pass any checkpoints, then drop at the tables
+            head = ([start] if start and start != depot else []) + [depot] + vias
+            stops = nearest_neighbour(head[-1], tables, self.positions)
+            route = head[:-1] + two_opt(head[-1:] + stops, self.positions)
+        else:
+            # Pick up at the tables, then unload via any checkpoints at the depot
+            origin = start or tables[0]
+            stops = nearest_neighbour(origin, [t for t in tables if t != origin], self.positions)
+            tail = vias + [depot]
+            route = two_opt([origin] + stops + tail[:1], self.positions, fixed_end=True) + tail[1:]
+
+        arrivals = self._arrival_offsets(route)
+        finish: Dict[str, float] = {}
+        for task in tasks:
+            _, _, table = _split_waypoints(task)
+            target = table if task_type == "delivery" else depot
+            finish[task["id"]] = round(arrivals.get(target, arrivals[route[-1]]), 2)
+        return {
+            "route": route,
+            "distance": round(route_length(route, self.positions), 2),
+            "duration_s": round(arrivals[route[-1]], 2) if route else 0.0,
+            "finish_offsets_s": finish,
+        }
+
+    def _arrival_offsets(self, route: List[str]) -> Dict[str, float]:
+        """Seconds from trip start until each stop is reached and served"""
+        arrivals: Dict[str, float] = {}
+        elapsed = 0.0
+        for index, stop in enumerate(route):
+            if index:
+                elapsed += _distance(self.positions, route[index - 1], stop) / self.speed
+                elapsed += self.service_seconds
+            arrivals.setdefault(stop, elapsed)
+        return arrivals
+
+    def _meets_deadlines(self, tasks: List[Dict[str, Any]], plan: Dict[str, Any], now: datetime) -> bool:
+        for task in tasks:
+            deadline = task.get("deadline")
+            if deadline is None:
+                continue
+            if (deadline - now).total_seconds() < plan["finish_offsets_s"][task["id"]]:
+                return False
+        return True
+
+    def plan(self, tasks: Iterable[Dict[str, Any]], robots: Iterable[Dict[str, Any]],
+             now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """
+        Plan trips for the plannable tasks over the available robots
+
+        Nothing is mutated; the caller applies the returned trips.
+
+        Returns:
+            list: One dict per trip with robot_id, type, task_ids, route,
+                distance and duration_s
+        """
+        now = now or datetime.now()
+        pending = sorted(
+            (t for t in tasks if self.is_plannable(t)),
+            key=lambda t: (t.get("deadline") or datetime.max, -t.get("effective_priority", 0))
+        )
+        idle = [r for r in robots if self.is_available(r)]
+        trips: List[Dict[str, Any]] = []
+
+        while pending and idle:
+            seed = pending.pop(0)
+            seed_type = str(getattr(seed["type"], "value", seed["type"]))
+            depot, _, seed_table = _split_waypoints(seed)
+            first_stop = depot if seed_type == "delivery" else seed_table
+            # Robots at unknown locations (e.g. "Base Station") are picked last
+            robot = min(idle, key=lambda r: (
+                _distance(self.positions, r["current_location"], first_stop)
+                if r.get("current_location") in self.positions else math.inf
+            ))
+            idle.remove(robot)
+            start = robot.get("current_location")
+            if start not in self.positions:
+                start = None
+
+            group = [seed]
+            plan = self.build_route(group, start)
+            candidates = sorted(
+                (t for t in pending
+                 if str(getattr(t["type"], "value", t["type"])) == seed_type and _split_waypoints(t)[0] == depot),
+                key=lambda t: _distance(self.positions, seed_table, _split_waypoints(t)[2])
+            )
+            for candidate in candidates:
+                if len(group) >= self.capacity:
+                    break
+                trial = self.build_route(group + [candidate], start)
+                if self._meets_deadlines(group + [candidate], trial, now):
+                    group.append(candidate)
+                    plan = trial
+                    pending.remove(candidate)
+
+            trips.append({
+                "robot_id": robot["id"],
+                "type": seed_type,
+                "task_ids": [t["id"] for t in group],
+                "route": plan["route"],
+                "distance": plan["distance"],
+                "duration_s": plan["duration_s"],
+                "finish_offsets_s": plan["finish_offsets_s"],
+            })
+        return trips
@@ -0,0 +1,343 @@
+"""
+Venue gateway: one front door for many restaurants' fleets
+
+Each venue's state (tasks, robots, tables, points, charging stations) is a
+shard held by its own app.py worker process. The gateway routes
+/venues/{venue_id}/... to that worker with the prefix removed, so
+/venues/airport/api/tasks reaches the airport worker's /api/tasks and
+/venues/airport/ws its WebSocket. Paths without a prefix go to the default
+venue, so single-venue clients keep working. Run from the project root:
+
+    python venue_gateway.py --venues downtown,airport,mall [--port 8000]
+
+starts one worker per venue on ports from --base-port, each with its own
+event log directory, database and task history, and the gateway in
+front. Venues served elsewhere are added with --venue NAME=URL.
+"""
+import argparse
+import asyncio
+import json
+import os
+import secrets
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+import websockets
+
+# First port of the local venue workers started by main()
+DEFAULT_BASE_PORT = 8100
+
+# Seconds a proxied request may take, e.g. a large customer export
+DEFAULT_TIMEOUT = 60.0
+
+# Seconds main() waits for the venue workers to accept connections
+DEFAULT_STARTUP_TIMEOUT = 30.0
+
+# Per-venue storage of the workers main() starts; {venue} is the venue id
+DEFAULT_EVENT_STORE_DIR = os.path.join("event_store", "{venue}")
+DEFAULT_DATABASE_URL = "sqlite:///./robot_control_{venue}.db"
+DEFAULT_ANALYTICS_DIR = os.path.join("analytics", "{venue}")
+
+VENUE_PREFIX = "/venues/"
+
+# Headers about one connection rather than the request; never forwarded
+_HOP_BY_HOP = frozenset({
+    b"connection", b"keep-alive", b"proxy-authenticate", b"proxy-authorization", b"te", b"trailer",
+    b"transfer-encoding", b"upgrade", b"host", b"content-length",
+})
+
+
+class VenueGateway:
+    """
+    ASGI app routing each venue's REST and WebSocket traffic to the worker holding its shard
+
+    The gateway only moves bytes: request and response bodies are streamed
+    through and WebSocket frames are relayed as they arrive, so a busy venue
+    costs the gateway its traffic and nothing more. Everything else,
+    including authentication, admission control and broadcasting, happens
+    in the venue's own worker, on its own event loop and CPU; a venue
+    saturating its worker does not delay the others. Workers must share
+    JWT_SECRET, so one login works at every venue, and WORKER_LEASE_DIR
+    (or distinct WORKER_IDs), so ids stay unique across venues.
+
+    GET /venues lists the venue ids. An unknown venue gets 404, and one
+    whose worker cannot be reached gets 502 (WebSocket close 1011).
+    """
+
+    def __init__(self, venues: Dict[str, str], default_venue: Optional[str] = None, timeout: float = DEFAULT_TIMEOUT):
+        """
+        Args:
+            venues: Venue id -> base URL of the worker holding its shard
+            default_venue (str, optional): Venue of unprefixed paths; the first venue by default
+            timeout (float): Seconds a proxied request may take
+        """
+        if not venues:
+            raise ValueError("A gateway needs at least one venue")
+        self.venues = dict(venues)
+        self.default_venue = default_venue or next(iter(self.venues))
+        if self.default_venue not in self.venues:
+            raise ValueError(f"Unknown default venue {self.default_venue!r}")
+        self.timeout = timeout
+        # One pooled client per worker, created on the running loop
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self.requests: Dict[str, int] = {venue: 0 for venue in self.venues}
+        self.websockets: Dict[str, int] = {venue: 0 for venue in self.venues}
+        self.upstream_errors = 0
+
+    def route(self, path: str) -> Tuple[Optional[str], str]:
+        """
+        Venue and worker path of a request path
+
+        Returns:
+            Tuple[Optional[str], str]: The venue id (None if unknown) and the path to forward
+        """
+        if not path.startswith(VENUE_PREFIX):
+            return self.default_venue, path
+        venue, _, rest = path[len(VENUE_PREFIX):].partition("/")
+        return (venue if venue in self.venues else None), "/" + rest
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        path = scope["path"]
+        if scope["type"] == "http" and path.rstrip("/") == "/venues":
+            await self._respond(send, 200, {
+                "venues": list(self.venues), "default": self.default_venue, "traffic": self.stats(),
+            })
+            return
+        venue, upstream_path = self.route(path)
+        if venue is None:
+            if scope["type"] == "http":
+                await self._respond(send, 404, {"detail": f"Unknown venue {path[len(VENUE_PREFIX):].split('/')[0]!r}"})
+            else:
+                await send({"type": "websocket.close", "code": 1008})
+            return
+        if scope["type"] == "http":
+            await self._proxy_http(scope, receive, send, venue, upstream_path)
+        elif scope["type"] == "websocket":
+            await self._proxy_websocket(scope, receive, send, venue, upstream_path)
+
+    async def _lifespan(self, receive, send) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.aclose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def aclose(self) -> None:
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            await client.aclose()
+
+    def _client(self, venue: str) -> httpx.AsyncClient:
+        client = self._clients.get(venue)
+        if client is None:
+            client = self._clients[venue] = httpx.AsyncClient(
+                base_url=self.venues[venue],
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=None, max_keepalive_connections=100)
+            )
+        return client
+
+    @staticmethod
+    async def _respond(send, status: int, body: dict) -> None:
+        payload = json.dumps(body).encode()
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(payload)).encode())],
+        })
+        await send({"type": "http.response.body", "body": payload})
+
+    @staticmethod
+    def _forwarded_headers(scope, venue: str) -> List[Tuple[bytes, bytes]]:
+        headers = [(name, value) for name, value in scope["headers"] if name not in _HOP_BY_HOP]
+        client = scope.get("client")
+        if client:
+            headers.append((b"x-forwarded-for", client[0].encode("latin-1")))
+        headers.append((b"x-forwarded-prefix", f"{VENUE_PREFIX}{venue}".encode("latin-1")))
+        return headers
+
+    async def _proxy_http(self, scope, receive, send, venue: str, path: str) -> None:
+        self.requests[venue] += 1
+
+        async def body():
+            while True:
+                message = await receive()
+                if message["type"] != "http.request":
+                    return
+                if message.get("body"):
+                    yield message["body"]
+                if not message.get("more_body"):
+                    return
+
+        client = self._client(venue)
+        request = client.build_request(
+            scope["method"],
+            httpx.URL(path=path, query=scope.get("query_string", b"")),
+            headers=self._forwarded_headers(scope, venue),
+            content=body() if scope["method"] not in ("GET", "HEAD", "OPTIONS", "DELETE") else None,
+        )
+        try:
+            response = await client.send(request, stream=True)
+        except httpx.HTTPError:
+            self.upstream_errors += 1
+            await self._respond(send, 502, {"detail": f"Venue {venue} is unavailable"})
+            return
+        try:
+            await send({
+                "type": "http.response.start",
+                "status": response.status_code,
+                "headers": [
+                    (name, value) for name, value in response.headers.raw
+                    if name.lower() not in _HOP_BY_HOP or name.lower() == b"content-length"
+                ],
+            })
+            async for chunk in response.aiter_raw():
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            await response.aclose()
+
+    async def _proxy_websocket(self, scope, receive, send, venue: str, path: str) -> None:
+        if (await receive())["type"] != "websocket.connect":
+            return
+        base = urlsplit(self.venues[venue])
+        url = f"{'wss' if base.scheme == 'https' else 'ws'}://{base.netloc}{base.path.rstrip('/')}{path}"
+        if scope.get("query_string"):
+            url += "?" + scope["query_string"].decode("latin-1")
+        headers = [
+            (name.decode("latin-1"), value.decode("latin-1"))
+            for name, value in self._forwarded_headers(scope, venue) if not name.startswith(b"sec-websocket-")
+        ]
+        try:
+            upstream = await websockets.connect(url, additional_headers=headers, max_size=None)
+        except websockets.InvalidStatus as e:
+            # The worker refused the handshake, e.g. a missing token
+            await send({"type": "websocket.close", "code": 1008 if e.response.status_code == 403 else 1011})
+            return
+        except (OSError, websockets.InvalidHandshake):
+            self.upstream_errors += 1
+            await send({"type": "websocket.close", "code": 1011})
+            return
+        self.websockets[venue] += 1
+        await send({"type": "websocket.accept"})
+
+        async def client_to_upstream():
+            while True:
+                message = await receive()
+                if message["type"] == "websocket.disconnect":
+                    return
+                await upstream.send(message["text"] if message.get("text") is not None else message["bytes"])
+
+        async def upstream_to_client():
+            try:
+                async for message in upstream:
+                    key = "text" if isinstance(message, str) else "bytes"
+                    await send({"type": "websocket.send", key: message})
+            except websockets.ConnectionClosed:
+                pass
+            await send({"type": "websocket.close", "code": upstream.close_code or 1000})
+
+        relays = [asyncio.ensure_future(client_to_upstream()), asyncio.ensure_future(upstream_to_client())]
+        try:
+            await asyncio.wait(relays, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for relay in relays:
+                relay.cancel()
+            await asyncio.gather(*relays, return_exceptions=True)
+            await upstream.close()
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {
+            venue: {"requests": self.requests[venue], "websockets": self.websockets[venue]} for venue in self.venues
+        }
+
+
+def start_venue_worker(venue: str, port: int, host: str = "127.0.0.1", env: Optional[Dict[str, str]] = None) -> subprocess.Popen:
+    """
+    Start an app.py worker holding one venue's shard
+
+    The worker gets VENUE_ID, and its own event log directory, database
+    and task history directory from VENUE_EVENT_STORE_DIR,
+    VENUE_DATABASE_URL and VENUE_ANALYTICS_DIR, templates with a {venue}
+    placeholder (defaults: event_store/{venue},
+    sqlite:///./robot_control_{venue}.db and analytics/{venue}). An empty
+    VENUE_EVENT_STORE_DIR or VENUE_ANALYTICS_DIR keeps that in memory.
+    """
+    worker_env = {**os.environ, **(env or {})}
+    event_store_dir = worker_env.get("VENUE_EVENT_STORE_DIR", DEFAULT_EVENT_STORE_DIR)
+    analytics_dir = worker_env.get("VENUE_ANALYTICS_DIR", DEFAULT_ANALYTICS_DIR)
+    worker_env.update({
+        "VENUE_ID": venue,
+        "EVENT_STORE_DIR": event_store_dir.format(venue=venue),
+        "DATABASE_URL": worker_env.get("VENUE_DATABASE_URL", DEFAULT_DATABASE_URL).format(venue=venue),
+        "ANALYTICS_DIR": analytics_dir.format(venue=venue),
+    })
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--host", host, "--port", str(port), "--log-level", "warning"],
+        env=worker_env
+    )
+
+
+def wait_until_listening(urls: List[str], timeout: float = DEFAULT_STARTUP_TIMEOUT) -> None:
+    """Block until every URL answers HTTP (any status)"""
+    deadline = time.monotonic() + timeout
+    for url in urls:
+        while True:
+            try:
+                httpx.get(url, timeout=1.0)
+                break
+            except httpx.TransportError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"{url} did not start within {timeout:.0f} s")
+                time.sleep(0.1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--venues", default="", help="Comma-separated venues to start a local worker for")
+    parser.add_argument("--venue", action="append", default=[], metavar="NAME=URL",
+                        help="A venue served by a worker elsewhere; repeatable")
+    parser.add_argument("--default-venue", help="Venue of unprefixed paths; the first venue by default")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--base-port", type=int, default=DEFAULT_BASE_PORT)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    # Workers must agree on the token signing key so one login works everywhere
+    os.environ.setdefault("JWT_SECRET", secrets.token_urlsafe(32))
+    venues: Dict[str, str] = {}
+    workers = []
+    for n, venue in enumerate(filter(None, (name.strip() for name in args.venues.split(",")))):
+        port = args.base_port + n
+        workers.append(start_venue_worker(venue, port))
+        venues[venue] = f"http://127.0.0.1:{port}"
+    for entry in args.venue:
+        name, _, url = entry.partition("=")
+        venues[name] = url
+    if not venues:
+        parser.error("Give at least one venue with --venues or --venue")
+    try:
+        wait_until_listening([url for url in venues.values()])
+        print(f"Serving venues {', '.join(venues)} on port {args.port}")
+        uvicorn.run(VenueGateway(venues, args.default_venue), host=args.host, port=args.port, log_level="warning")
+    finally:
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import asyncio
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Optional
+
+from structured_log import get_logger
+
+# Messages queued for one connection before it counts as stalled and is dropped
+DEFAULT_MAX_MESSAGES = 1024
+
+log = get_logger("ws_outbox")
+
+
+class ConnectionOutbox:
+    """
+    Bounded send queue for one WebSocket, drained by its own writer task
+
+    put() only appends, so a broadcast costs the command loop one append
+    per subscribed connection however slow the client is. A client that
+    falls max_messages behind, or whose send raises, is closed through
+    on_close and gets nothing more; it reconnects and refetches state,
+    rather than stalling every other client or silently missing events.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[str], Awaitable[None]],
+        on_close: Callable[[str], None],
+        max_messages: int = DEFAULT_MAX_MESSAGES
+    ):
+        """
+        Args:
+            send: Coroutine function writing one text message to the socket
+            on_close: Called once, with the reason, when the outbox closes itself
+            max_messages (int): Most messages queued before the connection is dropped
+        """
+        self._send = send
+        self._on_close = on_close
+        self.max_messages = max_messages
+        self._queue: Deque[str] = deque()
+        self._ready = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self.closed = False
+        self.sent = 0
+        self._writer = asyncio.get_running_loop().create_task(self._run())
+
+    def put(self, message: str) -> bool:
+        """Queue a message; returns False if the outbox is closed or just overflowed"""
+        if self.closed:
+            return False
+        if len(self._queue) >= self.max_messages:
+            self._fail("overflow")
+            return False
+        self._queue.append(message)
+        self._idle.clear()
+        self._ready.set()
+        return True
+
+    async def _run(self) -> None:
+        queue = self._queue
+        while True:
+            if not queue:
+                self._idle.set()
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+            try:
+                await self._send(queue[0])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._fail(f"send failed: {e}")
+                return
+            queue.popleft()
+            self.sent += 1
+
+    def _fail(self, reason: str) -> None:
+        if self.closed:
+            return
+        log.warning("ws_outbox.closed", reason=reason, queued=len(self._queue))
+        self.close()
+        self._on_close(reason)
+
+    def close(self) -> None:
+        """Stop sending and discard anything queued"""
+        self.closed = True
+        self._queue.clear()
+        self._idle.set()
+        if self._writer is not asyncio.current_task():
+            self._writer.cancel()
+
+    async def drain(self, timeout: Optional[float] = None) -> None:
+        """Wait until everything queued so far has been sent, or the outbox closed"""
+        await asyncio.wait_for(self._idle.wait(), timeout)
+
+    def stats(self) -> Dict[str, int]:
+        return {"queued": len(self._queue), "sent": self.sent}
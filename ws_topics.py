@@ -0,0 +1,118 @@
+from collections import defaultdict
+from typing import Any, Dict, FrozenSet, Hashable, Iterable, List, Mapping, Set, Tuple
+
+# Fields a subscription can filter on, most selective first. A subscription
+# is indexed under its most selective field only.
+TOPIC_FIELDS = ("robot", "table", "task_type", "event", "kind")
+
+# An event's topics: field -> every value the event carries for it
+Topics = Mapping[str, Iterable[str]]
+
+
+class InvalidSubscription(ValueError):
+    pass
+
+
+class Subscription:
+    __slots__ = ("connection", "id", "filter", "index_field")
+
+    def __init__(self, connection: Hashable, sub_id: str, filter: Dict[str, FrozenSet[str]]):
+        self.connection = connection
+        self.id = sub_id
+        self.filter = filter
+        self.index_field = next((field for field in TOPIC_FIELDS if field in filter), None)
+
+    def matches(self, topics: Mapping[str, Set[str]]) -> bool:
+        """True if, for every filtered field, the event carries at least one accepted value"""
+        return all(not values.isdisjoint(topics.get(field, ())) for field, values in self.filter.items())
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"id": self.id, "filter": {field: sorted(values) for field, values in self.filter.items()}}
+
+
+def parse_filter(raw: Any) -> Dict[str, FrozenSet[str]]:
+    """
+    Validate a client filter such as {"kind": "task", "task_type": ["delivery"]}
+
+    Raises:
+        InvalidSubscription: If the filter is not an object of known fields
+            mapping to a string or a non-empty list of strings
+    """
+    if not isinstance(raw, dict):
+        raise InvalidSubscription("filter must be an object")
+    parsed = {}
+    for field, value in raw.items():
+        if field not in TOPIC_FIELDS:
+            raise InvalidSubscription(f"unknown filter field '{field}', expected one of {', '.join(TOPIC_FIELDS)}")
+        values = [value] if isinstance(value, str) else value
+        if not isinstance(values, list) or not values or not all(isinstance(v, str) for v in values):
+            raise InvalidSubscription(f"filter field '{field}' must be a string or a non-empty list of strings")
+        parsed[field] = frozenset(values)
+    return parsed
+
+
+class SubscriptionIndex:
+    """
+    Maps events to the connections subscribed to them
+
+    Each subscription is a filter: an AND over fields, each field an OR
+    over accepted values; an empty filter matches every event. A connection
+    receives an event if any of its subscriptions matches. Subscriptions
+    are indexed by (field, value) of their most selective field, so
+    matching an event looks up only the buckets for the values the event
+    carries and checks those candidates, instead of testing every
+    connection.
+    """
+
+    def __init__(self):
+        self._index: Dict[Tuple[str, str], Set[Subscription]] = defaultdict(set)
+        self._match_all: Set[Subscription] = set()
+        self._by_connection: Dict[Hashable, Dict[str, Subscription]] = {}
+
+    def __len__(self) -> int:
+        return sum(len(subscriptions) for subscriptions in self._by_connection.values())
+
+    def subscribe(self, connection: Hashable, sub_id: str, filter: Dict[str, FrozenSet[str]]) -> Subscription:
+        """Add or replace the connection's subscription with this id"""
+        self.unsubscribe(connection, sub_id)
+        subscription = Subscription(connection, sub_id, filter)
+        self._by_connection.setdefault(connection, {})[sub_id] = subscription
+        if subscription.index_field is None:
+            self._match_all.add(subscription)
+        else:
+            for value in filter[subscription.index_field]:
+                self._index[(subscription.index_field, value)].add(subscription)
+        return subscription
+
+    def unsubscribe(self, connection: Hashable, sub_id: str) -> bool:
+        subscription = self._by_connection.get(connection, {}).pop(sub_id, None)
+        if subscription is None:
+            return False
+        if subscription.index_field is None:
+            self._match_all.discard(subscription)
+        else:
+            for value in subscription.filter[subscription.index_field]:
+                bucket = self._index[(subscription.index_field, value)]
+                bucket.discard(subscription)
+                if not bucket:
+                    del self._index[(subscription.index_field, value)]
+        return True
+
+    def remove_connection(self, connection: Hashable) -> None:
+        for sub_id in list(self._by_connection.get(connection, {})):
+            self.unsubscribe(connection, sub_id)
+        self._by_connection.pop(connection, None)
+
+    def subscriptions(self, connection: Hashable) -> List[Subscription]:
+        return list(self._by_connection.get(connection, {}).values())
+
+    def match(self, topics: Topics) -> Set[Hashable]:
+        """Connections with at least one subscription matching an event with these topics"""
+        topic_sets = {field: set(values) for field, values in topics.items()}
+        connections = {subscription.connection for subscription in self._match_all}
+        for field, values in topic_sets.items():
+            for value in values:
+                for subscription in self._index.get((field, value), ()):
+                    if subscription.connection not in connections and subscription.matches(topic_sets):
+                        connections.add(subscription.connection)
+        return connections